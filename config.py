@@ -33,6 +33,17 @@ FIRESTORE_SERVICE_ACCOUNT_KEY_PATH = "data/firebase_data.json" # تم تحديث
 FIRESTORE_CONVERSATIONS_COLLECTION = "conversations" # Collection for storing chat logs
 FIRESTORE_METRICS_COLLECTION = "dashboardMetrics"   # Collection for dashboard summary metrics
 
+# Conversation message layout in Firestore:
+# - "subcollection": small conversation header + one document per message (O(1) appends)
+# - "array": legacy single document holding the whole `messages` array
+# Legacy array conversations stay readable in both modes and are migrated on their next append
+# when "subcollection" is active (bulk: scripts/migrate_conversation_messages.py).
+CONVERSATION_STORAGE_MODE = os.getenv("CONVERSATION_STORAGE_MODE", "subcollection").strip().lower()
+
+# Live Chat list views read a local materialized index (one row per customer, kept current on every
+# save/takeover/end) instead of scanning every user's conversations. Set to false to force the scan.
+LIVE_CHAT_INDEX_ENABLED = os.getenv("LIVE_CHAT_INDEX_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+
 # Testing Mode Flag (NEW)
 TESTING_MODE = False  # When True, Firebase saving is disabled for testing
 
@@ -60,6 +71,83 @@ TRAINER_WHATSAPP_NUMBER = os.getenv("TRAINER_WHATSAPP_NUMBER")
 # FFMPEG Path for voice message processing
 FFMPEG_PATH = os.getenv("FFMPEG_PATH")
 
+# --- Shared State Store (cross-worker per-user state) ---
+# With REDIS_URL set, per-user state below is loaded from / saved to Redis around each message so
+# every gunicorn worker sees the same greeting/booking/takeover progress (services/state_store.py).
+# STATE_STORE_BACKEND: "auto" (redis when REDIS_URL is set), "redis" or "memory" (process-local).
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+STATE_STORE_BACKEND = os.getenv("STATE_STORE_BACKEND", "auto").strip().lower()
+USER_STATE_TTL_SECONDS = int(os.getenv("USER_STATE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+STATE_STORE_KEY_PREFIX = os.getenv("STATE_STORE_KEY_PREFIX", "linasbot")
+# Webhook retries (Qiscus can resend 15+ seconds later) are dropped within this window;
+# shared across workers through Redis when REDIS_URL is set (services/webhook_dedup.py).
+WEBHOOK_DEDUP_WINDOW_SECONDS = int(os.getenv("WEBHOOK_DEDUP_WINDOW_SECONDS", "60"))
+# Inbound dispatcher (services/message_dispatcher.py): messages are processed in order per user;
+# LLM pipelines (text/photo/voice) share a global concurrency cap; beyond the backlog limits
+# new messages are shed instead of queued.
+MAX_CONCURRENT_LLM_PIPELINES = int(os.getenv("MAX_CONCURRENT_LLM_PIPELINES", "16"))
+INBOUND_USER_QUEUE_MAX = int(os.getenv("INBOUND_USER_QUEUE_MAX", "20"))
+INBOUND_QUEUE_MAX_PENDING = int(os.getenv("INBOUND_QUEUE_MAX_PENDING", "1000"))
+# LLM context history (services/conversation_history_cache.py): last N messages per conversation,
+# written through on save and shared via Redis when REDIS_URL is set. Without Redis the in-process
+# ring is only used when the app runs a single worker (WEB_CONCURRENCY, also read by gunicorn).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CONVERSATION_HISTORY_SIZE = int(os.getenv("CONVERSATION_HISTORY_SIZE", "20"))
+CONVERSATION_HISTORY_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_HISTORY_MAX_CONVERSATIONS", "5000"))
+CONVERSATION_HISTORY_TTL_SECONDS = int(os.getenv("CONVERSATION_HISTORY_TTL_SECONDS", str(24 * 60 * 60)))
+# Live Chat SSE events are fanned out to every worker via Redis pub/sub when REDIS_URL is set; the
+# last N events are kept so reconnecting dashboards resume from Last-Event-ID (services/live_chat_sse_broadcaster.py).
+LIVE_CHAT_SSE_REPLAY_SIZE = int(os.getenv("LIVE_CHAT_SSE_REPLAY_SIZE", "500"))
+# CRM reference data (branches, services, machines, clinic hours, pricing) is cached per worker
+# and refreshed in the background once stale (services/reference_data_cache.py); invalidations
+# reach every worker through Redis when REDIS_URL is set.
+REFERENCE_DATA_CACHE_ENABLED = os.getenv("REFERENCE_DATA_CACHE_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+REFERENCE_DATA_TTL_SECONDS = int(os.getenv("REFERENCE_DATA_TTL_SECONDS", "3600"))
+REFERENCE_DATA_PRICING_TTL_SECONDS = int(os.getenv("REFERENCE_DATA_PRICING_TTL_SECONDS", "600"))
+REFERENCE_DATA_STALE_SECONDS = int(os.getenv("REFERENCE_DATA_STALE_SECONDS", "86400"))
+REFERENCE_DATA_PRICING_STALE_SECONDS = int(os.getenv("REFERENCE_DATA_PRICING_STALE_SECONDS", "300"))
+# Bounded per-worker caches (services/async_cache.py): external customer resolution by phone, and
+# user gender/language preferences. "Not found" results expire after the *_NEGATIVE_TTL_SECONDS.
+EXTERNAL_RESOLVE_CACHE_MAX_SIZE = int(os.getenv("EXTERNAL_RESOLVE_CACHE_MAX_SIZE", "5000"))
+EXTERNAL_RESOLVE_CACHE_TTL_SECONDS = int(os.getenv("EXTERNAL_RESOLVE_CACHE_TTL_SECONDS", "600"))
+EXTERNAL_RESOLVE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("EXTERNAL_RESOLVE_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+USER_PREFERENCE_CACHE_MAX_SIZE = int(os.getenv("USER_PREFERENCE_CACHE_MAX_SIZE", "10000"))
+USER_PREFERENCE_CACHE_TTL_SECONDS = int(os.getenv("USER_PREFERENCE_CACHE_TTL_SECONDS", "86400"))
+USER_PREFERENCE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("USER_PREFERENCE_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+# Outbound HTTP clients are shared per provider (services/http_clients.py); limits apply per client.
+# HTTP/2 also needs the optional `h2` package.
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "false").strip().lower() in ("1", "true", "yes")
+# Audio proxied to the dashboard (/api/media/audio) is cached under LINASBOT_DATA_ROOT/media_cache,
+# least recently played files evicted first (services/media_cache.py).
+MEDIA_CACHE_MAX_MB = int(os.getenv("MEDIA_CACHE_MAX_MB", "512"))
+# Blocking work offloaded from async handlers (services/blocking_executor.py): the I/O pool is also
+# the loop's default executor (asyncio.to_thread); the CPU pool runs bcrypt / PIL / ffmpeg.
+OFFLOAD_IO_THREADS = int(os.getenv("OFFLOAD_IO_THREADS", "16"))
+OFFLOAD_CPU_THREADS = int(os.getenv("OFFLOAD_CPU_THREADS", "4"))
+# Event-loop stalls longer than the threshold are logged with the blocking stack (services/loop_monitor.py).
+EVENT_LOOP_MONITOR_ENABLED = os.getenv("EVENT_LOOP_MONITOR_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+EVENT_LOOP_MONITOR_INTERVAL_MS = int(os.getenv("EVENT_LOOP_MONITOR_INTERVAL_MS", "100"))
+EVENT_LOOP_STALL_THRESHOLD_MS = int(os.getenv("EVENT_LOOP_STALL_THRESHOLD_MS", "250"))
+# Analytics events are appended in batches by a background writer (services/analytics_writer.py).
+ANALYTICS_FLUSH_BATCH_SIZE = int(os.getenv("ANALYTICS_FLUSH_BATCH_SIZE", "200"))
+ANALYTICS_FLUSH_INTERVAL_MS = int(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "1000"))
+ANALYTICS_FSYNC_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_FSYNC_INTERVAL_SECONDS", "5"))
+ANALYTICS_MAX_PENDING_EVENTS = int(os.getenv("ANALYTICS_MAX_PENDING_EVENTS", "10000"))
+# Smart message batches (services/smart_message_sender.py): parallel sends under a provider rate limit.
+SMART_MESSAGE_SEND_CONCURRENCY = int(os.getenv("SMART_MESSAGE_SEND_CONCURRENCY", "4"))
+SMART_MESSAGE_RATE_PER_SECOND = float(os.getenv("SMART_MESSAGE_RATE_PER_SECOND", "5"))
+SMART_MESSAGE_RATE_BURST = float(os.getenv("SMART_MESSAGE_RATE_BURST", "5"))
+SMART_MESSAGE_PROGRESS_EVERY = int(os.getenv("SMART_MESSAGE_PROGRESS_EVERY", "25"))
+SMART_MESSAGE_HISTORY_WORKERS = int(os.getenv("SMART_MESSAGE_HISTORY_WORKERS", "2"))
+SMART_MESSAGE_HISTORY_MAX_PENDING = int(os.getenv("SMART_MESSAGE_HISTORY_MAX_PENDING", "5000"))
+# Only the elected worker runs the smart-messaging scheduler (services/scheduler_leader.py).
+SCHEDULER_LEADER_ELECTION_ENABLED = os.getenv("SCHEDULER_LEADER_ELECTION_ENABLED", "true").strip().lower() in ("1", "true", "yes")
+SCHEDULER_LEADER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEADER_LEASE_SECONDS", "30"))
+SCHEDULER_LEADER_RENEW_SECONDS = float(os.getenv("SCHEDULER_LEADER_RENEW_SECONDS", "10"))
+
 # --- User State Management (DefaultDicts for easy access) ---
 user_context = defaultdict(deque) # Stores conversation history for each user
 user_gender = defaultdict(str) # Stores detected gender for each user
@@ -103,6 +191,13 @@ DEFAULT_MACHINE_ID = 1
 # Requirement: wait 3 seconds after the LAST message before responding.
 MESSAGE_COMBINING_DELAY = 3.0 # seconds
 
+# Per-step timeouts for the concurrent pre-flight stage of get_bot_chat_response
+# (moderation, explicit gender detection, Q&A context lookup). A timed-out step falls back to
+# "allowed" / "unknown" / no Q&A context instead of holding up the reply.
+PREFLIGHT_MODERATION_TIMEOUT_SECONDS = float(os.getenv("PREFLIGHT_MODERATION_TIMEOUT_SECONDS", "8"))
+PREFLIGHT_GENDER_TIMEOUT_SECONDS = float(os.getenv("PREFLIGHT_GENDER_TIMEOUT_SECONDS", "6"))
+PREFLIGHT_QA_TIMEOUT_SECONDS = float(os.getenv("PREFLIGHT_QA_TIMEOUT_SECONDS", "3"))
+
 # --- Bot Welcome Messages (Language-specific) ---
 WELCOME_MESSAGES = {
     "ar": "مرحباً! 😊\nمعك Marwa – المساعد الذكي بالذكاء الاصطناعي من Lina’s Laser Center.\nكيفك؟ كيف فيني ساعدك اليوم؟ 🧠✨\n\nفيك تحكيلي بأي طريقة بتحبها – حتى لو بالصوت! 🎤\nأنا هون مشان أساعدك بأي شي بدك ياه، بكل سهولة وسرعة.\nجاهز؟ يلا نحكي! 🤖💬\n\nوبالمناسبة، كرمال نقدر نساعدك ونقدم لك أفضل خدمة، ممكن تخبرنا لو سمحت إذا أنتَ شاباً أم صبية؟ 👦👧",
@@ -1,9 +1,9 @@
 import io
 import base64
-import httpx # NEW: for downloading image from URL
 import time
 
 import config
+from services.http_clients import get_http_client
 from utils.utils import notify_human_on_whatsapp, save_conversation_message_to_firestore, update_dashboard_metric_in_firestore # NEW: Import Firestore utilities
 from services.photo_analysis_service import get_bot_photo_analysis_from_gpt
 from services.analytics_events import analytics  # 📊 ANALYTICS
@@ -81,12 +81,12 @@ async def handle_photo_message(user_id: str, user_name: str, image_url: str, use
         else:
             # Download the image from the provided URL
             print(f"DEBUG: Downloading image from URL: {image_url[:100]}...")
-            async with httpx.AsyncClient() as client:
-                photo_response = await client.get(image_url)
-                photo_response.raise_for_status() # Raise an exception for bad status codes
+            client = get_http_client("media")
+            photo_response = await client.get(image_url)
+            photo_response.raise_for_status() # Raise an exception for bad status codes
 
-                photo_data_bytes = io.BytesIO(photo_response.content)
-                photo_data_bytes.seek(0)
+            photo_data_bytes = io.BytesIO(photo_response.content)
+            photo_data_bytes.seek(0)
 
             base64_image = base64.b64encode(photo_data_bytes.read()).decode("utf-8")
             print(f"DEBUG: Encoded image to base64, length: {len(base64_image)}")
@@ -8,30 +8,56 @@ from handlers.text_handlers_respond import _process_and_respond
 async def _delayed_process_messages(user_id: str, user_data: dict, send_message_func, send_action_func):
     """
     Delays processing to combine rapid messages from the same user.
+    The reply itself runs in the user's dispatcher mailbox, in order with their other messages;
+    once handed over it is no longer cancelled by a newer message (that one is answered next).
     """
+    from services.message_dispatcher import message_dispatcher
+    from services.tracing import current_trace, span
+
     try:
         await send_action_func(user_id)  # Send typing indicator
-        await asyncio.sleep(config.MESSAGE_COMBINING_DELAY)
+        async with span("combine_delay"):
+            await asyncio.sleep(config.MESSAGE_COMBINING_DELAY)
+
+        parent_trace = current_trace()
+        await message_dispatcher.run_in_mailbox(
+            user_id,
+            lambda: _respond_to_pending_messages(user_id, user_data, send_message_func, send_action_func, parent_trace),
+        )
+
+    except asyncio.CancelledError:
+        pass  # Task was cancelled
+    except Exception as e:
+        print(f"[_delayed_process_messages] ERROR: An error occurred in delayed processing for user {user_id}: {e}")
+        import traceback
+        traceback.print_exc()
+
 
-        if config.user_pending_messages[user_id]:
-            combined_message = " ".join(config.user_pending_messages[user_id])
-            config.user_pending_messages[user_id].clear()
+async def _respond_to_pending_messages(user_id: str, user_data: dict, send_message_func, send_action_func, parent_trace=None):
+    """Answer everything queued in config.user_pending_messages (runs in the user's mailbox)."""
+    from services.message_dispatcher import message_dispatcher
+    from services.tracing import span, start_trace, traced_send
 
+    if not config.user_pending_messages[user_id]:
+        return  # Queue was empty (already answered together with an earlier batch)
+
+    combined_count = len(config.user_pending_messages[user_id])
+    combined_message = " ".join(config.user_pending_messages[user_id])
+    config.user_pending_messages[user_id].clear()
+
+    # Continue the inbound trace of the message that scheduled this reply (webhook → reply sent)
+    with start_trace("text_reply", parent=parent_trace, combined_messages=combined_count):
+        async with message_dispatcher.llm_slot():
             await _process_and_respond(
                 user_id, 
                 user_name=config.user_names.get(user_id, "عميل"),
                 user_input_to_process=combined_message,
                 user_data=user_data,
-                send_message_func=send_message_func,
+                send_message_func=traced_send(send_message_func),
                 send_action_func=send_action_func
             )
-            config.user_last_bot_response_time[user_id] = datetime.datetime.now()
-        else:
-            pass  # Queue was empty
-
-    except asyncio.CancelledError:
-        pass  # Task was cancelled
-    except Exception as e:
-        print(f"[_delayed_process_messages] ERROR: An error occurred in delayed processing for user {user_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        config.user_last_bot_response_time[user_id] = datetime.datetime.now()
+        # Response ran after the webhook task returned: publish the updated state to other workers
+        from services.state_store import user_state_store
+        async with span("state_save"):
+            await user_state_store.save(user_id)
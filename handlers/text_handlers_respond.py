@@ -3,8 +3,10 @@
 
 from handlers.text_handlers_firestore import *
 from services.analytics_events import analytics
+from services.blocking_executor import blocking_executor
 from services.language_detection_service import language_detection_service
 from services.interaction_flow_logger import log_interaction
+from services.tracing import span
 from utils.datetime_utils import detect_reschedule_intent
 import time
 
@@ -241,17 +243,19 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
             }
             user_data['awaiting_human_handover_confirmation'] = False
         else:
-            conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
-            gpt_response_data = await get_bot_chat_response(
-                user_id=user_id,
-                user_input=user_input_to_process,
-                current_context_messages=conversation_history,
-                current_gender=current_gender,
-                current_preferred_lang=current_preferred_lang,
-                response_language=response_language,
-                is_initial_message_after_start=is_initial_message_for_gpt,
-                initial_user_query_to_process=initial_user_query_to_process_original
-            )
+            async with span("history_load"):
+                conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
+            async with span("gpt_response"):
+                gpt_response_data = await get_bot_chat_response(
+                    user_id=user_id,
+                    user_input=user_input_to_process,
+                    current_context_messages=conversation_history,
+                    current_gender=current_gender,
+                    current_preferred_lang=current_preferred_lang,
+                    response_language=response_language,
+                    is_initial_message_after_start=is_initial_message_for_gpt,
+                    initial_user_query_to_process=initial_user_query_to_process_original
+                )
 
     else:
         query_to_send_to_gpt = user_input_to_process
@@ -279,6 +283,12 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
 
         is_reschedule_intent = detect_reschedule_intent(query_to_send_to_gpt)
         is_price_intent = _is_price_intent(query_to_send_to_gpt)
+        # One Q&A scoring pass per turn: the direct-answer tier below and the GPT context pairs
+        # (reused by get_bot_chat_response). Reschedule turns get neither.
+        qa_turn = None
+        if not is_reschedule_intent:
+            async with span("qa_match"):
+                qa_turn = await local_qa_service.score_turn(query_to_send_to_gpt, current_preferred_lang)
         if is_reschedule_intent:
             # Routing safeguard: postpone/reschedule requests should never be short-circuited to Q&A.
             print(f"[_process_and_respond] 🔁 Reschedule intent detected. Skipping direct Q&A routing.")
@@ -288,7 +298,7 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
             print(f"[_process_and_respond] 💰 Price intent detected. Skipping direct Q&A routing for exact system pricing.")
             match_result = None
         else:
-            match_result = await local_qa_service.find_match_with_tier(query_to_send_to_gpt, current_preferred_lang)
+            match_result = qa_turn.direct_match()
 
         if match_result:
             # 90%+ match: Return Q&A directly
@@ -354,10 +364,11 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
                     retrieve_and_merge,
                 )
                 if is_dynamic_retrieval_available() and not is_reschedule_intent:
-                    merged, clarification, action, dr_flow_meta = await retrieve_and_merge(
-                        query_to_send_to_gpt,
-                        include_price_hint=is_price_intent,
-                    )
+                    async with span("dynamic_retrieval"):
+                        merged, clarification, action, dr_flow_meta = await retrieve_and_merge(
+                            query_to_send_to_gpt,
+                            include_price_hint=is_price_intent,
+                        )
                     if action == "ask_clarification" and clarification:
                         bot_sent = dr_flow_meta.get("bot_sent_to_selector", "")
                         ai_returned = dr_flow_meta.get("selector_ai_raw_response", '{"action": "ask_clarification"}')
@@ -382,19 +393,22 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
             except Exception as e:
                 print(f"[_process_and_respond] ⚠️ Dynamic retrieval fallback: {e}")
 
-            conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
-
-            gpt_response_data = await get_bot_chat_response(
-                user_id=user_id,
-                user_input=query_to_send_to_gpt,
-                current_context_messages=conversation_history,
-                current_gender=current_gender,
-                current_preferred_lang=current_preferred_lang,
-                response_language=response_language,
-                is_initial_message_after_start=is_initial_message_for_gpt,
-                initial_user_query_to_process=None,
-                custom_knowledge_context=custom_context,
-            )
+            async with span("history_load"):
+                conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
+
+            async with span("gpt_response"):
+                gpt_response_data = await get_bot_chat_response(
+                    user_id=user_id,
+                    user_input=query_to_send_to_gpt,
+                    current_context_messages=conversation_history,
+                    current_gender=current_gender,
+                    current_preferred_lang=current_preferred_lang,
+                    response_language=response_language,
+                    is_initial_message_after_start=is_initial_message_for_gpt,
+                    initial_user_query_to_process=None,
+                    custom_knowledge_context=custom_context,
+                    qa_turn=qa_turn,
+                )
 
     action = gpt_response_data.get("action")
     bot_reply_text = gpt_response_data.get("bot_reply")
@@ -521,17 +535,19 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
             config.user_greeting_stage[user_id] = 2
 
             # Get GPT response for the initial query
-            conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
-            initial_query_response = await get_bot_chat_response(
-                user_id=user_id,
-                user_input=initial_query,
-                current_context_messages=conversation_history,
-                current_gender=detected_gender_from_gpt or current_gender,
-                current_preferred_lang=current_preferred_lang,
-                response_language=response_language,
-                is_initial_message_after_start=False,
-                initial_user_query_to_process=None
-            )
+            async with span("history_load"):
+                conversation_history = await get_conversation_history_from_firestore(user_id, current_conversation_id, max_messages=10)
+            async with span("gpt_response"):
+                initial_query_response = await get_bot_chat_response(
+                    user_id=user_id,
+                    user_input=initial_query,
+                    current_context_messages=conversation_history,
+                    current_gender=detected_gender_from_gpt or current_gender,
+                    current_preferred_lang=current_preferred_lang,
+                    response_language=response_language,
+                    is_initial_message_after_start=False,
+                    initial_user_query_to_process=None
+                )
 
             initial_query_answer = initial_query_response.get("bot_reply", "")
 
@@ -717,14 +733,17 @@ async def _process_and_respond(user_id: str, user_name: str, user_input_to_proce
     cost = 0.0
     
     if user_input_to_process.strip() and not user_input_to_process.lower().startswith('/start'):
-        prompt_tokens = count_tokens(get_system_instruction(user_id, current_preferred_lang) + "\n\n" + user_input_to_process)
-        completion_tokens = count_tokens(bot_reply_text)
+        # Prefer the usage reported by OpenAI; estimate only when the reply didn't come from GPT
+        prompt_tokens = flow_meta.get("prompt_tokens") or count_tokens(get_system_instruction(user_id, current_preferred_lang) + "\n\n" + user_input_to_process)
+        completion_tokens = flow_meta.get("completion_tokens") or count_tokens(bot_reply_text)
         total_tokens = prompt_tokens + completion_tokens
         cost = (prompt_tokens / 1_000_000 * 5) + (completion_tokens / 1_000_000 * 15)
         print(f"[_process_and_respond] 🔹 Prompt tokens: {prompt_tokens}")
         print(f"[_process_and_respond] 🔹 Completion tokens: {completion_tokens}")
+        if flow_meta.get("cached_prompt_tokens"):
+            print(f"[_process_and_respond] 🔹 Cached prompt tokens: {flow_meta['cached_prompt_tokens']}")
         print(f"[_process_and_respond] 📊 Total tokens: {total_tokens} | 💰 Estimated cost: ${cost:.6f}\n")
-        save_for_training_conversation_log(user_input_to_process, bot_reply_text)
+        await blocking_executor.run_io(save_for_training_conversation_log, user_input_to_process, bot_reply_text)
     
     # 📊 ANALYTICS: Log bot's response with performance metrics
     response_time_ms = (time.time() - start_time) * 1000
@@ -4,9 +4,9 @@ import base64
 import json
 import asyncio
 from collections import deque
-import httpx # NEW: for downloading media in training mode
 
 import config
+from services.http_clients import get_http_client
 from utils.utils import save_for_training_conversation_log, notify_human_on_whatsapp, translate_qa_pair_with_gpt
 from services.photo_analysis_service import get_bot_photo_analysis_from_gpt
 from services.training_response_service import process_training_request_with_gpt
@@ -161,11 +161,11 @@ async def handle_training_input(user_id: str, user_name: str = "مدرب", user_
              await send_message_func(user_id, "وصلت لعدد الصور القصوى المسموحة في وضع التدريب أيضاً. يرجى الخروج من وضع التدريب أو التواصل مع المطور.")
              return
         try:
-            async with httpx.AsyncClient() as client:
-                photo_response = await client.get(image_url)
-                photo_response.raise_for_status()
-                photo_data_bytes = io.BytesIO(photo_response.content)
-                photo_data_bytes.seek(0)
+            client = get_http_client("media")
+            photo_response = await client.get(image_url)
+            photo_response.raise_for_status()
+            photo_data_bytes = io.BytesIO(photo_response.content)
+            photo_data_bytes.seek(0)
             base64_image = base64.b64encode(photo_data_bytes.read()).decode("utf-8")
 
             bot_initial_reply, analysis_data = await get_bot_photo_analysis_from_gpt(user_id, base64_image, is_training_quiz=True)
@@ -10,6 +10,7 @@ from pydantic import BaseModel, EmailStr
 from typing import Dict, Any, Optional, List
 
 from modules.core import app
+from services.blocking_executor import blocking_executor
 from services.user_service import user_service
 
 
@@ -78,7 +79,8 @@ async def login(request: LoginRequest):
     """
     try:
         user = await asyncio.wait_for(
-            asyncio.to_thread(user_service.authenticate, request.email, request.password),
+            # Firestore lookup + bcrypt check (12 rounds): keep both off the event loop
+            blocking_executor.run_cpu(user_service.authenticate, request.email, request.password),
             timeout=12.0
         )
 
@@ -121,7 +123,7 @@ async def validate_session(user_id: str):
     request their own user_id. Frontend currently sends only its own id from localStorage.
     """
     try:
-        user = user_service.get_user_by_id(user_id)
+        user = await blocking_executor.run_io(user_service.get_user_by_id, user_id)
 
         if not user:
             return {
@@ -157,7 +159,8 @@ async def change_password(request: ChangePasswordRequest):
     Requires current password for verification
     """
     try:
-        success = user_service.change_password(
+        success = await blocking_executor.run_cpu(
+            user_service.change_password,
             request.user_id,
             request.current_password,
             request.new_password
@@ -198,7 +201,7 @@ async def get_users():
     Admin only endpoint
     """
     try:
-        users = user_service.get_all_users()
+        users = await blocking_executor.run_io(user_service.get_all_users)
         return {
             "success": True,
             "users": users
@@ -228,7 +231,7 @@ async def create_user(request: CreateUserRequest, created_by: Optional[str] = No
             "status": request.status
         }
 
-        user = user_service.create_user(user_data, created_by)
+        user = await blocking_executor.run_cpu(user_service.create_user, user_data, created_by)
 
         return {
             "success": True,
@@ -269,7 +272,7 @@ async def update_user(user_id: str, request: UpdateUserRequest):
         if request.password is not None:
             updates['password'] = request.password
 
-        user = user_service.update_user(user_id, updates)
+        user = await blocking_executor.run_cpu(user_service.update_user, user_id, updates)
 
         return {
             "success": True,
@@ -297,7 +300,7 @@ async def delete_user(user_id: str):
     Admin only endpoint
     """
     try:
-        success = user_service.delete_user(user_id)
+        success = await blocking_executor.run_io(user_service.delete_user, user_id)
 
         if success:
             return {
@@ -10,7 +10,7 @@ import tempfile
 import os
 import io
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from fastapi import File, UploadFile, Form
 import httpx
@@ -121,6 +121,14 @@ async def switch_provider(request: ProviderSwitchRequest):
         return {"success": False, "error": str(e)}
 
 
+@app.post("/api/reference-data/invalidate")
+async def invalidate_reference_data(endpoint: Optional[str] = None):
+    """Drop cached CRM reference data (branches, services, machines, clinic_hours, pricing) after a CRM change."""
+    from services.reference_data_cache import reference_data_cache
+    dropped = await reference_data_cache.invalidate(endpoint)
+    return {"success": True, "endpoint": endpoint or "all", "dropped": dropped, "worker_pid": os.getpid()}
+
+
 @app.post("/api/test-message")
 async def test_message(request: TestMessageRequest):
     """Send a test message through the bot"""
@@ -27,6 +27,16 @@ from services.daily_template_dispatcher import daily_template_dispatcher
 @app.on_event("startup")
 async def startup_event():
     """Initialize MontyMobile as the default WhatsApp provider on startup"""
+    # Bounded pool for asyncio.to_thread + blocking-call watchdog (before anything else runs)
+    try:
+        from services.blocking_executor import blocking_executor
+        from services.loop_monitor import event_loop_monitor
+        blocking_executor.install_default()
+        if config.EVENT_LOOP_MONITOR_ENABLED:
+            event_loop_monitor.start()
+    except Exception as e:
+        print(f"⚠️ Could not start event-loop monitor: {e}")
+
     try:
         print("=" * 60)
         print("🚀 INITIALIZING WHATSAPP PROVIDER")
@@ -213,44 +223,31 @@ async def startup_event():
                             approved_messages = message_preview_service.get_pending_messages(status='approved')
                             print(f"\n Sending {approved_count} approved messages...")
 
-                            for msg in approved_messages:
-                                try:
-                                    phone = msg.get('customer_phone')
-                                    content = msg.get('rendered_content')
-                                    message_id = msg.get('message_id')
-                                    template_id = msg.get('template_id', 'smart_message')
-                                    customer_name = msg.get('customer_name', 'Customer')
-
-                                    if phone and content:
-                                        # Send using WhatsApp adapter
-                                        from services.whatsapp_adapters.whatsapp_factory import WhatsAppFactory
-                                        adapter = WhatsAppFactory.get_adapter()
-                                        result = await adapter.send_text_message(phone, content)
-
-                                        if result.get('success'):
-                                            message_preview_service.mark_as_sent(message_id)
-                                            smart_messaging.mark_messages_sent_by_phone(phone, template_id)
-                                            print(f"   Sent message {message_id} to {phone}")
-
-                                            # Save to conversation history for continuous context
-                                            await save_conversation_message_to_firestore(
-                                                user_id=phone,
-                                                role="ai",
-                                                text=content,
-                                                conversation_id=None,  # Will create/continue conversation
-                                                user_name=customer_name,
-                                                phone_number=phone,
-                                                metadata={
-                                                    "source": "smart_message",
-                                                    "type": template_id,
-                                                    "message_id": message_id
-                                                }
-                                            )
-                                            print(f"   💾 Saved smart message to conversation history for {phone}")
-                                        else:
-                                            print(f"   Failed to send {message_id}: {result.get('error')}")
-                                except Exception as send_error:
-                                    print(f"   Error sending message: {send_error}")
+                            from services.smart_message_sender import smart_message_sender
+
+                            def _approved_sent(msg):
+                                message_preview_service.mark_as_sent(msg['message_id'])
+                                smart_messaging.mark_messages_sent_by_phone(msg['phone'], msg['type'])
+
+                            report = await smart_message_sender.send_batch(
+                                [
+                                    {
+                                        'phone': msg.get('customer_phone'),
+                                        'content': msg.get('rendered_content'),
+                                        'message_id': msg.get('message_id'),
+                                        'type': msg.get('template_id', 'smart_message'),
+                                        'customer_name': msg.get('customer_name', 'Customer'),
+                                    }
+                                    for msg in approved_messages
+                                    if msg.get('customer_phone') and msg.get('rendered_content')
+                                ],
+                                on_sent=_approved_sent,
+                                batch="approved",
+                            )
+                            print(
+                                f"   Approved batch: {report['sent']} sent, {report['failed']} failed "
+                                f"in {report['duration_seconds']}s"
+                            )
 
                     except Exception as preview_error:
                         print(f"Error checking preview queue: {preview_error}")
@@ -273,66 +270,22 @@ async def startup_event():
                 print(f"Found {len(messages_to_send)} messages READY TO SEND")
                 print("=" * 80)
 
-                # Send each message
-                from services.whatsapp_adapters.whatsapp_factory import WhatsAppFactory
-                adapter = WhatsAppFactory.get_adapter()
-                sent_count = 0
-                failed_count = 0
-
-                for i, msg in enumerate(messages_to_send, 1):
-                    phone = msg.get('phone')
-                    content = msg.get('content')
-                    msg_type = msg.get('type')
-                    message_id = msg.get('message_id')
-                    customer_name = msg.get('customer_name', 'Customer')
-
-                    print(f"\n📤 Sending Message #{i}:")
-                    print(f"   ID: {message_id}")
-                    print(f"   Type: {msg_type}")
-                    print(f"   To: {phone}")
-                    print(f"   Content: {content[:100]}{'...' if len(content) > 100 else ''}")
-
-                    try:
-                        # Actually send the message
-                        result = await adapter.send_text_message(phone, content)
-
-                        if result.get('dry_run'):
-                            sent_count += 1
-                            smart_messaging.mark_message_dry_run(message_id)
-                            print(f"   📋 Dry-run (would send)")
-                        elif result.get('success'):
-                            sent_count += 1
-                            smart_messaging.mark_message_sent(message_id)
-                            print(f"   ✅ Sent successfully")
-
-                            # Save to conversation history for continuous context
-                            await save_conversation_message_to_firestore(
-                                user_id=phone,
-                                role="ai",
-                                text=content,
-                                conversation_id=None,
-                                user_name=customer_name,
-                                phone_number=phone,
-                                metadata={
-                                    "source": "smart_message",
-                                    "type": msg_type,
-                                    "message_id": message_id
-                                }
-                            )
-                            print(f"   💾 Saved to conversation history")
-                        else:
-                            failed_count += 1
-                            error_msg = result.get('error', 'Unknown error')
-                            smart_messaging.mark_message_failed(message_id, error_msg)
-                            print(f"   ❌ Failed to send: {error_msg}")
-
-                    except Exception as send_error:
-                        failed_count += 1
-                        smart_messaging.mark_message_failed(message_id, str(send_error))
-                        print(f"   ❌ Error sending: {send_error}")
+                from services.smart_message_sender import smart_message_sender
+                report = await smart_message_sender.send_batch(
+                    messages_to_send,
+                    on_sent=lambda msg: smart_messaging.mark_message_sent(msg['message_id']),
+                    on_failed=lambda msg, error: smart_messaging.mark_message_failed(msg['message_id'], error),
+                    on_dry_run=lambda msg: smart_messaging.mark_message_dry_run(msg['message_id']),
+                    batch="scheduled",
+                )
+                sent_count = report['sent'] + report['dry_run']
+                failed_count = report['failed']
 
                 print("\n" + "=" * 80)
-                print(f"Send complete: {sent_count} sent, {failed_count} failed")
+                print(
+                    f"Send complete: {sent_count} sent, {failed_count} failed "
+                    f"in {report['duration_seconds']}s ({report['messages_per_second']} msg/s)"
+                )
                 print("=" * 80)
 
             except Exception as e:
@@ -425,7 +378,7 @@ async def startup_event():
                                 else:
                                     print(f"✅ Sent missed yesterday message to {customer_phone}")
 
-                                    # Sync in-memory scheduled_messages dict
+                                    # Sync the scheduled messages store
                                     smart_messaging.mark_messages_sent_by_phone(customer_phone, "missed_yesterday")
 
                                     # Save to conversation history for continuous context
@@ -518,7 +471,7 @@ async def startup_event():
                                 else:
                                     print(f"✅ Sent missed this month message to {customer_phone}")
 
-                                    # Sync in-memory scheduled_messages dict
+                                    # Sync the scheduled messages store
                                     smart_messaging.mark_messages_sent_by_phone(customer_phone, "missed_this_month")
 
                                     # Save to conversation history for continuous context
@@ -625,11 +578,22 @@ async def startup_event():
             replace_existing=True
         )
 
-        scheduler.start()
-
-        print("\n🚀 Running initial daily template dispatcher check...")
-        asyncio.create_task(run_daily_template_dispatcher_job())
-        print("✅ Initial dispatcher check queued")
+        # Only one worker runs the jobs: the scheduler starts paused and the elected leader
+        # resumes it (another worker takes over if the leader dies).
+        def _scheduler_elected():
+            scheduler.resume()
+            print("\n🚀 Running initial daily template dispatcher check...")
+            asyncio.create_task(run_daily_template_dispatcher_job())
+            print("✅ Initial dispatcher check queued")
+
+        if config.SCHEDULER_LEADER_ELECTION_ENABLED:
+            from services.scheduler_leader import scheduler_leader
+            scheduler.start(paused=True)
+            scheduler_leader.start(on_elected=_scheduler_elected, on_demoted=scheduler.pause)
+            print(f"🗳️ Scheduler leader election started (worker {scheduler_leader.worker_id}, {scheduler_leader.backend})")
+        else:
+            scheduler.start()
+            _scheduler_elected()
 
         print("✅ Smart Messaging Scheduler started successfully")
         print("📅 Scheduled jobs:")
@@ -646,10 +610,33 @@ async def startup_event():
         import traceback
         traceback.print_exc()
 
+    # Live Chat index: backfill from Firestore once (in background) so list views skip full scans
+    try:
+        from services.live_chat_service import live_chat_service
+        await live_chat_service.ensure_chat_index()
+    except Exception as e:
+        print(f"⚠️ Live Chat index warm-up skipped: {e}")
+
+    # Media cache: drop partial downloads left by a worker that died mid-stream
+    try:
+        from services.media_cache import media_cache
+        removed = await asyncio.to_thread(media_cache.cleanup_tmp)
+        if removed:
+            print(f"🧹 Removed {removed} partial media cache downloads")
+    except Exception as e:
+        print(f"⚠️ Media cache cleanup skipped: {e}")
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    try:
+        if config.SCHEDULER_LEADER_ELECTION_ENABLED:
+            from services.scheduler_leader import scheduler_leader
+            await scheduler_leader.stop()
+    except Exception as e:
+        print(f"❌ Error releasing scheduler leadership: {e}")
+
     try:
         if hasattr(app.state, 'scheduler'):
             print("🛑 Shutting down Smart Messaging Scheduler...")
@@ -657,3 +644,48 @@ async def shutdown_event():
             print("✅ Scheduler shut down successfully")
     except Exception as e:
         print(f"❌ Error shutting down scheduler: {e}")
+
+    # History writes use Redis/Firestore and the offload pool: drain them before those are closed
+    try:
+        from services.smart_message_sender import smart_message_history
+        await smart_message_history.drain(timeout=10)
+    except Exception as e:
+        print(f"❌ Error draining smart message history writes: {e}")
+
+    try:
+        from services.live_chat_sse_broadcaster import live_chat_sse_broadcaster
+        await live_chat_sse_broadcaster.close()
+    except Exception as e:
+        print(f"❌ Error stopping Live Chat SSE subscriber: {e}")
+
+    try:
+        from services.reference_data_cache import reference_data_cache
+        await reference_data_cache.close()
+    except Exception as e:
+        print(f"❌ Error stopping reference data invalidation subscriber: {e}")
+
+    try:
+        from services.redis_client import close_redis
+        await close_redis()
+    except Exception as e:
+        print(f"❌ Error closing Redis client: {e}")
+
+    try:
+        from services.blocking_executor import blocking_executor
+        from services.loop_monitor import event_loop_monitor
+        await event_loop_monitor.stop()
+        blocking_executor.shutdown()
+    except Exception as e:
+        print(f"❌ Error stopping offload pools: {e}")
+
+    try:
+        from services.analytics_events import analytics
+        analytics.writer.close()
+    except Exception as e:
+        print(f"❌ Error flushing analytics events: {e}")
+
+    try:
+        from services.http_clients import close_http_clients
+        await close_http_clients()
+    except Exception as e:
+        print(f"❌ Error closing outbound HTTP clients: {e}")
@@ -44,12 +44,10 @@ async def _load_initial_sse_payload():
 
 async def broadcast_sse_event(event_type: str, data: dict):
     """
-    Broadcast an event to all connected SSE clients.
+    Broadcast an event to all connected SSE clients (on every worker).
     Called when new messages arrive or conversations change.
     """
     client_count = await live_chat_sse_broadcaster.active_clients_count()
-    if client_count == 0:
-        return
     _log_sse("broadcast", event_type=event_type, client_count=client_count, conv_id=data.get("conversation_id"))
     if event_type == "new_message":
         print(f"📡 [SSE] broadcast new_message conv_id={data.get('conversation_id')} user_id={data.get('user_id')}")
@@ -67,11 +65,19 @@ async def live_chat_events(request: Request):
     - new_message: New message in a conversation
     - new_conversation: New conversation created
     - heartbeat: Keep-alive ping every 30s
+
+    Reconnecting clients send the last event id (Last-Event-ID header or ?last_event_id=)
+    and receive the events they missed instead of the full conversation list.
     """
-    _log_sse("client_connect")
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    _log_sse("client_connect", last_event_id=last_event_id)
     print("📡 [SSE] client connected")
     return StreamingResponse(
-        live_chat_sse_broadcaster.stream(request, initial_payload_loader=_load_initial_sse_payload),
+        live_chat_sse_broadcaster.stream(
+            request,
+            initial_payload_loader=_load_initial_sse_payload,
+            last_event_id=last_event_id,
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -241,6 +247,35 @@ async def get_live_chat_metrics():
         }
 
 
+@app.get("/api/live-chat/index/status")
+async def get_chat_index_status():
+    """Materialized chat list index status (rows, last full build)"""
+    try:
+        from services.chat_index_service import chat_index_service
+        return {"success": True, **chat_index_service.stats()}
+    except Exception as e:
+        print(f"❌ Error in get_chat_index_status: {e}")
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+@app.post("/api/live-chat/index/rebuild")
+async def rebuild_chat_index():
+    """Rebuild the chat list index from Firestore (full scan, use after manual data fixes)"""
+    try:
+        return await live_chat_service.rebuild_chat_index()
+    except Exception as e:
+        print(f"❌ Error in rebuild_chat_index: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
 @app.get("/api/live-chat/faq-match-context")
 async def get_faq_match_context(
     user_id: str = Query(..., description="User ID"),
@@ -390,6 +425,9 @@ async def debug_firestore():
             for conv_doc in conversations_docs:
                 conv_data = conv_doc.to_dict()
                 messages = conv_data.get("messages", [])
+                if conv_data.get("storage_mode") == "subcollection":
+                    # Header document: messages live in a subcollection, keep a recent tail only
+                    messages = conv_data.get("recent_messages", [])
                 status = conv_data.get("status", "active")
 
                 last_message_time = None
@@ -421,7 +459,7 @@ async def debug_firestore():
 
                 conversations_info.append({
                     "id": conv_doc.id,
-                    "message_count": len(messages),
+                    "message_count": conv_data.get("message_count", len(messages)),
                     "status": status,
                     "hours_ago": round(hours_ago, 1) if hours_ago else None,
                     "human_takeover": conv_data.get("human_takeover_active", False)
@@ -2,18 +2,103 @@
 """
 Media API module: Audio and media proxy endpoints
 Handles proxying external audio URLs to avoid CORS issues in the browser.
+Local files and cached proxied audio are served with Range / ETag support (browsers seek in
+audio with Range requests); proxied audio is streamed and cached on disk (services/media_cache.py).
 """
 
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import anyio
 import httpx
 from fastapi import Query, Request
-from fastapi.responses import Response, FileResponse
+from fastapi.responses import Response, FileResponse, StreamingResponse
 
 from modules.core import app
+from services.http_clients import get_http_client
+from services.media_cache import media_cache
 from services.media_service import (
     resolve_media_file_path,
     get_media_content_type,
 )
 
+_FILE_CHUNK_SIZE = 64 * 1024
+
+# CORS-friendly headers for proxied audio
+_PROXY_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, OPTIONS",
+    "Access-Control-Allow-Headers": "*",
+    "Cache-Control": "public, max-age=3600",  # Cache for 1 hour
+}
+
+
+def _parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) of a single "bytes=" range. None means "send the whole file"
+    (no/unsupported/multi-range header); start >= size means the range is not satisfiable.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            return (max(0, size - length), size - 1) if length > 0 else (size, size)
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return size, size
+    if end < start:
+        return None
+    return start, end
+
+
+async def _iter_file_range(path: Path, start: int, end: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(_FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _file_response(
+    request: Request, path: Path, media_type: str, etag: str, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """Serve a local file honouring HEAD, If-None-Match and single byte Range requests."""
+    size = path.stat().st_size
+    headers = {**(headers or {}), "ETag": etag, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_byte_range(range_header, size)
+
+    if byte_range is None:
+        if request.method == "HEAD":
+            return Response(status_code=200, media_type=media_type, headers={**headers, "Content-Length": str(size)})
+        return FileResponse(str(path), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    if start >= size:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    if request.method == "HEAD":
+        return Response(status_code=206, media_type=media_type, headers=headers)
+    return StreamingResponse(_iter_file_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
 
 @app.api_route("/api/media/serve/{filename}", methods=["GET", "HEAD"])
 async def serve_media_file(filename: str, request: Request):
@@ -23,28 +108,18 @@ async def serve_media_file(filename: str, request: Request):
         return Response(content="File not found", status_code=404)
 
     media_type = get_media_content_type(filename)
-
-    file_size = file_path.stat().st_size
-
-    if request.method == "HEAD":
-        return Response(
-            status_code=200,
-            headers={
-                "Content-Type": media_type,
-                "Content-Length": str(file_size),
-                "Accept-Ranges": "bytes",
-            }
-        )
-
-    return FileResponse(str(file_path), media_type=media_type)
+    stat = file_path.stat()
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    return _file_response(request, file_path, media_type, etag)
 
 
 @app.get("/api/media/audio")
-async def proxy_audio(url: str = Query(..., description="The audio URL to proxy")):
+async def proxy_audio(request: Request, url: str = Query(..., description="The audio URL to proxy")):
     """
     Proxy audio from external URLs to avoid CORS issues.
     This endpoint fetches audio from WhatsApp/MontyMobile/Firebase and serves it
-    with proper headers for browser playback.
+    with proper headers for browser playback. The first play streams the upstream body while
+    caching it on disk; later plays (and Range requests) are served from the cache.
     """
     try:
         # Use URL as-is (FastAPI already decodes query params once)
@@ -58,52 +133,52 @@ async def proxy_audio(url: str = Query(..., description="The audio URL to proxy"
                 media_type="text/plain"
             )
 
-        # Fetch the audio from the external URL
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
-            response = await client.get(decoded_url)
-
-            if response.status_code != 200:
-                print(f"Failed to fetch audio from {decoded_url}: {response.status_code}")
-                return Response(
-                    content="Failed to fetch audio",
-                    status_code=response.status_code,
-                    media_type="text/plain"
-                )
-
-            # Determine content type from response or default to audio/ogg
-            content_type = response.headers.get("content-type", "audio/ogg")
-
-            # Common audio content types
-            if "audio" not in content_type.lower():
-                # Try to infer from URL
-                if ".mp3" in decoded_url.lower():
-                    content_type = "audio/mpeg"
-                elif ".ogg" in decoded_url.lower():
-                    content_type = "audio/ogg"
-                elif ".opus" in decoded_url.lower():
-                    content_type = "audio/opus"
-                elif ".wav" in decoded_url.lower():
-                    content_type = "audio/wav"
-                elif ".m4a" in decoded_url.lower():
-                    content_type = "audio/mp4"
-                elif ".webm" in decoded_url.lower():
-                    content_type = "audio/webm"
-                else:
-                    content_type = "audio/ogg"  # Default for WhatsApp voice messages
+        cached = await media_cache.lookup(decoded_url)
+        if cached is not None:
+            return _file_response(request, cached.path, cached.content_type, cached.etag, _PROXY_HEADERS)
+
+        # Fetch the audio from the external URL (streamed, not buffered in memory)
+        client = get_http_client("media")
+        response = await client.send(client.build_request("GET", decoded_url), stream=True)
 
-            # Return the audio with CORS-friendly headers
+        if response.status_code != 200:
+            await response.aclose()
+            print(f"Failed to fetch audio from {decoded_url}: {response.status_code}")
             return Response(
-                content=response.content,
-                status_code=200,
-                media_type=content_type,
-                headers={
-                    "Access-Control-Allow-Origin": "*",
-                    "Access-Control-Allow-Methods": "GET, OPTIONS",
-                    "Access-Control-Allow-Headers": "*",
-                    "Cache-Control": "public, max-age=3600",  # Cache for 1 hour
-                }
+                content="Failed to fetch audio",
+                status_code=response.status_code,
+                media_type="text/plain"
             )
 
+        try:
+            content_type = _audio_content_type(response.headers.get("content-type", "audio/ogg"), decoded_url)
+            headers = dict(_PROXY_HEADERS)
+            expected_size = None
+            if "content-encoding" not in response.headers:
+                expected_size = _content_length(response.headers.get("content-length"))
+            if expected_size is not None:
+                headers["Content-Length"] = str(expected_size)
+            writer = media_cache.writer(decoded_url, content_type)
+        except BaseException:
+            await response.aclose()  # the streamed body is only closed by stream_and_cache below
+            raise
+
+        async def stream_and_cache():
+            complete = False
+            try:
+                async for chunk in response.aiter_bytes():
+                    await writer.write(chunk)
+                    yield chunk
+                complete = expected_size is None or writer.size == expected_size
+            finally:
+                await response.aclose()
+                if complete:
+                    await writer.commit()
+                else:
+                    await writer.abort()
+
+        return StreamingResponse(stream_and_cache(), status_code=200, media_type=content_type, headers=headers)
+
     except httpx.TimeoutException:
         print(f"Timeout fetching audio from {url}")
         return Response(
@@ -118,3 +193,33 @@ async def proxy_audio(url: str = Query(..., description="The audio URL to proxy"
             status_code=500,
             media_type="text/plain"
         )
+
+
+def _content_length(value: Optional[str]) -> Optional[int]:
+    """Upstream Content-Length, or None when it is missing or malformed (then it is not forwarded)."""
+    try:
+        size = int(value) if value is not None else None
+    except ValueError:
+        return None
+    return size if size is not None and size >= 0 else None
+
+
+def _audio_content_type(content_type: str, url: str) -> str:
+    """Upstream content type, or one inferred from the URL when it is not an audio type."""
+    # Common audio content types
+    if "audio" in content_type.lower():
+        return content_type
+    # Try to infer from URL
+    if ".mp3" in url.lower():
+        return "audio/mpeg"
+    elif ".ogg" in url.lower():
+        return "audio/ogg"
+    elif ".opus" in url.lower():
+        return "audio/opus"
+    elif ".wav" in url.lower():
+        return "audio/wav"
+    elif ".m4a" in url.lower():
+        return "audio/mp4"
+    elif ".webm" in url.lower():
+        return "audio/webm"
+    return "audio/ogg"  # Default for WhatsApp voice messages
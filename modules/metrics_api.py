@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Metrics API - Prometheus scrape endpoint and JSON runtime stats for the dashboard.
+Each gunicorn worker reports its own counters.
+"""
+
+import asyncio
+
+from fastapi import Response
+
+from modules.core import app
+from services.analytics_events import analytics
+from services.blocking_executor import blocking_executor
+from services.http_clients import http_client_stats
+from services.live_chat_sse_broadcaster import live_chat_sse_broadcaster
+from services.loop_monitor import event_loop_monitor
+from services.media_cache import media_cache
+from services.metrics import CONTENT_TYPE_LATEST, render_latest
+from services.message_dispatcher import message_dispatcher
+from services.prompt_builder import system_prompt_builder
+from services.reference_data_cache import reference_data_cache
+from services.scheduler_leader import scheduler_leader
+from services.smart_message_sender import smart_message_sender
+from services.webhook_dedup import webhook_deduplicator
+
+
+@app.get("/api/metrics")
+async def get_prometheus_metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(content=render_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/metrics/webhooks")
+async def get_webhook_metrics():
+    """Webhook dedup rates per provider and inbound queue depth / LLM concurrency."""
+    return {
+        "success": True,
+        "data": {"dedup": webhook_deduplicator.stats(), "dispatcher": message_dispatcher.stats()},
+    }
+
+
+@app.get("/api/metrics/prompt")
+async def get_prompt_metrics():
+    """System prompt section sizes and the share of prompt tokens served from OpenAI's cache."""
+    return {"success": True, "data": system_prompt_builder.stats()}
+
+
+@app.get("/api/metrics/event-loop")
+async def get_event_loop_metrics():
+    """Event-loop stalls (with the blocking stack) and offload pool usage."""
+    return {
+        "success": True,
+        "data": {"event_loop": event_loop_monitor.stats(), "offload": blocking_executor.stats()},
+    }
+
+
+@app.get("/api/metrics/analytics")
+async def get_analytics_pipeline_metrics():
+    """Analytics event writer (queued / dropped / late events) and daily rollup state."""
+    return {
+        "success": True,
+        "data": {"writer": analytics.writer.stats(), "rollups": analytics.rollups.stats()},
+    }
+
+
+@app.get("/api/metrics/smart-messages")
+async def get_smart_message_sender_metrics():
+    """Smart message sender: rate limit, current/recent batches and history write queue."""
+    return {"success": True, "data": smart_message_sender.stats()}
+
+
+@app.get("/api/metrics/scheduler")
+async def get_scheduler_leader_metrics():
+    """Which worker currently runs the scheduler jobs, and this worker's view of the election."""
+    return {"success": True, "data": await scheduler_leader.describe()}
+
+
+@app.get("/api/metrics/live-chat-sse")
+async def get_live_chat_sse_metrics():
+    """Live Chat SSE fan-out: connected/lagging clients, queue depth, drops, resyncs and replays."""
+    return {"success": True, "data": live_chat_sse_broadcaster.stats()}
+
+
+@app.get("/api/metrics/reference-data")
+async def get_reference_data_cache_metrics():
+    """CRM reference-data cache: entries, freshness and hit/stale/miss counts per endpoint."""
+    return {"success": True, "data": reference_data_cache.stats()}
+
+
+@app.get("/api/metrics/caches")
+async def get_cache_metrics():
+    """Bounded in-process caches (customer resolution, user preferences): size, hits and evictions."""
+    from services.customer_identity_service import _external_resolve_cache
+    from services.user_persistence_service import user_persistence
+
+    caches = [_external_resolve_cache, user_persistence._gender_cache, user_persistence._language_cache]
+    return {"success": True, "data": {cache.name: cache.stats() for cache in caches}}
+
+
+@app.get("/api/metrics/http-clients")
+async def get_http_client_metrics():
+    """Shared outbound HTTP clients: pool limits and active/idle/queued connections per client."""
+    return {"success": True, "data": http_client_stats()}
+
+
+@app.get("/api/metrics/media-cache")
+async def get_media_cache_metrics():
+    """Disk cache of proxied dashboard audio: files, bytes used and the size limit."""
+    return {"success": True, "data": await asyncio.to_thread(media_cache.stats)}
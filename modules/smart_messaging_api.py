@@ -639,9 +639,13 @@ async def get_scheduler_status():
                 statistics["by_type"][msg_type] = {"scheduled": 0, "sent": 0}
             statistics["by_type"][msg_type]["sent"] += 1
         
+        from services.scheduler_leader import scheduler_leader
+        leader = await scheduler_leader.describe()
+
         return {
             "success": True,
             "scheduler_running": scheduler_running,
+            "scheduler_leader": leader,
             "scheduled_jobs": scheduled_jobs,
             "statistics": statistics,
             "last_check": datetime.now().isoformat()
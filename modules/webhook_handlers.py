@@ -13,7 +13,7 @@ import time
 from typing import Dict, Any, Optional
 
 from fastapi import Request, HTTPException
-import httpx
+from fastapi.responses import JSONResponse
 
 from modules.core import app, whatsapp_api_client, dashboard_bot_responses
 from modules.models import WebhookRequest
@@ -22,16 +22,16 @@ from config import WHATSAPP_API_TOKEN
 from services.whatsapp_adapters.whatsapp_factory import WhatsAppFactory
 from utils.utils import get_firestore_db, set_human_takeover_status
 from services.api_integrations import log_report_event
+from services.state_store import user_state_store
+from services.webhook_dedup import webhook_deduplicator
+from services.message_dispatcher import message_dispatcher
+from services.http_clients import get_http_client
+from services.tracing import record_span, span, start_trace
 from handlers.text_handlers import handle_message, start_command, _delayed_processing_tasks
 from handlers.photo_handlers import handle_photo_message
 from handlers.voice_handlers import handle_voice_message
 from handlers.training_handlers import start_training_mode, exit_training_mode
 
-# Webhook deduplication cache: {message_id: timestamp}
-# Prevents processing the same webhook multiple times within a time window
-_webhook_dedup_cache = {}
-WEBHOOK_DEDUP_WINDOW_SECONDS = 60  # Consider duplicate if received within 60 seconds (Qiscus can send duplicates up to 15+ seconds apart)
-
 
 @app.get("/webhook")
 async def verify_webhook(request: Request):
@@ -92,34 +92,35 @@ async def receive_webhook(request: Request):
             print("Trying Meta fallback parser...")
             parsed_message = await handle_meta_webhook(webhook_data)
         
-        # Check for duplicate webhooks
+        # Check for duplicate webhooks (shared across workers when Redis is configured)
         if parsed_message:
             message_id = parsed_message.get("message_id", "")
-            current_time = time.time()
-            
-            # Clean up old entries (older than dedup window)
-            expired_keys = [k for k, v in _webhook_dedup_cache.items() if current_time - v > WEBHOOK_DEDUP_WINDOW_SECONDS]
-            for k in expired_keys:
-                del _webhook_dedup_cache[k]
-            
-            # Check if this message was recently processed
-            if message_id and message_id in _webhook_dedup_cache:
-                time_since_last = current_time - _webhook_dedup_cache[message_id]
+            time_since_last = await webhook_deduplicator.is_duplicate(current_provider, message_id)
+            if time_since_last is not None:
                 print(f"⚠️ DUPLICATE WEBHOOK DETECTED: message_id={message_id} (received {time_since_last:.2f}s ago)")
                 print(f"Skipping duplicate processing to prevent duplicate image analysis")
                 return {"status": "skipped", "reason": "duplicate_webhook", "message_id": message_id}
-            
-            # Record this message as processed
             if message_id:
-                _webhook_dedup_cache[message_id] = current_time
                 print(f"✅ Webhook recorded in dedup cache: {message_id}")
         
         if parsed_message:
             print(f"Processing parsed message: {parsed_message}")
             # IMPORTANT: Process in background so we return 200 immediately.
             # MontyMobile throttles/backs off if webhook responses are slow.
-            asyncio.ensure_future(process_parsed_message(parsed_message, adapter))
-            print("Message queued for processing (background)")
+            # Messages from the same user are processed one at a time, in arrival order.
+            from utils.utils import get_canonical_user_id_and_phone
+            mailbox_key, _ = get_canonical_user_id_and_phone(parsed_message["user_id"], parsed_message.get("phone_number"))
+            parsed_message["_received_at"] = time.perf_counter()
+            if message_dispatcher.submit(mailbox_key, lambda: process_parsed_message(parsed_message, adapter)):
+                print("Message queued for processing (background)")
+            else:
+                # Not queued: let the provider's retry through the dedup check and ask for one
+                await webhook_deduplicator.release(current_provider, parsed_message.get("message_id", ""))
+                return JSONResponse(
+                    status_code=503,
+                    content={"status": "error", "queued": False, "reason": "overloaded"},
+                    headers={"Retry-After": "5"},
+                )
         else:
             print("ERROR: Could not parse webhook from any provider")
 
@@ -175,6 +176,27 @@ def extract_meta_message_content(message) -> Dict[str, Any]:
 
 
 async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
+    """
+    Process a parsed message with the user's shared state (greeting/booking/takeover progress)
+    loaded from the state store first and saved back afterwards, so any worker can handle it.
+    """
+    from utils.utils import get_canonical_user_id_and_phone
+
+    canonical_user_id, _ = get_canonical_user_id_and_phone(parsed_message["user_id"], parsed_message.get("phone_number"))
+    received_at = parsed_message.pop("_received_at", None)
+    with start_trace("inbound", started_at=received_at, message_type=parsed_message.get("type")):
+        if received_at is not None:
+            record_span("queue_wait", time.perf_counter() - received_at, received_at)
+        async with span("state_load"):
+            await user_state_store.load(canonical_user_id)
+        try:
+            await _process_parsed_message(parsed_message, adapter)
+        finally:
+            async with span("state_save"):
+                await user_state_store.save(canonical_user_id)
+
+
+async def _process_parsed_message(parsed_message: Dict[str, Any], adapter):
     """Process a parsed message regardless of provider. Uses normalized phone as canonical user_id to prevent duplicates."""
     from utils.phone_utils import normalize_phone, is_phone_like_user_id
     from utils.utils import get_canonical_user_id_and_phone
@@ -207,7 +229,8 @@ async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
     defer_external = message_type == "text" and bool(normalized_phone)
     if normalized_phone and not defer_external:
         try:
-            external = await resolve_customer_from_external(normalized_phone)
+            async with span("crm_lookup"):
+                external = await resolve_customer_from_external(normalized_phone)
             print(f"DEBUG: external_lookup normalized_phone={normalized_phone} exists={external.get('exists')} name={external.get('name')}")
             if external.get("exists") and external.get("name"):
                 config.user_names[user_id] = external["name"]
@@ -231,13 +254,15 @@ async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
         # Resolve CRM name in background (user message will show in Live Chat immediately)
         async def _set_name_from_external():
             try:
-                ext = await resolve_customer_from_external(normalized_phone)
+                async with span("crm_lookup_deferred"):
+                    ext = await resolve_customer_from_external(normalized_phone)
                 if ext.get("exists") and ext.get("name"):
                     config.user_names[user_id] = ext["name"]
                 else:
                     config.user_names.pop(user_id, None)
                 if ext.get("gender") and ext["gender"] in ("male", "female"):
                     config.user_gender[user_id] = ext["gender"]
+                await user_state_store.save(user_id, ("user_names", "user_gender"))
             except Exception:
                 pass
         asyncio.create_task(_set_name_from_external())
@@ -278,7 +303,8 @@ async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
         try:
             from utils.utils import get_user_state_from_firestore
             print(f"🔄 Attempting to restore user state from Firestore for {user_id}...")
-            firestore_state = await get_user_state_from_firestore(user_id)
+            async with span("firestore_restore"):
+                firestore_state = await get_user_state_from_firestore(user_id)
             print(f"🔍 DEBUG: Firestore returned state: {firestore_state}")
 
             if firestore_state:
@@ -321,7 +347,8 @@ async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
     
     if is_new_user:
         print(f"🆕 NEW USER detected: {user_id}, calling start_command_whatsapp...")
-        await start_command_whatsapp(user_id, user_name)
+        async with span("start_command"):
+            await start_command_whatsapp(user_id, user_name)
     else:
         print(f"👤 EXISTING USER: {user_id}, skipping start_command_whatsapp")
 
@@ -356,27 +383,32 @@ async def process_parsed_message(parsed_message: Dict[str, Any], adapter):
             else:
                 await adapter.send_text_message(user_id, "لا توجد محادثة جارية لإلغاء التحكم البشري عليها.")
         else:
-            await handle_message_whatsapp_with_adapter(user_id, user_input_text, user_name, adapter, phone_number)
+            async with span("text_buffer"):
+                await handle_message_whatsapp_with_adapter(user_id, user_input_text, user_name, adapter, phone_number)
             
     elif message_type == "image":
         image_id = content.get("image_id")
         if image_id:
             # Process image with GPT-4 Vision analysis for all providers
             print(f"DEBUG: Image received - processing with GPT-4 Vision analysis")
-            await handle_photo_message_whatsapp_with_adapter(user_id, image_id, user_name, adapter)
+            async with message_dispatcher.llm_slot(), span("photo_pipeline"):
+                await handle_photo_message_whatsapp_with_adapter(user_id, image_id, user_name, adapter)
             
     elif message_type == "audio":
         audio_id = content.get("audio_id")
         if audio_id:
-            await handle_voice_message_whatsapp_with_adapter(user_id, audio_id, user_name, adapter)
+            async with message_dispatcher.llm_slot(), span("voice_pipeline"):
+                await handle_voice_message_whatsapp_with_adapter(user_id, audio_id, user_name, adapter)
             
     elif message_type == "file_attachment":
         file_url = content.get("image_id") or content.get("audio_id") or content.get("document_id")
         if file_url:
             if content.get("image_id"):
-                await handle_photo_message_whatsapp_with_adapter(user_id, file_url, user_name, adapter)
+                async with message_dispatcher.llm_slot(), span("photo_pipeline"):
+                    await handle_photo_message_whatsapp_with_adapter(user_id, file_url, user_name, adapter)
             elif content.get("audio_id"):
-                await handle_voice_message_whatsapp_with_adapter(user_id, file_url, user_name, adapter)
+                async with message_dispatcher.llm_slot(), span("voice_pipeline"):
+                    await handle_voice_message_whatsapp_with_adapter(user_id, file_url, user_name, adapter)
             else:
                 await adapter.send_text_message(user_id, "تم استلام الملف، شكراً لك!")
                 
@@ -513,113 +545,113 @@ async def handle_photo_message_whatsapp_with_adapter(user_id: str, image_id: str
                 print(f"DEBUG: Downloading media from MontyMobile API: {media_api_url}")
                 print(f"DEBUG: Using Tenant: {adapter.tenant_id}")
                 
-                async with httpx.AsyncClient() as client:
-                    # Download the media file directly
-                    media_response = await client.get(media_api_url, headers=montymobile_headers, timeout=30)
-                    media_response.raise_for_status()
+                client = get_http_client("media")
+                # Download the media file directly
+                media_response = await client.get(media_api_url, headers=montymobile_headers, timeout=30)
+                media_response.raise_for_status()
                     
-                    # Detect image format from content-type header or magic bytes
-                    content_type = media_response.headers.get('content-type', '').lower()
-                    print(f"DEBUG: Media response content-type: {content_type}")
-                    print(f"DEBUG: Media response size: {len(media_response.content)} bytes")
+                # Detect image format from content-type header or magic bytes
+                content_type = media_response.headers.get('content-type', '').lower()
+                print(f"DEBUG: Media response content-type: {content_type}")
+                print(f"DEBUG: Media response size: {len(media_response.content)} bytes")
                     
-                    # Check if response is JSON (MontyMobile returns JSON with image data inside)
-                    if 'application/json' in content_type:
-                        print(f"DEBUG: Response is JSON, extracting image data...")
-                        media_json = media_response.json()
-                        print(f"DEBUG: JSON keys: {list(media_json.keys())}")
+                # Check if response is JSON (MontyMobile returns JSON with image data inside)
+                if 'application/json' in content_type:
+                    print(f"DEBUG: Response is JSON, extracting image data...")
+                    media_json = media_response.json()
+                    print(f"DEBUG: JSON keys: {list(media_json.keys())}")
                         
-                        # Extract the actual image data from JSON
-                        # MontyMobile might return base64 data or a URL
-                        if 'data' in media_json:
-                            image_data_field = media_json['data']
-                            if isinstance(image_data_field, str):
-                                # It's base64 encoded
+                    # Extract the actual image data from JSON
+                    # MontyMobile might return base64 data or a URL
+                    if 'data' in media_json:
+                        image_data_field = media_json['data']
+                        if isinstance(image_data_field, str):
+                            # It's base64 encoded
+                            import base64
+                            image_bytes = base64.b64decode(image_data_field)
+                            print(f"DEBUG: Decoded base64 image from JSON, size: {len(image_bytes)} bytes")
+                        elif isinstance(image_data_field, dict):
+                            # It's a nested object, check for base64 or URL inside
+                            print(f"DEBUG: data field is dict with keys: {list(image_data_field.keys())}")
+                            # MontyMobile returns {"data": {"data": "base64string"}}
+                            if 'data' in image_data_field and isinstance(image_data_field['data'], str):
+                                # The actual base64 data is in data.data
                                 import base64
-                                image_bytes = base64.b64decode(image_data_field)
-                                print(f"DEBUG: Decoded base64 image from JSON, size: {len(image_bytes)} bytes")
-                            elif isinstance(image_data_field, dict):
-                                # It's a nested object, check for base64 or URL inside
-                                print(f"DEBUG: data field is dict with keys: {list(image_data_field.keys())}")
-                                # MontyMobile returns {"data": {"data": "base64string"}}
-                                if 'data' in image_data_field and isinstance(image_data_field['data'], str):
-                                    # The actual base64 data is in data.data
+                                image_bytes = base64.b64decode(image_data_field['data'])
+                                print(f"DEBUG: Decoded base64 image from nested data.data, size: {len(image_bytes)} bytes")
+                            elif 'base64' in image_data_field or 'content' in image_data_field or 'file' in image_data_field:
+                                # Try different possible field names
+                                base64_data = image_data_field.get('base64') or image_data_field.get('content') or image_data_field.get('file')
+                                if base64_data:
                                     import base64
-                                    image_bytes = base64.b64decode(image_data_field['data'])
-                                    print(f"DEBUG: Decoded base64 image from nested data.data, size: {len(image_bytes)} bytes")
-                                elif 'base64' in image_data_field or 'content' in image_data_field or 'file' in image_data_field:
-                                    # Try different possible field names
-                                    base64_data = image_data_field.get('base64') or image_data_field.get('content') or image_data_field.get('file')
-                                    if base64_data:
-                                        import base64
-                                        image_bytes = base64.b64decode(base64_data)
-                                        print(f"DEBUG: Decoded base64 image from nested JSON, size: {len(image_bytes)} bytes")
-                                    else:
-                                        print(f"DEBUG: Full data object: {json.dumps(image_data_field, indent=2)[:500]}...")
-                                        raise ValueError(f"Could not find base64 data in nested object")
-                                elif 'url' in image_data_field:
-                                    image_url_from_json = image_data_field['url']
-                                    print(f"DEBUG: Found URL in nested data object, downloading from: {image_url_from_json}")
-                                    image_response = await client.get(image_url_from_json, timeout=30)
-                                    image_response.raise_for_status()
-                                    image_bytes = image_response.content
+                                    image_bytes = base64.b64decode(base64_data)
+                                    print(f"DEBUG: Decoded base64 image from nested JSON, size: {len(image_bytes)} bytes")
                                 else:
-                                    print(f"DEBUG: Full data object: {json.dumps(image_data_field, indent=2)}")
-                                    raise ValueError(f"Could not find image data in nested object")
+                                    print(f"DEBUG: Full data object: {json.dumps(image_data_field, indent=2)[:500]}...")
+                                    raise ValueError(f"Could not find base64 data in nested object")
+                            elif 'url' in image_data_field:
+                                image_url_from_json = image_data_field['url']
+                                print(f"DEBUG: Found URL in nested data object, downloading from: {image_url_from_json}")
+                                image_response = await client.get(image_url_from_json, timeout=30)
+                                image_response.raise_for_status()
+                                image_bytes = image_response.content
                             else:
-                                print(f"DEBUG: Unexpected data format in JSON: {type(image_data_field)}")
-                                raise ValueError(f"Unexpected image data format in JSON response")
-                        elif 'url' in media_json:
-                            # It's a URL, download from there
-                            image_url_from_json = media_json['url']
-                            print(f"DEBUG: Found URL in JSON, downloading from: {image_url_from_json}")
-                            image_response = await client.get(image_url_from_json, timeout=30)
-                            image_response.raise_for_status()
-                            image_bytes = image_response.content
+                                print(f"DEBUG: Full data object: {json.dumps(image_data_field, indent=2)}")
+                                raise ValueError(f"Could not find image data in nested object")
                         else:
-                            print(f"DEBUG: Full JSON response: {json.dumps(media_json, indent=2)}")
-                            raise ValueError(f"Could not find image data in JSON response")
+                            print(f"DEBUG: Unexpected data format in JSON: {type(image_data_field)}")
+                            raise ValueError(f"Unexpected image data format in JSON response")
+                    elif 'url' in media_json:
+                        # It's a URL, download from there
+                        image_url_from_json = media_json['url']
+                        print(f"DEBUG: Found URL in JSON, downloading from: {image_url_from_json}")
+                        image_response = await client.get(image_url_from_json, timeout=30)
+                        image_response.raise_for_status()
+                        image_bytes = image_response.content
                     else:
-                        # Response is raw binary image
-                        image_bytes = media_response.content
-                        print(f"DEBUG: Response is raw binary image")
+                        print(f"DEBUG: Full JSON response: {json.dumps(media_json, indent=2)}")
+                        raise ValueError(f"Could not find image data in JSON response")
+                else:
+                    # Response is raw binary image
+                    image_bytes = media_response.content
+                    print(f"DEBUG: Response is raw binary image")
                     
-                    # Detect format from magic bytes (first few bytes of file)
-                    magic_bytes = image_bytes[:8]
-                    print(f"DEBUG: First 8 bytes (hex): {magic_bytes.hex()}")
+                # Detect format from magic bytes (first few bytes of file)
+                magic_bytes = image_bytes[:8]
+                print(f"DEBUG: First 8 bytes (hex): {magic_bytes.hex()}")
                     
-                    # Determine image format
-                    if magic_bytes.startswith(b'\xff\xd8\xff'):
+                # Determine image format
+                if magic_bytes.startswith(b'\xff\xd8\xff'):
+                    image_format = 'jpeg'
+                elif magic_bytes.startswith(b'\x89PNG'):
+                    image_format = 'png'
+                elif magic_bytes.startswith(b'GIF87a') or magic_bytes.startswith(b'GIF89a'):
+                    image_format = 'gif'
+                elif magic_bytes.startswith(b'RIFF') and magic_bytes[8:12] == b'WEBP':
+                    image_format = 'webp'
+                else:
+                    # Fallback to content-type
+                    if 'jpeg' in content_type or 'jpg' in content_type:
                         image_format = 'jpeg'
-                    elif magic_bytes.startswith(b'\x89PNG'):
+                    elif 'png' in content_type:
                         image_format = 'png'
-                    elif magic_bytes.startswith(b'GIF87a') or magic_bytes.startswith(b'GIF89a'):
+                    elif 'gif' in content_type:
                         image_format = 'gif'
-                    elif magic_bytes.startswith(b'RIFF') and magic_bytes[8:12] == b'WEBP':
+                    elif 'webp' in content_type:
                         image_format = 'webp'
                     else:
-                        # Fallback to content-type
-                        if 'jpeg' in content_type or 'jpg' in content_type:
-                            image_format = 'jpeg'
-                        elif 'png' in content_type:
-                            image_format = 'png'
-                        elif 'gif' in content_type:
-                            image_format = 'gif'
-                        elif 'webp' in content_type:
-                            image_format = 'webp'
-                        else:
-                            image_format = 'jpeg'  # Default fallback
+                        image_format = 'jpeg'  # Default fallback
                     
-                    print(f"DEBUG: Detected image format: {image_format}")
+                print(f"DEBUG: Detected image format: {image_format}")
                     
-                    # Convert to base64 for processing (use image_bytes, not media_response.content!)
-                    import base64
-                    base64_image = base64.b64encode(image_bytes).decode("utf-8")
-                    print(f"DEBUG: Encoded image to base64, size: {len(base64_image)} bytes")
+                # Convert to base64 for processing (use image_bytes, not media_response.content!)
+                import base64
+                base64_image = base64.b64encode(image_bytes).decode("utf-8")
+                print(f"DEBUG: Encoded image to base64, size: {len(base64_image)} bytes")
                     
-                    # Create a data URL for the photo handler with correct format
-                    image_url = f"data:image/{image_format};base64,{base64_image}"
-                    print(f"DEBUG: Created base64 data URL for image processing with format: {image_format}")
+                # Create a data URL for the photo handler with correct format
+                image_url = f"data:image/{image_format};base64,{base64_image}"
+                print(f"DEBUG: Created base64 data URL for image processing with format: {image_format}")
                     
             except Exception as e:
                 print(f"ERROR: Failed to download media from MontyMobile: {e}")
@@ -681,11 +713,11 @@ async def handle_voice_message_whatsapp_with_adapter(user_id: str, audio_id: str
             # For Qiscus, audio_id IS the full URL
             print(f"DEBUG: Using Qiscus provider - audio_id is URL")
             audio_url = audio_id
-            async with httpx.AsyncClient() as client:
-                audio_content_response = await client.get(audio_id)
-                audio_content_response.raise_for_status()
-                audio_data_bytes = io.BytesIO(audio_content_response.content)
-                audio_data_bytes.seek(0)
+            client = get_http_client("media")
+            audio_content_response = await client.get(audio_id)
+            audio_content_response.raise_for_status()
+            audio_data_bytes = io.BytesIO(audio_content_response.content)
+            audio_data_bytes.seek(0)
         elif current_provider == "montymobile":
             print(f"DEBUG: Using MontyMobile provider - downloading audio via MontyMobile API")
             
@@ -701,91 +733,91 @@ async def handle_voice_message_whatsapp_with_adapter(user_id: str, audio_id: str
                 print(f"DEBUG: Downloading audio from MontyMobile API: {media_api_url}")
                 print(f"DEBUG: Using Tenant: {adapter.tenant_id}")
                 
-                async with httpx.AsyncClient() as client:
-                    # Download the media file
-                    media_response = await client.get(media_api_url, headers=montymobile_headers, timeout=30)
-                    media_response.raise_for_status()
+                client = get_http_client("media")
+                # Download the media file
+                media_response = await client.get(media_api_url, headers=montymobile_headers, timeout=30)
+                media_response.raise_for_status()
                     
-                    content_type = media_response.headers.get('content-type', '').lower()
-                    print(f"DEBUG: Audio response content-type: {content_type}")
-                    print(f"DEBUG: Audio response size: {len(media_response.content)} bytes")
+                content_type = media_response.headers.get('content-type', '').lower()
+                print(f"DEBUG: Audio response content-type: {content_type}")
+                print(f"DEBUG: Audio response size: {len(media_response.content)} bytes")
                     
-                    # Check if response is JSON (MontyMobile returns JSON with audio data inside)
-                    if 'application/json' in content_type:
-                        print(f"DEBUG: Response is JSON, extracting audio data...")
-                        media_json = media_response.json()
-                        print(f"DEBUG: JSON keys: {list(media_json.keys())}")
+                # Check if response is JSON (MontyMobile returns JSON with audio data inside)
+                if 'application/json' in content_type:
+                    print(f"DEBUG: Response is JSON, extracting audio data...")
+                    media_json = media_response.json()
+                    print(f"DEBUG: JSON keys: {list(media_json.keys())}")
                         
-                        # Extract the actual audio data from JSON (same structure as images)
-                        if 'data' in media_json:
-                            audio_data_field = media_json['data']
-                            if isinstance(audio_data_field, str):
-                                # It's base64 encoded
+                    # Extract the actual audio data from JSON (same structure as images)
+                    if 'data' in media_json:
+                        audio_data_field = media_json['data']
+                        if isinstance(audio_data_field, str):
+                            # It's base64 encoded
+                            import base64
+                            audio_bytes = base64.b64decode(audio_data_field)
+                            print(f"DEBUG: Decoded base64 audio from JSON, size: {len(audio_bytes)} bytes")
+                        elif isinstance(audio_data_field, dict):
+                            # It's a nested object
+                            print(f"DEBUG: data field is dict with keys: {list(audio_data_field.keys())}")
+                            # MontyMobile returns {"data": {"data": "base64string"}}
+                            if 'data' in audio_data_field and isinstance(audio_data_field['data'], str):
+                                # The actual base64 data is in data.data
                                 import base64
-                                audio_bytes = base64.b64decode(audio_data_field)
-                                print(f"DEBUG: Decoded base64 audio from JSON, size: {len(audio_bytes)} bytes")
-                            elif isinstance(audio_data_field, dict):
-                                # It's a nested object
-                                print(f"DEBUG: data field is dict with keys: {list(audio_data_field.keys())}")
-                                # MontyMobile returns {"data": {"data": "base64string"}}
-                                if 'data' in audio_data_field and isinstance(audio_data_field['data'], str):
-                                    # The actual base64 data is in data.data
-                                    import base64
-                                    audio_bytes = base64.b64decode(audio_data_field['data'])
-                                    print(f"DEBUG: Decoded base64 audio from nested data.data, size: {len(audio_bytes)} bytes")
-                                elif 'url' in audio_data_field:
-                                    audio_url_from_json = audio_data_field['url']
-                                    print(f"DEBUG: Found URL in nested data object, downloading from: {audio_url_from_json}")
-                                    audio_response = await client.get(audio_url_from_json, timeout=30)
-                                    audio_response.raise_for_status()
-                                    audio_bytes = audio_response.content
-                                else:
-                                    print(f"DEBUG: Full data object: {json.dumps(audio_data_field, indent=2)[:500]}...")
-                                    raise ValueError(f"Could not find audio data in nested object")
+                                audio_bytes = base64.b64decode(audio_data_field['data'])
+                                print(f"DEBUG: Decoded base64 audio from nested data.data, size: {len(audio_bytes)} bytes")
+                            elif 'url' in audio_data_field:
+                                audio_url_from_json = audio_data_field['url']
+                                print(f"DEBUG: Found URL in nested data object, downloading from: {audio_url_from_json}")
+                                audio_response = await client.get(audio_url_from_json, timeout=30)
+                                audio_response.raise_for_status()
+                                audio_bytes = audio_response.content
                             else:
-                                print(f"DEBUG: Unexpected data format in JSON: {type(audio_data_field)}")
-                                raise ValueError(f"Unexpected audio data format in JSON response")
-                        elif 'url' in media_json:
-                            # It's a URL, download from there
-                            audio_url_from_json = media_json['url']
-                            print(f"DEBUG: Found URL in JSON, downloading from: {audio_url_from_json}")
-                            audio_response = await client.get(audio_url_from_json, timeout=30)
-                            audio_response.raise_for_status()
-                            audio_bytes = audio_response.content
+                                print(f"DEBUG: Full data object: {json.dumps(audio_data_field, indent=2)[:500]}...")
+                                raise ValueError(f"Could not find audio data in nested object")
                         else:
-                            print(f"DEBUG: Full JSON response: {json.dumps(media_json, indent=2)[:500]}...")
-                            raise ValueError(f"Could not find audio data in JSON response")
+                            print(f"DEBUG: Unexpected data format in JSON: {type(audio_data_field)}")
+                            raise ValueError(f"Unexpected audio data format in JSON response")
+                    elif 'url' in media_json:
+                        # It's a URL, download from there
+                        audio_url_from_json = media_json['url']
+                        print(f"DEBUG: Found URL in JSON, downloading from: {audio_url_from_json}")
+                        audio_response = await client.get(audio_url_from_json, timeout=30)
+                        audio_response.raise_for_status()
+                        audio_bytes = audio_response.content
                     else:
-                        # Response is raw binary audio
-                        audio_bytes = media_response.content
-                        print(f"DEBUG: Response is raw binary audio")
+                        print(f"DEBUG: Full JSON response: {json.dumps(media_json, indent=2)[:500]}...")
+                        raise ValueError(f"Could not find audio data in JSON response")
+                else:
+                    # Response is raw binary audio
+                    audio_bytes = media_response.content
+                    print(f"DEBUG: Response is raw binary audio")
                     
-                    # Create BytesIO object for audio processing
-                    audio_data_bytes = io.BytesIO(audio_bytes)
-                    audio_data_bytes.seek(0)
-                    print(f"DEBUG: Created BytesIO object for audio processing")
-
-                    # Upload audio to Firebase Storage to get a playable URL for the dashboard
-                    try:
-                        import base64
-                        from utils.utils import upload_base64_to_firebase_storage
-
-                        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-                        file_name = f"voice_{user_id}_{audio_id[:8]}.ogg"
-
-                        audio_url = await upload_base64_to_firebase_storage(
-                            audio_base64,
-                            file_name,
-                            file_type="audio/ogg"
-                        )
-
-                        if audio_url:
-                            print(f"DEBUG: Uploaded audio to Firebase Storage: {audio_url}")
-                        else:
-                            print(f"DEBUG: Failed to upload audio to Firebase Storage, audio_url will be None")
-                    except Exception as upload_error:
-                        print(f"WARNING: Failed to upload audio to Firebase Storage: {upload_error}")
-                        audio_url = None
+                # Create BytesIO object for audio processing
+                audio_data_bytes = io.BytesIO(audio_bytes)
+                audio_data_bytes.seek(0)
+                print(f"DEBUG: Created BytesIO object for audio processing")
+
+                # Upload audio to Firebase Storage to get a playable URL for the dashboard
+                try:
+                    import base64
+                    from utils.utils import upload_base64_to_firebase_storage
+
+                    audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+                    file_name = f"voice_{user_id}_{audio_id[:8]}.ogg"
+
+                    audio_url = await upload_base64_to_firebase_storage(
+                        audio_base64,
+                        file_name,
+                        file_type="audio/ogg"
+                    )
+
+                    if audio_url:
+                        print(f"DEBUG: Uploaded audio to Firebase Storage: {audio_url}")
+                    else:
+                        print(f"DEBUG: Failed to upload audio to Firebase Storage, audio_url will be None")
+                except Exception as upload_error:
+                    print(f"WARNING: Failed to upload audio to Firebase Storage: {upload_error}")
+                    audio_url = None
                     
             except Exception as e:
                 print(f"ERROR: Failed to download audio from MontyMobile: {e}")
@@ -802,11 +834,11 @@ async def handle_voice_message_whatsapp_with_adapter(user_id: str, audio_id: str
             if not audio_url:
                 raise ValueError("Audio URL not found in API response.")
 
-            async with httpx.AsyncClient() as client:
-                audio_content_response = await client.get(audio_url)
-                audio_content_response.raise_for_status()
-                audio_data_bytes = io.BytesIO(audio_content_response.content)
-                audio_data_bytes.seek(0)
+            client = get_http_client("media")
+            audio_content_response = await client.get(audio_url)
+            audio_content_response.raise_for_status()
+            audio_data_bytes = io.BytesIO(audio_content_response.content)
+            audio_data_bytes.seek(0)
 
         if user_id not in config.user_data_whatsapp:
             config.user_data_whatsapp[user_id] = {
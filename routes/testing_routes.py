@@ -16,6 +16,7 @@ from handlers.photo_handlers import handle_photo_message
 from handlers.voice_handlers import handle_voice_message
 from services.whatsapp_adapters.whatsapp_factory import WhatsAppFactory
 from services.llm_core_service import client as openai_client
+from services.conversation_store import load_conversation_messages
 from utils.utils import detect_language
 
 # Try to import pydub for audio processing
@@ -135,7 +136,7 @@ async def test_firebase():
             doc_data = doc.to_dict()
             conversations.append({
                 "id": doc.id,
-                "messages": doc_data.get("messages", []),
+                "messages": await load_conversation_messages(doc.reference, doc_data),
                 "timestamp": doc_data.get("timestamp"),
                 "user_id": doc_data.get("user_id")
             })
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Benchmark: indexed Q&A matcher vs the previous linear SequenceMatcher scan.
+
+For each query the linear scan (every pair of the language, full ratio) and LocalQAService
+(QAIndex) must agree on:
+- the best match and score used by find_match / find_match_with_tier,
+- the top-3 context pairs of get_relevant_qa_pairs,
+- the search_qa_pairs results (question/answer max score >= 0.3).
+
+Queries are the stored questions with random edits (typos, dropped/added words) plus
+unrelated text. With --synthetic N the Q&A set is padded to N pairs by perturbing the real ones.
+
+Usage:
+  python scripts/benchmark_qa_matcher.py                        # live Q&A file
+  python scripts/benchmark_qa_matcher.py --synthetic 2000 --queries 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.local_qa_service import LocalQAService
+from storage.persistent_storage import QA_PAIRS_FILE
+
+FILLER_WORDS = ["please", "laser", "price", "kifak", "شو", "بدي", "merci", "today", "session", "ok"]
+
+
+def perturb(text: str, rng: random.Random) -> str:
+    words = text.split()
+    for _ in range(rng.randint(1, 3)):
+        action = rng.random()
+        if action < 0.35 and len(words) > 1:
+            words.pop(rng.randrange(len(words)))
+        elif action < 0.7:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(FILLER_WORDS))
+        elif words:
+            i = rng.randrange(len(words))
+            word = words[i]
+            if len(word) > 2:
+                j = rng.randrange(len(word))
+                words[i] = word[:j] + word[j + 1:]
+    return " ".join(words)
+
+
+def linear_best(service, question, language):
+    requested = service._normalize_language(language)
+    best_match, best_score = None, 0
+    for qa in service.qa_pairs:
+        if service._normalize_language(qa.get("language")) != requested:
+            continue
+        similarity = service.calculate_similarity(question, qa.get("question", ""))
+        if similarity > best_score:
+            best_score, best_match = similarity, qa
+    return best_match, best_score
+
+
+def linear_relevant(service, question, language, limit=3):
+    results = []
+    for qa in service.qa_pairs:
+        if language:
+            if service._normalize_language(qa.get("language"), default="") != service._normalize_language(language, default=""):
+                continue
+        similarity = service.calculate_similarity(question, qa.get("question", ""))
+        if similarity >= 0.3:
+            results.append((similarity, qa.get("question")))
+    results.sort(key=lambda x: x[0], reverse=True)
+    return results[:limit]
+
+
+def linear_search(service, query, language):
+    results = []
+    for qa in service.qa_pairs:
+        if language:
+            if service._normalize_language(qa.get("language"), default="") != service._normalize_language(language, default=""):
+                continue
+        if not qa.get("question") and not qa.get("answer"):
+            continue
+        score = max(service.calculate_similarity(query, qa.get("question", "")),
+                    service.calculate_similarity(query, qa.get("answer", "")))
+        if score >= 0.3:
+            results.append((score, qa.get("question")))
+    results.sort(key=lambda x: x[0], reverse=True)
+    return results
+
+
+def build_dataset(source_path: str, synthetic: int, rng: random.Random) -> list:
+    with open(source_path, "r", encoding="utf-8") as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    base = list(pairs)
+    while base and len(pairs) < synthetic:
+        qa = dict(rng.choice(base))
+        qa["question"] = perturb(qa["question"], rng)
+        qa["answer"] = perturb(qa.get("answer", ""), rng)
+        pairs.append(qa)
+    return pairs
+
+
+async def run(source_path: str, synthetic: int, query_count: int, seed: int) -> int:
+    rng = random.Random(seed)
+    pairs = build_dataset(source_path, synthetic, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, "qa_pairs.jsonl")
+        with open(data_path, "w", encoding="utf-8") as f:
+            for qa in pairs:
+                f.write(json.dumps(qa, ensure_ascii=False) + "\n")
+        service = LocalQAService(data_path=data_path)
+
+    queries = []
+    for _ in range(query_count):
+        if rng.random() < 0.15:
+            queries.append((" ".join(rng.choice(FILLER_WORDS) for _ in range(4)), rng.choice(["ar", "en", "fr", "franco"])))
+        else:
+            qa = rng.choice(service.qa_pairs)
+            text = qa["question"] if rng.random() < 0.3 else perturb(qa["question"], rng)
+            queries.append((text, qa.get("language") or "ar"))
+
+    mismatches = 0
+    timings = {"linear_hot": 0.0, "indexed_hot": 0.0, "linear_search": 0.0, "indexed_search": 0.0}
+    service._qa_index.comparisons = 0
+    for query, language in queries:
+        # Per-message hot path: direct-answer check + GPT context pairs
+        started = time.perf_counter()
+        expected_best = linear_best(service, query, language)
+        expected_relevant = linear_relevant(service, query, language)
+        timings["linear_hot"] += time.perf_counter() - started
+        started = time.perf_counter()
+        best = service._best_match(query, service._normalize_language(language))
+        relevant = await service.get_relevant_qa_pairs(query, language, limit=3)
+        timings["indexed_hot"] += time.perf_counter() - started
+
+        # Dashboard search
+        started = time.perf_counter()
+        expected_search = linear_search(service, query, language)
+        timings["linear_search"] += time.perf_counter() - started
+        started = time.perf_counter()
+        search = await service.search_qa_pairs(query, language)
+        timings["indexed_search"] += time.perf_counter() - started
+
+        ok = (best[0] is expected_best[0] and best[1] == expected_best[1])
+        ok = ok and [(r["similarity"], r["question"]) for r in relevant] == expected_relevant
+        ok = ok and [(r["match_score"], r["question"]) for r in search["data"]] == expected_search
+        if not ok:
+            mismatches += 1
+            print(f"❌ Mismatch for query {query!r} ({language})")
+
+    per_query = {name: value / len(queries) * 1000 for name, value in timings.items()}
+    print("\n" + "=" * 60)
+    print(f"Q&A pairs: {len(service.qa_pairs)} | queries: {len(queries)}")
+    print(f"Hot path (best + top-3): linear {per_query['linear_hot']:.2f}ms/query, indexed {per_query['indexed_hot']:.2f}ms/query")
+    print(f"Search (question/answer): linear {per_query['linear_search']:.2f}ms/query, indexed {per_query['indexed_search']:.2f}ms/query")
+    print(f"ratio() calls: linear <= {len(queries) * len(service.qa_pairs) * 4}, indexed {service._qa_index.comparisons}")
+    print(f"Mismatches: {mismatches}")
+    print("=" * 60)
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare indexed Q&A matching with the linear scan")
+    parser.add_argument("--source", default=str(QA_PAIRS_FILE), help="Q&A JSONL file (default: live Q&A file)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Pad the Q&A set to this many pairs")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    mismatches = asyncio.run(run(args.source, args.synthetic, args.queries, args.seed))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -75,6 +75,9 @@ def check_conversations():
         for conv_doc in conversations_docs:
             conv_data = conv_doc.to_dict()
             messages = conv_data.get("messages", [])
+            if conv_data.get("storage_mode") == "subcollection":
+                # Header document: only the recent tail is inline, the rest is in messages/
+                messages = conv_data.get("recent_messages", [])
 
             print(f"\n   📝 Conversation ID: {conv_doc.id}")
 
@@ -84,7 +87,7 @@ def check_conversations():
                 stats["no_messages"] += 1
                 continue
 
-            print(f"      Messages: {len(messages)}")
+            print(f"      Messages: {conv_data.get('message_count', len(messages))}")
 
             # Check status
             status = conv_data.get("status", "active")
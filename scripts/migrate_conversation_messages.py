@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Migration: Move conversation `messages` arrays into per-message subcollection documents.
+Run after enabling CONVERSATION_STORAGE_MODE=subcollection (conversations are also migrated
+lazily on their next append, this script handles the idle backlog).
+
+- Streams every conversation under artifacts/linas-ai-bot-backend/users/*/conversations.
+- Copies each legacy `messages` entry to conversations/{id}/messages/{message_id}.
+- Turns the conversation document into a header (counters, last message, recent tail)
+  and removes the `messages` array.
+- Safe to re-run: message documents are keyed by message_id and already-migrated
+  headers are skipped.
+
+Usage:
+  python scripts/migrate_conversation_messages.py --dry-run          # report only
+  python scripts/migrate_conversation_messages.py                    # run migration
+  python scripts/migrate_conversation_messages.py --user +9617000000 # one user only
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# Project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.utils import get_firestore_db
+from services.conversation_store import is_subcollection_layout, migrate_conversation
+import config
+
+
+APP_ID = "linas-ai-bot-backend"
+CONVERSATIONS_COLLECTION = getattr(config, "FIRESTORE_CONVERSATIONS_COLLECTION", "conversations")
+
+
+def _get_users_collection(db):
+    return db.collection("artifacts").document(APP_ID).collection("users")
+
+
+async def run_migration(dry_run: bool, only_user: str = None):
+    db = get_firestore_db()
+    if not db:
+        print("❌ Firestore not initialized. Ensure data/firebase_data.json exists.")
+        return
+
+    users_col = _get_users_collection(db)
+    if only_user:
+        user_ids = [only_user]
+    else:
+        user_ids = [doc.id for doc in await asyncio.to_thread(lambda: list(users_col.stream()))]
+
+    stats = {"users": 0, "conversations": 0, "migrated": 0, "already": 0, "messages": 0, "failed": 0}
+    for user_id in user_ids:
+        stats["users"] += 1
+        conversations_col = users_col.document(user_id).collection(CONVERSATIONS_COLLECTION)
+        conv_docs = await asyncio.to_thread(lambda: list(conversations_col.stream()))
+        for conv_doc in conv_docs:
+            stats["conversations"] += 1
+            payload = conv_doc.to_dict() or {}
+            if is_subcollection_layout(payload):
+                stats["already"] += 1
+                continue
+            message_count = len(payload.get("messages") or [])
+            if dry_run:
+                print(f"  Would migrate {user_id}/{conv_doc.id} ({message_count} messages)")
+                stats["migrated"] += 1
+                stats["messages"] += message_count
+                continue
+            try:
+                await migrate_conversation(conv_doc.reference, payload)
+                stats["migrated"] += 1
+                stats["messages"] += message_count
+                print(f"  ✅ Migrated {user_id}/{conv_doc.id} ({message_count} messages)")
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"  ❌ Failed {user_id}/{conv_doc.id}: {e}")
+
+    print("\nSummary:")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+    if dry_run:
+        print("(dry-run: nothing was written)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate conversation messages to subcollections")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, do not write")
+    parser.add_argument("--user", default=None, help="Migrate a single user id")
+    args = parser.parse_args()
+    asyncio.run(run_migration(dry_run=args.dry_run, only_user=args.user))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Rebuild the analytics daily rollups (data/analytics_rollups.json) from data/analytics_events.jsonl.
+
+The dashboard keeps the rollups up to date by itself; run this after editing or restoring the
+events file, to backfill a fresh deployment before the first dashboard request, or after a
+change to what the rollups count.
+
+Usage:
+  python scripts/rebuild_analytics_rollups.py
+"""
+import os
+import sys
+
+# Project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.analytics_events import analytics
+
+
+def main():
+    print(f"Rebuilding analytics rollups from {analytics.events_file} ...")
+    stats = analytics.rollups.rebuild()
+    print(
+        f"✅ {stats['closed_days']} days ({stats['first_day']} → {stats['last_day']}), "
+        f"{stats['indexed_users']} users, {stats['tail_events']} events from today kept in the tail, "
+        f"{stats['rebuild_seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
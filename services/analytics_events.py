@@ -2,7 +2,9 @@
 """
 Analytics Events System
 Simple append-only event logging for analytics
-Each event is one line in a JSONL file
+Each event is one line in a JSONL file, appended in batches by a background writer
+(services/analytics_writer.py); the dashboard aggregation is served from persisted
+daily rollups (services/analytics_rollups.py)
 """
 
 import json
@@ -12,6 +14,11 @@ import math
 from typing import Dict, Any, List, Optional
 from collections import defaultdict
 
+from services.analytics_rollups import AnalyticsRollups
+from services.analytics_writer import AnalyticsEventWriter
+
+APPOINTMENT_STATUSES = ("requested", "booked", "confirmed", "rescheduled", "cancelled")
+
 
 class AnalyticsEvents:
     """Handles analytics event logging and aggregation"""
@@ -21,6 +28,8 @@ class AnalyticsEvents:
         # Session rule used for Conversation 1/2/3 counting
         self.conversation_session_gap_minutes = 30
         self._ensure_file_exists()
+        self.writer = AnalyticsEventWriter(self.events_file)
+        self.rollups = AnalyticsRollups(self)
     
     def _ensure_file_exists(self):
         """Create events file if it doesn't exist"""
@@ -29,11 +38,10 @@ class AnalyticsEvents:
             open(self.events_file, 'a').close()
     
     def _append_event(self, event: Dict[str, Any]):
-        """Append a single event to the file"""
+        """Queue a single event for the background writer"""
         try:
             event["timestamp"] = datetime.datetime.now().isoformat()
-            with open(self.events_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self.writer.write(event)
         except Exception as e:
             print(f"❌ Error appending event: {e}")
 
@@ -223,8 +231,12 @@ class AnalyticsEvents:
         return f"...{user[-4:]}"
     
     def _build_conversation_type_metrics(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build Conversation 1/2/3 metrics from event logs."""
+        return self._format_conversation_type_metrics(self._conversation_stage_counts(events))
+
+    def _conversation_stage_counts(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
-        Build Conversation 1/2/3 metrics from event logs.
+        Count Conversation 1/2/3 sessions in a list of events.
 
         Counting model:
         - Events are grouped by user_id.
@@ -233,7 +245,24 @@ class AnalyticsEvents:
           Conversation 1 -> message-only/general session
           Conversation 2 -> qualified session (gender or service intent captured)
           Conversation 3 -> appointment action detected
+
+        The counts are additive, so the counts of single days (kept in the daily rollups) are
+        summed for a date range; a session spanning midnight is counted on both days.
         """
+        stages = {
+            key: {
+                "exclusive_count": 0,
+                "funnel_count": 0,
+                "total_events": 0,
+                "message_events": 0,
+                "user_messages": 0,
+                "bot_messages": 0,
+                "total_tokens": 0,
+                "estimated_cost_usd": 0.0,
+                "examples": [],
+            }
+            for key in ("conversation_1", "conversation_2", "conversation_3")
+        }
         try:
             events_by_user = defaultdict(list)
             for event in events:
@@ -281,57 +310,6 @@ class AnalyticsEvents:
                         "events": [entry[1] for entry in current_session],
                     })
             
-            definitions = {
-                "conversation_1": "General conversation session with no qualification signal and no appointment event.",
-                "conversation_2": "Qualified conversation session where intent/profile is captured (service_request or gender), but no appointment event yet.",
-                "conversation_3": "Conversion conversation session that includes an appointment event (requested/booked/confirmed/rescheduled/cancelled).",
-            }
-            
-            stages = {
-                "conversation_1": {
-                    "id": "conversation_1",
-                    "label": "Conversation 1",
-                    "description": definitions["conversation_1"],
-                    "exclusive_count": 0,
-                    "funnel_count": 0,
-                    "total_events": 0,
-                    "message_events": 0,
-                    "user_messages": 0,
-                    "bot_messages": 0,
-                    "total_tokens": 0,
-                    "estimated_cost_usd": 0.0,
-                    "examples": [],
-                },
-                "conversation_2": {
-                    "id": "conversation_2",
-                    "label": "Conversation 2",
-                    "description": definitions["conversation_2"],
-                    "exclusive_count": 0,
-                    "funnel_count": 0,
-                    "total_events": 0,
-                    "message_events": 0,
-                    "user_messages": 0,
-                    "bot_messages": 0,
-                    "total_tokens": 0,
-                    "estimated_cost_usd": 0.0,
-                    "examples": [],
-                },
-                "conversation_3": {
-                    "id": "conversation_3",
-                    "label": "Conversation 3",
-                    "description": definitions["conversation_3"],
-                    "exclusive_count": 0,
-                    "funnel_count": 0,
-                    "total_events": 0,
-                    "message_events": 0,
-                    "user_messages": 0,
-                    "bot_messages": 0,
-                    "total_tokens": 0,
-                    "estimated_cost_usd": 0.0,
-                    "examples": [],
-                },
-            }
-            
             stage_rank = {
                 "conversation_1": 1,
                 "conversation_2": 2,
@@ -420,8 +398,42 @@ class AnalyticsEvents:
                         "bot_tokens": session_tokens,
                         "estimated_cost_usd": round(session_cost, 6),
                     })
+        except Exception as e:
+            print(f"❌ Error counting conversation sessions: {e}")
+        return stages
+
+    def _format_conversation_type_metrics(self, stage_counts: Dict[str, Any]) -> Dict[str, Any]:
+        """Format Conversation 1/2/3 session counts (see _conversation_stage_counts) for the API."""
+        try:
+            definitions = {
+                "conversation_1": "General conversation session with no qualification signal and no appointment event.",
+                "conversation_2": "Qualified conversation session where intent/profile is captured (service_request or gender), but no appointment event yet.",
+                "conversation_3": "Conversion conversation session that includes an appointment event (requested/booked/confirmed/rescheduled/cancelled).",
+            }
+            labels = {
+                "conversation_1": "Conversation 1",
+                "conversation_2": "Conversation 2",
+                "conversation_3": "Conversation 3",
+            }
+            stages = {}
+            for key in ("conversation_1", "conversation_2", "conversation_3"):
+                counts = stage_counts.get(key, {})
+                stages[key] = {
+                    "id": key,
+                    "label": labels[key],
+                    "description": definitions[key],
+                    "exclusive_count": counts.get("exclusive_count", 0),
+                    "funnel_count": counts.get("funnel_count", 0),
+                    "total_events": counts.get("total_events", 0),
+                    "message_events": counts.get("message_events", 0),
+                    "user_messages": counts.get("user_messages", 0),
+                    "bot_messages": counts.get("bot_messages", 0),
+                    "total_tokens": counts.get("total_tokens", 0),
+                    "estimated_cost_usd": counts.get("estimated_cost_usd", 0.0),
+                    "examples": list(counts.get("examples", []))[:3],
+                }
             
-            total_sessions = len(sessions)
+            total_sessions = sum(stage["exclusive_count"] for stage in stages.values())
             estimated_total_cost = sum(stage["estimated_cost_usd"] for stage in stages.values())
             
             ordered_keys = ["conversation_1", "conversation_2", "conversation_3"]
@@ -547,9 +559,179 @@ class AnalyticsEvents:
             print(f"❌ Error reading events: {e}")
             return []
     
+    def _parse_event_line(self, line: Any) -> Optional[tuple]:
+        """Parse one JSONL line into (event, normalized user_id, timestamp), or None if unusable."""
+        try:
+            event = json.loads(line)
+        except Exception:
+            return None
+        if not isinstance(event, dict):
+            return None
+        event_date = self._parse_timestamp(event.get("timestamp"))
+        if not event_date:
+            return None
+        normalized_user_id = self._normalize_user_id(event.get("user_id"))
+        if normalized_user_id:
+            event["user_id"] = normalized_user_id
+        return event, normalized_user_id, event_date
+
+    @staticmethod
+    def _rollup_key(value: Any) -> str:
+        """Rollups are stored as JSON, whose object keys are strings."""
+        return value if isinstance(value, str) else json.dumps(value)
+
+    @staticmethod
+    def _new_rollup() -> Dict[str, Any]:
+        """
+        Empty rollup bucket. Everything in it is additive (see analytics_rollups.merge_rollup):
+        user sets are {user_id: event_count} dicts and per-day values are keyed by date.
+        """
+        return {
+            "messages": 0,
+            "conversations": 0,
+            "new_user_conversations": 0,
+            "users": {},
+            "message_users": {},
+            "inquiry_users": {},
+            "by_type": {},
+            "by_source": {},
+            "by_language": {},
+            "daily": {},
+            "hourly": {},
+            "sentiment": {},
+            "genders": {},
+            "services": {},
+            "qualified_leads": 0,
+            "appointments": {},
+            "appointments_by_service": {},
+            "messages_to_booking": [],
+            "feedback": {},
+            "feedback_reasons": {},
+            "escalations": 0,
+            "escalations_by_type": {},
+            "response_times": [],
+            "total_tokens": 0,
+            "total_cost": 0.0,
+            "by_model": {},
+            "service_users": {},
+            "booked_users": {},
+            "service_mentions": {},
+            "service_mention_users": {},
+            "conversation_stages": {},
+        }
+
+    def _fold_event(self, rollup: Dict[str, Any], event: Dict[str, Any], user_id: Optional[str], dt: datetime.datetime):
+        """Add one event to a rollup bucket."""
+        def bump(counts: Dict[str, Any], key: Any, amount: int = 1):
+            key = self._rollup_key(key)
+            counts[key] = counts.get(key, 0) + amount
+
+        event_type = event.get("type")
+        date_key = dt.strftime("%Y-%m-%d")
+        if user_id:
+            bump(rollup["users"], user_id)
+
+        if event_type == "message":
+            rollup["messages"] += 1
+            msg_type = event.get("msg_type", "text")
+            language = event.get("language", "ar")
+            bump(rollup["by_type"], msg_type)
+            bump(rollup["by_source"], event.get("source", "user"))
+            bump(rollup["by_language"], language)
+
+            sentiment = event.get("sentiment")
+            if sentiment:
+                bump(rollup["sentiment"], sentiment)
+
+            daily = rollup["daily"].setdefault(date_key, {})
+            bump(daily, "total")
+            bump(daily, msg_type)
+            bump(daily, language)
+            bump(rollup["hourly"], f"{dt.hour:02d}:00")
+
+            # AI performance (bot messages only)
+            if event.get("source") == "bot":
+                response_time = self._safe_float(event.get("response_time_ms"))
+                if response_time > 0:
+                    rollup["response_times"].append(response_time)
+
+                tokens = max(self._safe_int(event.get("tokens")), 0)
+                cost = max(self._safe_float(event.get("cost_usd")), 0.0)
+                model = self._rollup_key(event.get("model", "unknown"))
+                if tokens > 0:
+                    rollup["total_tokens"] += tokens
+                    rollup["by_model"].setdefault(model, {"tokens": 0, "cost": 0.0})["tokens"] += tokens
+                if cost > 0:
+                    rollup["total_cost"] += cost
+                    rollup["by_model"].setdefault(model, {"tokens": 0, "cost": 0.0})["cost"] += cost
+            elif event.get("source") == "user" and user_id:
+                bump(rollup["message_users"], user_id)
+                bump(rollup["inquiry_users"], user_id)
+
+        elif event_type == "conversation_start":
+            rollup["conversations"] += 1
+            if event.get("is_new_user"):
+                rollup["new_user_conversations"] += 1
+
+        elif event_type == "gender":
+            gender = event.get("gender")
+            if gender:
+                bump(rollup["genders"], gender)
+
+        elif event_type == "service_request":
+            service = event.get("service")
+            if user_id:
+                bump(rollup["inquiry_users"], user_id)
+                services_by_user = rollup["service_users"].setdefault(user_id, {})
+                if service:
+                    bump(services_by_user, service)
+            if service:
+                bump(rollup["services"], service)
+                rollup["qualified_leads"] += 1
+                bump(rollup["service_mentions"].setdefault(date_key, {}), service)
+                if user_id:
+                    mention_users = rollup["service_mention_users"].setdefault(date_key, {})
+                    bump(mention_users.setdefault(self._rollup_key(service), {}), user_id)
+
+        elif event_type == "appointment":
+            status = event.get("status")
+            service = event.get("service")
+            if status in APPOINTMENT_STATUSES:
+                bump(rollup["appointments"], status)
+            if status == "booked":
+                messages_count = max(self._safe_int(event.get("messages_count")), 0)
+                if messages_count > 0:
+                    rollup["messages_to_booking"].append(messages_count)
+                if user_id:
+                    booked_services = rollup["booked_users"].setdefault(user_id, {})
+                    if service:
+                        bump(booked_services, service)
+            if service and status:
+                bump(rollup["appointments_by_service"].setdefault(self._rollup_key(service), {}), status)
+
+        elif event_type == "feedback":
+            bump(rollup["feedback"], "total")
+            feedback_type = event.get("feedback_type")
+            if feedback_type == "good":
+                bump(rollup["feedback"], "likes")
+            else:
+                bump(rollup["feedback"], "dislikes")
+                reason = event.get("reason", feedback_type)
+                if reason:
+                    bump(rollup["feedback_reasons"], reason)
+
+        elif event_type == "escalation":
+            rollup["escalations"] += 1
+            escalation_type = event.get("escalation_type")
+            if escalation_type:
+                bump(rollup["escalations_by_type"], escalation_type)
+    
     def aggregate_analytics(self, days: int = 7) -> Dict[str, Any]:
         """
-        Aggregate all events into analytics data
+        Aggregate all events into analytics data.
+
+        Closed days come from the persisted daily rollups and only today's events are read
+        from the file, so the window covers whole days: from the day `days` ago through today.
         
         Args:
             days: Number of days to include
@@ -560,258 +742,96 @@ class AnalyticsEvents:
         try:
             days = max(self._safe_int(days), 1)
             now = datetime.datetime.now()
-            range_start = now - datetime.timedelta(days=days)
             today_date = now.date()
-            events = self.get_events(days=days)
-            all_events = self.get_events(days=None)
+            start_date = (now - datetime.timedelta(days=days)).date()
+            range_start = datetime.datetime.combine(start_date, datetime.time.min)
+            self.writer.flush()  # include this worker's queued events
+            totals, first_seen_by_user = self.rollups.collect(start_date, today_date, now)
+
+            # New clients: active in the window and first seen (over the full history) inside it
+            new_users = {
+                user_id for user_id in totals["users"]
+                if not self._is_test_user_id(user_id)
+                and user_id in first_seen_by_user
+                and range_start <= first_seen_by_user[user_id] <= now
+            }
+            asked_users = {user_id for user_id in totals["service_users"] if user_id in new_users}
+            booked_users = {user_id for user_id in totals["booked_users"] if user_id in new_users}
+
+            today_key = today_date.isoformat()
+            users_by_service_today = {
+                service: set(users)
+                for service, users in totals["service_mention_users"].get(today_key, {}).items()
+            }
+            response_times = totals["response_times"]
 
-            # Build first-seen index from the full event history.
-            first_seen_by_user: Dict[str, datetime.datetime] = {}
-            for event in all_events:
-                user_id = self._normalize_user_id(event.get("user_id"))
-                event_dt = self._parse_timestamp(event.get("timestamp"))
-                if not user_id or not event_dt:
-                    continue
-                existing_first_seen = first_seen_by_user.get(user_id)
-                if existing_first_seen is None or event_dt < existing_first_seen:
-                    first_seen_by_user[user_id] = event_dt
-            
-            # Initialize counters
             stats = {
                 "overview": {
-                    "total_messages": 0,
-                    "total_conversations": 0,
-                    "unique_users": set(),
-                    "new_users": 0,
-                    "active_user_message_users": set()
+                    "total_messages": totals["messages"],
+                    "total_conversations": totals["conversations"] or len(totals["message_users"]),
+                    "unique_users": len(totals["users"]),
+                    "new_users": totals["new_user_conversations"] or len(new_users),
                 },
                 "messages": {
-                    "by_type": defaultdict(int),
-                    "by_source": defaultdict(int),
-                    "by_language": defaultdict(int),
-                    "daily": defaultdict(lambda: defaultdict(int)),
-                    "hourly": defaultdict(int)
+                    "by_type": totals["by_type"],
+                    "by_source": totals["by_source"],
+                    "by_language": totals["by_language"],
+                    "daily": totals["daily"],
+                    "hourly": totals["hourly"],
                 },
-                "sentiment": defaultdict(int),
-                "genders": defaultdict(int),
-                "services": defaultdict(int),
+                "sentiment": totals["sentiment"],
+                "genders": totals["genders"],
+                "services": totals["services"],
                 "appointments": {
-                    "requested": 0,
-                    "booked": 0,
-                    "confirmed": 0,
-                    "rescheduled": 0,
-                    "cancelled": 0,
-                    "by_service": defaultdict(lambda: defaultdict(int))
+                    **{status: totals["appointments"].get(status, 0) for status in APPOINTMENT_STATUSES},
+                    "by_service": totals["appointments_by_service"],
                 },
                 "feedback": {
-                    "total": 0,
-                    "likes": 0,
-                    "dislikes": 0,
-                    "reasons": defaultdict(int)
+                    "total": totals["feedback"].get("total", 0),
+                    "likes": totals["feedback"].get("likes", 0),
+                    "dislikes": totals["feedback"].get("dislikes", 0),
+                    "reasons": totals["feedback_reasons"],
                 },
                 "escalations": {
-                    "total": 0,
-                    "by_type": defaultdict(int)
+                    "total": totals["escalations"],
+                    "by_type": totals["escalations_by_type"],
                 },
                 "ai_performance": {
-                    "total_response_time": 0,
-                    "response_count": 0,
-                    "min_response_time": None,
-                    "max_response_time": None,
-                    "response_times": [],
-                    "total_tokens": 0,
-                    "total_cost": 0.0,
-                    "by_model": defaultdict(lambda: {"tokens": 0, "cost": 0.0})
+                    "total_response_time": sum(response_times),
+                    "response_count": len(response_times),
+                    "min_response_time": min(response_times) if response_times else None,
+                    "max_response_time": max(response_times) if response_times else None,
+                    "response_times": response_times,
+                    "total_tokens": totals["total_tokens"],
+                    "total_cost": totals["total_cost"],
+                    "by_model": totals["by_model"],
                 },
                 "conversions": {
-                    "inquiries": 0,
-                    "qualified_leads": 0,
-                    "appointment_requests": 0,
-                    "bookings": 0,
-                    "messages_to_booking": [],
-                    "inquiry_users": set()
+                    "inquiries": len(totals["inquiry_users"]),
+                    "qualified_leads": totals["qualified_leads"],
+                    "appointment_requests": totals["appointments"].get("requested", 0),
+                    "bookings": totals["appointments"].get("booked", 0),
+                    "messages_to_booking": totals["messages_to_booking"],
                 },
                 "new_client_metrics": {
-                    "all_new_users": set(),
-                    "asked_users": set(),
-                    "booked_users": set(),
-                    "services_by_user": defaultdict(set),
-                    "booked_services_by_user": defaultdict(set)
+                    "all_new_users": new_users,
+                    "asked_users": asked_users,
+                    "booked_users": booked_users,
+                    "services_by_user": {user_id: set(totals["service_users"][user_id]) for user_id in asked_users},
+                    "booked_services_by_user": {user_id: set(totals["booked_users"][user_id]) for user_id in booked_users},
                 },
                 "services_today": {
-                    "date": today_date.isoformat(),
-                    "mentions_by_service": defaultdict(int),
-                    "users_by_service": defaultdict(set),
-                    "all_users": set()
+                    "date": today_key,
+                    "mentions_by_service": totals["service_mentions"].get(today_key, {}),
+                    "users_by_service": users_by_service_today,
+                    "all_users": set().union(*users_by_service_today.values()),
                 },
             }
             
-            # Process each event
-            for event in events:
-                event_type = event.get("type")
-                user_id = self._normalize_user_id(event.get("user_id"))
-                if user_id:
-                    event["user_id"] = user_id
-                dt = self._parse_timestamp(event.get("timestamp"))
-                
-                # Track unique users
-                if user_id:
-                    stats["overview"]["unique_users"].add(user_id)
-                    first_seen = first_seen_by_user.get(user_id)
-                    if first_seen and range_start <= first_seen <= now and not self._is_test_user_id(user_id):
-                        stats["new_client_metrics"]["all_new_users"].add(user_id)
-                
-                # Parse timestamp for time-based stats
-                if dt:
-                    date_key = dt.strftime("%Y-%m-%d")
-                    hour_key = f"{dt.hour:02d}:00"
-                else:
-                    date_key = None
-                    hour_key = None
-                
-                # Process by event type
-                if event_type == "message":
-                    stats["overview"]["total_messages"] += 1
-                    stats["messages"]["by_type"][event.get("msg_type", "text")] += 1
-                    stats["messages"]["by_source"][event.get("source", "user")] += 1
-                    stats["messages"]["by_language"][event.get("language", "ar")] += 1
-                    
-                    sentiment = event.get("sentiment")
-                    if sentiment:
-                        stats["sentiment"][sentiment] += 1
-                    
-                    # Time-based
-                    if date_key:
-                        stats["messages"]["daily"][date_key]["total"] += 1
-                        stats["messages"]["daily"][date_key][event.get("msg_type", "text")] += 1
-                        stats["messages"]["daily"][date_key][event.get("language", "ar")] += 1
-                    if hour_key:
-                        stats["messages"]["hourly"][hour_key] += 1
-                    
-                    # AI performance (bot messages only)
-                    if event.get("source") == "bot":
-                        response_time = self._safe_float(event.get("response_time_ms"))
-                        if response_time > 0:
-                            stats["ai_performance"]["total_response_time"] += response_time
-                            stats["ai_performance"]["response_count"] += 1
-                            stats["ai_performance"]["response_times"].append(response_time)
-                            
-                            if stats["ai_performance"]["min_response_time"] is None:
-                                stats["ai_performance"]["min_response_time"] = response_time
-                            else:
-                                stats["ai_performance"]["min_response_time"] = min(
-                                    stats["ai_performance"]["min_response_time"], response_time
-                                )
-                            
-                            if stats["ai_performance"]["max_response_time"] is None:
-                                stats["ai_performance"]["max_response_time"] = response_time
-                            else:
-                                stats["ai_performance"]["max_response_time"] = max(
-                                    stats["ai_performance"]["max_response_time"], response_time
-                                )
-                        
-                        tokens = max(self._safe_int(event.get("tokens")), 0)
-                        cost = max(self._safe_float(event.get("cost_usd")), 0.0)
-                        model = event.get("model", "unknown")
-                        
-                        if tokens > 0:
-                            stats["ai_performance"]["total_tokens"] += tokens
-                            stats["ai_performance"]["by_model"][model]["tokens"] += tokens
-                        
-                        if cost > 0:
-                            stats["ai_performance"]["total_cost"] += cost
-                            stats["ai_performance"]["by_model"][model]["cost"] += cost
-                    elif event.get("source") == "user" and user_id:
-                        stats["overview"]["active_user_message_users"].add(user_id)
-                        stats["conversions"]["inquiry_users"].add(user_id)
-                
-                elif event_type == "conversation_start":
-                    stats["overview"]["total_conversations"] += 1
-                    if event.get("is_new_user"):
-                        stats["overview"]["new_users"] += 1
-                
-                elif event_type == "gender":
-                    gender = event.get("gender")
-                    if gender:
-                        stats["genders"][gender] += 1
-                
-                elif event_type == "service_request":
-                    service = event.get("service")
-                    if user_id:
-                        stats["conversions"]["inquiry_users"].add(user_id)
-                    if service:
-                        stats["services"][service] += 1
-                        stats["conversions"]["qualified_leads"] += 1
-                        if dt and dt.date() == today_date:
-                            stats["services_today"]["mentions_by_service"][service] += 1
-                            if user_id:
-                                stats["services_today"]["users_by_service"][service].add(user_id)
-                                stats["services_today"]["all_users"].add(user_id)
-                    if user_id and user_id in stats["new_client_metrics"]["all_new_users"] and not self._is_test_user_id(user_id):
-                        stats["new_client_metrics"]["asked_users"].add(user_id)
-                        if service:
-                            stats["new_client_metrics"]["services_by_user"][user_id].add(service)
-                
-                elif event_type == "appointment":
-                    status = event.get("status")
-                    service = event.get("service")
-                    
-                    if status == "requested":
-                        stats["appointments"]["requested"] += 1
-                        stats["conversions"]["appointment_requests"] += 1
-                    elif status == "booked":
-                        stats["appointments"]["booked"] += 1
-                        stats["conversions"]["bookings"] += 1
-                        
-                        messages_count = max(self._safe_int(event.get("messages_count")), 0)
-                        if messages_count > 0:
-                            stats["conversions"]["messages_to_booking"].append(messages_count)
-                        if user_id and user_id in stats["new_client_metrics"]["all_new_users"] and not self._is_test_user_id(user_id):
-                            stats["new_client_metrics"]["booked_users"].add(user_id)
-                            if service:
-                                stats["new_client_metrics"]["booked_services_by_user"][user_id].add(service)
-                    elif status == "confirmed":
-                        stats["appointments"]["confirmed"] += 1
-                    elif status == "rescheduled":
-                        stats["appointments"]["rescheduled"] += 1
-                    elif status == "cancelled":
-                        stats["appointments"]["cancelled"] += 1
-                    
-                    if service and status:
-                        stats["appointments"]["by_service"][service][status] += 1
-                
-                elif event_type == "feedback":
-                    stats["feedback"]["total"] += 1
-                    feedback_type = event.get("feedback_type")
-                    
-                    if feedback_type == "good":
-                        stats["feedback"]["likes"] += 1
-                    else:
-                        stats["feedback"]["dislikes"] += 1
-                        reason = event.get("reason", feedback_type)
-                        if reason:
-                            stats["feedback"]["reasons"][reason] += 1
-                
-                elif event_type == "escalation":
-                    stats["escalations"]["total"] += 1
-                    escalation_type = event.get("escalation_type")
-                    if escalation_type:
-                        stats["escalations"]["by_type"][escalation_type] += 1
-            
-            # Normalize counters and fallback values.
-            stats["conversions"]["inquiries"] = len(stats["conversions"]["inquiry_users"])
-            if stats["overview"]["total_conversations"] == 0:
-                stats["overview"]["total_conversations"] = len(stats["overview"]["active_user_message_users"])
-            if stats["overview"]["new_users"] == 0:
-                stats["overview"]["new_users"] = len(stats["new_client_metrics"]["all_new_users"])
-
-            # Convert sets to counts
-            stats["overview"]["unique_users"] = len(stats["overview"]["unique_users"])
-            
             # Build final response
             response = self._format_analytics_response(stats, days)
             if response.get("success"):
-                response["conversation_types"] = self._build_conversation_type_metrics(events)
+                response["conversation_types"] = self._format_conversation_type_metrics(totals["conversation_stages"])
             return response
             
         except Exception as e:
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Persisted daily rollups for the analytics dashboard.
+
+`aggregate_analytics` used to parse the whole `analytics_events.jsonl` twice per request (the
+requested window, then the full history for the first-seen index). The file only grows, so the
+aggregation is now kept in `data/analytics_rollups.json`:
+
+- one rollup bucket per closed day (counters, per-user sets as {user: count} dicts, response
+  times, Conversation 1/2/3 stage counts),
+- the first-seen timestamp of every user,
+- the byte offset in the events file up to which closed days have been folded.
+
+Each request only reads the bytes appended since the previous request (any worker's appends, as
+it follows the file rather than this process's writes). Those events stay in an in-memory tail
+(normally just today); once a day is over it is folded into the persisted buckets and the offset
+moves past it. Workers append buffered batches up to ANALYTICS_FLUSH_INTERVAL_MS late, so lines
+around midnight are not in time order: a day is only folded once the fold grace period has passed
+after it ended. The window combines the closed-day buckets with the tail.
+
+If the events file shrinks (rotated/truncated) the rollups are rebuilt from scratch;
+`scripts/rebuild_analytics_rollups.py` does the same on demand (backfill, schema change).
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+
+ROLLUPS_VERSION = 1
+MAX_STAGE_EXAMPLES = 3
+
+
+def merge_rollup(target: Dict[str, Any], source: Dict[str, Any]) -> Dict[str, Any]:
+    """Add `source` into `target`: numbers are summed, lists extended, dicts merged recursively."""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_rollup(target.setdefault(key, {}), value)
+        elif isinstance(value, list):
+            target.setdefault(key, []).extend(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            target[key] = target.get(key, 0) + value
+        elif key not in target:
+            target[key] = value
+    return target
+
+
+def trim_stage_examples(rollup: Dict[str, Any]) -> None:
+    for stage in (rollup.get("conversation_stages") or {}).values():
+        if len(stage.get("examples", [])) > MAX_STAGE_EXAMPLES:
+            stage["examples"] = stage["examples"][:MAX_STAGE_EXAMPLES]
+
+
+class AnalyticsRollups:
+    """
+    Rollup store for one events file. The event schema lives in `AnalyticsEvents` (the owner),
+    which provides `_parse_event_line`, `_new_rollup`, `_fold_event` and `_conversation_stage_counts`.
+    """
+
+    def __init__(self, owner: Any, state_file: str = "data/analytics_rollups.json", fold_grace_seconds: Optional[float] = None):
+        self.owner = owner
+        self.state_file = state_file
+        # A day is complete once every worker has flushed the batches it buffered before midnight
+        self.fold_grace = datetime.timedelta(seconds=(
+            fold_grace_seconds if fold_grace_seconds is not None
+            else max(60.0, 2 * getattr(config, "ANALYTICS_FLUSH_INTERVAL_MS", 1000) / 1000.0)
+        ))
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._state_mtime: Optional[int] = None
+        self._reset_state()
+
+    # --- state ---------------------------------------------------------------------------------
+    def _reset_state(self) -> None:
+        self.offset = 0
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self.first_seen: Dict[str, datetime.datetime] = {}
+        self._reset_tail()
+
+    def _reset_tail(self) -> None:
+        # Events read past `offset` that are not folded yet: (line_start, event, day), plus their
+        # rollups by day and the read position in the file.
+        self._tail: List[Tuple[int, Dict[str, Any], datetime.date]] = []
+        self._tail_days: Dict[datetime.date, Dict[str, Any]] = {}
+        self._pos = self.offset
+
+    def _load(self) -> None:
+        """(Re)load the persisted state if another process saved a newer one."""
+        try:
+            mtime = os.stat(self.state_file).st_mtime_ns
+        except OSError:
+            self._loaded = True
+            return
+        if self._loaded and mtime == self._state_mtime:
+            return
+        self._state_mtime = mtime
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Could not read analytics rollups ({e}), rebuilding")
+            self._loaded = True
+            return
+        self._loaded = True
+        if state.get("version") != ROLLUPS_VERSION or state.get("offset", 0) <= self.offset:
+            return
+        self.offset = int(state["offset"])
+        self.days = state.get("days", {})
+        self.first_seen = {}
+        for user_id, seen in state.get("first_seen", {}).items():
+            try:
+                self.first_seen[user_id] = datetime.datetime.fromisoformat(seen)
+            except ValueError:
+                continue
+        self._reset_tail()
+
+    def _save(self) -> None:
+        state = {
+            "version": ROLLUPS_VERSION,
+            "events_file": self.owner.events_file,
+            "offset": self.offset,
+            "updated_at": datetime.datetime.now().isoformat(),
+            "days": self.days,
+            "first_seen": {user_id: seen.isoformat() for user_id, seen in self.first_seen.items()},
+        }
+        tmp_file = f"{self.state_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_file, self.state_file)
+            self._state_mtime = os.stat(self.state_file).st_mtime_ns
+        except Exception as e:
+            print(f"❌ Error saving analytics rollups: {e}")
+
+    # --- reading the events file ---------------------------------------------------------------
+    def _refresh(self, today: datetime.date, now: Optional[datetime.datetime] = None) -> None:
+        self._load()
+        try:
+            size = os.path.getsize(self.owner.events_file)
+        except OSError:
+            size = 0
+        if size < self._pos:
+            print("⚠️ Analytics events file shrank, rebuilding rollups")
+            self._reset_state()
+
+        folded = False
+        if size > self._pos:
+            with open(self.owner.events_file, "rb") as f:
+                f.seek(self._pos)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # a line still being written by another worker
+                    parsed = self.owner._parse_event_line(raw)
+                    if parsed is None:
+                        self._pos += len(raw)
+                        continue
+                    event, user_id, dt = parsed
+                    day = dt.date()
+                    # Batches land up to a flush interval late: a line this far past midnight means
+                    # the days before it are complete
+                    complete_before = (dt - self.fold_grace).date()
+                    if self._tail and self._tail[0][2] < complete_before:
+                        folded = self._fold_before(complete_before) or folded
+                    self._tail.append((self._pos, event, day))
+                    self._pos += len(raw)
+                    self.owner._fold_event(self._tail_days.setdefault(day, self.owner._new_rollup()), event, user_id, dt)
+                    if user_id:
+                        seen = self.first_seen.get(user_id)
+                        if seen is None or dt < seen:
+                            self.first_seen[user_id] = dt
+        now = now or datetime.datetime.now()
+        folded = self._fold_before(min(today, (now - self.fold_grace).date())) or folded
+        if not self._tail:
+            self.offset = self._pos
+        if folded:
+            self._save()
+
+    def _fold_before(self, cutoff: datetime.date) -> bool:
+        """Move every tail event dated before `cutoff` (wherever it sits in the tail) into the persisted day buckets."""
+        events_by_day: Dict[datetime.date, List[Dict[str, Any]]] = {}
+        remaining = []
+        for item in self._tail:
+            if item[2] < cutoff:
+                events_by_day.setdefault(item[2], []).append(item[1])
+            else:
+                remaining.append(item)
+        if not events_by_day:
+            return False
+        self._tail = remaining
+
+        for day, events in events_by_day.items():
+            rollup = self._tail_days.pop(day)
+            rollup["conversation_stages"] = self.owner._conversation_stage_counts(events)
+            date_key = day.isoformat()
+            if date_key in self.days:
+                # A line later than the grace period: its sessions are counted on their own
+                merge_rollup(self.days[date_key], rollup)
+                trim_stage_examples(self.days[date_key])
+            else:
+                self.days[date_key] = rollup
+
+        self.offset = self._tail[0][0] if self._tail else self._pos
+        return True
+
+    # --- queries -------------------------------------------------------------------------------
+    def collect(
+        self,
+        start_date: datetime.date,
+        today: Optional[datetime.date] = None,
+        now: Optional[datetime.datetime] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, datetime.datetime]]:
+        """
+        Combined rollup of the days from `start_date` through today, and the first-seen
+        timestamps of the users active in it.
+        """
+        today = today or datetime.date.today()
+        with self._lock:
+            self._refresh(today, now)
+            totals = self.owner._new_rollup()
+            start_key = start_date.isoformat()
+            for date_key in sorted(self.days):
+                if date_key >= start_key:
+                    merge_rollup(totals, self.days[date_key])
+            tail_events = []
+            for day, rollup in self._tail_days.items():
+                if day >= start_date:
+                    merge_rollup(totals, rollup)
+            for _, event, day in self._tail:
+                if day >= start_date:
+                    tail_events.append(event)
+            if tail_events:
+                merge_rollup(totals, {"conversation_stages": self.owner._conversation_stage_counts(tail_events)})
+            trim_stage_examples(totals)
+            first_seen = {user_id: self.first_seen[user_id] for user_id in totals["users"] if user_id in self.first_seen}
+            return totals, first_seen
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Drop the persisted rollups and fold the whole events file again."""
+        with self._lock:
+            started = time.perf_counter()
+            self._reset_state()
+            self._loaded = True
+            try:
+                self._state_mtime = os.stat(self.state_file).st_mtime_ns
+            except OSError:
+                pass
+            self._refresh(datetime.date.today())
+            self._save()
+            stats = self.stats()
+            stats["rebuild_seconds"] = round(time.perf_counter() - started, 3)
+            return stats
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state_file": self.state_file,
+            "closed_days": len(self.days),
+            "first_day": min(self.days) if self.days else None,
+            "last_day": max(self.days) if self.days else None,
+            "indexed_users": len(self.first_seen),
+            "offset": self.offset,
+            "tail_events": len(self._tail),
+        }
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered writer for the analytics events JSONL file.
+
+`AnalyticsEvents._append_event` used to open the file, write one line and close it on the event
+loop for every message, gender, service request... Events are now serialized into an in-memory
+buffer and a background thread appends them in batches:
+
+- a batch is written when ANALYTICS_FLUSH_BATCH_SIZE events are pending or every
+  ANALYTICS_FLUSH_INTERVAL_MS, whichever comes first;
+- each batch is one O_APPEND write under an exclusive flock, so batches from several gunicorn
+  workers never interleave inside a line (the daily rollups follow this single file);
+- the file is fsynced at most every ANALYTICS_FSYNC_INTERVAL_SECONDS (0 = after every batch);
+- beyond ANALYTICS_MAX_PENDING_EVENTS new events are dropped rather than growing the buffer.
+
+`close()` (app shutdown, and atexit) writes what is left. Events logged after that are written
+synchronously and counted as late.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import config
+from services.metrics import counter
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_analytics_events_total = counter(
+    "linasbot_analytics_events_total",
+    "Analytics events by outcome (written in a batch, dropped, or written late after shutdown)",
+    ("result",),
+)
+
+
+class AnalyticsEventWriter:
+    def __init__(
+        self,
+        path: str,
+        batch_size: Optional[int] = None,
+        flush_interval_seconds: Optional[float] = None,
+        fsync_interval_seconds: Optional[float] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.path = path
+        self.batch_size = batch_size or getattr(config, "ANALYTICS_FLUSH_BATCH_SIZE", 200)
+        self.flush_interval = (
+            flush_interval_seconds if flush_interval_seconds is not None
+            else getattr(config, "ANALYTICS_FLUSH_INTERVAL_MS", 1000) / 1000.0
+        )
+        self.fsync_interval = (
+            fsync_interval_seconds if fsync_interval_seconds is not None
+            else getattr(config, "ANALYTICS_FSYNC_INTERVAL_SECONDS", 5.0)
+        )
+        self.max_pending = max_pending or getattr(config, "ANALYTICS_MAX_PENDING_EVENTS", 10000)
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        # Held from taking a batch until it is written: flushes from the writer thread and from
+        # aggregate_analytics must not reorder batches
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._last_fsync = time.monotonic()
+        self._stats = {"written": 0, "batches": 0, "dropped": 0, "late": 0, "fsyncs": 0, "max_pending": 0}
+
+    def write(self, event: Dict[str, Any]) -> None:
+        """Queue one event; serialized now so later changes to the dict don't leak into the log."""
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._lock:
+            closed = self._closed
+            if not closed and len(self._pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                _analytics_events_total.labels(result="dropped").inc()
+                return
+            if not closed:
+                self._pending.append(line)
+                pending = len(self._pending)
+                self._stats["max_pending"] = max(self._stats["max_pending"], pending)
+                if self._thread is None:
+                    self._start()
+        if closed:
+            self._stats["late"] += 1
+            _analytics_events_total.labels(result="late").inc()
+            with self._write_lock:
+                self._write_lines([line])
+        elif pending >= self.batch_size:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of events written."""
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+            if not lines:
+                return 0
+            return self._write_lines(lines)
+
+    def close(self) -> None:
+        """Stop the writer thread and write what is left."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.flush()
+        self._fsync()
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Analytics writer error: {e}")
+
+    def _write_lines(self, lines: List[str]) -> int:
+        """Append one batch; the caller holds `_write_lock`."""
+        data = "".join(lines).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                if self.fsync_interval <= 0 or time.monotonic() - self._last_fsync >= self.fsync_interval:
+                    os.fsync(fd)
+                    self._last_fsync = time.monotonic()
+                    self._stats["fsyncs"] += 1
+            finally:
+                os.close(fd)  # also releases the flock
+        except Exception as e:
+            self._stats["dropped"] += len(lines)
+            _analytics_events_total.labels(result="dropped").inc(len(lines))
+            print(f"❌ Error appending {len(lines)} analytics events: {e}")
+            return 0
+        self._stats["written"] += len(lines)
+        self._stats["batches"] += 1
+        _analytics_events_total.labels(result="written").inc(len(lines))
+        return len(lines)
+
+    def _fsync(self) -> None:
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+            self._last_fsync = time.monotonic()
+            self._stats["fsyncs"] += 1
+        finally:
+            os.close(fd)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "pending": len(self._pending),
+            "batch_size": self.batch_size,
+            "flush_interval_ms": round(self.flush_interval * 1000),
+            "fsync_interval_seconds": self.fsync_interval,
+            **self._stats,
+        }
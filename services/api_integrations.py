@@ -10,16 +10,12 @@ import config
 import api_config
 # NEW: Import Firestore utility functions
 from utils.utils import update_dashboard_metric_in_firestore, get_firestore_db
+from services.http_clients import get_http_client
+from services.reference_data_cache import reference_data_cache
 
 # Path to the daily reports log file
 REPORT_LOG_FILE = 'data/reports_log.jsonl' 
 
-# Increase timeout to 60 seconds for slow API endpoints (especially appointment queries)
-api_client = httpx.AsyncClient(
-    base_url=api_config.LINASLASER_API_BASE_URL,
-    timeout=60.0  # 60 seconds timeout instead of default 5 seconds
-)
-
 async def _make_api_request(method: str, endpoint: str, params: dict = None, json_data: dict = None):
     """
     Helper function to make authenticated API requests to the LinasLaser Agent API.
@@ -29,6 +25,8 @@ async def _make_api_request(method: str, endpoint: str, params: dict = None, jso
         "Content-Type": "application/json"
     }
 
+    # Shared "crm" client: keep-alive pool, 60 seconds timeout for slow endpoints (especially appointment queries)
+    api_client = get_http_client("crm")
     try:
         if method.lower() == "get":
             response = await api_client.get(endpoint, params=params, headers=headers)
@@ -72,7 +70,10 @@ async def _make_api_request(method: str, endpoint: str, params: dict = None, jso
 # ----------------------------------------------------------------------------------------------------------------------
 
 async def get_branches():
-    """Retrieves a list of all branches associated with the clinic."""
+    """Retrieves a list of all branches associated with the clinic. Served from the reference-data cache."""
+    return await reference_data_cache.get("branches", _fetch_branches)
+
+async def _fetch_branches():
     print("API Call: get_branches")
     response = await _make_api_request("GET", "branches")
     if response.get("success"):
@@ -82,7 +83,10 @@ async def get_branches():
     return response
 
 async def get_services():
-    """Retrieves a list of all services offered by the clinic."""
+    """Retrieves a list of all services offered by the clinic. Served from the reference-data cache."""
+    return await reference_data_cache.get("services", _fetch_services)
+
+async def _fetch_services():
     print("API Call: get_services")
     response = await _make_api_request("GET", "services")
     if response.get("success"):
@@ -92,7 +96,10 @@ async def get_services():
     return response
 
 async def get_machines():
-    """Retrieves a list of all machines available in the clinic."""
+    """Retrieves a list of all machines available in the clinic. Served from the reference-data cache."""
+    return await reference_data_cache.get("machines", _fetch_machines)
+
+async def _fetch_machines():
     print("API Call: get_machines")
     response = await _make_api_request("GET", "machines")
     if response.get("success"):
@@ -102,7 +109,10 @@ async def get_machines():
     return response
 
 async def get_clinic_hours():
-    """Returns the clinic's working hours for each day of the week."""
+    """Returns the clinic's working hours for each day of the week. Served from the reference-data cache."""
+    return await reference_data_cache.get("clinic_hours", _fetch_clinic_hours)
+
+async def _fetch_clinic_hours():
     print("API Call: get_clinic_hours")
     response = await _make_api_request("GET", "clinic/hours")
     if response.get("success"):
@@ -228,7 +238,18 @@ async def check_appointment_payment(phone: str, user_code: str = None):
     return response
 
 async def get_pricing_details(service_id: int, machine_id: int = None, body_part_ids: list = None, branch_id: int = None):
-    """Returns pricing details for appointments or services based on specified criteria."""
+    """Returns pricing details for appointments or services based on specified criteria (cached per criteria)."""
+    if body_part_ids is None or isinstance(body_part_ids, list):
+        body_parts_key = tuple(sorted(map(str, body_part_ids or [])))
+    else:
+        body_parts_key = (str(body_part_ids),)
+    return await reference_data_cache.get(
+        "pricing",
+        lambda: _fetch_pricing_details(service_id, machine_id, body_part_ids, branch_id),
+        key=(str(service_id), str(machine_id or ""), body_parts_key, str(branch_id or "")),
+    )
+
+async def _fetch_pricing_details(service_id: int, machine_id: int = None, body_part_ids: list = None, branch_id: int = None):
     print(f"API Call: get_pricing_details for service_id={service_id}")
     params = {"service_id": service_id}
     if machine_id: params["machine_id"] = machine_id
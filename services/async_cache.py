@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded in-process TTL cache with single-flight loading.
+
+Used where a per-worker dict used to grow forever or be swept in full on every call (external
+customer resolution, user gender/language preferences), and under the CRM reference-data cache
+(services/reference_data_cache.py):
+
+- entries expire after `ttl_seconds`; "negative" values (per `is_negative`, e.g. customer not in
+  the CRM, gender unknown) after the shorter `negative_ttl_seconds`. Expiry is checked on access,
+  so a lookup is O(1) whatever the size;
+- at most `max_size` entries: the least recently used one is evicted (OrderedDict);
+- `get_or_load(key, loader)` runs one loader per key at a time: concurrent misses for the same
+  key (several messages from a new number arriving together) await the same call. The call runs
+  in its own task, so a waiter that is cancelled does not cancel it for the others. Exceptions
+  are passed to every waiter and not cached, nor are values rejected by `cacheable`.
+  `load(key, loader)` does the same without looking at the cached value first (refreshes).
+
+Hit/miss/coalesced/eviction counts are exported per cache name.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from services.metrics import counter
+
+_cache_requests_total = counter(
+    "linasbot_async_cache_requests_total",
+    "In-process cache lookups by cache and result (hit, miss, coalesced)",
+    ("cache", "result"),
+)
+_cache_evictions_total = counter(
+    "linasbot_async_cache_evictions_total",
+    "In-process cache entries removed, by cache and reason (expired, lru)",
+    ("cache", "reason"),
+)
+
+MISSING = object()
+
+
+class AsyncTTLCache:
+    def __init__(
+        self,
+        name: str,
+        max_size: int = 10000,
+        ttl_seconds: float = 600,
+        negative_ttl_seconds: Optional[float] = None,
+        is_negative: Optional[Callable[[Any], bool]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds if negative_ttl_seconds is not None else ttl_seconds
+        self._is_negative = is_negative
+        self._cacheable = cacheable
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, MISSING, count=False) is not MISSING
+
+    def _count(self, stat: str, result: str) -> None:
+        self._stats[stat] += 1
+        _cache_requests_total.labels(cache=self.name, result=result).inc()
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """Cached value for `key` (refreshing its LRU position), or `default`."""
+        item = self._entries.get(key)
+        if item is not None:
+            value, expires_at = item
+            if self._clock() < expires_at:
+                self._entries.move_to_end(key)
+                if count:
+                    self._count("hits", "hit")
+                return value
+            del self._entries[key]
+            self._stats["expired"] += 1
+            _cache_evictions_total.labels(cache=self.name, reason="expired").inc()
+        if count:
+            self._count("misses", "miss")
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        if ttl_seconds is None:
+            negative = self._is_negative is not None and self._is_negative(value)
+            ttl_seconds = self.negative_ttl_seconds if negative else self.ttl_seconds
+        self._entries[key] = (value, self._clock() + ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+            _cache_evictions_total.labels(cache=self.name, reason="lru").inc()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._entries.pop(key, None)
+        return item[0] if item is not None else default
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Unexpired (key, value) pairs, least recently used first (does not touch LRU order)."""
+        now = self._clock()
+        return [(key, value) for key, (value, expires_at) in self._entries.items() if now < expires_at]
+
+    def loading(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached value, or the result of `loader()` (one call per key at a time), cached."""
+        value = self.get(key, MISSING, count=False)
+        if value is not MISSING:
+            self._count("hits", "hit")
+            return value
+        return await self.load(key, loader)
+
+    async def load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `loader()`, shared with any load of `key` already running, cached if cacheable."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count("coalesced", "coalesced")
+        else:
+            self._count("misses", "miss")
+            task = asyncio.ensure_future(self._run_loader(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._load_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _run_loader(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = await loader()
+        if self._cacheable is None or self._cacheable(value):
+            self.set(key, value)
+        return value
+
+    def _load_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved: waiters re-raise it, no "never retrieved" warning
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds,
+            "inflight": len(self._inflight),
+            **self._stats,
+        }
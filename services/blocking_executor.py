@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Bounded thread pools for blocking work called from async handlers.
+
+- `await blocking_executor.run_io(func, *args)`: blocking I/O (Firestore/Storage SDK calls, file
+  reads/writes). This pool is also installed as the event loop's default executor at startup,
+  so the existing `asyncio.to_thread(...)` calls share the same bound and metrics.
+- `await blocking_executor.run_cpu(func, *args)`: CPU-heavy calls (bcrypt, PIL resizing,
+  pydub/ffmpeg). bcrypt and PIL release the GIL and pydub runs ffmpeg as a subprocess, so a small
+  thread pool keeps them off the event loop without the fork/pickling cost of a process pool.
+
+Both preserve contextvars (like `asyncio.to_thread`) and export queue/latency metrics.
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+import config
+from services.metrics import gauge, histogram
+
+T = TypeVar("T")
+
+_offload_seconds = histogram(
+    "linasbot_offload_seconds",
+    "Time blocking calls spent in an offload pool (queued + running)",
+    ("pool",),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+_offload_pending = gauge("linasbot_offload_pending", "Blocking calls queued or running in an offload pool", ("pool",))
+
+
+class _Pool:
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.pending = 0
+        self.completed = 0
+        self.max_pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"offload-{self.name}")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        _offload_pending.labels(pool=self.name).set(self.pending)
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+            _offload_pending.labels(pool=self.name).set(self.pending)
+            _offload_seconds.labels(pool=self.name).observe(time.perf_counter() - started)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+        }
+
+
+class BlockingExecutor:
+    def __init__(self, io_workers: Optional[int] = None, cpu_workers: Optional[int] = None):
+        self._io = _Pool("io", io_workers or getattr(config, "OFFLOAD_IO_THREADS", 16))
+        self._cpu = _Pool("cpu", cpu_workers or getattr(config, "OFFLOAD_CPU_THREADS", 4))
+
+    async def run_io(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run blocking I/O in the bounded I/O pool."""
+        return await self._io.run(func, *args, **kwargs)
+
+    async def run_cpu(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run CPU-heavy work in the bounded CPU pool."""
+        return await self._cpu.run(func, *args, **kwargs)
+
+    def install_default(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Make the I/O pool the loop's default executor (used by asyncio.to_thread)."""
+        (loop or asyncio.get_running_loop()).set_default_executor(self._io.executor)
+
+    def shutdown(self) -> None:
+        self._io.shutdown()
+        self._cpu.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"io": self._io.stats(), "cpu": self._cpu.stats()}
+
+
+# Global instance
+blocking_executor = BlockingExecutor()
@@ -6,12 +6,12 @@ Combines existing API responses to build knowledge base dynamically
 
 import os
 import asyncio
-import httpx
 import json
 import time
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 import api_config
+from services.http_clients import get_http_client
 
 # Load environment variables
 load_dotenv()
@@ -242,19 +242,19 @@ class BotDataService:
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient(base_url=self.base_url, timeout=30.0) as client:
-            if method == "GET":
-                response = await client.get(endpoint, headers=headers, params=params)
-            else:
-                response = await client.post(endpoint, headers=headers, json=params)
+        client = get_http_client("crm")  # same API as self.base_url
+        if method == "GET":
+            response = await client.get(endpoint, headers=headers, params=params, timeout=30.0)
+        else:
+            response = await client.post(endpoint, headers=headers, json=params, timeout=30.0)
             
-            response.raise_for_status()
-            data = response.json()
+        response.raise_for_status()
+        data = response.json()
             
-            if not data.get('success'):
-                raise Exception(f"API Error: {data.get('message', 'Unknown error')}")
+        if not data.get('success'):
+            raise Exception(f"API Error: {data.get('message', 'Unknown error')}")
             
-            return data.get('data', [])
+        return data.get('data', [])
     
     def _is_cache_valid(self, key: str) -> bool:
         """Check if cache is valid and not expired"""
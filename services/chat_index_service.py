@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+Chat Index Service - materialized Live Chat list (one row per customer).
+
+Live Chat list views (unified chats, active conversations, history customers, waiting queue)
+used to stream every user document and every conversation on each cache miss. This index keeps
+the latest conversation per customer (preview, last activity, status, takeover, phone/name) in a
+local SQLite database (WAL, shared by all workers on the host) so listing, search and pagination
+are single indexed queries.
+
+- Updated incrementally by save_conversation_message_to_firestore, set_human_takeover_status
+  and the end/reopen/archive paths in LiveChatService.
+- Rebuilt from Firestore on startup when empty, or on demand (POST /api/live-chat/index/rebuild).
+- Firestore stays the source of truth; the index can be deleted at any time and rebuilt.
+"""
+
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from services.conversation_store import is_subcollection_layout
+from services.live_chat_contracts import parse_timestamp_utc
+
+UTC = datetime.timezone.utc
+STATE_FIELDS = (
+    "conversation_status",
+    "human_takeover_active",
+    "operator_id",
+    "operator_name",
+    "sentiment",
+    "escalation_reason",
+    "escalation_time",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_index (
+    user_id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    customer_info TEXT NOT NULL DEFAULT '{}',
+    user_name TEXT NOT NULL DEFAULT '',
+    user_phone TEXT NOT NULL DEFAULT '',
+    phone_clean TEXT NOT NULL DEFAULT '',
+    search_text TEXT NOT NULL DEFAULT '',
+    last_message_content TEXT NOT NULL DEFAULT '',
+    last_message_is_user INTEGER NOT NULL DEFAULT 0,
+    last_activity REAL NOT NULL,
+    first_message_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    total_message_count INTEGER NOT NULL DEFAULT 0,
+    conversation_count INTEGER NOT NULL DEFAULT 0,
+    conversation_status TEXT NOT NULL DEFAULT 'active',
+    human_takeover_active INTEGER NOT NULL DEFAULT 0,
+    operator_id TEXT,
+    operator_name TEXT,
+    sentiment TEXT NOT NULL DEFAULT 'neutral',
+    escalation_reason TEXT,
+    escalation_time REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_index_last_activity ON chat_index (last_activity DESC);
+CREATE INDEX IF NOT EXISTS idx_chat_index_waiting ON chat_index (human_takeover_active, operator_id);
+CREATE TABLE IF NOT EXISTS chat_index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = (
+    "user_id",
+    "conversation_id",
+    "customer_info",
+    "user_name",
+    "user_phone",
+    "phone_clean",
+    "search_text",
+    "last_message_content",
+    "last_message_is_user",
+    "last_activity",
+    "first_message_at",
+    "message_count",
+    "total_message_count",
+    "conversation_count",
+    "conversation_status",
+    "human_takeover_active",
+    "operator_id",
+    "operator_name",
+    "sentiment",
+    "escalation_reason",
+    "escalation_time",
+    "updated_at",
+)
+
+# Not waiting for an operator (waiting_human chats only appear in the waiting queue)
+_NOT_WAITING_SQL = "NOT (human_takeover_active = 1 AND operator_id IS NULL)"
+
+
+def _epoch(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return parse_timestamp_utc(value).timestamp()
+
+
+def epoch_to_datetime(value: Optional[float]) -> Optional[datetime.datetime]:
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(float(value), tz=UTC)
+
+
+def _digits(value: Any) -> str:
+    return "".join(ch for ch in str(value or "") if ch.isdigit())
+
+
+def _is_smart_message(message: Dict[str, Any]) -> bool:
+    metadata = (message or {}).get("metadata", {}) or {}
+    return metadata.get("source") == "smart_message"
+
+
+def build_search_text(user_id: str, user_name: str, *phones: Any) -> str:
+    """Lowercased haystack for LIKE search: name, user id, phones and their digit variants."""
+    parts = [str(user_name or ""), str(user_id or "")]
+    for phone in (user_id,) + phones:
+        parts.append(str(phone or ""))
+        digits = _digits(phone)
+        if digits:
+            parts.append(digits)
+            if digits.startswith("961") and len(digits) > 8:
+                parts.append(digits[3:])
+    return " ".join(p for p in parts if p).lower()
+
+
+def conversation_visible_stats(payload: Dict[str, Any]) -> Tuple[int, Optional[float]]:
+    """Visible (non-smart) message count and first visible timestamp of a raw conversation document."""
+    payload = payload or {}
+    if is_subcollection_layout(payload):
+        return int(payload.get("visible_message_count") or 0), _epoch(payload.get("first_visible_at"))
+    visible = [m for m in (payload.get("messages") or []) if not _is_smart_message(m)]
+    if not visible:
+        return 0, None
+    return len(visible), _epoch(visible[0].get("timestamp"))
+
+
+def conversation_state(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Index state columns taken from a (raw or normalized) conversation document."""
+    payload = payload or {}
+    return {
+        "conversation_status": str(payload.get("status") or "active"),
+        "human_takeover_active": 1 if payload.get("human_takeover_active") else 0,
+        "operator_id": payload.get("operator_id") or None,
+        "operator_name": payload.get("operator_name") or None,
+        "sentiment": str(payload.get("sentiment") or "neutral"),
+        "escalation_reason": payload.get("escalation_reason") or None,
+        "escalation_time": _epoch(payload.get("escalation_time")),
+    }
+
+
+def _identity_columns(user_id: str, customer_info: Dict[str, Any]) -> Dict[str, Any]:
+    customer_info = dict(customer_info or {})
+    user_name = str(customer_info.get("name") or "")
+    user_phone = str(customer_info.get("phone_full") or "")
+    phone_clean = str(customer_info.get("phone_clean") or "")
+    return {
+        "customer_info": json.dumps(customer_info, ensure_ascii=False, default=str),
+        "user_name": user_name,
+        "user_phone": user_phone,
+        "phone_clean": phone_clean,
+        "search_text": build_search_text(user_id, user_name, user_phone, phone_clean),
+    }
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    try:
+        data["customer_info"] = json.loads(data.get("customer_info") or "{}")
+    except ValueError:
+        data["customer_info"] = {}
+    data["human_takeover_active"] = bool(data.get("human_takeover_active"))
+    data["last_message_is_user"] = bool(data.get("last_message_is_user"))
+    if "is_live" in data:
+        data["is_live"] = bool(data["is_live"])
+    return data
+
+
+def _like_pattern(search: str) -> str:
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class ChatIndexService:
+    """SQLite-backed chat list index (one row per customer, latest conversation only)."""
+
+    BUSY_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, db_path: Optional[Path] = None):
+        if db_path is None:
+            from storage.persistent_storage import CHAT_INDEX_DB_FILE
+            db_path = CHAT_INDEX_DB_FILE
+        self.db_path = Path(db_path)
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ connection
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_SECONDS)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(_SCHEMA)
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    self._schema_ready = True
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=self.BUSY_TIMEOUT_SECONDS, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, fn):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _read(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, tuple(params)).fetchall()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------ meta
+
+    def is_ready(self) -> bool:
+        """True once a full build from Firestore has completed at least once."""
+        try:
+            rows = self._read("SELECT value FROM chat_index_meta WHERE key = 'built_at'")
+            return bool(rows)
+        except sqlite3.Error as e:
+            print(f"⚠️ Chat index unavailable: {e}")
+            return False
+
+    def mark_built(self, rows: int) -> None:
+        def _apply(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_index_meta (key, value) VALUES ('built_at', ?)",
+                (str(time.time()),),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO chat_index_meta (key, value) VALUES ('built_rows', ?)",
+                (str(rows),),
+            )
+        self._write(_apply)
+
+    def stats(self) -> Dict[str, Any]:
+        meta = {row["key"]: row["value"] for row in self._read("SELECT key, value FROM chat_index_meta")}
+        total = self._read("SELECT COUNT(*) AS n FROM chat_index")[0]["n"]
+        built_at = meta.get("built_at")
+        return {
+            "ready": built_at is not None,
+            "rows": total,
+            "built_at": epoch_to_datetime(float(built_at)).isoformat() if built_at else None,
+            "built_rows": int(meta["built_rows"]) if meta.get("built_rows") else None,
+            "db_path": str(self.db_path),
+        }
+
+    # ------------------------------------------------------------------ incremental writes
+
+    def record_message(
+        self,
+        user_id: str,
+        conversation_id: str,
+        message: Dict[str, Any],
+        *,
+        customer_info: Optional[Dict[str, Any]] = None,
+        conversation: Optional[Dict[str, Any]] = None,
+        new_conversation: bool = False,
+    ) -> bool:
+        """
+        Apply one saved message to the customer's row.
+        `conversation` is the conversation document as stored before this message, with the
+        header updates of the same save applied (status/takeover reset etc.).
+        Smart messages are not shown in Live Chat and are ignored.
+        """
+        if not user_id or not conversation_id or _is_smart_message(message):
+            return False
+
+        message_ts = _epoch(message.get("timestamp")) or time.time()
+        state = conversation_state(conversation or {})
+        prior_visible_count, prior_first_at = conversation_visible_stats(conversation or {})
+
+        def _apply(conn):
+            current = conn.execute(
+                "SELECT conversation_id, message_count, first_message_at, total_message_count, conversation_count "
+                "FROM chat_index WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            if current is not None and current["conversation_id"] == conversation_id:
+                message_count = current["message_count"] + 1
+                first_message_at = current["first_message_at"]
+            else:
+                message_count = prior_visible_count + 1
+                first_message_at = prior_first_at or message_ts
+            if current is None:
+                total_message_count = prior_visible_count + 1
+                conversation_count = 1
+            else:
+                total_message_count = current["total_message_count"] + 1
+                conversation_count = current["conversation_count"] + (1 if new_conversation else 0)
+
+            row = {
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "last_message_content": str(message.get("text", "") or ""),
+                "last_message_is_user": 1 if message.get("role") == "user" else 0,
+                "last_activity": message_ts,
+                "first_message_at": first_message_at,
+                "message_count": message_count,
+                "total_message_count": total_message_count,
+                "conversation_count": conversation_count,
+                "updated_at": time.time(),
+            }
+            row.update(state)
+            identity = customer_info or (conversation or {}).get("customer_info")
+            if identity or current is None:
+                row.update(_identity_columns(user_id, identity or {}))
+            self._upsert(conn, row)
+        self._write(_apply)
+        return True
+
+    def update_conversation_state(self, user_id: str, conversation_id: str, **fields: Any) -> bool:
+        """
+        Update status/takeover columns when the row still points at this conversation.
+        Accepts conversation document field names (status, human_takeover_active, operator_id, ...).
+        """
+        if "status" in fields:
+            fields["conversation_status"] = fields.pop("status")
+        updates = {}
+        for key, value in fields.items():
+            if key not in STATE_FIELDS:
+                continue
+            if key == "human_takeover_active":
+                value = 1 if value else 0
+            elif key == "escalation_time":
+                value = _epoch(value)
+            elif key in ("operator_id", "operator_name", "escalation_reason"):
+                value = value or None
+            updates[key] = value
+        if not updates:
+            return False
+        updates["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in updates)
+
+        def _apply(conn):
+            cursor = conn.execute(
+                f"UPDATE chat_index SET {assignments} WHERE user_id = ? AND conversation_id = ?",
+                (*updates.values(), user_id, conversation_id),
+            )
+            return cursor.rowcount > 0
+        return self._write(_apply)
+
+    def update_customer_info(self, user_id: str, conversation_id: str, customer_info: Dict[str, Any]) -> bool:
+        """Refresh name/phone (e.g. deferred CRM name resolution) for the customer's latest conversation."""
+        columns = _identity_columns(user_id, customer_info)
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in columns)
+
+        def _apply(conn):
+            cursor = conn.execute(
+                f"UPDATE chat_index SET {assignments} WHERE user_id = ? AND conversation_id = ?",
+                (*columns.values(), user_id, conversation_id),
+            )
+            return cursor.rowcount > 0
+        return self._write(_apply)
+
+    # ------------------------------------------------------------------ rebuild
+
+    def build_row(
+        self,
+        chat_row: Dict[str, Any],
+        *,
+        total_message_count: int,
+        conversation_count: int,
+    ) -> Dict[str, Any]:
+        """
+        Index row from a chat row computed by a full Firestore read (rebuild path). Chat rows carry
+        epoch timestamps, a customer_info dict and the STATE_FIELDS of the latest conversation.
+        """
+        row = {
+            "user_id": chat_row["user_id"],
+            "conversation_id": chat_row["conversation_id"],
+            "last_message_content": str(chat_row.get("last_message_content") or ""),
+            "last_message_is_user": 1 if chat_row.get("last_message_is_user") else 0,
+            "last_activity": float(chat_row["last_activity"]),
+            "first_message_at": float(chat_row.get("first_message_at") or chat_row["last_activity"]),
+            "message_count": int(chat_row.get("message_count") or 0),
+            "total_message_count": int(total_message_count),
+            "conversation_count": int(conversation_count),
+            "updated_at": time.time(),
+        }
+        for key in STATE_FIELDS:
+            row[key] = chat_row.get(key)
+        row["conversation_status"] = row["conversation_status"] or "active"
+        row["sentiment"] = row["sentiment"] or "neutral"
+        row["human_takeover_active"] = 1 if chat_row.get("human_takeover_active") else 0
+        row.update(_identity_columns(chat_row["user_id"], chat_row.get("customer_info") or {}))
+        return row
+
+    def replace_rows(self, rows: List[Dict[str, Any]], *, built_after: float) -> int:
+        """
+        Upsert rebuilt rows. Rows touched incrementally after `built_after` (the moment the
+        Firestore read started) are newer than the rebuilt data and are kept as they are.
+        """
+        def _apply(conn):
+            written = 0
+            for row in rows:
+                written += self._upsert(conn, row, only_if_updated_before=built_after)
+            return written
+        return self._write(_apply)
+
+    def _upsert(self, conn: sqlite3.Connection, row: Dict[str, Any], only_if_updated_before: Optional[float] = None) -> int:
+        columns = [column for column in _COLUMNS if column in row]
+        values = [row[column] for column in columns]
+        assignments = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "user_id")
+        sql = (
+            f"INSERT INTO chat_index ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {assignments}"
+        )
+        if only_if_updated_before is not None:
+            sql += " WHERE chat_index.updated_at <= ?"
+            values.append(only_if_updated_before)
+        return conn.execute(sql, values).rowcount
+
+    # ------------------------------------------------------------------ queries
+
+    def query_unified(self, search: str, live_since: float, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Live chats first (recent, open, bot-handled), then everything else by last activity."""
+        where = [_NOT_WAITING_SQL]
+        params: List[Any] = []
+        if search:
+            where.append("search_text LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(search.lower()))
+        where_sql = " AND ".join(where)
+        is_live_sql = (
+            "(last_activity >= ? AND conversation_status NOT IN ('resolved', 'archived') "
+            "AND human_takeover_active = 0)"
+        )
+        rows = self._read(
+            f"SELECT *, {is_live_sql} AS is_live FROM chat_index WHERE {where_sql} "
+            f"ORDER BY is_live DESC, last_activity DESC LIMIT ? OFFSET ?",
+            [live_since, *params, limit, offset],
+        )
+        total = self._read(f"SELECT COUNT(*) AS n FROM chat_index WHERE {where_sql}", params)[0]["n"]
+        return [_row_to_dict(r) for r in rows], total
+
+    def query_active(self, active_since: float) -> List[Dict[str, Any]]:
+        """Open chats active since `active_since` (human-handled ones regardless of age)."""
+        rows = self._read(
+            "SELECT * FROM chat_index "
+            "WHERE conversation_status NOT IN ('resolved', 'archived') "
+            f"AND (last_activity >= ? OR human_takeover_active = 1) AND {_NOT_WAITING_SQL} "
+            "ORDER BY last_activity DESC",
+            [active_since],
+        )
+        return [_row_to_dict(r) for r in rows]
+
+    def query_history(
+        self, search: str, since: Optional[float], limit: int, offset: int
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        where = ["1 = 1"]
+        params: List[Any] = []
+        if since is not None:
+            where.append("last_activity >= ?")
+            params.append(since)
+        if search:
+            pattern = _like_pattern(search.lower())
+            where.append("(search_text LIKE ? ESCAPE '\\' OR lower(last_message_content) LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        where_sql = " AND ".join(where)
+        rows = self._read(
+            f"SELECT * FROM chat_index WHERE {where_sql} ORDER BY last_activity DESC LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        )
+        total = self._read(f"SELECT COUNT(*) AS n FROM chat_index WHERE {where_sql}", params)[0]["n"]
+        return [_row_to_dict(r) for r in rows], total
+
+    def query_waiting(self) -> List[Dict[str, Any]]:
+        rows = self._read(
+            "SELECT * FROM chat_index WHERE human_takeover_active = 1 AND operator_id IS NULL "
+            "AND conversation_status NOT IN ('resolved', 'archived')"
+        )
+        return [_row_to_dict(r) for r in rows]
+
+
+# Global instance
+chat_index_service = ChatIndexService()
+
+
+async def update_chat_index(fn, *args, **kwargs) -> None:
+    """Run an incremental index write off the event loop; failures never break the caller."""
+    if not getattr(config, "LIVE_CHAT_INDEX_ENABLED", True):
+        return
+    try:
+        await asyncio.to_thread(fn, *args, **kwargs)
+    except Exception as e:
+        print(f"⚠️ Chat index update failed ({getattr(fn, '__name__', fn)}): {e}")
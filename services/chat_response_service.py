@@ -1,14 +1,17 @@
 # services/chat_response_service.py
+import asyncio
 import json
+import os
 import random
 import config
-from utils.utils import detect_language, get_system_instruction, get_openai_tools_schema
+from utils.utils import detect_language, get_openai_tools_schema
 from services.llm_core_service import client
-from services.gender_recognition_service import get_gender_from_gpt
+from services.gender_recognition_service import detect_explicit_gender
 from services.moderation_service import moderate_content, check_rate_limits, get_safe_response_for_violation, get_rate_limit_response
 from difflib import SequenceMatcher
 import datetime
 import re
+import time
 from typing import Any, Dict, List, Optional
 
 # Import all API functions from api_integrations
@@ -24,16 +27,26 @@ from utils.datetime_utils import (
 )
 
 # Import local Q&A service for context injection
-from services.local_qa_service import local_qa_service
+from services.local_qa_service import QATurnMatch, local_qa_service
 
 # Import dynamic model selector for cost optimization
 from services.dynamic_model_selector import select_optimal_model
+from services.metrics import histogram
+from services.prompt_builder import system_prompt_builder
+from services.tracing import record_span, span
 
 # Fixed bot timezone (UTC+0200) for all booking day comparisons
 BOOKING_TZ = BOT_FIXED_TZ
 
 _custom_qa_cache = {}
 
+_preflight_step_seconds = histogram(
+    "linasbot_preflight_step_seconds",
+    "Duration of each pre-flight step of get_bot_chat_response",
+    ("step",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+
 PRICE_KEYWORDS = [
     "price",
     "cost",
@@ -60,6 +73,89 @@ PRICE_KEYWORDS = [
 DEFAULT_BODY_PART_REQUIRED_SERVICE_IDS = {1, 12, 13}
 
 
+async def _timed_preflight_step(name: str, coro, timeout: float, fallback, timings: Dict[str, float]):
+    """Await one pre-flight step with a timeout; record its duration and fall back on timeout."""
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Pre-flight step '{name}' timed out after {timeout}s - using fallback")
+        return fallback
+    finally:
+        elapsed = time.perf_counter() - started
+        timings[name] = elapsed
+        _preflight_step_seconds.labels(step=name).observe(elapsed)
+        record_span(f"preflight_{name}", elapsed, started)
+
+
+async def _run_preflight_checks(
+    user_id: str,
+    user_input: str,
+    language: str,
+    include_qa: bool,
+    current_gender: str = None,
+    qa_turn: Optional[QATurnMatch] = None,
+) -> dict:
+    """
+    Run moderation, explicit gender detection and Q&A context lookup concurrently.
+    Moderation is awaited first: if it vetoes the message the other steps are cancelled.
+    Q&A scores already computed for this turn (`qa_turn`) are reused instead of rescoring.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    moderation_task = asyncio.ensure_future(_timed_preflight_step(
+        "moderation",
+        moderate_content(user_input, user_id),
+        config.PREFLIGHT_MODERATION_TIMEOUT_SECONDS,
+        (True, {"flagged": False, "message": "Moderation timed out - content allowed"}),
+        timings,
+    ))
+    other_tasks = {}
+    if user_input.strip():
+        other_tasks["gender"] = asyncio.ensure_future(_timed_preflight_step(
+            "gender",
+            detect_explicit_gender(user_input, current_gender),
+            config.PREFLIGHT_GENDER_TIMEOUT_SECONDS,
+            "unknown",
+            timings,
+        ))
+    reuse_qa = include_qa and qa_turn is not None and qa_turn.matches(user_input, language)
+    if include_qa and not reuse_qa:
+        # Started last: the local matcher is CPU-bound and runs while the OpenAI requests are in flight
+        other_tasks["qa"] = asyncio.ensure_future(_timed_preflight_step(
+            "qa",
+            local_qa_service.get_relevant_qa_pairs(question=user_input, language=language, limit=3),
+            config.PREFLIGHT_QA_TIMEOUT_SECONDS,
+            [],
+            timings,
+        ))
+
+    is_safe, moderation_result = await moderation_task
+    results = {"is_safe": is_safe, "moderation_result": moderation_result, "gender": None, "relevant_qa": []}
+    if reuse_qa and is_safe:
+        print(f"♻️ Reusing this turn's Q&A scores ({len(qa_turn.relevant)} context pairs)")
+        results["relevant_qa"] = qa_turn.relevant
+    if not is_safe:
+        for task in other_tasks.values():
+            task.cancel()
+        await asyncio.gather(*other_tasks.values(), return_exceptions=True)
+    else:
+        for name, value in zip(other_tasks, await asyncio.gather(*other_tasks.values(), return_exceptions=True)):
+            if isinstance(value, Exception):
+                print(f"⚠️ Pre-flight step '{name}' failed: {value}")
+                continue
+            results["gender" if name == "gender" else "relevant_qa"] = value
+
+    wall = time.perf_counter() - started
+    serial = sum(timings.values())
+    steps = " ".join(f"{name}={elapsed * 1000:.0f}ms" for name, elapsed in timings.items())
+    print(f"⏱️ Pre-flight for {user_id}: {steps} | wall={wall * 1000:.0f}ms (saved {max(0.0, serial - wall) * 1000:.0f}ms vs serial)")
+    results["timings_ms"] = {name: round(elapsed * 1000, 1) for name, elapsed in timings.items()}
+    results["timings_ms"]["wall"] = round(wall * 1000, 1)
+    return results
+
+
 def format_qa_for_context(qa_pairs: list) -> str:
     """
     Format Q&A pairs for injection into GPT system prompt.
@@ -190,10 +286,17 @@ def _normalize_body_part_ids(raw_value: Any) -> List[int]:
     return [parsed_single] if parsed_single is not None else []
 
 
+# (settings file mtime, ids): the settings file is only re-read when it changes
+_body_part_required_ids_cache: Dict[str, Any] = {"mtime": None, "ids": None}
+
+
 def _get_body_part_required_service_ids() -> set:
     configured_ids = set(DEFAULT_BODY_PART_REQUIRED_SERVICE_IDS)
     try:
         from storage.persistent_storage import APP_SETTINGS_FILE
+        mtime = os.stat(APP_SETTINGS_FILE).st_mtime_ns
+        if _body_part_required_ids_cache["mtime"] == mtime:
+            return set(_body_part_required_ids_cache["ids"])
         with open(APP_SETTINGS_FILE, "r", encoding="utf-8") as settings_file:
             app_settings = json.load(settings_file)
         configured_list = app_settings.get("pricingSync", {}).get("requireBodyPartServiceIds", [])
@@ -201,6 +304,7 @@ def _get_body_part_required_service_ids() -> set:
         normalized = {item for item in normalized if item is not None}
         if normalized:
             configured_ids = normalized
+        _body_part_required_ids_cache.update(mtime=mtime, ids=set(configured_ids))
     except Exception as settings_error:
         print(f"ℹ️ Pricing sync settings fallback to defaults: {settings_error}")
     return configured_ids
@@ -470,7 +574,7 @@ def _build_exact_pricing_reply(language: str, pricing_payload: Any) -> str:
     return "\n".join(lines)
 
 # user_id is the WhatsApp phone number
-async def get_bot_chat_response(user_id: str, user_input: str, current_context_messages: list, current_gender: str, current_preferred_lang: str, response_language: str, is_initial_message_after_start: bool, initial_user_query_to_process: str = None, custom_knowledge_context: str = None) -> dict:
+async def get_bot_chat_response(user_id: str, user_input: str, current_context_messages: list, current_gender: str, current_preferred_lang: str, response_language: str, is_initial_message_after_start: bool, initial_user_query_to_process: str = None, custom_knowledge_context: str = None, qa_turn: Optional[QATurnMatch] = None) -> dict:
     user_name = config.user_names.get(user_id, "client") 
     current_gender_attempts = config.gender_attempts.get(user_id, 0)
     
@@ -498,22 +602,6 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
             "current_gender_from_config": current_gender
         }
     
-    # Moderate content for policy violations
-    is_safe, moderation_result = await moderate_content(user_input, user_id)
-    if not is_safe:
-        print(f"âڑ ï¸ڈ Content flagged for user {user_id}: {moderation_result}")
-        return {
-            "action": "content_moderated",
-            "bot_reply": get_safe_response_for_violation(current_preferred_lang),
-            "detected_language": current_preferred_lang,
-            "current_gender_from_config": current_gender
-        }
-    
-    explicitly_detected_gender_from_input = None
-    if user_input.strip():
-        explicitly_detected_gender_from_input = await get_gender_from_gpt(user_input)
-        print(f"DEBUG GPT Gender Recognition: Input '{user_input}' -> Detected as '{explicitly_detected_gender_from_input}' (for logging/debug, GPT will decide action)")
-
     is_reschedule_intent = detect_reschedule_intent(user_input)
     if is_reschedule_intent:
         print("🔁 Intent routing lock: reschedule/postpone intent detected.")
@@ -523,18 +611,37 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
     # This happens in text_handlers.py BEFORE calling this function
     # If we reach here, it means no Q&A match was found, so proceed with GPT-4
 
-    # NEW: Get relevant Q&A pairs to inject into GPT context
-    # This ensures GPT knows about trained answers even for partial matches.
-    # For reschedule intents, skip Q&A injection to avoid drifting into unrelated informational replies.
-    relevant_qa = []
-    if not is_reschedule_intent:
-        relevant_qa = await local_qa_service.get_relevant_qa_pairs(
-            question=user_input,
-            language=current_preferred_lang,
-            limit=3
-        )
-    else:
+    # Pre-flight: moderation, explicit gender detection and Q&A context run concurrently.
+    # Relevant Q&A pairs are injected into GPT context so it knows about trained answers even for
+    # partial matches. For reschedule intents, skip Q&A injection to avoid drifting into unrelated
+    # informational replies.
+    if is_reschedule_intent:
         print("🔁 Skipping Q&A context injection for reschedule/postpone intent.")
+    preflight = await _run_preflight_checks(
+        user_id,
+        user_input,
+        current_preferred_lang,
+        include_qa=not is_reschedule_intent,
+        current_gender=current_gender,
+        qa_turn=qa_turn,
+    )
+
+    # Moderation veto wins over everything else
+    is_safe, moderation_result = preflight["is_safe"], preflight["moderation_result"]
+    if not is_safe:
+        print(f"âڑ ï¸ڈ Content flagged for user {user_id}: {moderation_result}")
+        return {
+            "action": "content_moderated",
+            "bot_reply": get_safe_response_for_violation(current_preferred_lang),
+            "detected_language": current_preferred_lang,
+            "current_gender_from_config": current_gender
+        }
+    
+    explicitly_detected_gender_from_input = preflight["gender"]
+    if explicitly_detected_gender_from_input:
+        print(f"DEBUG GPT Gender Recognition: Input '{user_input}' -> Detected as '{explicitly_detected_gender_from_input}' (for logging/debug, GPT will decide action)")
+
+    relevant_qa = preflight["relevant_qa"]
     qa_reference_text = format_qa_for_context(relevant_qa)
 
     if relevant_qa:
@@ -546,15 +653,6 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
     is_price_question = is_price_related_question(user_input)
     body_part_required_service_ids = _get_body_part_required_service_ids()
 
-    # Get the core system instruction from utils.py, with conditional price list loading.
-    # When custom_knowledge_context is provided (from dynamic retrieval), use it instead of config files.
-    system_instruction_core = get_system_instruction(
-        user_id,
-        current_preferred_lang,
-        qa_reference_text,
-        include_price_list=is_price_question,
-        custom_knowledge_context=custom_knowledge_context
-    )
 
     # Log which training files GPT is receiving
     print(f"📄 GPT will receive knowledge_base.txt in context")
@@ -588,7 +686,6 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
     routing_guardrail = ""
     if is_reschedule_intent:
         routing_guardrail = (
-            "\n\n"
             "**🔒 INTENT ROUTING OVERRIDE:**\n"
             "- The user's latest request is to RESCHEDULE/POSTPONE an appointment.\n"
             "- This is NOT a clinic working-hours request.\n"
@@ -596,8 +693,18 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
             "- Use appointment flow only: `check_next_appointment` then `update_appointment_date` when date/time is provided.\n"
         )
 
-    # Combine system instruction with dynamic context
-    system_instruction_final = system_instruction_core + "\n\n" + dynamic_customer_context + routing_guardrail
+    # System prompt: static sections (identity, style guide, knowledge base, rules, price list)
+    # form a stable prefix for OpenAI prompt caching; gender, Q&A, customer status and time go last.
+    # When custom_knowledge_context is provided (from dynamic retrieval), it replaces the config files.
+    system_prompt = system_prompt_builder.build(
+        user_id,
+        current_preferred_lang,
+        qa_reference=qa_reference_text,
+        include_price_list=is_price_question,
+        custom_knowledge_context=custom_knowledge_context,
+        tail_sections=[("customer_status", dynamic_customer_context), ("routing_guardrail", routing_guardrail)],
+    )
+    system_instruction_final = system_prompt.text
 
     messages = [{"role": "system", "content": system_instruction_final}]
     messages.extend(current_context_messages[-config.MAX_CONTEXT_MESSAGES:])
@@ -616,14 +723,16 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
     print(f"🤖 Model selected: {selected_model} | Complexity: {model_metadata['complexity']} | Reason: {model_metadata['reason']}")
 
     try:
-        response = await client.chat.completions.create(
-            model=selected_model,
-            messages=messages,
-            temperature=0.7,
-            tools=get_openai_tools_schema(),
-            tool_choice="auto",
-            response_format={"type": "json_object"}
-        )
+        async with span("main_completion"):
+            response = await client.chat.completions.create(
+                model=selected_model,
+                messages=messages,
+                temperature=0.7,
+                tools=get_openai_tools_schema(),
+                tool_choice="auto",
+                response_format={"type": "json_object"}
+            )
+        system_prompt_builder.record_usage(selected_model, getattr(response, "usage", None))
         
         if not response.choices:
             raise ValueError("GPT returned no choices")
@@ -847,6 +956,7 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
                 function_args["date"] = dt_obj.astimezone(BOOKING_TZ).strftime('%Y-%m-%d %H:%M:%S')
                 print(f"DEBUG: Normalized date for {function_name}: {original_date_str} -> {function_args['date']}")
 
+            tool_calls_started = time.perf_counter()
             for tool_call in tool_calls:
                 function_name = tool_call.function.name
                 function_args = json.loads(tool_call.function.arguments) if tool_call.function.arguments else {}
@@ -1366,7 +1476,8 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
                     print(f"DEBUG: Executing tool: {function_name} with args: {function_args}")
                     
                     try:
-                        tool_output = await function_to_call(**function_args)
+                        async with span(f"tool_{function_name}"):
+                            tool_output = await function_to_call(**function_args)
                         print(f"DEBUG: Tool output for {function_name}: {tool_output}")
 
                         # Store check_next_appointment result for auto-chaining appointment_id
@@ -1489,13 +1600,16 @@ async def get_bot_chat_response(user_id: str, user_input: str, current_context_m
                             "content": err_content,
                         }
                     )
+            record_span("tool_calls", time.perf_counter() - tool_calls_started, tool_calls_started)
 
-            second_response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                temperature=0.7,
-                response_format={"type": "json_object"}
-            )
+            async with span("second_completion"):
+                second_response = await client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    temperature=0.7,
+                    response_format={"type": "json_object"}
+                )
+            system_prompt_builder.record_usage("gpt-4o", getattr(second_response, "usage", None))
             if not second_response.choices:
                 raise ValueError("GPT returned no choices (after tool call)")
             gpt_raw_content = second_response.choices[0].message.content.strip() if second_response.choices[0].message.content else ""
@@ -1563,15 +1677,16 @@ User's latest message: {user_input}
 Answer the user's question or continue the booking flow. Do NOT ask for gender."""
 
             try:
-                recall_response = await client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": recall_system_prompt},
-                        {"role": "user", "content": recall_user_prompt}
-                    ],
-                    temperature=0.7,
-                    response_format={"type": "json_object"}
-                )
+                async with span("gender_recall_completion"):
+                    recall_response = await client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": recall_system_prompt},
+                            {"role": "user", "content": recall_user_prompt}
+                        ],
+                        temperature=0.7,
+                        response_format={"type": "json_object"}
+                    )
                 if not recall_response.choices:
                     raise ValueError("GPT recall returned no choices")
                 recall_content = recall_response.choices[0].message.content.strip()
@@ -1663,15 +1778,16 @@ Return JSON with "action" and "bot_reply" fields."""
                             context_msgs += f"{role}: {msg.get('content', '')[:80]}\n"
 
                         try:
-                            recall_resp = await client.chat.completions.create(
-                                model="gpt-4o-mini",
-                                messages=[
-                                    {"role": "system", "content": recall_system},
-                                    {"role": "user", "content": f"Context:\n{context_msgs}\nUser: {user_input}\n\nAnswer directly without asking for gender."}
-                                ],
-                                temperature=0.7,
-                                response_format={"type": "json_object"}
-                            )
+                            async with span("gender_recall_completion"):
+                                recall_resp = await client.chat.completions.create(
+                                    model="gpt-4o-mini",
+                                    messages=[
+                                        {"role": "system", "content": recall_system},
+                                        {"role": "user", "content": f"Context:\n{context_msgs}\nUser: {user_input}\n\nAnswer directly without asking for gender."}
+                                    ],
+                                    temperature=0.7,
+                                    response_format={"type": "json_object"}
+                                )
                             if not recall_resp.choices:
                                 raise ValueError("GPT recall returned no choices")
                             recall_data = json.loads(recall_resp.choices[0].message.content.strip())
@@ -1714,6 +1830,11 @@ Return JSON with "action" and "bot_reply" fields."""
         tokens_val = (usage.total_tokens or (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)) if usage else None
         prompt_tokens_val = getattr(usage, "prompt_tokens", None) if usage else None
         completion_tokens_val = getattr(usage, "completion_tokens", None) if usage else None
+        usage_details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        cached_tokens_val = (
+            usage_details.get("cached_tokens") if isinstance(usage_details, dict)
+            else getattr(usage_details, "cached_tokens", None)
+        )
         context_count = len(current_context_messages) if current_context_messages else 0
         sys_len = len(system_instruction_final) if system_instruction_final else 0
         ai_query_summary = (
@@ -1734,6 +1855,8 @@ Return JSON with "action" and "bot_reply" fields."""
             "tokens": tokens_val,
             "prompt_tokens": prompt_tokens_val,
             "completion_tokens": completion_tokens_val,
+            "cached_prompt_tokens": cached_tokens_val,
+            "system_prompt_sections": system_prompt.token_counts(),
         }
         if tool_calls and tool_round_trips:
             flow_meta["ai_first_response"] = ai_first_response_with_tools[:1500] if ai_first_response_with_tools else None
@@ -1818,15 +1941,16 @@ You MUST respond in **{response_language.upper()}** ONLY.
 Rewrite your response in the correct language. Return ONLY a JSON object with "action" and "bot_reply"."""
 
             try:
-                correction_response = await client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": f"You are a helpful assistant. Respond ONLY in {response_language}. Return JSON with 'action' and 'bot_reply' fields."},
-                        {"role": "user", "content": lang_correction_prompt}
-                    ],
-                    temperature=0,
-                    response_format={"type": "json_object"}
-                )
+                async with span("language_correction"):
+                    correction_response = await client.chat.completions.create(
+                        model="gpt-4o-mini",
+                        messages=[
+                            {"role": "system", "content": f"You are a helpful assistant. Respond ONLY in {response_language}. Return JSON with 'action' and 'bot_reply' fields."},
+                            {"role": "user", "content": lang_correction_prompt}
+                        ],
+                        temperature=0,
+                        response_format={"type": "json_object"}
+                    )
                 if not correction_response.choices:
                     raise ValueError("GPT language correction returned no choices")
                 corrected_content = correction_response.choices[0].message.content.strip()
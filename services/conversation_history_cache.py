@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Recent-message ring buffer per conversation, used to build the LLM context.
+
+`get_conversation_history_from_firestore` used to read the conversation from Firestore on every
+turn (up to three times per turn) just to keep its last 10 messages. Messages are now written
+through to a bounded ring as `services.conversation_store` saves them, and the ring is hydrated
+lazily from Firestore the first time a conversation is read, so a normal turn does no read.
+
+- Memory backend: an LRU of conversations (CONVERSATION_HISTORY_MAX_CONVERSATIONS), each a
+  deque of the last CONVERSATION_HISTORY_SIZE messages. Only used with a single worker
+  (WEB_CONCURRENCY=1): another worker's saves would never reach this ring, so with several
+  workers and no Redis the cache is disabled and every read goes to Firestore.
+- Redis backend (REDIS_URL configured): one list per conversation (RPUSHX + LTRIM), shared by all
+  workers so a message saved by one worker is in the context built by another.
+
+Only conversations that are already cached are appended to; for any other conversation the
+append bumps a generation counter instead, so a hydration that raced with a save is discarded
+rather than caching a history that misses that message. Edited messages invalidate the ring.
+"""
+
+import json
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import config
+from services.metrics import counter
+
+_history_cache_total = counter(
+    "linasbot_conversation_history_cache_total",
+    "Conversation history lookups served from the ring buffer (hit) or Firestore (miss)",
+    ("result",),
+)
+
+
+def _compact(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Only what the LLM context needs (no metadata / base64 images)."""
+    text = message.get("text", "")
+    return {"role": message.get("role", "user"), "text": text if isinstance(text, str) else str(text or "")}
+
+
+class ConversationHistoryCache:
+    def __init__(
+        self,
+        capacity: Optional[int] = None,
+        max_conversations: Optional[int] = None,
+        redis_client: Any = None,
+        workers: Optional[int] = None,
+    ):
+        self.capacity = capacity or getattr(config, "CONVERSATION_HISTORY_SIZE", 20)
+        self.max_conversations = max_conversations or getattr(config, "CONVERSATION_HISTORY_MAX_CONVERSATIONS", 5000)
+        self.ttl_seconds = getattr(config, "CONVERSATION_HISTORY_TTL_SECONDS", 24 * 60 * 60)
+        self._redis = redis_client
+        self.workers = workers or getattr(config, "WEB_CONCURRENCY", 1)
+        self._warned_disabled = False
+        self._rings: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "appends": 0, "fills": 0, "stale_fills": 0}
+
+    def _redis_client(self):
+        if self._redis is None:
+            from services.redis_client import get_redis
+            return get_redis()
+        return self._redis
+
+    @property
+    def backend(self) -> str:
+        if self._redis_client() is not None:
+            return "redis"
+        return "memory" if self.workers <= 1 else "disabled"
+
+    def _memory_enabled(self) -> bool:
+        """The process-local ring only sees this worker's saves: use it only when there is one worker."""
+        if self.workers <= 1:
+            return True
+        if not self._warned_disabled:
+            print(f"⚠️ Conversation history ring disabled: {self.workers} workers and no Redis (set REDIS_URL)")
+            self._warned_disabled = True
+        return False
+
+    def _key(self, conversation_id: str) -> str:
+        prefix = getattr(config, "STATE_STORE_KEY_PREFIX", "linasbot")
+        return f"{prefix}:history:{conversation_id}"
+
+    # --- reads ---------------------------------------------------------------------------------
+    async def get(self, conversation_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Last `limit` messages ({role, text}), or None when the conversation isn't cached."""
+        if not conversation_id or limit > self.capacity:
+            return None
+        messages = None
+        client = self._redis_client()
+        if client is not None:
+            try:
+                raw = await client.lrange(self._key(conversation_id), -limit, -1)
+                messages = [json.loads(item) for item in raw] if raw else None
+            except Exception as e:
+                print(f"⚠️ Redis history read failed for {conversation_id}: {e}")
+        elif self._memory_enabled():
+            ring = self._rings.get(conversation_id)
+            if ring is not None:
+                self._rings.move_to_end(conversation_id)
+                messages = list(ring)[-limit:]
+
+        result = "hit" if messages is not None else "miss"
+        self._stats["hits" if messages is not None else "misses"] += 1
+        _history_cache_total.labels(result=result).inc()
+        return messages
+
+    async def generation(self, conversation_id: str) -> int:
+        """Token to pass to fill(); changes whenever a message is saved to an uncached conversation."""
+        client = self._redis_client()
+        if client is not None:
+            try:
+                return int(await client.get(self._key(conversation_id) + ":gen") or 0)
+            except Exception:
+                return -1
+        return self._generations.get(conversation_id, 0)
+
+    # --- writes --------------------------------------------------------------------------------
+    async def fill(self, conversation_id: str, messages: List[Dict[str, Any]], generation: int) -> bool:
+        """Install the history read from Firestore, unless a save happened since `generation` was taken."""
+        if not conversation_id or generation < 0:
+            return False
+        if await self.generation(conversation_id) != generation:
+            self._stats["stale_fills"] += 1
+            return False
+        compact = [_compact(message) for message in messages[-self.capacity:]]
+        client = self._redis_client()
+        if client is not None:
+            if not compact:
+                return False  # an empty list can't be told apart from a miss in Redis
+            key = self._key(conversation_id)
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(message, ensure_ascii=False) for message in compact])
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Redis history fill failed for {conversation_id}: {e}")
+                return False
+        elif not self._memory_enabled():
+            return False
+        else:
+            self._rings[conversation_id] = deque(compact, maxlen=self.capacity)
+            self._rings.move_to_end(conversation_id)
+            while len(self._rings) > self.max_conversations:
+                self._rings.popitem(last=False)
+        self._stats["fills"] += 1
+        return True
+
+    async def start(self, conversation_id: str, first_message: Dict[str, Any]) -> None:
+        """A conversation was just created with `first_message`: its history is known completely."""
+        await self.fill(conversation_id, [first_message], await self.generation(conversation_id))
+
+    async def append(self, conversation_id: str, message: Dict[str, Any]) -> None:
+        """Write-through after a message was saved to Firestore."""
+        if not conversation_id:
+            return
+        self._stats["appends"] += 1
+        client = self._redis_client()
+        if client is not None:
+            key = self._key(conversation_id)
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.rpushx(key, json.dumps(_compact(message), ensure_ascii=False))
+                pipe.ltrim(key, -self.capacity, -1)
+                pipe.expire(key, self.ttl_seconds)
+                length, _, _ = await pipe.execute()
+                if not length:
+                    pipe = client.pipeline(transaction=True)
+                    pipe.incr(key + ":gen")
+                    pipe.expire(key + ":gen", self.ttl_seconds)
+                    await pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Redis history append failed for {conversation_id}: {e}")
+                await self.invalidate(conversation_id)
+            return
+        if not self._memory_enabled():
+            return
+
+        ring = self._rings.get(conversation_id)
+        if ring is None:
+            self._generations[conversation_id] = self._generations.get(conversation_id, 0) + 1
+            if len(self._generations) > self.max_conversations:
+                self._generations.pop(next(iter(self._generations)))
+            return
+        ring.append(_compact(message))
+        self._rings.move_to_end(conversation_id)
+
+    async def invalidate(self, conversation_id: str) -> None:
+        """Drop a conversation's ring (e.g. a message was edited); the next read re-hydrates it."""
+        if not conversation_id:
+            return
+        client = self._redis_client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=True)
+                pipe.delete(self._key(conversation_id))
+                pipe.incr(self._key(conversation_id) + ":gen")
+                pipe.expire(self._key(conversation_id) + ":gen", self.ttl_seconds)
+                await pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Redis history invalidate failed for {conversation_id}: {e}")
+            return
+        self._rings.pop(conversation_id, None)
+        self._generations[conversation_id] = self._generations.get(conversation_id, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "backend": self.backend,
+            "capacity": self.capacity,
+            "cached_conversations": len(self._rings),
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global instance
+conversation_history_cache = ConversationHistoryCache()
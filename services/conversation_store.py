@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+Conversation Store - Firestore storage layout for conversation messages.
+
+Two layouts are supported (selected by config.CONVERSATION_STORAGE_MODE):
+- "array" (legacy): every message lives in the conversation document's `messages` array.
+  Each append downloads and rewrites the whole array.
+- "subcollection": the conversation document is a small header (customer_info, status,
+  counters, last visible message and a bounded tail of recent messages) and every message
+  is its own document under `<conversation>/messages/<message_id>`. Appends are one
+  transaction (header read, message create + header update) regardless of conversation length.
+
+Readers go through load_conversation_messages() / load_recent_messages(), which understand
+both layouts. Legacy array documents are migrated lazily on their next append (or in bulk
+with scripts/migrate_conversation_messages.py).
+"""
+
+import asyncio
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud import firestore
+
+import config
+from services.conversation_history_cache import conversation_history_cache
+from services.live_chat_contracts import is_duplicate_message, parse_timestamp_utc
+
+STORAGE_MODE_ARRAY = "array"
+STORAGE_MODE_SUBCOLLECTION = "subcollection"
+MESSAGES_SUBCOLLECTION = "messages"
+
+# Messages kept inline on the header (dedupe window + LLM context without extra reads)
+RECENT_MESSAGES_LIMIT = 20
+# Firestore allows 500 writes per batch; stay well below it
+_BATCH_WRITE_LIMIT = 400
+# Large payloads that must never be copied onto the header document
+_HEADER_EXCLUDED_METADATA_KEYS = ("image_data",)
+
+
+def get_storage_mode() -> str:
+    """Configured layout for new writes ("array" or "subcollection")."""
+    mode = str(getattr(config, "CONVERSATION_STORAGE_MODE", STORAGE_MODE_SUBCOLLECTION) or "").strip().lower()
+    if mode in (STORAGE_MODE_ARRAY, STORAGE_MODE_SUBCOLLECTION):
+        return mode
+    return STORAGE_MODE_SUBCOLLECTION
+
+
+def is_subcollection_layout(payload: Optional[Dict[str, Any]]) -> bool:
+    """True when a conversation document is a header with messages in a subcollection."""
+    return (payload or {}).get("storage_mode") == STORAGE_MODE_SUBCOLLECTION
+
+
+def _is_smart_message(message: Dict[str, Any]) -> bool:
+    return ((message or {}).get("metadata") or {}).get("source") == "smart_message"
+
+
+def _compact_for_header(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a message without heavy metadata (e.g. base64 images) for the header tail."""
+    compact = dict(message or {})
+    metadata = compact.get("metadata")
+    if isinstance(metadata, dict) and any(key in metadata for key in _HEADER_EXCLUDED_METADATA_KEYS):
+        compact["metadata"] = {
+            key: value for key, value in metadata.items() if key not in _HEADER_EXCLUDED_METADATA_KEYS
+        }
+    return compact
+
+
+def message_document_id(message: Dict[str, Any], fallback_index: Optional[int] = None) -> str:
+    """Stable document id for a message (message_id when known, so re-saves are idempotent)."""
+    metadata = (message or {}).get("metadata") or {}
+    raw_id = str((message or {}).get("message_id") or metadata.get("message_id") or "").strip()
+    if not raw_id:
+        raw_id = f"legacy_{fallback_index:06d}" if fallback_index is not None else f"msg_{uuid.uuid4().hex}"
+    # "/" would be interpreted as a path separator by Firestore
+    return raw_id.replace("/", "_")[:500]
+
+
+def build_header_summary(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Header summary fields computed from a complete, ordered message list."""
+    visible = [msg for msg in messages if not _is_smart_message(msg)]
+    return {
+        "storage_mode": STORAGE_MODE_SUBCOLLECTION,
+        "message_count": len(messages),
+        "visible_message_count": len(visible),
+        "first_visible_at": visible[0].get("timestamp") if visible else None,
+        "last_visible_message": _compact_for_header(visible[-1]) if visible else None,
+        "last_message_at": messages[-1].get("timestamp") if messages else None,
+        "recent_messages": [_compact_for_header(msg) for msg in messages[-RECENT_MESSAGES_LIMIT:]],
+    }
+
+
+def _append_header_updates(header: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, Any]:
+    """Header field updates for one appended message (counters are server-side increments)."""
+    compact = _compact_for_header(message)
+    recent = list(header.get("recent_messages") or [])
+    recent.append(compact)
+    updates = {
+        "message_count": firestore.Increment(1),
+        "last_message_at": message.get("timestamp"),
+        "recent_messages": recent[-RECENT_MESSAGES_LIMIT:],
+    }
+    if not _is_smart_message(message):
+        updates["visible_message_count"] = firestore.Increment(1)
+        updates["last_visible_message"] = compact
+        if not header.get("first_visible_at"):
+            updates["first_visible_at"] = message.get("timestamp")
+    return updates
+
+
+def _get_db():
+    from utils.utils import get_firestore_db
+    return get_firestore_db()
+
+
+def _messages_collection(conv_ref):
+    return conv_ref.collection(MESSAGES_SUBCOLLECTION)
+
+
+def _run_in_transaction(db, apply: Callable[[Any], Any]) -> Any:
+    """Run `apply(transaction)` in a Firestore transaction (retried by Firestore on contention)."""
+    return firestore.transactional(apply)(db.transaction())
+
+
+def _migrate_sync(conv_ref, payload: Dict[str, Any]) -> Dict[str, Any]:
+    db = _get_db()
+    legacy_messages = list(payload.get("messages") or [])
+    messages = []
+    for message in legacy_messages:
+        stored = dict(message or {})
+        # Mixed str/Timestamp values would break ordering inside the subcollection
+        stored["timestamp"] = parse_timestamp_utc(stored.get("timestamp"))
+        messages.append(stored)
+
+    messages_ref = _messages_collection(conv_ref)
+    for start in range(0, len(messages), _BATCH_WRITE_LIMIT):
+        batch = db.batch()
+        for offset, message in enumerate(messages[start:start + _BATCH_WRITE_LIMIT]):
+            doc_id = message_document_id(message, fallback_index=start + offset)
+            batch.set(messages_ref.document(doc_id), message)
+        batch.commit()
+
+    def _apply(transaction):
+        # Another worker may have migrated (and appended) since `payload` was read: never
+        # overwrite its header with counts and a tail computed from the stale array
+        current = conv_ref.get(transaction=transaction).to_dict() or {}
+        if is_subcollection_layout(current) or "messages" not in current:
+            return current
+        current_messages = []
+        for index, message in enumerate(current.get("messages") or []):
+            stored = dict(message or {})
+            stored["timestamp"] = parse_timestamp_utc(stored.get("timestamp"))
+            current_messages.append(stored)
+            if index >= len(messages):  # appended to the array after the batches above were written
+                transaction.set(messages_ref.document(message_document_id(stored, fallback_index=index)), stored)
+        summary = build_header_summary(current_messages)
+        transaction.update(conv_ref, {**summary, "messages": firestore.DELETE_FIELD})
+        migrated = {key: value for key, value in current.items() if key != "messages"}
+        migrated.update(summary)
+        return migrated
+
+    return _run_in_transaction(db, _apply)
+
+
+async def migrate_conversation(conv_ref, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Move a legacy `messages` array into the subcollection and turn the document into a header.
+    Idempotent: message documents are keyed by message_id, and the header is written in a
+    transaction that re-reads the document. Returns the new header payload.
+    """
+    if is_subcollection_layout(payload):
+        return payload
+    return await asyncio.to_thread(_migrate_sync, conv_ref, payload or {})
+
+
+async def create_conversation(
+    conversations_collection,
+    header_fields: Dict[str, Any],
+    message: Dict[str, Any],
+) -> str:
+    """Create a conversation with its first message using the configured layout. Returns its id."""
+    if get_storage_mode() == STORAGE_MODE_ARRAY:
+        _, new_doc_ref = await asyncio.to_thread(
+            conversations_collection.add, {**header_fields, "messages": [message]}
+        )
+        await conversation_history_cache.start(new_doc_ref.id, message)
+        return new_doc_ref.id
+
+    conv_ref = conversations_collection.document()
+    header = {**header_fields, **build_header_summary([message])}
+
+    def _write():
+        batch = _get_db().batch()
+        batch.set(conv_ref, header)
+        batch.set(_messages_collection(conv_ref).document(message_document_id(message)), message)
+        batch.commit()
+
+    await asyncio.to_thread(_write)
+    await conversation_history_cache.start(conv_ref.id, message)
+    return conv_ref.id
+
+
+async def append_message(
+    conv_ref,
+    header: Dict[str, Any],
+    message: Dict[str, Any],
+    header_updates: Dict[str, Any],
+    *,
+    dedupe_window_seconds: int = 20,
+) -> Optional[int]:
+    """
+    Append one message to an existing conversation and apply `header_updates`.
+    Returns the new message count, or None when the message is a duplicate.
+    Legacy array documents are migrated first when the subcollection layout is enabled.
+    """
+    header = dict(header or {})
+    if not is_subcollection_layout(header) and get_storage_mode() == STORAGE_MODE_SUBCOLLECTION:
+        header = await migrate_conversation(conv_ref, header)
+
+    # Cheap early exit on the caller's copy; the transaction below re-checks the stored document
+    tail = header.get("recent_messages") if is_subcollection_layout(header) else header.get("messages")
+    if is_duplicate_message(tail or [], message, dedupe_window_seconds=dedupe_window_seconds):
+        return None
+
+    if not is_subcollection_layout(header):
+        def _apply_array(transaction):
+            current = conv_ref.get(transaction=transaction).to_dict() or {}
+            current_messages = list(current.get("messages") or [])
+            if is_duplicate_message(current_messages, message, dedupe_window_seconds=dedupe_window_seconds):
+                return None
+            current_messages.append(message)
+            transaction.update(conv_ref, {**header_updates, "messages": current_messages})
+            return len(current_messages)
+
+        total = await asyncio.to_thread(_run_in_transaction, _get_db(), _apply_array)
+        if total is not None:
+            await conversation_history_cache.append(conv_ref.id, message)
+        return total
+
+    message_ref = _messages_collection(conv_ref).document(message_document_id(message))
+
+    def _apply(transaction):
+        # Read the header inside the transaction: concurrent appends must not overwrite each
+        # other's recent_messages tail (it is the LLM context)
+        current = conv_ref.get(transaction=transaction).to_dict() or {}
+        if is_duplicate_message(current.get("recent_messages") or [], message, dedupe_window_seconds=dedupe_window_seconds):
+            return None
+        transaction.create(message_ref, message)
+        transaction.update(conv_ref, {**header_updates, **_append_header_updates(current, message)})
+        return int(current.get("message_count") or 0) + 1
+
+    try:
+        total = await asyncio.to_thread(_run_in_transaction, _get_db(), _apply)
+    except gcp_exceptions.AlreadyExists:
+        # Same message_id already stored (webhook retry racing the first save)
+        return None
+    if total is not None:
+        await conversation_history_cache.append(conv_ref.id, message)
+    return total
+
+
+async def load_conversation_messages(conv_ref, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """All messages of a conversation in chronological order, for either layout."""
+    payload = payload or {}
+    legacy_messages = list(payload.get("messages") or [])
+    if not is_subcollection_layout(payload):
+        return legacy_messages
+
+    query = _messages_collection(conv_ref).order_by("timestamp")
+    docs = await asyncio.to_thread(lambda: list(query.stream()))
+    return legacy_messages + [doc.to_dict() or {} for doc in docs]
+
+
+async def load_recent_messages(conv_ref, payload: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+    """Last `limit` messages; served from the header tail when it is long enough."""
+    payload = payload or {}
+    if not is_subcollection_layout(payload):
+        return list(payload.get("messages") or [])[-limit:]
+
+    recent = list(payload.get("recent_messages") or [])
+    if limit <= len(recent) or len(recent) >= int(payload.get("message_count") or 0):
+        return recent[-limit:]
+
+    query = _messages_collection(conv_ref).order_by(
+        "timestamp", direction=firestore.Query.DESCENDING
+    ).limit(limit)
+    docs = await asyncio.to_thread(lambda: list(query.stream()))
+    return [doc.to_dict() or {} for doc in reversed(docs)]
+
+
+async def hydrate_conversation_payload(conv_ref, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the document payload with `messages` filled in (no-op for legacy documents)."""
+    payload = dict(payload or {})
+    if is_subcollection_layout(payload):
+        payload["messages"] = await load_conversation_messages(conv_ref, payload)
+    return payload
+
+
+async def update_message(
+    conv_ref,
+    payload: Dict[str, Any],
+    select_index: Callable[[List[Dict[str, Any]]], Optional[int]],
+    mutate: Callable[[Dict[str, Any]], None],
+    header_updates: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Update one message in place. `select_index(messages)` picks the message to change and
+    `mutate(message)` edits it. Returns the updated message, or None when nothing matched.
+    """
+    payload = payload or {}
+    header_updates = dict(header_updates or {})
+
+    if not is_subcollection_layout(payload):
+        messages = list(payload.get("messages") or [])
+        index = select_index(messages)
+        if index is None:
+            return None
+        mutate(messages[index])
+        await asyncio.to_thread(conv_ref.update, {**header_updates, "messages": messages})
+        await conversation_history_cache.invalidate(conv_ref.id)
+        return messages[index]
+
+    # Most edits target recent messages: try the header tail before streaming everything
+    recent = list(payload.get("recent_messages") or [])
+    index = select_index(recent)
+    if index is not None:
+        target = dict(recent[index])
+    else:
+        messages = await load_conversation_messages(conv_ref, payload)
+        index = select_index(messages)
+        if index is None:
+            return None
+        target = dict(messages[index])
+
+    doc_id = message_document_id(target)
+    if "message_id" not in target and not (target.get("metadata") or {}).get("message_id"):
+        # Legacy message migrated without an id: locate its document by timestamp
+        query = _messages_collection(conv_ref).where("timestamp", "==", target.get("timestamp")).limit(1)
+        docs = await asyncio.to_thread(lambda: list(query.stream()))
+        if not docs:
+            return None
+        doc_id = docs[0].id
+        target = docs[0].to_dict() or target
+
+    def _identity(message: Dict[str, Any]):
+        metadata = message.get("metadata") or {}
+        return (
+            str(message.get("message_id") or metadata.get("message_id") or ""),
+            message.get("role"),
+            parse_timestamp_utc(message.get("timestamp")),
+        )
+
+    target_identity = _identity(target)
+    mutate(target)
+
+    def _matches(candidate: Dict[str, Any]) -> bool:
+        return _identity(candidate) == target_identity
+
+    compact = _compact_for_header(target)
+    header_updates["recent_messages"] = [compact if _matches(msg) else msg for msg in recent]
+    last_visible = payload.get("last_visible_message")
+    if last_visible and _matches(last_visible):
+        header_updates["last_visible_message"] = compact
+
+    def _write():
+        batch = _get_db().batch()
+        batch.set(_messages_collection(conv_ref).document(doc_id), target, merge=True)
+        batch.update(conv_ref, header_updates)
+        batch.commit()
+
+    await asyncio.to_thread(_write)
+    await conversation_history_cache.invalidate(conv_ref.id)
+    return target
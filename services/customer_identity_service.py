@@ -2,21 +2,29 @@
 """
 Resolve customer from external CRM/main system before naming or creating users.
 Cache by normalized_phone with TTL. On API failure: do NOT set a name (fallback unknown/phone only).
+The cache is bounded (LRU), "not found"/failed lookups expire sooner, and concurrent lookups of
+the same number share one CRM call.
 """
 import asyncio
 import logging
-import time
 from typing import Dict, Any, Optional
 
+import config
+from services.async_cache import AsyncTTLCache
 from utils.phone_utils import normalize_phone
 
 logger = logging.getLogger(__name__)
 
 # TTL in seconds for external lookup cache (reduce API load)
-EXTERNAL_RESOLVE_CACHE_TTL = 600  # 10 minutes
+EXTERNAL_RESOLVE_CACHE_TTL = getattr(config, "EXTERNAL_RESOLVE_CACHE_TTL_SECONDS", 600)  # 10 minutes
 
-_external_resolve_cache: Dict[str, Dict[str, Any]] = {}
-_cache_entries_ttl: Dict[str, float] = {}
+_external_resolve_cache = AsyncTTLCache(
+    "external_customer",
+    max_size=getattr(config, "EXTERNAL_RESOLVE_CACHE_MAX_SIZE", 5000),
+    ttl_seconds=EXTERNAL_RESOLVE_CACHE_TTL,
+    negative_ttl_seconds=getattr(config, "EXTERNAL_RESOLVE_CACHE_NEGATIVE_TTL_SECONDS", 60),
+    is_negative=lambda result: not result.get("exists"),
+)
 
 
 def _phone_to_api_format(normalized_phone: str) -> str:
@@ -34,23 +42,17 @@ async def resolve_customer_from_external(normalized_phone: str) -> Dict[str, Any
     Resolve customer from external system by normalized E.164 phone.
     Returns: { "exists": bool, "name": str|None, "external_id": str|None, "gender": str|None }
     On timeout/failure: exists=False, name=None (do not create named user; use unknown/phone only).
-    Cache key: normalized_phone only. TTL applied.
+    Cache key: normalized_phone only. TTL applied (shorter for exists=False).
     """
     if not normalized_phone or not normalized_phone.startswith("+"):
         return {"exists": False, "name": None, "external_id": None, "gender": None}
 
-    now = time.monotonic()
-    # Evict expired
-    for key in list(_cache_entries_ttl.keys()):
-        if now - _cache_entries_ttl.get(key, 0) > EXTERNAL_RESOLVE_CACHE_TTL:
-            _external_resolve_cache.pop(key, None)
-            _cache_entries_ttl.pop(key, None)
+    return await _external_resolve_cache.get_or_load(
+        normalized_phone, lambda: _fetch_customer_from_external(normalized_phone)
+    )
 
-    cached = _external_resolve_cache.get(normalized_phone)
-    if cached is not None:
-        logger.debug("External resolve cache hit for %s", normalized_phone)
-        return cached
 
+async def _fetch_customer_from_external(normalized_phone: str) -> Dict[str, Any]:
     api_phone = _phone_to_api_format(normalized_phone)
     result = {"exists": False, "name": None, "external_id": None, "gender": None}
 
@@ -79,16 +81,12 @@ async def resolve_customer_from_external(normalized_phone: str) -> Dict[str, Any
     except Exception as e:
         logger.warning("External resolve failed for %s: %s; fallback unknown", normalized_phone, e)
 
-    _external_resolve_cache[normalized_phone] = result
-    _cache_entries_ttl[normalized_phone] = now
     return result
 
 
 def invalidate_external_resolve_cache(normalized_phone: Optional[str] = None):
     """Clear cache for one number or entire cache (e.g. after customer update)."""
     if normalized_phone:
-        _external_resolve_cache.pop(normalized_phone, None)
-        _cache_entries_ttl.pop(normalized_phone, None)
+        _external_resolve_cache.pop(normalized_phone)
     else:
         _external_resolve_cache.clear()
-        _cache_entries_ttl.clear()
@@ -126,11 +126,7 @@ class DailyTemplateDispatcher:
         target_template = normalize_template_id(template_id)
         target_appointment = str(appointment_id) if appointment_id is not None else None
 
-        for message_data in smart_messaging.scheduled_messages.values():
-            msg_template = normalize_template_id(message_data.get("message_type", ""))
-            if msg_template != target_template:
-                continue
-
+        for _, message_data in smart_messaging.store.find(message_type=target_template):
             msg_phone = _normalize_phone(message_data.get("customer_phone"))
             if msg_phone != target_phone:
                 continue
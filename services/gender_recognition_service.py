@@ -1,6 +1,10 @@
 # services/gender_recognition_service.py
 from services.llm_core_service import client
+from services.metrics import counter
+from collections import OrderedDict
+from typing import Optional
 import json
+import re
 
 async def get_gender_from_gpt(user_input: str) -> str:
     """
@@ -55,4 +59,110 @@ async def get_gender_from_gpt(user_input: str) -> str:
         return "unknown"
     except Exception as e:
         print(f"❌ ERROR in get_gender_from_gpt: {e}")
-        return "unknown"
\ No newline at end of file
+        return "unknown"
+
+# --- Local pre-classifier -------------------------------------------------------------------
+# Mirrors the explicit statements listed in the GPT prompt above. Most turns either contain one
+# of these phrases or no gender word at all, so the gpt-4o call is only needed for the rest.
+
+_ARABIC_DIACRITICS = re.compile(r"[\u064B-\u0652\u0640]")
+_NON_WORD = re.compile(r"[^\w']+", re.UNICODE)
+
+_MALE_PHRASES = (
+    "ana shab", "ana chab", "ana shabb", "ana zalami", "ana zalame", "ana rajol", "ana rajel",
+    "انا شب", "انا شاب", "انا زلمه", "انا رجل", "انا ذكر",
+    "i am a guy", "i'm a guy", "im a guy", "i am a man", "i'm a man", "im a man", "i am male", "i'm male",
+    "i am a boy", "i'm a boy", "je suis un homme", "je suis un garcon", "je suis un garçon",
+    "ليزر رجالي", "خدمات رجاليه",
+)
+_FEMALE_PHRASES = (
+    "ana sabieh", "ana sabiye", "ana sabiyye", "ana sabiyeh", "ana bnt", "ana bint",
+    "انا صبيه", "انا بنت", "انا انثى", "انا امراه",
+    "i am a girl", "i'm a girl", "im a girl", "i am a woman", "i'm a woman", "im a woman", "i am female",
+    "i'm female", "je suis une femme", "je suis une fille",
+    "ليزر نسائي", "خدمات نسائيه",
+)
+# Whole-message answers to the gender question
+_MALE_ANSWERS = {"شب", "شاب", "ذكر", "رجل", "زلمه", "male", "man", "guy", "boy", "shab", "chab", "zalami", "homme"}
+_FEMALE_ANSWERS = {"صبيه", "بنت", "انثى", "امراه", "female", "woman", "girl", "sabieh", "sabiye", "bnt", "bint", "femme", "fille"}
+
+# Words that may carry a gender signal; a message without any of them is always 'unknown'
+_SIGNAL_WORDS = _MALE_ANSWERS | _FEMALE_ANSWERS | {
+    "رجالي", "رجاليه", "نسائي", "نسائيه", "نساء", "رجال", "بنات", "شباب", "صبايا",
+    "men", "women", "girls", "guys", "boys", "ladies", "lady", "gentleman", "sabaya", "shabab",
+    "femmes", "hommes", "filles", "garcon", "garçon", "madame", "monsieur", "mr", "mrs", "ms", "miss",
+    "rajol", "rajel", "sabiyye", "sabiyeh", "zalame",
+}
+
+_GENDER_MEMO_MAX = 2048
+_gender_memo: "OrderedDict[str, str]" = OrderedDict()
+
+_gender_classifier_total = counter(
+    "linasbot_gender_classifier_total",
+    "Explicit gender detections by source (local rules, memo, gpt, skipped)",
+    ("source",),
+)
+
+
+def normalize_gender_text(text: str) -> str:
+    """Lowercase, strip Arabic diacritics/tatweel, unify alef/ta marbuta/ya variants and punctuation."""
+    text = _ARABIC_DIACRITICS.sub("", (text or "").lower())
+    text = re.sub("[أإآ]", "ا", text).replace("ة", "ه").replace("ى", "ي")
+    text = text.replace("’", "'")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _contains_phrase(padded_text: str, phrases) -> bool:
+    return any(f" {phrase} " in padded_text for phrase in phrases)
+
+
+def classify_gender_locally(user_input: str) -> Optional[str]:
+    """
+    Rule-based explicit gender detection.
+    Returns 'male'/'female' for explicit statements, 'unknown' when the text has no gender
+    signal at all (greetings, booking/price questions), or None when GPT should decide.
+    """
+    text = normalize_gender_text(user_input)
+    if not text:
+        return "unknown"
+    if text in _MALE_ANSWERS:
+        return "male"
+    if text in _FEMALE_ANSWERS:
+        return "female"
+
+    padded = f" {text} "
+    is_male = _contains_phrase(padded, _MALE_PHRASES)
+    is_female = _contains_phrase(padded, _FEMALE_PHRASES)
+    if is_male != is_female:
+        return "male" if is_male else "female"
+    if not is_male and not (set(text.split()) & _SIGNAL_WORDS):
+        return "unknown"
+    return None
+
+
+async def detect_explicit_gender(user_input: str, current_gender: str = None) -> str:
+    """
+    Explicit gender statement in `user_input` ('male'/'female'/'unknown').
+    Local rules first; GPT only for ambiguous text when the customer's gender is not yet known.
+    GPT answers are memoized by normalized text.
+    """
+    local_result = classify_gender_locally(user_input)
+    if local_result is not None:
+        _gender_classifier_total.labels(source="local").inc()
+        return local_result
+    if current_gender in ("male", "female"):
+        _gender_classifier_total.labels(source="skipped").inc()
+        return "unknown"
+
+    key = normalize_gender_text(user_input)
+    if key in _gender_memo:
+        _gender_memo.move_to_end(key)
+        _gender_classifier_total.labels(source="memo").inc()
+        return _gender_memo[key]
+
+    result = await get_gender_from_gpt(user_input)
+    _gender_classifier_total.labels(source="gpt").inc()
+    _gender_memo[key] = result
+    if len(_gender_memo) > _GENDER_MEMO_MAX:
+        _gender_memo.popitem(last=False)
+    return result
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Shared outbound HTTP clients (one pool per provider, per process).
+
+Creating an `httpx.AsyncClient` per media download or per API call meant a new TCP + TLS
+handshake every time. Call sites now use `get_http_client(name)`; each named client keeps its
+connections alive between requests:
+
+- "crm": Lina's Laser API (services/api_integrations.py), base URL from api_config, 60s timeout;
+- "whatsapp": provider send APIs (WhatsApp adapters); "meta_graph": the Graph API client in
+  modules/core.py (base URL includes the phone number id);
+- "media": media downloads and the dashboard audio proxy, follows redirects;
+- "default": other JSON APIs (Q&A database, templates, usage).
+
+A client's pool limits (HTTP_POOL_MAX_CONNECTIONS / HTTP_POOL_MAX_KEEPALIVE /
+HTTP_KEEPALIVE_EXPIRY_SECONDS) apply to that client, i.e. per provider host. HTTP/2 is used when
+HTTP_CLIENT_HTTP2 is on and the `h2` package is installed. Profile timeouts are defaults; a call
+site passes `timeout=` to override them for one request. Clients are closed on app shutdown.
+"""
+
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import config
+from services.metrics import counter, gauge
+
+try:
+    import h2  # noqa: F401 - only needed for HTTP/2
+    _HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - HTTP/2 is optional
+    _HTTP2_AVAILABLE = False
+
+_http_requests_total = counter(
+    "linasbot_http_client_requests_total",
+    "Outbound HTTP responses by client, host and status class",
+    ("client", "host", "status"),
+)
+_http_pool_connections = gauge(
+    "linasbot_http_client_pool_connections",
+    "Pooled connections per client by state (active, idle) and requests waiting for one (queued)",
+    ("client", "state"),
+)
+
+_PROFILES: Dict[str, Dict[str, Any]] = {
+    "crm": {"timeout": httpx.Timeout(60.0, connect=10.0)},
+    "whatsapp": {"timeout": httpx.Timeout(30.0, connect=10.0)},
+    "meta_graph": {"timeout": httpx.Timeout(30.0, connect=10.0)},
+    "media": {"timeout": httpx.Timeout(30.0, connect=10.0), "follow_redirects": True},
+    "default": {"timeout": httpx.Timeout(30.0, connect=10.0)},
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_created_at: Dict[str, float] = {}
+_warned_http2 = False
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=getattr(config, "HTTP_POOL_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=getattr(config, "HTTP_POOL_MAX_KEEPALIVE", 20),
+        keepalive_expiry=getattr(config, "HTTP_KEEPALIVE_EXPIRY_SECONDS", 30),
+    )
+
+
+def _use_http2() -> bool:
+    global _warned_http2
+    if not getattr(config, "HTTP_CLIENT_HTTP2", False):
+        return False
+    if not _HTTP2_AVAILABLE:
+        if not _warned_http2:
+            print("⚠️ HTTP_CLIENT_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+            _warned_http2 = True
+        return False
+    return True
+
+
+def _profile(name: str) -> Dict[str, Any]:
+    options = dict(_PROFILES.get(name, _PROFILES["default"]))
+    if name == "crm":
+        import api_config
+        options["base_url"] = api_config.LINASLASER_API_BASE_URL
+    return options
+
+
+def get_http_client(name: str = "default", **options: Any) -> httpx.AsyncClient:
+    """
+    Return the shared client for `name`, creating it on first use. `options` (e.g. base_url)
+    override the profile and only apply when the client is created.
+    """
+    client = _clients.get(name)
+    if client is not None and not client.is_closed:
+        return client
+
+    async def _on_response(response: httpx.Response) -> None:
+        host = urlsplit(str(response.request.url)).hostname or ""
+        _http_requests_total.labels(client=name, host=host, status=f"{response.status_code // 100}xx").inc()
+        _update_pool_gauges(name, _clients.get(name))
+
+    settings = {**_profile(name), **options}
+    client = httpx.AsyncClient(
+        limits=_limits(),
+        http2=_use_http2(),
+        event_hooks={"response": [_on_response]},
+        **settings,
+    )
+    _clients[name] = client
+    _created_at[name] = time.time()
+    return client
+
+
+def _pool_state(client: Optional[httpx.AsyncClient]) -> Dict[str, int]:
+    """Connection counts from the client's httpcore pool (empty if it is not introspectable)."""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if connections is None:
+        return {}
+    state = {"active": 0, "idle": 0, "queued": 0}
+    for connection in connections:
+        state["idle" if connection.is_idle() else "active"] += 1
+    for request in getattr(pool, "_requests", []):
+        if getattr(request, "connection", None) is None:
+            state["queued"] += 1
+    return state
+
+
+def _update_pool_gauges(name: str, client: Optional[httpx.AsyncClient]) -> None:
+    for state, value in _pool_state(client).items():
+        _http_pool_connections.labels(client=name, state=state).set(value)
+
+
+def http_client_stats() -> Dict[str, Any]:
+    limits = _limits()
+    clients = {}
+    for name, client in _clients.items():
+        state = _pool_state(client)
+        _update_pool_gauges(name, client)
+        clients[name] = {
+            "closed": client.is_closed,
+            "base_url": str(client.base_url) or None,
+            "created_at": _created_at.get(name),
+            **state,
+        }
+    return {
+        "http2": _use_http2(),
+        "max_connections": limits.max_connections,
+        "max_keepalive_connections": limits.max_keepalive_connections,
+        "keepalive_expiry": limits.keepalive_expiry,
+        "clients": clients,
+    }
+
+
+async def close_http_clients() -> None:
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"⚠️ Error closing HTTP client '{name}': {e}")
+    _clients.clear()
+    _created_at.clear()
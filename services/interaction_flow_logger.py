@@ -99,6 +99,7 @@ def log_interaction(
     qa_match_score: Optional[float] = None,
     tool_calls: Optional[List[str]] = None,
     flow_steps: Optional[List[Dict]] = None,
+    trace: Optional[Any] = None,
 ) -> None:
     """
     Log one interaction in the User → Bot → AI → Bot → User flow.
@@ -115,12 +116,21 @@ def log_interaction(
         response_time_ms: Response time in ms
         qa_match_score: If from Q&A, the match score
         tool_calls: List of tool names called (e.g. ["check_next_appointment"])
+        trace: services.tracing.Trace with the per-stage latency breakdown
+            (defaults to the trace active in the current context)
     """
     if not is_flow_logging_enabled():
         return
 
     _load_from_file()
 
+    if trace is None:
+        from services.tracing import current_trace
+        trace = current_trace()
+    if trace is not None and trace.spans:
+        flow_steps = list(flow_steps or [])[:34]
+        flow_steps.append({"step": len(flow_steps) + 1, "title": "⏱️ Latency breakdown", "content": trace.format()})
+
     phone = user_phone or user_id
     entry = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -142,6 +152,7 @@ def log_interaction(
         "qa_match_score": qa_match_score,
         "tool_calls": tool_calls,
         "flow_steps": flow_steps[:35] if flow_steps else None,
+        "trace": trace.to_dict() if trace is not None else None,
     }
 
     _FLOW_BUFFER.append(entry)
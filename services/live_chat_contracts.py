@@ -202,7 +202,7 @@ def normalize_conversation_document(
     """Normalize a raw conversation document while keeping contract fields."""
     data = dict(payload or {})
     normalized_messages = dedupe_messages(data.get("messages", []))
-    return {
+    normalized = {
         "conversation_id": conversation_id,
         "user_id": str(data.get("user_id") or user_id),
         "customer_info": dict(data.get("customer_info", {}) or {}),
@@ -215,3 +215,15 @@ def normalize_conversation_document(
         "operator_id": data.get("operator_id"),
         "operator_name": data.get("operator_name"),
     }
+    # Header documents (messages in a subcollection) carry a summary instead of the full list
+    if data.get("storage_mode") == "subcollection":
+        last_visible = data.get("last_visible_message")
+        normalized.update({
+            "storage_mode": "subcollection",
+            "message_count": int(data.get("message_count") or 0),
+            "visible_message_count": int(data.get("visible_message_count") or 0),
+            "first_visible_at": parse_timestamp_utc(data.get("first_visible_at")) if data.get("first_visible_at") else None,
+            "last_visible_message": normalize_message(last_visible) if last_visible else None,
+            "recent_messages": dedupe_messages(data.get("recent_messages", [])),
+        })
+    return normalized
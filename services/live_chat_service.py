@@ -12,6 +12,7 @@ import asyncio
 import json
 import os
 import re
+import time
 from typing import List, Dict, Optional, Any, Tuple
 from collections import defaultdict
 from google.cloud import firestore
@@ -23,8 +24,20 @@ from services.live_chat_contracts import (
     utc_now,
 )
 from utils.utils import get_firestore_db, set_human_takeover_status
+from services.conversation_store import (
+    STORAGE_MODE_SUBCOLLECTION,
+    hydrate_conversation_payload,
+    update_message as update_conversation_message,
+)
 from utils.phone_utils import normalize_phone
 from services.media_service import build_whatsapp_audio_delivery_url
+from services.chat_index_service import (
+    chat_index_service,
+    conversation_state,
+    conversation_visible_stats,
+    epoch_to_datetime,
+    update_chat_index,
+)
 
 
 class LiveChatService:
@@ -56,9 +69,14 @@ class LiveChatService:
         # Cache for unified chats (WhatsApp-style list)
         self._unified_chats_cache = []
         self._unified_chats_cache_time = None
+        # Per-user chat rows backing the cached lists (patched by deltas, see apply_message_delta)
+        self._chat_rows: Dict[str, Dict[str, Any]] = {}
+        # Background rebuild of the materialized chat index (one per process)
+        self._chat_index_rebuild_task = None
 
     def invalidate_cache(self):
-        """Clear service caches so UI reads latest state."""
+        """Clear service caches so UI reads latest state (explicit refresh only, events apply deltas)."""
+        self._chat_rows = {}
         self._conversations_cache = None
         self._conversations_cache_time = None
         self._queue_cache = None
@@ -80,6 +98,29 @@ class LiveChatService:
         """
         return [msg for msg in (messages or []) if not self._is_smart_message(msg)]
 
+    def _visible_summary(
+        self, conv_data: Dict[str, Any]
+    ) -> Tuple[List[Dict[str, Any]], int, Optional[datetime.datetime]]:
+        """
+        Visible messages available in memory, total visible count and first visible timestamp.
+        Header documents (messages in a subcollection) only carry a recent tail plus counters,
+        so list views never have to read the message subcollection.
+        """
+        if conv_data.get("storage_mode") == STORAGE_MODE_SUBCOLLECTION:
+            visible_messages = self._visible_chat_messages(conv_data.get("recent_messages"))
+            last_visible = conv_data.get("last_visible_message")
+            if not visible_messages and last_visible:
+                visible_messages = [last_visible]
+            visible_count = max(int(conv_data.get("visible_message_count") or 0), len(visible_messages))
+            first_visible_at = conv_data.get("first_visible_at")
+            if first_visible_at is None and visible_messages:
+                first_visible_at = self._parse_timestamp(visible_messages[0].get("timestamp"))
+            return visible_messages, visible_count, first_visible_at
+
+        visible_messages = self._visible_chat_messages(conv_data.get("messages", []))
+        first_visible_at = self._parse_timestamp(visible_messages[0].get("timestamp")) if visible_messages else None
+        return visible_messages, len(visible_messages), first_visible_at
+
     def _is_cache_fresh(self, cache_time: Optional[datetime.datetime], ttl_seconds: Optional[int] = None) -> bool:
         if cache_time is None:
             return False
@@ -150,6 +191,492 @@ class LiveChatService:
         start = (safe_page - 1) * safe_page_size
         end = start + safe_page_size
         return items[start:end], total_items, total_pages
+
+    # ------------------------------------------------------------------ chat rows
+    #
+    # A "chat row" is the per-customer list state (latest conversation, preview, timestamps as
+    # epoch seconds, status/takeover fields). It is the shape stored in the chat index and is kept
+    # in memory per user so list caches can be patched with deltas instead of being rebuilt.
+
+    def _use_chat_index(self) -> bool:
+        """List views read the materialized chat index once it has been built from Firestore."""
+        return bool(getattr(config, "LIVE_CHAT_INDEX_ENABLED", True)) and chat_index_service.is_ready()
+
+    def _chat_row(
+        self,
+        user_id: str,
+        conversation_id: str,
+        conversation: Dict[str, Any],
+        *,
+        last_message: Dict[str, Any],
+        last_activity: datetime.datetime,
+        first_message_at: Optional[datetime.datetime],
+        message_count: int,
+        customer_info: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        row = conversation_state(conversation)
+        row.update({
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "customer_info": dict(customer_info or conversation.get("customer_info") or {}),
+            "last_message_content": str((last_message or {}).get("text", "") or ""),
+            "last_message_is_user": (last_message or {}).get("role") == "user",
+            "last_activity": last_activity.timestamp(),
+            "first_message_at": (first_message_at or last_activity).timestamp(),
+            "message_count": int(message_count),
+            "human_takeover_active": bool(row["human_takeover_active"]),
+        })
+        return row
+
+    def _row_identity(self, row: Dict[str, Any], unknown_name: str) -> Dict[str, Any]:
+        """Display name/phone/language/gender for a chat row (same fallbacks as the Firestore scan)."""
+        user_id = row["user_id"]
+        customer_info = row.get("customer_info") or {}
+        user_name = customer_info.get("name") or config.user_names.get(user_id) or ""
+        phone_full, phone_clean = self._resolve_user_phone(user_id=user_id, customer_info=customer_info)
+        if not user_name and phone_full and phone_full != "Unknown":
+            user_name = phone_full
+        if not user_name:
+            user_name = unknown_name
+        return {
+            "user_name": user_name,
+            "phone_full": phone_full,
+            "phone_clean": phone_clean,
+            "language": config.user_data_whatsapp.get(user_id, {}).get("user_preferred_lang", "ar"),
+            "gender": customer_info.get("gender") or config.user_gender.get(user_id, "unknown"),
+        }
+
+    def _row_status(self, row: Dict[str, Any]) -> str:
+        if row.get("operator_id"):
+            return "human"
+        return "waiting_human" if row.get("human_takeover_active") else "bot"
+
+    def _row_times(self, row: Dict[str, Any]) -> Tuple[datetime.datetime, int]:
+        last_activity = epoch_to_datetime(row["last_activity"])
+        first_message_at = epoch_to_datetime(row.get("first_message_at")) or last_activity
+        return last_activity, max(0, int((last_activity - first_message_at).total_seconds()))
+
+    def _row_is_open(self, row: Dict[str, Any]) -> bool:
+        return row.get("conversation_status") not in ("resolved", "archived")
+
+    def _row_is_waiting(self, row: Dict[str, Any]) -> bool:
+        return bool(row.get("human_takeover_active")) and not row.get("operator_id")
+
+    def _row_is_live(self, row: Dict[str, Any], now: datetime.datetime) -> bool:
+        return (
+            now.timestamp() - row["last_activity"] <= self.ACTIVE_TIME_WINDOW
+            and self._row_is_open(row)
+            and not row.get("human_takeover_active")
+        )
+
+    def _row_is_active(self, row: Dict[str, Any], now: datetime.datetime) -> bool:
+        recent = now.timestamp() - row["last_activity"] <= self.ACTIVE_TIME_WINDOW
+        return (
+            self._row_is_open(row)
+            and (recent or bool(row.get("human_takeover_active")))
+            and not self._row_is_waiting(row)
+        )
+
+    def _unified_entry(self, row: Dict[str, Any], now: datetime.datetime) -> Dict[str, Any]:
+        identity = self._row_identity(row, "Unknown")
+        last_activity, duration_seconds = self._row_times(row)
+        return {
+            "user_id": row["user_id"],
+            "conversation_id": row["conversation_id"],
+            "user_name": identity["user_name"],
+            "user_phone": identity["phone_full"],
+            "language": identity["language"],
+            "phone_clean": identity["phone_clean"],
+            "last_message": {
+                "content": row.get("last_message_content", ""),
+                "is_user": bool(row.get("last_message_is_user")),
+                "timestamp": last_activity.isoformat(),
+            },
+            "last_activity": last_activity.isoformat(),
+            "status": self._row_status(row),
+            "message_count": row.get("message_count", 0),
+            "duration_seconds": duration_seconds,
+            "is_live": self._row_is_live(row, now),
+            "customer_info": row.get("customer_info") or {},
+        }
+
+    def _active_entry(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Active-view entry for a customer. `conversations` holds the latest conversation only, while
+        conversation_count / message_count are the customer's totals over all their conversations
+        (stored per user in the index); the Firestore scan fallback counts only the open, recent ones.
+        """
+        user_id = row["user_id"]
+        identity = self._row_identity(row, "Unknown Customer")
+        last_activity, duration_seconds = self._row_times(row)
+        last_message = {
+            "content": row.get("last_message_content", ""),
+            "is_user": bool(row.get("last_message_is_user")),
+            "timestamp": last_activity.isoformat(),
+        }
+        conversation = {
+            "conversation_id": row["conversation_id"],
+            "user_id": user_id,
+            "status": self._row_status(row),
+            "message_count": row.get("message_count", 0),
+            "last_activity": last_activity.isoformat(),
+            "duration_seconds": duration_seconds,
+            "sentiment": row.get("sentiment", "neutral"),
+            "operator_id": row.get("operator_id"),
+            "customer_info": row.get("customer_info") or {},
+            "last_message": last_message,
+        }
+        return {
+            "user_id": user_id,
+            "user_name": identity["user_name"],
+            "user_phone": identity["phone_full"],
+            "phone_clean": identity["phone_clean"],
+            "language": identity["language"],
+            "gender": identity["gender"],
+            "conversation_count": row.get("conversation_count") or 1,
+            "conversations": [conversation],
+            "conversation_id": conversation["conversation_id"],
+            "status": conversation["status"],
+            "message_count": row.get("total_message_count") or conversation["message_count"],
+            "last_activity": conversation["last_activity"],
+            "duration_seconds": duration_seconds,
+            "sentiment": conversation["sentiment"],
+            "operator_id": conversation["operator_id"],
+            "last_message": last_message,
+        }
+
+    def _queue_item(self, row: Dict[str, Any], now: datetime.datetime) -> Dict[str, Any]:
+        identity = self._row_identity(row, "Unknown Customer")
+        waiting_since = epoch_to_datetime(row.get("escalation_time") or row["last_activity"])
+        wait_time_seconds = int((now - waiting_since).total_seconds())
+        sentiment = row.get("sentiment", "neutral")
+        return {
+            "conversation_id": row["conversation_id"],
+            "user_id": row["user_id"],
+            "user_name": identity["user_name"],
+            "user_phone": identity["phone_full"],
+            "phone_clean": identity["phone_clean"],
+            "language": identity["language"],
+            "reason": row.get("escalation_reason") or "user_request",
+            "wait_time_seconds": wait_time_seconds,
+            "sentiment": sentiment,
+            "message_count": row.get("message_count", 0),
+            "priority": 1 if sentiment == "negative" or wait_time_seconds > 300 else 2,
+            "last_message": row.get("last_message_content", ""),
+        }
+
+    def _latest_chat_row(self, user_id: str, conversations_docs) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Chat row for the latest visible conversation of a customer plus their total visible message count."""
+        best_conv = None
+        best_ts = None
+        best_messages: List[Dict[str, Any]] = []
+        best_count = 0
+        best_first_ts = None
+        total_messages = 0
+        conversation_count = 0
+        for conv_doc in conversations_docs:
+            conv_data = normalize_conversation_document(
+                conversation_id=conv_doc.id,
+                user_id=user_id,
+                payload=conv_doc.to_dict() or {},
+            )
+            visible_messages, visible_count, first_visible_ts = self._visible_summary(conv_data)
+            if not visible_messages:
+                continue
+            total_messages += visible_count
+            conversation_count += 1
+            ts = self._parse_timestamp(visible_messages[-1].get("timestamp"))
+            if best_ts is None or ts > best_ts:
+                best_ts = ts
+                best_conv = conv_data
+                best_messages = visible_messages
+                best_count = visible_count
+                best_first_ts = first_visible_ts
+
+        if best_conv is None:
+            return None, 0
+        row = self._chat_row(
+            user_id,
+            best_conv["conversation_id"],
+            best_conv,
+            last_message=best_messages[-1],
+            last_activity=best_ts,
+            first_message_at=best_first_ts,
+            message_count=best_count,
+        )
+        row["total_message_count"] = total_messages
+        row["conversation_count"] = conversation_count
+        return row, total_messages
+
+    # ------------------------------------------------------------------ chat index
+
+    async def _get_unified_chats_from_index(self, search_val: str, page: int, page_size: int) -> Dict[str, Any]:
+        safe_page = max(1, int(page))
+        safe_size = max(1, min(int(page_size), 100))
+        now = utc_now()
+        live_since = now.timestamp() - self.ACTIVE_TIME_WINDOW
+        rows, total = await asyncio.to_thread(
+            chat_index_service.query_unified, search_val, live_since, safe_size, (safe_page - 1) * safe_size
+        )
+        for row in rows:
+            self._chat_rows[row["user_id"]] = row
+        has_more = safe_page * safe_size < total
+        return {
+            "success": True,
+            "chats": [self._unified_entry(row, now) for row in rows],
+            "total": total,
+            "page": safe_page,
+            "page_size": safe_size,
+            "has_more": has_more,
+            "next_cursor": str(safe_page + 1) if has_more else None,
+        }
+
+    async def _get_active_conversations_from_index(self) -> List[Dict[str, Any]]:
+        active_since = utc_now().timestamp() - self.ACTIVE_TIME_WINDOW
+        rows = await asyncio.to_thread(chat_index_service.query_active, active_since)
+        for row in rows:
+            self._chat_rows[row["user_id"]] = row
+        return [self._active_entry(row) for row in rows]
+
+    async def _get_history_customers_from_index(
+        self, search: str, filter_by: str, page: int, page_size: int
+    ) -> Dict[str, Any]:
+        safe_page = max(1, int(page))
+        safe_page_size = max(1, min(int(page_size), 1000))
+        window_hours = {"today": 24, "week": 24 * 7, "month": 24 * 30}.get(filter_by)
+        since = utc_now().timestamp() - window_hours * 3600 if window_hours else None
+        rows, total_customers = await asyncio.to_thread(
+            chat_index_service.query_history,
+            (search or "").strip().lower(),
+            since,
+            safe_page_size,
+            (safe_page - 1) * safe_page_size,
+        )
+        customers = []
+        for row in rows:
+            identity = self._row_identity(row, "Unknown Customer")
+            customers.append({
+                "user_id": row["user_id"],
+                "user_name": identity["user_name"],
+                "phone_full": identity["phone_full"],
+                "phone_clean": identity["phone_clean"],
+                "gender": identity["gender"],
+                "last_message": row.get("last_message_content", ""),
+                "last_message_time": epoch_to_datetime(row["last_activity"]).isoformat(),
+                "message_count": row.get("total_message_count", 0),
+                "conversation_count": row.get("conversation_count", 0),
+                "unread_count": 0,
+            })
+        return {
+            "success": True,
+            "customers": customers,
+            "total_customers": total_customers,
+            "page": safe_page,
+            "page_size": safe_page_size,
+            "total_pages": max(1, (total_customers + safe_page_size - 1) // safe_page_size),
+        }
+
+    async def _get_waiting_queue_from_index(self) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(chat_index_service.query_waiting)
+        now = utc_now()
+        for row in rows:
+            self._chat_rows[row["user_id"]] = row
+        return [self._queue_item(row, now) for row in rows]
+
+    async def rebuild_chat_index(self) -> Dict[str, Any]:
+        """Full rebuild of the chat index from Firestore (startup backfill / explicit refresh)."""
+        users_collection = self._get_users_collection()
+        if users_collection is None:
+            return {"success": False, "error": "Firestore not initialized"}
+
+        _start = __import__("time").time()
+        users_docs = await self._stream_user_docs(users_collection)
+        user_ids = [doc.id for doc in users_docs]
+        results = await self._stream_conversations_for_users(users_collection, user_ids)
+
+        rows = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ Error in chat index rebuild fetch: {result}")
+                continue
+            user_id, conversations_docs = result
+            chat_row, total_messages = self._latest_chat_row(user_id, conversations_docs)
+            if chat_row is None:
+                continue
+            rows.append(chat_index_service.build_row(
+                chat_row,
+                total_message_count=total_messages,
+                conversation_count=len(conversations_docs),
+            ))
+
+        written = await asyncio.to_thread(chat_index_service.replace_rows, rows, built_after=_start)
+        await asyncio.to_thread(chat_index_service.mark_built, len(rows))
+        self.invalidate_cache()
+        elapsed_ms = (__import__("time").time() - _start) * 1000
+        print(f"✅ Chat index rebuilt | users={len(user_ids)} | rows={len(rows)} | written={written} | {elapsed_ms:.0f}ms")
+        return {"success": True, "users": len(user_ids), "rows": len(rows), "written": written, "elapsed_ms": round(elapsed_ms)}
+
+    # ------------------------------------------------------------------ cache deltas
+    #
+    # Message saves and takeover/release/end events patch the cached lists in place (move one chat
+    # to the top, update its preview/status) instead of dropping them. Caches are still rebuilt
+    # when CACHE_TTL expires, which bounds drift from writes handled by other workers.
+
+    def _unified_sort_key(self, entry: Dict[str, Any]) -> Tuple[bool, float]:
+        ts_str = entry.get("last_activity", "") or ""
+        ts_val = self._parse_timestamp(ts_str).timestamp() if ts_str else 0
+        return (not entry.get("is_live", False), -ts_val)
+
+    def _active_sort_key(self, entry: Dict[str, Any]) -> Tuple[float]:
+        return (-self._parse_timestamp(entry.get("last_activity")).timestamp(),)
+
+    def _queue_sort_key(self, entry: Dict[str, Any]) -> Tuple[int, int]:
+        return (entry["priority"], -entry["wait_time_seconds"])
+
+    def _place_entry(self, entries: List[Dict[str, Any]], user_id: str, entry: Optional[Dict[str, Any]], sort_key) -> None:
+        """Remove the user's entry from a sorted cached list and insert the new one at its position."""
+        entries[:] = [item for item in entries if item.get("user_id") != user_id]
+        if entry is None:
+            return
+        key = sort_key(entry)
+        position = len(entries)
+        for index, item in enumerate(entries):
+            if sort_key(item) > key:
+                position = index
+                break
+        entries.insert(position, entry)
+
+    def _has_cached_lists(self) -> bool:
+        return (
+            self._conversations_cache is not None
+            or self._queue_cache is not None
+            or self._unified_chats_cache_time is not None
+        )
+
+    def _apply_chat_row(self, user_id: str, row: Optional[Dict[str, Any]]) -> None:
+        """Patch every cached list with the new state of one customer (None removes the customer)."""
+        if row is None:
+            self._chat_rows.pop(user_id, None)
+        else:
+            self._chat_rows[user_id] = row
+        now = utc_now()
+        if self._unified_chats_cache_time is not None:
+            entry = self._unified_entry(row, now) if row is not None and not self._row_is_waiting(row) else None
+            self._place_entry(self._unified_chats_cache, user_id, entry, self._unified_sort_key)
+        if self._conversations_cache is not None:
+            entry = self._active_entry(row) if row is not None and self._row_is_active(row, now) else None
+            self._place_entry(self._conversations_cache, user_id, entry, self._active_sort_key)
+        if self._queue_cache is not None:
+            in_queue = row is not None and self._row_is_waiting(row) and self._row_is_open(row)
+            entry = self._queue_item(row, now) if in_queue else None
+            self._place_entry(self._queue_cache, user_id, entry, self._queue_sort_key)
+
+    def apply_message_delta(
+        self,
+        user_id: str,
+        conversation_id: str,
+        message: Dict[str, Any],
+        conversation: Dict[str, Any],
+    ) -> None:
+        """
+        A message was saved: move the customer's chat to the top with the new preview.
+        `conversation` is the stored document before the append with this save's header updates applied.
+        """
+        if self._is_smart_message(message):
+            return
+        previous = self._chat_rows.get(user_id)
+        last_activity = self._parse_timestamp(message.get("timestamp"))
+        new_conversation = False
+        if previous is not None and previous.get("conversation_id") == conversation_id:
+            message_count = int(previous.get("message_count") or 0) + 1
+            first_message_at = epoch_to_datetime(previous.get("first_message_at"))
+        else:
+            prior_count, prior_first_at = conversation_visible_stats(conversation)
+            message_count = prior_count + 1
+            first_message_at = epoch_to_datetime(prior_first_at)
+            new_conversation = prior_count == 0
+        customer_info = conversation.get("customer_info") or (previous or {}).get("customer_info")
+        row = self._chat_row(
+            user_id,
+            conversation_id,
+            conversation,
+            last_message=message,
+            last_activity=last_activity,
+            first_message_at=first_message_at,
+            message_count=message_count,
+            customer_info=customer_info,
+        )
+        # Per-customer totals, as in the chat index
+        if previous is None:
+            row["total_message_count"] = message_count
+            row["conversation_count"] = 1
+        else:
+            row["total_message_count"] = int(previous.get("total_message_count") or previous.get("message_count") or 0) + 1
+            row["conversation_count"] = int(previous.get("conversation_count") or 1) + (1 if new_conversation else 0)
+        self._apply_chat_row(user_id, row)
+
+    async def apply_state_delta(self, user_id: str, conversation_id: str, **fields: Any) -> None:
+        """
+        Conversation status/takeover changed (takeover, release, end, reopen, archive).
+        Accepts conversation document field names; unknown customers are re-read individually.
+        """
+        if not self._has_cached_lists():
+            return
+        row = self._chat_rows.get(user_id)
+        if row is None:
+            await self.refresh_user_chat(user_id)
+            return
+        if row.get("conversation_id") != conversation_id:
+            return  # an older conversation changed; the list shows the latest one
+        row = dict(row)
+        for key, value in fields.items():
+            if key == "status":
+                row["conversation_status"] = value or "active"
+            elif key == "human_takeover_active":
+                row[key] = bool(value)
+            elif key in ("operator_id", "operator_name", "sentiment", "escalation_reason"):
+                row[key] = value or None
+        self._apply_chat_row(user_id, row)
+
+    async def refresh_user_chat(self, user_id: str) -> None:
+        """
+        Re-read one customer's conversations (no full scan) and write the row to the chat index
+        and the cached lists, e.g. after a message edit or a voice transcription.
+        """
+        write_index = bool(getattr(config, "LIVE_CHAT_INDEX_ENABLED", True)) and chat_index_service.is_ready()
+        if not write_index and not self._has_cached_lists():
+            return
+        users_collection = self._get_users_collection()
+        if users_collection is None:
+            return
+        read_started = time.time()
+        _, conversations_docs = await self._stream_user_conversations(users_collection, user_id)
+        row, total_messages = self._latest_chat_row(user_id, conversations_docs)
+        if write_index and row is not None:
+            index_row = chat_index_service.build_row(
+                row,
+                total_message_count=total_messages,
+                conversation_count=row["conversation_count"],
+            )
+            # Messages indexed while Firestore was being read are newer: keep them
+            await update_chat_index(chat_index_service.replace_rows, [index_row], built_after=read_started)
+        if self._has_cached_lists():
+            self._apply_chat_row(user_id, row)
+
+    async def ensure_chat_index(self) -> None:
+        """Build the chat index in the background if it has never been built on this host."""
+        if not getattr(config, "LIVE_CHAT_INDEX_ENABLED", True) or chat_index_service.is_ready():
+            return
+        if self._chat_index_rebuild_task is not None and not self._chat_index_rebuild_task.done():
+            return
+
+        async def _run():
+            try:
+                await self.rebuild_chat_index()
+            except Exception as e:
+                print(f"❌ Chat index rebuild failed: {e}")
+
+        self._chat_index_rebuild_task = asyncio.create_task(_run())
         
     async def get_active_conversations(self, search: Optional[str] = None) -> List[Dict[str, Any]]:
         """
@@ -173,6 +700,14 @@ class LiveChatService:
             return self._conversations_cache
 
         try:
+            if self._use_chat_index():
+                active_conversations = await self._get_active_conversations_from_index()
+                self._conversations_cache = active_conversations
+                self._conversations_cache_time = current_time
+                if normalized_search:
+                    return self._filter_conversations(active_conversations, normalized_search)
+                return active_conversations
+
             users_collection = self._get_users_collection()
             if users_collection is None:
                 return []
@@ -201,8 +736,7 @@ class LiveChatService:
                         user_id=user_id,
                         payload=conv_doc.to_dict() or {},
                     )
-                    messages = conv_data.get("messages", [])
-                    visible_messages = self._visible_chat_messages(messages)
+                    visible_messages, visible_count, first_message_time = self._visible_summary(conv_data)
 
                     if not visible_messages:
                         continue
@@ -244,14 +778,13 @@ class LiveChatService:
                         continue
                     
                     # Calculate duration
-                    first_message_time = self._parse_timestamp(visible_messages[0].get("timestamp"))
                     duration_seconds = int((last_message_time - first_message_time).total_seconds())
                     
                     conversation = {
                         "conversation_id": conv_doc.id,
                         "user_id": user_id,
                         "status": status,
-                        "message_count": len(visible_messages),
+                        "message_count": visible_count,
                         "last_activity": last_message_time.isoformat(),
                         "last_activity_dt": last_message_time,
                         "duration_seconds": duration_seconds,
@@ -371,6 +904,12 @@ class LiveChatService:
                 }
 
         try:
+            if self._use_chat_index():
+                result = await self._get_unified_chats_from_index(search_val, page, page_size)
+                elapsed_ms = (__import__("time").time() - _start) * 1000
+                print(f"📊 [unified-chats] index | chats={result['total']} | page={result['page']} | {elapsed_ms:.0f}ms")
+                return result
+
             users_collection = self._get_users_collection()
             if users_collection is None:
                 return {"success": False, "chats": [], "total": 0, "has_more": False}
@@ -387,81 +926,16 @@ class LiveChatService:
                 if isinstance(r, Exception):
                     continue
                 user_id, conv_docs = r
-                best_conv = None
-                best_ts = None
-                best_messages = []
-
-                for conv_doc in conv_docs:
-                    conv_data = normalize_conversation_document(
-                        conversation_id=conv_doc.id,
-                        user_id=user_id,
-                        payload=conv_doc.to_dict() or {},
-                    )
-                    messages = conv_data.get("messages", []) or []
-                    visible_messages = self._visible_chat_messages(messages)
-                    if not visible_messages:
-                        continue
-                    last_msg = visible_messages[-1]
-                    ts = self._parse_timestamp(last_msg.get("timestamp"))
-                    if best_ts is None or ts > best_ts:
-                        best_ts = ts
-                        best_conv = conv_data
-                        best_conv["_id"] = conv_data.get("conversation_id", conv_doc.id)
-                        best_messages = visible_messages
-
-                if best_conv is None:
+                row, _ = self._latest_chat_row(user_id, conv_docs)
+                if row is None:
                     continue
-
-                conv_status = best_conv.get("status", "active")
-                time_diff = (current_time - best_ts).total_seconds()
-                is_live = (
-                    time_diff <= self.ACTIVE_TIME_WINDOW
-                    and conv_status not in ("resolved", "archived")
-                    and not best_conv.get("human_takeover_active", False)
-                )
-                if best_conv.get("human_takeover_active") and not best_conv.get("operator_id"):
+                self._chat_rows[user_id] = row
+                if self._row_is_waiting(row):
                     continue  # waiting_human - skip from main list
-
-                cust = best_conv.get("customer_info", {}) or {}
-                user_name = cust.get("name") or config.user_names.get(user_id) or ""
-                phone_full, phone_clean = self._resolve_user_phone(user_id=user_id, customer_info=cust)
-                if not user_name and phone_full and phone_full != "Unknown":
-                    user_name = phone_full
-                if not user_name:
-                    user_name = "Unknown"
-
-                preview = best_messages[-1] if best_messages else {}
-
-                first_ts = self._parse_timestamp(best_messages[0].get("timestamp")) if best_messages else best_ts
-                duration_seconds = int((best_ts - first_ts).total_seconds()) if best_messages else 0
-                language = config.user_data_whatsapp.get(user_id, {}).get("user_preferred_lang", "ar")
-                entry = {
-                    "user_id": user_id,
-                    "conversation_id": best_conv["_id"],
-                    "user_name": user_name,
-                    "user_phone": phone_full,
-                    "language": language,
-                    "phone_clean": phone_clean,
-                    "last_message": {
-                        "content": str(preview.get("text", "")),
-                        "is_user": preview.get("role") == "user",
-                        "timestamp": best_ts.isoformat(),
-                    },
-                    "last_activity": best_ts.isoformat(),
-                    "status": "human" if best_conv.get("operator_id") else ("bot" if not best_conv.get("human_takeover_active") else "waiting_human"),
-                    "message_count": len(best_messages),
-                    "duration_seconds": duration_seconds,
-                    "is_live": is_live,
-                    "customer_info": cust,
-                }
-                all_chats.append(entry)
+                all_chats.append(self._unified_entry(row, current_time))
 
             # Live at top, then by last_activity newest first
-            def _sort_key(c):
-                ts_str = c.get("last_activity", "") or ""
-                ts_val = self._parse_timestamp(ts_str).timestamp() if ts_str else 0
-                return (not c.get("is_live", False), -ts_val)
-            all_chats.sort(key=_sort_key)
+            all_chats.sort(key=self._unified_sort_key)
 
             search_val = (search or "").strip().lower()
             if search_val:
@@ -512,6 +986,9 @@ class LiveChatService:
     ) -> Dict[str, Any]:
         """Canonical customer list for chat history."""
         try:
+            if self._use_chat_index():
+                return await self._get_history_customers_from_index(search, filter_by, page, page_size)
+
             users_collection = self._get_users_collection()
             if users_collection is None:
                 return {"success": False, "error": "Firestore not initialized"}
@@ -540,12 +1017,11 @@ class LiveChatService:
                         user_id=user_id,
                         payload=conv_doc.to_dict() or {},
                     )
-                    messages = conv_data.get("messages", [])
-                    visible_messages = self._visible_chat_messages(messages)
+                    visible_messages, visible_count, _ = self._visible_summary(conv_data)
                     if not visible_messages:
                         continue
 
-                    total_messages += len(visible_messages)
+                    total_messages += visible_count
                     last_message = visible_messages[-1]
                     candidate_ts = self._parse_timestamp(last_message.get("timestamp"))
 
@@ -650,9 +1126,7 @@ class LiveChatService:
                     user_id=user_id,
                     payload=conv_doc.to_dict() or {},
                 )
-                messages = conv_data.get("messages", [])
-                visible_messages = self._visible_chat_messages(messages)
-                message_count = len(visible_messages)
+                visible_messages, message_count, _ = self._visible_summary(conv_data)
                 total_messages += message_count
 
                 last_timestamp = self._parse_timestamp(conv_data.get("timestamp"))
@@ -733,7 +1207,7 @@ class LiveChatService:
             if not conv_doc.exists:
                 return {"success": False, "error": "Conversation not found", "messages": []}
 
-            conv_data = conv_doc.to_dict() or {}
+            conv_data = await hydrate_conversation_payload(conv_ref, conv_doc.to_dict() or {})
             conv_data = normalize_conversation_document(
                 conversation_id=conv_doc.id,
                 user_id=user_id,
@@ -809,8 +1283,7 @@ class LiveChatService:
                     user_id=user_id,
                     payload=conv_doc.to_dict() or {},
                 )
-                messages = conv_data.get("messages", [])
-                visible_messages = self._visible_chat_messages(messages)
+                visible_messages, visible_count, _ = self._visible_summary(conv_data)
                 
                 if not visible_messages:
                     continue
@@ -820,7 +1293,7 @@ class LiveChatService:
                 
                 conversations.append({
                     "conversation_id": conv_doc.id,
-                    "message_count": len(visible_messages),
+                    "message_count": visible_count,
                     "last_activity": last_message_time.isoformat(),
                     "status": conv_data.get("status", "active"),
                     "sentiment": conv_data.get("sentiment", "neutral"),
@@ -846,6 +1319,13 @@ class LiveChatService:
             if self._queue_cache is not None and self._is_cache_fresh(self._queue_cache_time):
                 return self._queue_cache
 
+            if self._use_chat_index():
+                waiting_queue = await self._get_waiting_queue_from_index()
+                waiting_queue.sort(key=lambda x: (x["priority"], -x["wait_time_seconds"]))
+                self._queue_cache = waiting_queue
+                self._queue_cache_time = current_time
+                return waiting_queue
+
             users_collection = self._get_users_collection()
             if users_collection is None:
                 return []
@@ -868,8 +1348,7 @@ class LiveChatService:
                         user_id=user_id,
                         payload=conv_doc.to_dict() or {},
                     )
-                    messages = conv_data.get("messages", [])
-                    visible_messages = self._visible_chat_messages(messages)
+                    visible_messages, visible_count, _ = self._visible_summary(conv_data)
                     
                     if not visible_messages:
                         continue
@@ -927,7 +1406,7 @@ class LiveChatService:
                         "reason": escalation_reason,
                         "wait_time_seconds": wait_time_seconds,
                         "sentiment": sentiment,
-                        "message_count": len(visible_messages),
+                        "message_count": visible_count,
                         "priority": priority,
                         "last_message": last_preview_message.get("text", "")
                     }
@@ -983,6 +1462,14 @@ class LiveChatService:
             # ✅ Use asyncio.to_thread to prevent blocking the event loop
             await asyncio.to_thread(conv_ref.update, update_data)
             print(f"✅ Firebase updated successfully for conversation {conversation_id}")
+            await update_chat_index(
+                chat_index_service.update_conversation_state,
+                user_id,
+                conversation_id,
+                status="resolved",
+                human_takeover_active=False,
+                operator_id=None,
+            )
 
             # Verify the update
             updated_doc = await asyncio.to_thread(conv_ref.get)
@@ -999,9 +1486,13 @@ class LiveChatService:
             if user_id in config.user_data_whatsapp:
                 config.user_data_whatsapp[user_id].pop('current_conversation_id', None)
                 print(f"🔄 Cleared current_conversation_id for {user_id} - next message will start new conversation")
+            from services.state_store import user_state_store
+            await user_state_store.save(user_id, ("user_in_human_takeover_mode", "user_data_whatsapp"))
 
-            # Invalidate cache
-            self.invalidate_cache()
+            # Patch cached lists (chat leaves the active view, stays in history)
+            await self.apply_state_delta(
+                user_id, conversation_id, status="resolved", human_takeover_active=False, operator_id=None
+            )
 
             # Send notification to customer
             if adapter:
@@ -1072,6 +1563,10 @@ class LiveChatService:
                 "resolved_at": None,
                 "resolved_by": None
             })
+            await update_chat_index(
+                chat_index_service.update_conversation_state, user_id, conversation_id, status="active"
+            )
+            await self.apply_state_delta(user_id, conversation_id, status="active")
             
             print(f"✅ Conversation {conversation_id} reopened (customer messaged again)")
             
@@ -1108,6 +1603,10 @@ class LiveChatService:
                 "archived_at": utc_now(),
                 "archived_reason": "auto_6h_timeout"
             })
+            await update_chat_index(
+                chat_index_service.update_conversation_state, user_id, conversation_id, status="archived"
+            )
+            await self.apply_state_delta(user_id, conversation_id, status="archived")
 
             print(f"📦 Auto-archived conversation {conversation_id} (6-hour timeout)")
             
@@ -1121,9 +1620,6 @@ class LiveChatService:
             config.user_in_human_takeover_mode[user_id] = True
             self.operator_sessions[conversation_id] = operator_id
 
-            # Invalidate cache
-            self.invalidate_cache()
-
             print(f"✅ Operator {operator_id} took over conversation {conversation_id}")
 
             return {
@@ -1145,9 +1641,6 @@ class LiveChatService:
             if conversation_id in self.operator_sessions:
                 del self.operator_sessions[conversation_id]
 
-            # Invalidate cache
-            self.invalidate_cache()
-
             print(f"✅ Conversation {conversation_id} released back to bot")
 
             return {
@@ -1204,7 +1697,8 @@ class LiveChatService:
                 
                 try:
                     from utils.utils import convert_webm_to_opus
-                    opus_data, opus_file_name = convert_webm_to_opus(message)
+                    from services.blocking_executor import blocking_executor
+                    opus_data, opus_file_name = await blocking_executor.run_cpu(convert_webm_to_opus, message)
                     if opus_file_name:  # Conversion successful
                         audio_data_to_upload = opus_data
                         upload_file_name = opus_file_name
@@ -1428,7 +1922,7 @@ class LiveChatService:
             conv_data = normalize_conversation_document(
                 conversation_id=conv_doc.id,
                 user_id=user_id,
-                payload=conv_doc.to_dict() or {},
+                payload=await hydrate_conversation_payload(conv_ref, conv_doc.to_dict() or {}),
             )
             messages = conv_data.get("messages", [])
             messages = self._visible_chat_messages(messages)
@@ -1545,7 +2039,7 @@ class LiveChatService:
             if not conv_doc.exists:
                 return {"success": False, "error": "Conversation not found"}
 
-            doc_data = conv_doc.to_dict() or {}
+            doc_data = await hydrate_conversation_payload(conv_ref, conv_doc.to_dict() or {})
             messages = doc_data.get("messages", [])
             message_id_str = str(message_id).strip()
 
@@ -1612,7 +2106,7 @@ class LiveChatService:
     ) -> Dict[str, Any]:
         """
         Update a single message's text in a conversation (e.g. operator edit after dislike).
-        Updates Firestore, invalidates cache, and broadcasts message_updated for real-time UI.
+        Updates Firestore, refreshes the customer's cached list entry, and broadcasts message_updated for real-time UI.
         """
         try:
             db = get_firestore_db()
@@ -1629,11 +2123,14 @@ class LiveChatService:
                 return {"success": False, "error": "Conversation not found"}
 
             doc_data = conv_doc.to_dict() or {}
-            messages = list(doc_data.get("messages", []))
             message_id_str = str(message_id).strip()
             if not message_id_str:
                 return {"success": False, "error": "message_id is required"}
 
+            new_text = (new_content or "").strip()
+            if not new_text:
+                return {"success": False, "error": "new_content cannot be empty"}
+
             def _msg_id(m: Dict[str, Any]) -> str:
                 mid = m.get("message_id")
                 if mid:
@@ -1644,31 +2141,29 @@ class LiveChatService:
                         return str(meta[key]).strip()
                 return ""
 
-            found_index = None
-            for i, msg in enumerate(messages):
-                if _msg_id(msg) == message_id_str:
-                    found_index = i
-                    break
-
-            if found_index is None:
+            def _select_message(messages: List[Dict[str, Any]]) -> Optional[int]:
+                for i, msg in enumerate(messages):
+                    if _msg_id(msg) == message_id_str:
+                        return i
+                return None
+
+            def _apply_edit(message: Dict[str, Any]) -> None:
+                message["text"] = new_text
+                meta = message.get("metadata") or {}
+                meta["edited_at"] = utc_now().isoformat()
+                message["metadata"] = meta
+
+            updated_msg = await update_conversation_message(
+                conv_ref,
+                doc_data,
+                _select_message,
+                _apply_edit,
+                {"last_updated": utc_now()},
+            )
+            if updated_msg is None:
                 return {"success": False, "error": "Message not found"}
+            await self.refresh_user_chat(user_id)
 
-            new_text = (new_content or "").strip()
-            if not new_text:
-                return {"success": False, "error": "new_content cannot be empty"}
-
-            messages[found_index]["text"] = new_text
-            meta = messages[found_index].get("metadata") or {}
-            meta["edited_at"] = utc_now().isoformat()
-            messages[found_index]["metadata"] = meta
-
-            await asyncio.to_thread(conv_ref.update, {
-                "messages": messages,
-                "last_updated": utc_now(),
-            })
-            self.invalidate_cache()
-
-            updated_msg = messages[found_index]
             dash_msg = {
                 "message_id": message_id_str,
                 "content": new_text,
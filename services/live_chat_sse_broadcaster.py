@@ -1,15 +1,73 @@
-"""Shared SSE broadcaster for Live Chat events."""
+"""
+Shared SSE broadcaster for Live Chat events.
+
+Dashboard clients are connected to whichever gunicorn worker accepted their request, but the
+message that triggers an event is saved on any worker. `publish` therefore goes through a
+backplane:
+
+- Redis (REDIS_URL configured): one Lua script gives the event a global sequence number (`INCR`),
+  appends it to a replay ring (a capped list) and `PUBLISH`es it, so ring and channel order
+  match the ids even when several workers publish at once. Every worker with connected clients
+  subscribes to the channel and delivers what it receives (its own events included) to its
+  clients.
+- Otherwise (or if Redis errors): sequence, ring and delivery stay in this process.
+
+The SSE frame (`id: <sequence>`, event type, JSON data) is encoded once, in `publish` (the id
+line is prepended by the script on Redis); the same bytes travel through Redis, the replay ring
+and every client queue.
+
+A reconnecting client sends its last id back (`Last-Event-ID` header from EventSource, or
+`?last_event_id=`) and gets the events it missed from the ring instead of the full conversation
+list; if the ring no longer covers the gap it gets the full list as on a first connect.
+
+A client whose queue fills up (tab in the background, slow network) is not silently skipped:
+its queue is dropped and it receives a `resync` event followed by the full conversation list.
+"""
 
 from __future__ import annotations
 
 import asyncio
 import json
+import time
+from collections import deque
 from datetime import datetime
-from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
 
 from fastapi import Request
 
+import config
 from services.live_chat_contracts import utc_now
+from services.metrics import counter, gauge, histogram
+
+_sse_clients = gauge("linasbot_sse_clients", "Live Chat SSE clients connected to this worker")
+_sse_max_queue_depth = gauge("linasbot_sse_max_queue_depth", "Deepest Live Chat SSE client queue after the last fan-out")
+_sse_events_total = counter("linasbot_sse_events_total", "Live Chat SSE events published, by backend", ("backend",))
+_sse_dropped_total = counter(
+    "linasbot_sse_dropped_total",
+    "Live Chat SSE events not queued for a client, by reason",
+    ("reason",),
+)
+_sse_resyncs_total = counter("linasbot_sse_resyncs_total", "Live Chat SSE clients told to resync after falling behind")
+_sse_fanout_seconds = histogram(
+    "linasbot_sse_fanout_seconds",
+    "Time from publish to the event being queued for this worker's clients",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# KEYS[1] = sequence, KEYS[2] = replay ring, KEYS[3] = channel
+# ARGV[1] = frame without its id line, ARGV[2] = published_at, ARGV[3] = replay size
+_PUBLISH_SCRIPT = """
+local sequence = redis.call('incr', KEYS[1])
+local payload = cjson.encode({
+    sequence = sequence,
+    frame = 'id: ' .. sequence .. '\\n' .. ARGV[1],
+    published_at = tonumber(ARGV[2]),
+})
+redis.call('rpush', KEYS[2], payload)
+redis.call('ltrim', KEYS[2], -tonumber(ARGV[3]), -1)
+redis.call('publish', KEYS[3], payload)
+return sequence
+"""
 
 
 def _json_serializer(obj):
@@ -18,28 +76,124 @@ def _json_serializer(obj):
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
+def encode_sse_frame(event_type: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    event_data = json.dumps(data, default=_json_serializer)
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event_type}\ndata: {event_data}\n\n".encode("utf-8")
+
+
+# Queued in place of events for a client that fell behind
+_RESYNC = object()
+
+
+class _SSEClient:
+    __slots__ = ("queue", "lagging", "dropped")
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.lagging = False
+        self.dropped = 0
+
+
 class LiveChatSSEBroadcaster:
     """Stateful SSE hub with robust connect/disconnect handling."""
 
     HEARTBEAT_SECONDS = 25
     CLIENT_QUEUE_SIZE = 64
+    LISTENER_RETRY_SECONDS = 2.0
 
-    def __init__(self):
-        self._clients: Set[asyncio.Queue] = set()
+    def __init__(self, redis_client: Any = None, replay_size: Optional[int] = None):
+        self._clients: Set[_SSEClient] = set()
         self._lock = asyncio.Lock()
         self._sequence = 0
+        self._redis = redis_client
+        self.replay_size = replay_size or getattr(config, "LIVE_CHAT_SSE_REPLAY_SIZE", 500)
+        # Events are {"sequence": int, "frame": bytes, "published_at": float}
+        self._ring: Deque[Dict[str, Any]] = deque(maxlen=self.replay_size)
+        self._listener: Optional[asyncio.Task] = None
+        self._stats = {"published": 0, "delivered": 0, "dropped": 0, "resyncs": 0, "replays": 0}
+
+    # ------------------------------------------------------------------ backplane
+
+    def _client(self) -> Any:
+        if self._redis is not None:
+            return self._redis
+        from services.redis_client import get_redis
+        return get_redis()
+
+    def _key(self, name: str) -> str:
+        prefix = getattr(config, "STATE_STORE_KEY_PREFIX", "linasbot")
+        return f"{prefix}:sse:live_chat:{name}"
+
+    @staticmethod
+    def _load(raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            event = json.loads(raw)
+            event["frame"] = event["frame"].encode("utf-8")
+            return event
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return None
 
-    async def _register(self) -> asyncio.Queue:
-        queue: asyncio.Queue = asyncio.Queue(maxsize=self.CLIENT_QUEUE_SIZE)
+    def _ensure_listener(self) -> None:
+        if self._client() is None:
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        """Deliver the events published on the Redis channel (by any worker) to local clients."""
+        while True:
+            client = self._client()
+            if client is None:
+                return
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self._key("events"))
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    event = self._load(message["data"])
+                    if event is None:
+                        continue
+                    self._ring.append(event)
+                    await self._deliver(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Live Chat SSE subscriber error, reconnecting: {e}")
+                await asyncio.sleep(self.LISTENER_RETRY_SECONDS)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    # ------------------------------------------------------------------ clients
+
+    async def _register(self) -> _SSEClient:
+        sse_client = _SSEClient(self.CLIENT_QUEUE_SIZE)
         async with self._lock:
-            self._clients.add(queue)
-        return queue
+            self._clients.add(sse_client)
+            _sse_clients.set(len(self._clients))
+        self._ensure_listener()
+        return sse_client
 
-    async def _unregister(self, queue: asyncio.Queue) -> None:
+    async def _unregister(self, sse_client: _SSEClient) -> None:
         async with self._lock:
-            self._clients.discard(queue)
+            self._clients.discard(sse_client)
+            _sse_clients.set(len(self._clients))
 
-    async def _next_sequence(self) -> int:
+    async def _next_local_sequence(self) -> int:
         async with self._lock:
             self._sequence += 1
             return self._sequence
@@ -52,74 +206,196 @@ class LiveChatSSEBroadcaster:
         async with self._lock:
             return len(self._clients)
 
+    # ------------------------------------------------------------------ publish
+
     async def publish(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Send an event to the clients of every worker."""
+        published_at = time.time()
+        self._stats["published"] += 1
+        client = self._client()
+        if client is not None:
+            try:
+                await client.eval(
+                    _PUBLISH_SCRIPT,
+                    3,
+                    self._key("sequence"),
+                    self._key("ring"),
+                    self._key("events"),
+                    encode_sse_frame(event_type, data).decode("utf-8"),
+                    published_at,
+                    self.replay_size,
+                )
+                _sse_events_total.labels(backend="redis").inc()
+                return
+            except Exception as e:
+                print(f"⚠️ Live Chat SSE Redis publish failed, delivering locally: {e}")
+
+        sequence = await self._next_local_sequence()
+        event = {
+            "sequence": sequence,
+            "frame": encode_sse_frame(event_type, data, sequence),
+            "published_at": published_at,
+        }
+        self._ring.append(event)
+        _sse_events_total.labels(backend="local").inc()
+        await self._deliver(event)
+
+    async def _deliver(self, event: Dict[str, Any]) -> None:
         clients = await self._snapshot_clients()
         if not clients:
             return
 
-        event = {
-            "type": event_type,
-            "data": data,
-            "meta": {
-                "sequence": await self._next_sequence(),
-                "broadcast_at": utc_now().isoformat(),
-            },
-        }
+        deepest = 0
+        for sse_client in clients:
+            if sse_client.lagging:
+                # Already told to resync: the full reload covers this event
+                sse_client.dropped += 1
+                self._stats["dropped"] += 1
+                _sse_dropped_total.labels(reason="resync_pending").inc()
+                continue
+            queue = sse_client.queue
+            if queue.full():
+                dropped = queue.qsize()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(_RESYNC)
+                sse_client.lagging = True
+                sse_client.dropped += dropped + 1
+                self._stats["dropped"] += dropped + 1
+                self._stats["resyncs"] += 1
+                _sse_dropped_total.labels(reason="slow_consumer").inc(dropped + 1)
+                _sse_resyncs_total.inc()
+                continue
+            queue.put_nowait(event)
+            self._stats["delivered"] += 1
+            deepest = max(deepest, queue.qsize())
+
+        _sse_max_queue_depth.set(deepest)
+        _sse_fanout_seconds.observe(max(0.0, time.time() - event.get("published_at", time.time())))
 
-        stale_clients = []
-        for queue in clients:
+    # ------------------------------------------------------------------ replay
+
+    async def replay_since(self, last_event_id: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events after `last_event_id`, oldest first, or None when the ring no longer covers the
+        gap (or the sequence was reset) and the client needs a full reload.
+        """
+        client = self._client()
+        current = self._sequence
+        events: List[Dict[str, Any]] = list(self._ring)
+        if client is not None:
             try:
-                if queue.full():
-                    # Prevent stalled clients from blocking the broadcaster forever.
-                    queue.get_nowait()
-                queue.put_nowait(event)
-            except Exception:
-                stale_clients.append(queue)
+                current = int(await client.get(self._key("sequence")) or 0)
+                events = [
+                    event for event in map(self._load, await client.lrange(self._key("ring"), 0, -1))
+                    if event is not None
+                ]
+            except Exception as e:
+                print(f"⚠️ Live Chat SSE replay read failed: {e}")
+                return None
+
+        if last_event_id > current:
+            return None  # sequence restarted: our ids mean nothing to this client
+        missed = [event for event in events if event["sequence"] > last_event_id]
+        if current > last_event_id and (not missed or missed[0]["sequence"] > last_event_id + 1):
+            return None
+        return missed
 
-        if stale_clients:
-            async with self._lock:
-                for queue in stale_clients:
-                    self._clients.discard(queue)
+    @staticmethod
+    def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+        try:
+            return int(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    # ------------------------------------------------------------------ stream
 
     async def stream(
         self,
         request: Request,
         initial_payload_loader: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None,
+        last_event_id: Optional[str] = None,
     ):
         """Yield a resilient SSE stream for one connected client."""
-        client_queue = await self._register()
-        connected_payload = {"status": "connected", "connected_at": utc_now().isoformat()}
+        sse_client = await self._register()
+        resume_from = self.parse_last_event_id(last_event_id)
+        replay = await self.replay_since(resume_from) if resume_from is not None else None
+        if replay is not None:
+            self._stats["replays"] += 1
+        connected_payload = {
+            "status": "connected",
+            "connected_at": utc_now().isoformat(),
+            "resumed": replay is not None,
+            "replayed": len(replay) if replay else 0,
+        }
+        last_sent = resume_from or 0
+
+        async def _full_payload():
+            if initial_payload_loader is None:
+                return None
+            try:
+                initial_payload = await initial_payload_loader()
+                if initial_payload is not None:
+                    return encode_sse_frame("conversations", initial_payload)
+            except Exception as exc:
+                print(f"⚠️ SSE initial payload error: {exc}")
+            return None
 
         try:
-            yield f"event: connected\ndata: {json.dumps(connected_payload, default=_json_serializer)}\n\n"
+            yield encode_sse_frame("connected", connected_payload)
 
-            if initial_payload_loader is not None:
-                try:
-                    initial_payload = await initial_payload_loader()
-                    if initial_payload is not None:
-                        yield f"event: conversations\ndata: {json.dumps(initial_payload, default=_json_serializer)}\n\n"
-                except Exception as exc:
-                    print(f"⚠️ SSE initial payload error: {exc}")
+            if replay is not None:
+                for event in replay:
+                    last_sent = event["sequence"]
+                    yield event["frame"]
+            else:
+                frame = await _full_payload()
+                if frame is not None:
+                    yield frame
 
             while True:
                 if await request.is_disconnected():
                     break
 
                 try:
-                    event = await asyncio.wait_for(client_queue.get(), timeout=self.HEARTBEAT_SECONDS)
-                    event_data = json.dumps(event.get("data", {}), default=_json_serializer)
-                    event_type = event.get("type", "message")
-                    yield f"event: {event_type}\ndata: {event_data}\n\n"
+                    event = await asyncio.wait_for(sse_client.queue.get(), timeout=self.HEARTBEAT_SECONDS)
                 except asyncio.TimeoutError:
                     heartbeat = {
                         "timestamp": utc_now().isoformat(),
                         "active_clients": await self.active_clients_count(),
                     }
-                    yield f"event: heartbeat\ndata: {json.dumps(heartbeat)}\n\n"
+                    yield encode_sse_frame("heartbeat", heartbeat)
+                    continue
+
+                if event is _RESYNC:
+                    sse_client.lagging = False
+                    yield encode_sse_frame("resync", {"reason": "slow_consumer", "dropped": sse_client.dropped})
+                    sse_client.dropped = 0
+                    frame = await _full_payload()
+                    if frame is not None:
+                        yield frame
+                    continue
+                if replay is not None and event["sequence"] <= last_sent:
+                    continue  # already sent from the replay ring
+                yield event["frame"]
         except asyncio.CancelledError:
             pass
         finally:
-            await self._unregister(client_queue)
+            await self._unregister(sse_client)
+
+    def stats(self) -> Dict[str, Any]:
+        clients = list(self._clients)
+        return {
+            "backend": "redis" if self._client() is not None else "local",
+            "clients": len(clients),
+            "lagging_clients": sum(1 for c in clients if c.lagging),
+            "deepest_queue": max((c.queue.qsize() for c in clients), default=0),
+            "client_queue_size": self.CLIENT_QUEUE_SIZE,
+            "replay_ring": len(self._ring),
+            "replay_size": self.replay_size,
+            "listening": self._listener is not None and not self._listener.done(),
+            **self._stats,
+        }
 
 
 live_chat_sse_broadcaster = LiveChatSSEBroadcaster()
@@ -12,9 +12,45 @@ from difflib import SequenceMatcher
 import re
 from pathlib import Path
 from services.language_detection_service import language_detection_service
+from services.qa_index import QAIndex
 from storage.persistent_storage import QA_PAIRS_FILE, ensure_dirs
 
 
+class QATurnMatch:
+    """
+    Q&A scoring of one inbound message, computed once and shared by the direct-answer check
+    (best match, 90%+ tier) and GPT context injection (top relevant pairs, 30%+).
+    """
+
+    DIRECT_THRESHOLD = 0.90
+
+    def __init__(self, question: str, language: str, best_match: Optional[Dict], best_score: float, relevant: List[Dict]):
+        self.question = question
+        self.language = language
+        self.best_match = best_match
+        self.best_score = best_score
+        self.relevant = relevant
+
+    def matches(self, question: str, language: str) -> bool:
+        """True if this result was computed for the same text and language."""
+        return question == self.question and language == self.language
+
+    def direct_match(self) -> Optional[dict]:
+        """find_match_with_tier result: the best pair when it scores 90%+, else None."""
+        if self.best_match is not None and self.best_score >= self.DIRECT_THRESHOLD:
+            print(f"✅ Q&A Match Found! Score: {self.best_score:.2%}, Tier: direct")
+            return {
+                "qa_pair": self.best_match,
+                "match_score": self.best_score,
+                "tier": "direct",
+                "matched_language": LocalQAService._normalize_language(
+                    self.best_match.get("language"), default=LocalQAService._normalize_language(self.language)
+                )
+            }
+        print(f"ℹ️ No Q&A match found (best score: {self.best_score:.2%}, needs ≥90%)")
+        return None
+
+
 class LocalQAService:
     """Manages Q&A pairs using local JSONL file (no backend dependency)"""
     
@@ -26,8 +62,29 @@ class LocalQAService:
 
         self.data_path = data_path
         self.match_threshold = 0.9  # 90% similarity threshold
+        # Pre-normalized per-language index; rebuilt when qa_pairs is replaced, patched on create/update/delete
+        self._qa_index = QAIndex(self.normalize_text, self._index_languages)
         self.qa_pairs = self.load_from_jsonl()
         print(f"✅ LocalQAService initialized with {len(self.qa_pairs)} Q&A pairs from {self.data_path}")
+
+    @property
+    def qa_pairs(self) -> List[Dict]:
+        return self._qa_pairs
+
+    @qa_pairs.setter
+    def qa_pairs(self, qa_pairs: List[Dict]):
+        self._qa_pairs = qa_pairs
+        self._qa_index.rebuild(qa_pairs)
+
+    def _index_languages(self, qa: Dict) -> tuple:
+        """(bucket language for strict matching, language compared by optional filters)"""
+        return self._normalize_language(qa.get("language")), self._normalize_language(qa.get("language"), default="")
+
+    def _ensure_index(self):
+        # Guard against the list being changed without going through this service
+        if len(self._qa_index) != len(self._qa_pairs):
+            print("⚠️ Q&A index out of sync with qa_pairs - rebuilding")
+            self._qa_index.rebuild(self._qa_pairs)
     
     def load_from_jsonl(self) -> List[Dict]:
         """Load Q&A pairs from JSONL file"""
@@ -135,6 +192,7 @@ class LocalQAService:
                     "success": False,
                     "error": f"Failed to save Q&A pair to {self.data_path}. Check file permissions."
                 }
+            self._qa_index.add(qa_pair)
             
             print(f"✅ Created Q&A pair: '{question}' ({language}/{category})")
             
@@ -204,6 +262,7 @@ class LocalQAService:
             # Update fields
             self.qa_pairs[qa_index].update(updates)
             self.qa_pairs[qa_index]["timestamp"] = datetime.now().isoformat()
+            self._qa_index.update(self.qa_pairs[qa_index])
             
             # Save to file
             save_success = self.save_to_jsonl()
@@ -285,6 +344,7 @@ class LocalQAService:
                     "success": False,
                     "error": f"Failed to save Q&A pair to {self.data_path}. Check file permissions."
                 }
+            self._qa_index.remove(deleted)
             
             print(f"✅ Deleted Q&A pair: '{deleted.get('question')}'")
             
@@ -304,7 +364,7 @@ class LocalQAService:
     
     def normalize_text(self, text: str) -> str:
         """Normalize text for better matching"""
-        text = re.sub(r'\s+', ' ', text.strip())
+        text = re.sub(r'\s+', ' ', (text or "").strip())
         text = re.sub(r'[؟?!.،,;:]', '', text)
         text = text.replace('أ', 'ا').replace('إ', 'ا').replace('آ', 'ا')
         text = text.replace('ة', 'ه').replace('ى', 'ي')
@@ -316,34 +376,79 @@ class LocalQAService:
         text2_norm = self.normalize_text(text2)
         return SequenceMatcher(None, text1_norm, text2_norm).ratio()
     
+    def _best_match(self, question: str, language: str) -> tuple:
+        """Best (qa_pair, score) among pairs of `language`; (None, 0) when nothing scores above 0."""
+        self._ensure_index()
+        matches = self._qa_index.search(question, language=language, limit=1)
+        if not matches:
+            return None, 0
+        score, entry = matches[0]
+        return entry.qa, score
+
+    def _relevant_matches(self, question: str, language: Optional[str], limit: int) -> list:
+        """Top (score, entry) pairs scoring 30%+, optionally filtered by language."""
+        self._ensure_index()
+        filter_language = self._normalize_language(language, default="") if language else None
+        return self._qa_index.search(
+            question,
+            language=(filter_language or "ar") if language else None,
+            filter_language=filter_language,
+            limit=limit,
+            min_score=0.3,
+        )
+
+    def _format_relevant(self, matches: list) -> List[Dict]:
+        return [
+            {
+                "question": entry.qa.get("question"),
+                "answer": entry.qa.get("answer"),
+                "similarity": similarity,
+                "language": self._normalize_language(entry.qa.get("language"))
+            }
+            for similarity, entry in matches
+        ]
+
+    async def score_turn(self, question: str, language: str = "ar", limit: int = 3) -> QATurnMatch:
+        """
+        Score a message once for both the direct-answer tier and GPT context.
+        For a supported language both use the same candidate set, so one top-K pass serves both
+        unless it surfaced language-less pairs, which the context list excludes.
+        """
+        self._ensure_index()
+        requested_language = self._normalize_language(language)
+        if language and self._normalize_language(language, default="") == requested_language:
+            top = self._qa_index.search(question, language=requested_language, limit=max(limit, 1))
+            best_match, best_score = (top[0][1].qa, top[0][0]) if top else (None, 0)
+            candidates = [(score, entry) for score, entry in top[:limit] if score >= 0.3]
+            # Pairs without a language share the "ar" bucket but never count as context for it
+            relevant = [(score, entry) for score, entry in candidates if entry.filter_language == requested_language]
+            if len(relevant) < len(candidates):
+                relevant = self._relevant_matches(question, language, limit)
+        else:
+            best_match, best_score = self._best_match(question, requested_language)
+            relevant = self._relevant_matches(question, language, limit)
+        return QATurnMatch(question, language, best_match, best_score, self._format_relevant(relevant))
+
     async def search_qa_pairs(self, query: str, language: str = None) -> dict:
         """Search Q&A pairs by question/answer content"""
         try:
-            results = []
-            
-            for qa in self.qa_pairs:
-                # Filter by language if specified
-                if language:
-                    requested_language = self._normalize_language(language, default="")
-                    qa_language = self._normalize_language(qa.get("language"), default="")
-                    if qa_language != requested_language:
+            self._ensure_index()
+            filter_language = self._normalize_language(language, default="") if language else None
+            scores = {}
+            for field in ("question", "answer"):
+                for score, entry in self._qa_index.search(
+                    query,
+                    field=field,
+                    language=(filter_language or "ar") if language else None,
+                    filter_language=filter_language,
+                    min_score=0.3,  # Lower threshold for search results
+                ):
+                    if not entry.qa.get("question") and not entry.qa.get("answer"):
                         continue
-
-                if not qa.get("question") and not qa.get("answer"):
-                    continue
-                
-                # Calculate similarity for question
-                question_sim = self.calculate_similarity(query, qa.get("question", ""))
-                answer_sim = self.calculate_similarity(query, qa.get("answer", ""))
-                
-                # Use max similarity
-                max_sim = max(question_sim, answer_sim)
-                
-                if max_sim >= 0.3:  # Lower threshold for search results
-                    results.append({
-                        **qa,
-                        "match_score": max_sim
-                    })
+                    # Use max similarity of question and answer
+                    if score > scores.get(entry.seq, (0.0, None))[0]:
+                        scores[entry.seq] = (score, entry.qa)
+            results = [{**qa, "match_score": score} for _, (score, qa) in sorted(scores.items())]
             
             # Sort by score
             results.sort(key=lambda x: x["match_score"], reverse=True)
@@ -375,17 +480,8 @@ class LocalQAService:
             print(f"ℹ️ No Q&A match found (best score: 0.00%, threshold: {self.match_threshold:.2%})")
             return None
         
-        for qa in self.qa_pairs:
-            qa_language = self._normalize_language(qa.get("language"))
-            # Never mix language datasets during matching.
-            if qa_language != requested_language:
-                continue
-
-            similarity = self.calculate_similarity(question, qa.get("question", ""))
-            
-            if similarity > best_score:
-                best_score = similarity
-                best_match = qa
+        # Never mix language datasets during matching.
+        best_match, best_score = self._best_match(question, requested_language)
         
         if best_score >= self.match_threshold:
             print(f"✅ Q&A Match Found! Score: {best_score:.2%}")
@@ -411,32 +507,12 @@ class LocalQAService:
         Returns:
             List of dicts with question, answer, and similarity score
         """
-        results = []
-
-        for qa in self.qa_pairs:
-            # Filter by language if specified
-            if language:
-                requested_language = self._normalize_language(language, default="")
-                qa_language = self._normalize_language(qa.get("language"), default="")
-                if qa_language != requested_language:
-                    continue
-
-            similarity = self.calculate_similarity(question, qa.get("question", ""))
-
-            # Include anything moderately relevant (30%+ similarity)
-            if similarity >= 0.3:
-                results.append({
-                    "question": qa.get("question"),
-                    "answer": qa.get("answer"),
-                    "similarity": similarity,
-                    "language": self._normalize_language(qa.get("language"))
-                })
-
-        # Sort by similarity descending
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-
-        print(f"📚 Found {len(results)} relevant Q&A pairs for context (returning top {limit})")
-        return results[:limit]
+        # Scored in the CPU pool: off the event loop, and a caller's timeout (pre-flight) can fire
+        from services.blocking_executor import blocking_executor
+        matches = await blocking_executor.run_cpu(self._relevant_matches, question, language, limit)
+        results = self._format_relevant(matches)
+        print(f"📚 Found {len(results)} relevant Q&A pairs for context (top {limit})")
+        return results
 
     async def find_match_with_tier(self, question: str, language: str = "ar") -> Optional[dict]:
         """
@@ -453,37 +529,11 @@ class LocalQAService:
         Returns:
             Dict with qa_pair, match_score, and tier, or None if below 90%
         """
-        best_match = None
-        best_score = 0
-        requested_language = self._normalize_language(language)
-
         if not self.qa_pairs:
             print(f"❌ DEBUG: NO Q&A PAIRS LOADED!")
             return None
 
-        for qa in self.qa_pairs:
-            qa_language = self._normalize_language(qa.get("language"))
-            if qa_language != requested_language:
-                continue
-
-            similarity = self.calculate_similarity(question, qa.get("question", ""))
-
-            if similarity > best_score:
-                best_score = similarity
-                best_match = qa
-
-        # 90%+ threshold for direct Q&A response
-        if best_score >= 0.90:
-            print(f"✅ Q&A Match Found! Score: {best_score:.2%}, Tier: direct")
-            return {
-                "qa_pair": best_match,
-                "match_score": best_score,
-                "tier": "direct",
-                "matched_language": self._normalize_language(best_match.get("language"), default=requested_language)
-            }
-
-        print(f"ℹ️ No Q&A match found (best score: {best_score:.2%}, needs ≥90%)")
-        return None
+        return (await self.score_turn(question, language)).direct_match()
 
     async def get_statistics(self) -> dict:
         """Get Q&A statistics"""
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Event-loop lag monitor.
+
+A heartbeat task sleeps for a fixed interval and measures how late it wakes up; the lateness is
+the time the loop spent running something that didn't yield (a synchronous Firestore call,
+bcrypt, PIL, a large json.load, ...). Every sample goes to a Prometheus histogram.
+
+Measuring after the fact can't say *what* blocked, so a watchdog thread checks the heartbeat as
+well: when the loop has not ticked for longer than the threshold it captures the loop thread's
+current stack (sys._current_frames) while the blocking call is still running. The stall is then
+logged with that stack, counted, and kept in `recent_stalls` for `/api/metrics/event-loop`.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, Optional
+
+import config
+from services.metrics import counter, histogram
+
+_loop_lag_seconds = histogram(
+    "linasbot_event_loop_lag_seconds",
+    "How late the event-loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+_loop_stalls_total = counter("linasbot_event_loop_stalls_total", "Event-loop stalls longer than the threshold")
+
+_STACK_LIMIT = 25
+
+
+class EventLoopMonitor:
+    def __init__(self, interval_seconds: Optional[float] = None, threshold_seconds: Optional[float] = None):
+        self.interval = interval_seconds or getattr(config, "EVENT_LOOP_MONITOR_INTERVAL_MS", 100) / 1000.0
+        self.threshold = threshold_seconds or getattr(config, "EVENT_LOOP_STALL_THRESHOLD_MS", 250) / 1000.0
+        self.recent_stalls: deque = deque(maxlen=20)
+        self.stall_count = 0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = 0.0
+        self._captured_stack: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        print(f"✅ Event-loop monitor started (stall threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_tick = now
+            lag = max(0.0, now - expected)
+            _loop_lag_seconds.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _watch(self) -> None:
+        # Check a few times per threshold so the stack is captured while the loop is still blocked
+        poll = min(self.interval, self.threshold / 2)
+        while not self._stop.wait(poll):
+            if self._captured_stack is None and time.monotonic() - self._last_tick > self.interval + self.threshold:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._captured_stack = "".join(traceback.format_stack(frame, limit=_STACK_LIMIT))
+
+    def _record_stall(self, lag: float) -> None:
+        stack, self._captured_stack = self._captured_stack, None
+        self.stall_count += 1
+        _loop_stalls_total.inc()
+        self.recent_stalls.append({"at": time.time(), "lag_ms": round(lag * 1000, 1), "stack": stack})
+        print(f"⚠️ Event loop blocked for {lag * 1000:.0f}ms")
+        if stack:
+            print(f"   Blocking call stack:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "threshold_ms": round(self.threshold * 1000),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stall_count,
+            "recent_stalls": list(self.recent_stalls),
+        }
+
+
+# Global instance
+event_loop_monitor = EventLoopMonitor()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache for media proxied to the dashboard (GET /api/media/audio).
+
+The operator dashboard replays the same voice notes many times; each playback used to download
+the whole file from the provider/Firebase. The proxy now streams the upstream body to the
+browser and tees it into this cache, so later plays (and their Range requests) are served from
+disk:
+
+- blobs are content-addressed: `<root>/blobs/<sha256 of the bytes>`; the digest is also the
+  ETag. `<root>/urls/<sha256 of the URL>.json` maps a proxied URL to its blob and content type,
+  so two URLs for the same file share one blob;
+- a download is written to `<root>/tmp/` and only moved into place once the upstream body is
+  complete; an aborted download (client gone, upstream error) leaves nothing behind;
+- the cache is bounded by MEDIA_CACHE_MAX_MB: least recently served blobs (by mtime, touched on
+  every hit) are deleted first. URL entries whose blob was evicted are dropped on lookup.
+
+The directory lives under LINASBOT_DATA_ROOT and is shared by the workers.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import config
+from services.metrics import counter
+
+_media_cache_total = counter(
+    "linasbot_media_cache_requests_total",
+    "Proxied media lookups by result (hit, miss, stored, aborted, evicted)",
+    ("result",),
+)
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class MediaCacheEntry:
+    def __init__(self, path: Path, digest: str, content_type: str, size: int):
+        self.path = path
+        self.digest = digest
+        self.content_type = content_type
+        self.size = size
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+
+class MediaCacheWriter:
+    """Receives a download chunk by chunk; `commit()` publishes it, `abort()` discards it."""
+
+    def __init__(self, cache: "MediaDiskCache", url: str, content_type: str):
+        self.cache = cache
+        self.url = url
+        self.content_type = content_type
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._tmp_path = cache.tmp_dir / f"{uuid.uuid4().hex}.part"
+        self._file = None
+        self._closed = False
+
+    async def write(self, chunk: bytes) -> None:
+        if self._file is None:
+            self.cache.tmp_dir.mkdir(parents=True, exist_ok=True)
+            self._file = await asyncio.to_thread(open, self._tmp_path, "wb")
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self) -> Optional[MediaCacheEntry]:
+        if self._closed:
+            return None
+        self._closed = True
+        if self._file is None or self.size == 0 or self.size > self.cache.max_bytes:
+            await self._discard()
+            return None
+        await asyncio.to_thread(self._file.close)
+        entry = await asyncio.to_thread(self.cache._store, self.url, self._tmp_path, self._hash.hexdigest(), self.content_type, self.size)
+        _media_cache_total.labels(result="stored").inc()
+        return entry
+
+    async def abort(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        _media_cache_total.labels(result="aborted").inc()
+        await self._discard()
+
+    async def _discard(self) -> None:
+        def discard():
+            if self._file is not None:
+                self._file.close()
+            try:
+                self._tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+        await asyncio.to_thread(discard)
+
+
+class MediaDiskCache:
+    def __init__(self, root: Optional[Path] = None, max_bytes: Optional[int] = None):
+        if root is None:
+            from storage.persistent_storage import get_data_root
+            root = get_data_root() / "media_cache"
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.url_dir = self.root / "urls"
+        self.tmp_dir = self.root / "tmp"
+        self.max_bytes = max_bytes if max_bytes is not None else getattr(config, "MEDIA_CACHE_MAX_MB", 512) * 1024 * 1024
+        self._size_estimate: Optional[int] = None
+
+    async def lookup(self, url: str) -> Optional[MediaCacheEntry]:
+        entry = await asyncio.to_thread(self._lookup, url)
+        _media_cache_total.labels(result="hit" if entry else "miss").inc()
+        return entry
+
+    def _lookup(self, url: str) -> Optional[MediaCacheEntry]:
+        index_path = self.url_dir / f"{_url_key(url)}.json"
+        try:
+            meta = json.loads(index_path.read_text(encoding="utf-8"))
+            path = self.blob_dir / meta["digest"]
+            size = path.stat().st_size
+            os.utime(path)  # LRU: mark as recently served
+        except FileNotFoundError:
+            if index_path.exists():  # blob was evicted
+                index_path.unlink(missing_ok=True)
+            return None
+        except (ValueError, KeyError, OSError):
+            return None
+        return MediaCacheEntry(path, meta["digest"], meta.get("content_type") or "application/octet-stream", size)
+
+    def writer(self, url: str, content_type: str) -> MediaCacheWriter:
+        return MediaCacheWriter(self, url, content_type)
+
+    def _store(self, url: str, tmp_path: Path, digest: str, content_type: str, size: int) -> MediaCacheEntry:
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.url_dir.mkdir(parents=True, exist_ok=True)
+        blob_path = self.blob_dir / digest
+        if blob_path.exists():
+            tmp_path.unlink(missing_ok=True)  # same content already cached (other URL or worker)
+            os.utime(blob_path)
+        else:
+            if self._size_estimate is None:
+                self._size_estimate = self._scan_size()
+            os.replace(tmp_path, blob_path)
+            self._size_estimate += size
+
+        index_path = self.url_dir / f"{_url_key(url)}.json"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        index_tmp = self.tmp_dir / f"{uuid.uuid4().hex}.json"
+        index_tmp.write_text(json.dumps({"url": url, "digest": digest, "content_type": content_type, "size": size}), encoding="utf-8")
+        os.replace(index_tmp, index_path)
+
+        if self._size_estimate is not None and self._size_estimate > self.max_bytes:
+            self._evict()
+        return MediaCacheEntry(blob_path, digest, content_type, size)
+
+    def _blobs(self):
+        try:
+            with os.scandir(self.blob_dir) as entries:
+                return [(e.path, e.stat()) for e in entries if e.is_file()]
+        except FileNotFoundError:
+            return []
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for _, stat in self._blobs())
+
+    def _evict(self) -> None:
+        """Delete least recently served blobs until the cache fits in max_bytes (rescans: other workers write too)."""
+        blobs = sorted(self._blobs(), key=lambda item: item[1].st_mtime)
+        total = sum(stat.st_size for _, stat in blobs)
+        for path, stat in blobs:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= stat.st_size
+                _media_cache_total.labels(result="evicted").inc()
+            except FileNotFoundError:
+                total -= stat.st_size
+        self._size_estimate = total
+
+    def cleanup_tmp(self, older_than_seconds: float = 3600) -> int:
+        """Remove partial downloads left by a crashed worker; returns how many were removed."""
+        removed = 0
+        cutoff = time.time() - older_than_seconds
+        try:
+            with os.scandir(self.tmp_dir) as entries:
+                for e in entries:
+                    if e.is_file() and e.stat().st_mtime < cutoff:
+                        os.unlink(e.path)
+                        removed += 1
+        except FileNotFoundError:
+            pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        blobs = self._blobs()
+        size = sum(stat.st_size for _, stat in blobs)
+        self._size_estimate = size
+        return {"root": str(self.root), "files": len(blobs), "bytes": size, "max_bytes": self.max_bytes}
+
+
+# Global instance
+media_cache = MediaDiskCache()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Inbound message dispatcher.
+
+`/webhook` hands each parsed message to `message_dispatcher.submit(user_id, job)` and returns
+200 immediately. Jobs are queued in a per-user mailbox and drained by one task per user, so two
+messages from the same customer never run concurrently (no races on `config.user_data_whatsapp`)
+and are handled in arrival order. Different users run in parallel.
+
+Text replies are combined over MESSAGE_COMBINING_DELAY by handle_message's delayed task, which
+then runs the reply itself in the user's mailbox (`await message_dispatcher.run_in_mailbox(...)`),
+so the LLM pipeline is ordered with the user's other messages too.
+
+LLM-heavy pipelines (text responses, photo and voice analysis) additionally take a slot from a
+global semaphore (`async with message_dispatcher.llm_slot():`), so a burst of campaign replies
+waits in the mailboxes instead of launching hundreds of concurrent OpenAI calls.
+
+Load shedding: a message is refused (logged + counted) when the user's mailbox or the total
+backlog is full; the webhook then releases its dedup claim and answers 503 so the provider
+retries it. Queue depth, in-flight pipelines and shed counts are exported as metrics.
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import config
+from services.metrics import counter, gauge, histogram
+from services.tracing import record_span
+
+_queue_depth = gauge("linasbot_inbound_queue_depth", "Inbound messages waiting in per-user mailboxes")
+_active_mailboxes = gauge("linasbot_inbound_active_mailboxes", "Users with messages being processed or queued")
+_llm_in_flight = gauge("linasbot_llm_pipelines_in_flight", "LLM pipelines currently holding a slot")
+_llm_waiting = gauge("linasbot_llm_pipelines_waiting", "LLM pipelines waiting for a slot")
+_shed_total = counter("linasbot_inbound_shed_total", "Inbound messages dropped by load shedding", ("reason",))
+_queue_wait = histogram(
+    "linasbot_inbound_queue_wait_seconds",
+    "Time an inbound message waited in its mailbox",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60),
+)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class MessageDispatcher:
+    def __init__(
+        self,
+        max_llm_pipelines: Optional[int] = None,
+        max_user_queue: Optional[int] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.max_llm_pipelines = max_llm_pipelines or getattr(config, "MAX_CONCURRENT_LLM_PIPELINES", 16)
+        self.max_user_queue = max_user_queue or getattr(config, "INBOUND_USER_QUEUE_MAX", 20)
+        self.max_pending = max_pending or getattr(config, "INBOUND_QUEUE_MAX_PENDING", 1000)
+        self._mailboxes: Dict[str, Deque[Tuple[Job, float]]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._pending = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._llm_in_flight = 0
+        self._llm_waiting = 0
+        self._shed = {"user_queue_full": 0, "backlog_full": 0}
+        self._processed = 0
+
+    def _update_gauges(self) -> None:
+        _queue_depth.set(self._pending)
+        _active_mailboxes.set(len(self._mailboxes))
+
+    def submit(self, user_id: str, job: Job) -> bool:
+        """Queue `job` behind the user's earlier messages. Returns False if the message was shed."""
+        mailbox = self._mailboxes.get(user_id)
+        reason = None
+        if self._pending >= self.max_pending:
+            reason = "backlog_full"
+        elif mailbox is not None and len(mailbox) >= self.max_user_queue:
+            reason = "user_queue_full"
+        if reason:
+            self._shed[reason] += 1
+            _shed_total.labels(reason=reason).inc()
+            print(f"⚠️ Inbound message for {user_id} shed ({reason}, backlog={self._pending})")
+            return False
+
+        self._enqueue(user_id, job)
+        return True
+
+    def _enqueue(self, user_id: str, job: Job) -> None:
+        mailbox = self._mailboxes.get(user_id)
+        if mailbox is None:
+            mailbox = self._mailboxes[user_id] = deque()
+        mailbox.append((job, time.monotonic()))
+        self._pending += 1
+        if user_id not in self._workers:
+            self._workers[user_id] = asyncio.create_task(self._drain(user_id))
+        self._update_gauges()
+
+    async def run_in_mailbox(self, user_id: str, job: Job) -> Any:
+        """
+        Run `job` in the user's mailbox (after the messages already queued) and return its result.
+        For follow-up work of a message that was already accepted, so it is never shed. Cancelling
+        the caller does not cancel the job once queued.
+        """
+        done = asyncio.get_running_loop().create_future()
+        done.add_done_callback(lambda f: f.cancelled() or f.exception())  # no "never retrieved" warning
+
+        async def run():
+            try:
+                result = await job()
+            except Exception as e:
+                done.set_exception(e)
+            except BaseException:
+                done.cancel()
+                raise
+            else:
+                done.set_result(result)
+
+        self._enqueue(user_id, run)
+        return await asyncio.shield(done)
+
+    async def _drain(self, user_id: str) -> None:
+        mailbox = self._mailboxes[user_id]
+        try:
+            while mailbox:
+                job, enqueued_at = mailbox.popleft()
+                self._pending -= 1
+                self._update_gauges()
+                _queue_wait.observe(time.monotonic() - enqueued_at)
+                try:
+                    await job()
+                except Exception as e:
+                    print(f"❌ Error processing inbound message for {user_id}: {e}")
+                    import traceback
+                    traceback.print_exc()
+                self._processed += 1
+        finally:
+            self._pending -= len(mailbox)
+            self._mailboxes.pop(user_id, None)
+            self._workers.pop(user_id, None)
+            self._update_gauges()
+
+    @asynccontextmanager
+    async def llm_slot(self):
+        """Hold one of the global LLM pipeline slots for the duration of the block."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_llm_pipelines)
+        self._llm_waiting += 1
+        _llm_waiting.set(self._llm_waiting)
+        wait_started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._llm_waiting -= 1
+            _llm_waiting.set(self._llm_waiting)
+        record_span("llm_slot_wait", time.perf_counter() - wait_started, wait_started)
+        self._llm_in_flight += 1
+        _llm_in_flight.set(self._llm_in_flight)
+        try:
+            yield
+        finally:
+            self._llm_in_flight -= 1
+            _llm_in_flight.set(self._llm_in_flight)
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._pending,
+            "active_mailboxes": len(self._mailboxes),
+            "deepest_mailbox": max((len(m) for m in self._mailboxes.values()), default=0),
+            "llm_in_flight": self._llm_in_flight,
+            "llm_waiting": self._llm_waiting,
+            "max_llm_pipelines": self.max_llm_pipelines,
+            "processed": self._processed,
+            "shed": dict(self._shed),
+        }
+
+
+# Global instance
+message_dispatcher = MessageDispatcher()
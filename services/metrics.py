@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus metrics helpers.
+
+prometheus-client is optional: when it is missing every metric is a no-op, so services can
+record unconditionally. Metrics are created once per name (re-imports in tests reuse them).
+"""
+
+from typing import Dict, Sequence
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+except ImportError:  # pragma: no cover - monitoring is optional
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    Counter = Gauge = Histogram = generate_latest = None
+
+_metrics: Dict[str, object] = {}
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _get_or_create(factory, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+    if factory is None:
+        return _NoopMetric()
+    if name not in _metrics:
+        _metrics[name] = factory(name, documentation, labelnames=tuple(labelnames), **kwargs)
+    return _metrics[name]
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    return _get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    return _get_or_create(Gauge, name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = None):
+    kwargs = {"buckets": tuple(buckets)} if buckets else {}
+    return _get_or_create(Histogram, name, documentation, labelnames, **kwargs)
+
+
+def render_latest() -> bytes:
+    """Prometheus text exposition of this worker's metrics."""
+    if generate_latest is None:
+        return b"# prometheus-client is not installed\n"
+    return generate_latest()
@@ -305,13 +305,19 @@ async def get_moderation_stats() -> Dict:
             }
         
         import json
-        violations = []
-        with open(log_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                try:
-                    violations.append(json.loads(line))
-                except:
-                    continue
+        from services.blocking_executor import blocking_executor
+
+        def _read_violations():
+            violations = []
+            with open(log_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        violations.append(json.loads(line))
+                    except:
+                        continue
+            return violations
+
+        violations = await blocking_executor.run_io(_read_violations)
         
         today = datetime.now().date()
         violations_today = [v for v in violations if datetime.fromisoformat(v['timestamp']).date() == today]
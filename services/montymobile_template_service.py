@@ -9,6 +9,7 @@ import json
 import os
 from typing import Dict, List, Optional
 
+from services.http_clients import get_http_client
 from services.smart_messaging_catalog import normalize_template_id
 
 
@@ -191,52 +192,52 @@ class MontyMobileTemplateService:
             print(f"   API Key: {self.api_config['api_key'][:20]}...")
             print(f"   Payload: {json.dumps(payload, ensure_ascii=False)[:200]}...")
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=payload)
+            client = get_http_client("default")
+            response = await client.post(url, headers=headers, json=payload)
                 
-                print(f"   Response: {response.status_code}")
+            print(f"   Response: {response.status_code}")
                 
-                if response.status_code == 200:
-                    try:
-                        response_data = response.json()
+            if response.status_code == 200:
+                try:
+                    response_data = response.json()
                         
-                        if response_data.get("success"):
-                            message_id = response_data.get("data", {}).get("messageId", "unknown")
-                            print(f"✅ Template sent successfully! Message ID: {message_id}")
+                    if response_data.get("success"):
+                        message_id = response_data.get("data", {}).get("messageId", "unknown")
+                        print(f"✅ Template sent successfully! Message ID: {message_id}")
                             
-                            return {
-                                "success": True,
-                                "message_id": message_id,
-                                "template_id": template_id,
-                                "phone_number": phone_number,
-                                "language": language,
-                                "response": response_data
-                            }
-                        else:
-                            error_msg = response_data.get("message", "Unknown error")
-                            print(f"❌ Template send failed: {error_msg}")
+                        return {
+                            "success": True,
+                            "message_id": message_id,
+                            "template_id": template_id,
+                            "phone_number": phone_number,
+                            "language": language,
+                            "response": response_data
+                        }
+                    else:
+                        error_msg = response_data.get("message", "Unknown error")
+                        print(f"❌ Template send failed: {error_msg}")
                             
-                            return {
-                                "success": False,
-                                "error": error_msg,
-                                "response": response_data
-                            }
-                    except json.JSONDecodeError:
-                        print(f"⚠️ Could not parse response JSON")
                         return {
-                            "success": True,  # Assume success if 200 OK
-                            "message_id": "unknown",
-                            "response_text": response.text
+                            "success": False,
+                            "error": error_msg,
+                            "response": response_data
                         }
-                else:
-                    error_text = response.text[:500]
-                    print(f"❌ HTTP Error {response.status_code}: {error_text}")
-                    
+                except json.JSONDecodeError:
+                    print(f"⚠️ Could not parse response JSON")
                     return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}",
-                        "response_text": error_text
+                        "success": True,  # Assume success if 200 OK
+                        "message_id": "unknown",
+                        "response_text": response.text
                     }
+            else:
+                error_text = response.text[:500]
+                print(f"❌ HTTP Error {response.status_code}: {error_text}")
+                    
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}",
+                    "response_text": error_text
+                }
                     
         except httpx.TimeoutException:
             print(f"❌ Request timeout after 30 seconds")
@@ -4,10 +4,10 @@ OpenAI Usage API Integration
 Fetches real cost data from OpenAI's billing API for accurate cost tracking.
 """
 
-import httpx
 import datetime
 from typing import Dict, Optional
 import config
+from services.http_clients import get_http_client
 
 
 class OpenAIUsageService:
@@ -34,19 +34,19 @@ class OpenAIUsageService:
                 "Content-Type": "application/json"
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, headers=headers)
+            client = get_http_client("default")
+            response = await client.get(url, headers=headers)
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    print(f"✅ Fetched OpenAI usage for {date}: ${data.get('total_cost', 0):.4f}")
-                    return data
-                elif response.status_code == 404:
-                    print(f"⚠️ No usage data found for {date}")
-                    return None
-                else:
-                    print(f"❌ OpenAI Usage API error: {response.status_code} - {response.text}")
-                    return None
+            if response.status_code == 200:
+                data = response.json()
+                print(f"✅ Fetched OpenAI usage for {date}: ${data.get('total_cost', 0):.4f}")
+                return data
+            elif response.status_code == 404:
+                print(f"⚠️ No usage data found for {date}")
+                return None
+            else:
+                print(f"❌ OpenAI Usage API error: {response.status_code} - {response.text}")
+                return None
                     
         except Exception as e:
             print(f"❌ Error fetching OpenAI usage: {e}")
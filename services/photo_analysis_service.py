@@ -73,7 +73,8 @@ async def get_bot_photo_analysis_from_gpt(user_id: int, base64_image: str, is_tr
     
     # Resize image if needed to avoid URL length issues
     try:
-        base64_image = resize_image_if_needed(base64_image, max_size_kb=200)
+        from services.blocking_executor import blocking_executor
+        base64_image = await blocking_executor.run_cpu(resize_image_if_needed, base64_image, max_size_kb=200)
     except Exception as e:
         print(f"Warning: Could not optimize image: {e}")
 
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+System prompt builder.
+
+OpenAI caches the longest previously seen prompt prefix (in 128-token steps beyond 1024 tokens),
+so the system prompt is laid out as a stable prefix followed by everything that changes per
+user or per turn:
+
+    identity → style guide → knowledge base → appointment rules + output format → price list
+    → [dynamic-retrieval knowledge] → gender instruction → trained Q&A → customer status / time
+
+The static sections are compiled once per content version (style guide / knowledge base /
+price list text) and reused verbatim, so every turn of every customer shares the same prefix
+(turns without the price list share everything up to the output format).
+
+Per-section token counts are available for logging and `/api/metrics/prompt`, and
+`record_usage()` accumulates the cached-token share reported by the API.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import config
+from services.metrics import counter
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - token counts fall back to an estimate
+    tiktoken = None
+
+_prompt_tokens_total = counter("linasbot_llm_prompt_tokens_total", "Prompt tokens sent to OpenAI", ("model",))
+_cached_tokens_total = counter("linasbot_llm_cached_prompt_tokens_total", "Prompt tokens served from OpenAI's prompt cache", ("model",))
+
+IDENTITY_SECTION = """
+        You are Marwa AI Assistant – the official smart assistant for Lina's Laser Center. Your name is Marwa AI Assistant. When users ask "who is with me", "من معي", "who are you", "شو اسمك", "what's your name", "ما اسمك", etc., always respond that you are Marwa AI Assistant. Your primary task is to answer customer inquiries accurately and authoritatively, providing comprehensive information about services, prices, appointments, and interacting with the center's system."""
+
+RULES_SECTION = """
+        **🔴 APPOINTMENT STATE MACHINE RULES (MANDATORY):**
+        1. If the user asks to change/reschedule/postpone an appointment, treat this as a CHANGE request, not a NEW booking.
+        2. For CHANGE requests, you MUST check existing appointment state (using check_next_appointment).
+        3. If any existing appointment is paused/postponed, you MUST call update_appointment_date on that same appointment.
+        4. NEVER call create_appointment for a paused/postponed appointment change request.
+        5. If user asks to change appointment but did not provide a new date/time, ask for the new date/time first.
+
+        **Output Format:** Your responses MUST always be a JSON object with 'action' and 'bot_reply' fields. If you use a tool, provide a 'bot_reply' that summarizes the tool's purpose to the user while I process the tool call. Here is the strict JSON schema you MUST follow:
+        ```json
+        {
+          "action": "answer_question" | "ask_gender" | "confirm_gender" | "human_handover" | "human_handover_initial_ask" | "human_handover_confirmed" | "return_to_normal_chat" | "initial_greet_and_ask_gender" | "unknown_query" | "provide_info" | "tool_call" | "confirm_booking_details" | "check_customer_status" | "ask_for_details_for_booking",
+          "bot_reply": "Your response to the user, in their preferred language.",
+          "detected_language": "ar" | "en" | "fr" | "franco",
+          "detected_gender": "male" | "female" | null,
+          "current_gender_from_config": "male" | "female" | "unknown"
+        }
+        ```
+        Ensure the 'action' field is one of the specified types. If you are making a tool call, your 'action' should be 'tool_call' and your 'bot_reply' should be a user-friendly message explaining that you are processing their request with the system. If you are confirming booking details before a tool call, the action should be 'confirm_booking_details'. If you are checking customer status, use 'check_customer_status'."""
+
+GENDER_INSTRUCTIONS = {
+    "male": "The user is male. You MUST use masculine forms exclusively in all your replies (e.g., 'Hello sir', 'How can I help you', 'I saw your question', 'tell us'). Adhere strictly to masculine phrasing in every sentence, verb, noun, and adjective. Do not mix forms.",
+    "female": "The user is female. You MUST use feminine forms exclusively in all your replies (e.g., 'Hello madam', 'How can I help you', 'I saw your question', 'tell us'). Adhere strictly to feminine phrasing in every sentence, verb, noun and adjective. Do not mix forms.",
+    "unknown": """
+        **CRITICAL: GENDER MUST BE COLLECTED FIRST**
+        User's gender is UNKNOWN. You MUST follow this EXACT order:
+
+        1. **STOP** - Do NOT answer their question yet
+        2. **ASK FOR GENDER FIRST** - Politely ask for their gender before proceeding
+        3. Wait for gender response
+        4. Use 'confirm_gender' action to save it
+        5. **ONLY THEN** answer their original question
+
+        **Example Flow:**
+        User: "I want to remove my tattoo"
+        Bot: "Hi! 😊 To provide you with personalized service, may I ask if you're male or female? This helps us give you the most accurate information."
+        [Wait for gender]
+        User: "I'm female"
+        Bot: [Use confirm_gender action, THEN ask for tattoo photo]
+
+        **DO NOT:**
+        - Answer service questions before knowing gender
+        - Ask for tattoo photos before knowing gender
+        - Ask for body areas before knowing gender
+        - Provide prices before knowing gender
+
+        Use neutral language until gender is confirmed.
+        """,
+}
+
+QA_REFERENCE_TEMPLATE = """
+        **🔴 TRAINED Q&A REFERENCE (CRITICAL - MUST FOLLOW) 🔴**
+
+        The following are TRAINED question-answer pairs from our database.
+        If ANY of these trained Q&A pairs match the user's question (even partially),
+        you MUST use the trained answer. DO NOT generate a different answer.
+
+        {qa_reference}
+
+        **STRICT RULES:**
+        1. If the user's question is similar to a trained question above, copy the trained answer EXACTLY
+        2. Do not paraphrase, modify, or "improve" trained answers
+        3. Trained Q&A pairs take PRIORITY over your general knowledge
+        4. If a trained answer exists, USE IT - don't generate your own response
+        """
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def _get_encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"⚠️ tiktoken encoding unavailable, estimating prompt tokens: {e}")
+        return None
+
+
+class SystemPrompt:
+    """A built system prompt: ordered (name, text) sections, of which the first `static_count` are the cacheable prefix."""
+
+    def __init__(self, sections: List[Tuple[str, str]], static_count: int, builder: "SystemPromptBuilder"):
+        self.sections = sections
+        self.static_count = static_count
+        self._builder = builder
+        self.text = SECTION_SEPARATOR.join(text for _, text in sections)
+
+    @property
+    def prefix(self) -> str:
+        return SECTION_SEPARATOR.join(text for _, text in self.sections[:self.static_count])
+
+    def token_counts(self) -> Dict[str, int]:
+        return {
+            name: self._builder.count_tokens(text, section=name if index < self.static_count else None)
+            for index, (name, text) in enumerate(self.sections)
+        }
+
+
+class SystemPromptBuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[tuple] = None
+        self._static: Dict[str, str] = {}
+        # Token counts of the static sections, by section name (reset with the content version)
+        self._token_cache: Dict[str, int] = {}
+        self._encoder = None
+        self._encoder_loaded = False
+        self.compiles = 0
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    # --- static sections -----------------------------------------------------------------------
+    @staticmethod
+    def _content_version() -> tuple:
+        # str hashes are cached on the object, so this is O(1) until the content is reloaded
+        return (
+            hash(config.BOT_STYLE_GUIDE or ""),
+            hash(config.CORE_KNOWLEDGE_BASE or ""),
+            hash(config.PRICE_LIST or ""),
+        )
+
+    def _compiled(self) -> Dict[str, str]:
+        version = self._content_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._static = {
+                        "identity": IDENTITY_SECTION,
+                        "style_guide": f"""
+        **🔴 STYLE GUIDE (MANDATORY - FOLLOW EVERY STEP IN ORDER):**
+        The following contains MANDATORY rules for how you communicate AND the exact step-by-step flow for each service. You MUST follow every step in order. Do NOT skip steps. Do NOT jump ahead to booking if a step requires waiting (e.g., waiting for a photo before giving pricing).
+
+        {config.BOT_STYLE_GUIDE}""",
+                        "knowledge_base": f"""
+        **📘 KNOWLEDGE BASE:** (Use this to answer questions about services, devices, IDs, and matching rules)
+        {config.CORE_KNOWLEDGE_BASE}""",
+                        "rules": RULES_SECTION,
+                        "price_list": f"""
+        **💰 PRICE LIST:** (Use this to answer pricing questions)
+        {config.PRICE_LIST}
+        """,
+                    }
+                    self._token_cache = {}
+                    self._version = version
+                    self.compiles += 1
+        return self._static
+
+    # --- building ------------------------------------------------------------------------------
+    def build(
+        self,
+        user_id: str,
+        response_lang: str,
+        qa_reference: str = "",
+        include_price_list: bool = True,
+        custom_knowledge_context: str = None,
+        tail_sections: Optional[List[Tuple[str, str]]] = None,
+    ) -> SystemPrompt:
+        """
+        Stable prefix first (identity, style guide + knowledge base unless dynamic retrieval
+        supplied the knowledge, rules/output format, price list), then per-user/per-turn sections.
+        """
+        static = self._compiled()
+        sections: List[Tuple[str, str]] = [("identity", static["identity"])]
+        if not custom_knowledge_context:
+            sections += [("style_guide", static["style_guide"]), ("knowledge_base", static["knowledge_base"])]
+        sections.append(("rules", static["rules"]))
+        if include_price_list and not custom_knowledge_context:
+            sections.append(("price_list", static["price_list"]))
+        static_count = len(sections)
+
+        if custom_knowledge_context:
+            sections.append(("relevant_information", f"""
+        **📘 RELEVANT INFORMATION (Use ONLY this to answer - do NOT invent details):**
+        {custom_knowledge_context}
+        """))
+        gender = config.user_gender.get(user_id, "unknown")
+        sections.append(("gender", GENDER_INSTRUCTIONS.get(gender, GENDER_INSTRUCTIONS["unknown"])))
+        if qa_reference:
+            sections.append(("qa_reference", QA_REFERENCE_TEMPLATE.format(qa_reference=qa_reference)))
+        for name, text in tail_sections or []:
+            if text:
+                sections.append((name, text))
+        return SystemPrompt(sections, static_count, self)
+
+    # --- token accounting ----------------------------------------------------------------------
+    def count_tokens(self, text: str, section: Optional[str] = None) -> int:
+        """
+        Token count of `text`. Only static sections (`section` = their name) are cached: the
+        per-turn tail differs on every call and would grow the cache without bound.
+        """
+        cacheable = section is not None and self._static.get(section) is text
+        cached = self._token_cache.get(section) if cacheable else None
+        if cached is not None:
+            return cached
+        if not self._encoder_loaded:
+            self._encoder = _get_encoder()
+            self._encoder_loaded = True
+        if self._encoder is not None:
+            count = len(self._encoder.encode(text, disallowed_special=()))
+        else:
+            count = max(len(text) // 4, len(text.split()))
+        if cacheable:
+            self._token_cache[section] = count
+        return count
+
+    def record_usage(self, model: str, usage: Any) -> Optional[int]:
+        """Accumulate prompt/cached token usage from a chat completion's `usage`. Returns cached tokens."""
+        if usage is None:
+            return None
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        if isinstance(details, dict):
+            cached_tokens = details.get("cached_tokens") or 0
+        else:
+            cached_tokens = getattr(details, "cached_tokens", None) or 0
+        totals = self._usage.setdefault(model or "unknown", {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_tokens"] += cached_tokens
+        _prompt_tokens_total.labels(model=model or "unknown").inc(prompt_tokens)
+        _cached_tokens_total.labels(model=model or "unknown").inc(cached_tokens)
+        return cached_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        static = self._compiled()
+        section_tokens = {name: self.count_tokens(text, section=name) for name, text in static.items()}
+        usage = {
+            model: {**totals, "cached_ratio": round(totals["cached_tokens"] / totals["prompt_tokens"], 4) if totals["prompt_tokens"] else 0.0}
+            for model, totals in self._usage.items()
+        }
+        return {
+            "content_version_compiles": self.compiles,
+            "tokenizer": "tiktoken" if self._encoder is not None else "estimate",
+            "static_section_tokens": section_tokens,
+            "stable_prefix_tokens": sum(v for k, v in section_tokens.items() if k != "price_list"),
+            "usage": usage,
+        }
+
+
+# Global instance
+system_prompt_builder = SystemPromptBuilder()
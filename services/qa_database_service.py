@@ -11,6 +11,7 @@ from dotenv import load_dotenv
 from difflib import SequenceMatcher
 import re
 import api_config
+from services.http_clients import get_http_client
 from services.language_detection_service import language_detection_service
 
 # Load environment variables (.env then .env.local via core; load_dotenv for standalone scripts)
@@ -84,31 +85,31 @@ class QADatabaseService:
         if data:
             print(f"📦 Data: {data}")
         
-        async with httpx.AsyncClient(timeout=30.0, follow_redirects=False) as client:
-            try:
-                if method == "GET":
-                    response = await client.get(url, headers=headers, params=params)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, json=data)
-                elif method == "PUT":
-                    response = await client.put(url, headers=headers, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=headers)
-                else:
-                    raise ValueError(f"Unsupported HTTP method: {method}")
+        client = get_http_client("default")
+        try:
+            if method == "GET":
+                response = await client.get(url, headers=headers, params=params)
+            elif method == "POST":
+                response = await client.post(url, headers=headers, json=data)
+            elif method == "PUT":
+                response = await client.put(url, headers=headers, json=data)
+            elif method == "DELETE":
+                response = await client.delete(url, headers=headers)
+            else:
+                raise ValueError(f"Unsupported HTTP method: {method}")
                 
-                print(f"📡 Response Status: {response.status_code}")
-                print(f"📡 Response Headers: {dict(response.headers)}")
+            print(f"📡 Response Status: {response.status_code}")
+            print(f"📡 Response Headers: {dict(response.headers)}")
                 
-                response.raise_for_status()
-                return response.json()
+            response.raise_for_status()
+            return response.json()
                 
-            except httpx.HTTPStatusError as e:
-                print(f"❌ API Error ({e.response.status_code}): {e.response.text[:500]}")
-                return {"success": False, "error": f"HTTP {e.response.status_code}", "message": e.response.text}
-            except Exception as e:
-                print(f"❌ Request Error: {e}")
-                return {"success": False, "error": str(e)}
+        except httpx.HTTPStatusError as e:
+            print(f"❌ API Error ({e.response.status_code}): {e.response.text[:500]}")
+            return {"success": False, "error": f"HTTP {e.response.status_code}", "message": e.response.text}
+        except Exception as e:
+            print(f"❌ Request Error: {e}")
+            return {"success": False, "error": str(e)}
     
     async def create_qa_pair(self, 
                             question_ar: str, answer_ar: str,
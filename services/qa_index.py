@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory index for fuzzy Q&A matching (used by LocalQAService).
+
+The Q&A matcher scores `SequenceMatcher(None, query, question).ratio()` on normalized text.
+Instead of scoring every pair, the index keeps per-language character inverted lists
+(char -> {entry: count}). One pass over the query's postings gives, for every entry, the size
+of the character multiset intersection, which bounds the ratio from above
+(`2 * intersection / (len(query) + len(question))`, the same bound as `quick_ratio()`).
+Candidates are scored best-bound-first with a SequenceMatcher prepared once per entry, and the
+scan stops as soon as no remaining bound can beat the current top-K or the threshold, so the
+results are identical to the full linear scan.
+
+Questions and answers are normalized once when indexed; create/update/delete touch only the
+affected entry.
+"""
+
+import threading
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+FIELDS = ("question", "answer")
+
+
+class _IndexedField:
+    __slots__ = ("text", "length", "matcher")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.length = len(text)
+        self.matcher = SequenceMatcher(None, "", text)
+
+
+class QAIndexEntry:
+    __slots__ = ("qa", "seq", "language", "filter_language", "fields")
+
+    def __init__(self, qa: Dict[str, Any], seq: int, language: str, filter_language: str, fields: Dict[str, _IndexedField]):
+        self.qa = qa
+        self.seq = seq
+        self.language = language
+        self.filter_language = filter_language
+        self.fields = fields
+
+
+class QAIndex:
+    """
+    Args:
+        normalize: text normalizer applied to queries and indexed fields
+        language_of: callable(qa) -> (language, filter_language); `language` selects the
+            per-language bucket (strict matching), `filter_language` is compared when a caller
+            filters by language (entries without a recognised language have "").
+    """
+
+    def __init__(self, normalize: Callable[[str], str], language_of: Callable[[Dict[str, Any]], Tuple[str, str]]):
+        self._normalize = normalize
+        self._language_of = language_of
+        self._lock = threading.RLock()
+        self._entries: Dict[int, QAIndexEntry] = {}
+        # language -> field -> char -> {entry_key: count}
+        self._postings: Dict[str, Dict[str, Dict[str, Dict[int, int]]]] = {}
+        # language -> field -> entry keys whose normalized text is empty
+        self._empty: Dict[str, Dict[str, set]] = {}
+        self._next_seq = 0
+        self.comparisons = 0  # SequenceMatcher.ratio() calls, for benchmarks
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, qa_pairs: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._empty.clear()
+            self._next_seq = 0
+            for qa in qa_pairs:
+                self.add(qa)
+
+    def add(self, qa: Dict[str, Any]) -> None:
+        with self._lock:
+            self._add(qa, self._next_seq)
+            self._next_seq += 1
+
+    def update(self, qa: Dict[str, Any]) -> None:
+        """Re-index an entry edited in place, keeping its position for tie-breaking."""
+        with self._lock:
+            entry = self._remove(id(qa))
+            if entry is None:
+                self.add(qa)
+            else:
+                self._add(qa, entry.seq)
+
+    def remove(self, qa: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remove(id(qa))
+
+    def _add(self, qa: Dict[str, Any], seq: int) -> None:
+        key = id(qa)
+        language, filter_language = self._language_of(qa)
+        fields = {name: _IndexedField(self._normalize(qa.get(name) or "")) for name in FIELDS}
+        self._entries[key] = QAIndexEntry(qa, seq, language, filter_language, fields)
+        postings = self._postings.setdefault(language, {name: defaultdict(dict) for name in FIELDS})
+        empty = self._empty.setdefault(language, {name: set() for name in FIELDS})
+        for name, field in fields.items():
+            if not field.text:
+                empty[name].add(key)
+            for char, count in Counter(field.text).items():
+                postings[name][char][key] = count
+
+    def _remove(self, key: int) -> Optional[QAIndexEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        postings = self._postings[entry.language]
+        for name, field in entry.fields.items():
+            self._empty[entry.language][name].discard(key)
+            for char in set(field.text):
+                chars = postings[name].get(char)
+                if chars is not None:
+                    chars.pop(key, None)
+                    if not chars:
+                        del postings[name][char]
+        return entry
+
+    def search(
+        self,
+        query: str,
+        *,
+        field: str = "question",
+        language: Optional[str] = None,
+        filter_language: Optional[str] = None,
+        limit: Optional[int] = None,
+        min_score: float = 0.0,
+    ) -> List[Tuple[float, QAIndexEntry]]:
+        """
+        Exact top matches of `query` (raw text) against `field`, as (score, entry) sorted by score
+        descending then original order. Only scores > 0 and >= min_score are returned.
+
+        language: restrict to one per-language bucket; filter_language: additionally require
+        entry.filter_language to equal it.
+        """
+        query_text = self._normalize(query or "")
+        query_length = len(query_text)
+        query_chars = Counter(query_text)
+
+        with self._lock:
+            languages = [language] if language is not None else list(self._postings)
+            candidates = []
+            for lang in languages:
+                postings = self._postings.get(lang)
+                if postings is None:
+                    continue
+                if not query_text:
+                    # ratio("", "") == 1.0; an empty query scores 0 against anything else
+                    for key in self._empty[lang][field]:
+                        candidates.append((1.0, key))
+                    continue
+                intersections: Dict[int, int] = defaultdict(int)
+                for char, query_count in query_chars.items():
+                    for key, count in postings[field].get(char, {}).items():
+                        intersections[key] += count if count < query_count else query_count
+                for key, intersection in intersections.items():
+                    bound = 2.0 * intersection / (query_length + self._entries[key].fields[field].length)
+                    candidates.append((bound, key))
+
+            candidates = [
+                (bound, self._entries[key])
+                for bound, key in candidates
+                if bound > 0 and bound >= min_score
+                and (filter_language is None or self._entries[key].filter_language == filter_language)
+            ]
+            candidates.sort(key=lambda item: (-item[0], item[1].seq))
+
+            results: List[Tuple[float, QAIndexEntry]] = []
+            kth_score = None
+            for bound, entry in candidates:
+                if kth_score is not None and bound < kth_score:
+                    break
+                indexed = entry.fields[field]
+                if not query_text:
+                    score = 1.0
+                else:
+                    indexed.matcher.set_seq1(query_text)
+                    score = indexed.matcher.ratio()
+                    self.comparisons += 1
+                if score > 0 and score >= min_score:
+                    results.append((score, entry))
+                    if limit and len(results) >= limit:
+                        results.sort(key=lambda item: (-item[0], item[1].seq))
+                        del results[limit:]
+                        kth_score = results[-1][0]
+
+        results.sort(key=lambda item: (-item[0], item[1].seq))
+        return results[:limit] if limit else results
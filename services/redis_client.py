@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Shared async Redis client (one per process) for cross-worker state.
+
+Returns None when REDIS_URL is not configured or the redis package is missing, so callers
+fall back to their process-local implementation.
+"""
+
+from typing import Any, Optional
+
+import config
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # pragma: no cover - redis is optional in dev
+    redis_asyncio = None
+
+_client: Optional[Any] = None
+_warned_missing = False
+
+
+def get_redis() -> Optional[Any]:
+    """Return the process-wide redis.asyncio client, or None when Redis is not available."""
+    global _client, _warned_missing
+    if _client is not None:
+        return _client
+    if not config.REDIS_URL:
+        return None
+    if redis_asyncio is None:
+        if not _warned_missing:
+            print("⚠️ REDIS_URL is set but the 'redis' package is not installed; using process-local state")
+            _warned_missing = True
+        return None
+    _client = redis_asyncio.from_url(
+        config.REDIS_URL,
+        decode_responses=True,
+        socket_connect_timeout=2,
+        socket_timeout=2,
+        health_check_interval=30,
+    )
+    print(f"✅ Redis client configured ({config.REDIS_URL.split('@')[-1]})")
+    return _client
+
+
+def set_redis_client(client: Optional[Any]) -> None:
+    """Override the shared client (tests use a fake Redis)."""
+    global _client
+    _client = client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is None:
+        return
+    try:
+        await _client.close()
+    except Exception as e:
+        print(f"⚠️ Error closing Redis client: {e}")
+    _client = None
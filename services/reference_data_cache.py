@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Reference-data cache for the Lina's Laser CRM lookups used by the GPT tools.
+
+`get_branches`, `get_services`, `get_machines`, `get_clinic_hours` and `get_pricing_details`
+called the CRM API on every tool call although the data changes a few times a month. They now
+go through `reference_data_cache.get(endpoint, loader, key)`:
+
+- each endpoint has its own TTL (REFERENCE_DATA_TTL_SECONDS, pricing:
+  REFERENCE_DATA_PRICING_TTL_SECONDS); pricing is cached per (service, machine, body parts,
+  branch);
+- once the TTL has passed the cached response is still returned, for up to
+  REFERENCE_DATA_STALE_SECONDS (pricing: REFERENCE_DATA_PRICING_STALE_SECONDS, kept short so
+  old prices are not quoted for long), while one background task refreshes it
+  (stale-while-revalidate; this also keeps answering when the CRM is down);
+- concurrent misses for the same key share one CRM call (single-flight, from
+  services.async_cache.AsyncTTLCache: a caller that is cancelled does not cancel it for the
+  others);
+- only successful responses are cached; failures are returned as-is and retried next time.
+
+Callers get a deep copy. The cache is per worker; `invalidate()` (POST
+/api/reference-data/invalidate) clears it after a CRM change and, when REDIS_URL is set,
+publishes the invalidation so every worker drops its copy.
+"""
+
+import asyncio
+import copy
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+import config
+from services.async_cache import AsyncTTLCache
+from services.metrics import counter
+
+_reference_cache_total = counter(
+    "linasbot_reference_cache_requests_total",
+    "Reference-data lookups by endpoint and result (hit, stale, miss, coalesced, bypass)",
+    ("endpoint", "result"),
+)
+_reference_refresh_errors_total = counter(
+    "linasbot_reference_cache_refresh_errors_total",
+    "Failed reference-data fetches (CRM error or unsuccessful response)",
+    ("endpoint",),
+)
+
+_INVALIDATE_ALL = "*"
+
+Loader = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class _CacheEntry:
+    __slots__ = ("value", "fetched_at", "fresh_until")
+
+    def __init__(self, value: Dict[str, Any], ttl: float):
+        self.value = value
+        self.fetched_at = time.time()
+        self.fresh_until = time.monotonic() + ttl
+
+    @property
+    def successful(self) -> bool:
+        return isinstance(self.value, dict) and bool(self.value.get("success"))
+
+
+class ReferenceDataCache:
+    """
+    Stale-while-revalidate layer over one AsyncTTLCache per endpoint: entries live for TTL + stale
+    window there (single-flight, LRU), and are served as "stale" once past the TTL.
+    """
+
+    MAX_ENTRIES_PER_ENDPOINT = 1000
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: Optional[float] = None,
+        stale_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None,
+        stale_windows: Optional[Dict[str, float]] = None,
+        redis_client: Any = None,
+    ):
+        self.default_ttl = default_ttl or getattr(config, "REFERENCE_DATA_TTL_SECONDS", 3600)
+        self.ttls = ttls if ttls is not None else {
+            "pricing": getattr(config, "REFERENCE_DATA_PRICING_TTL_SECONDS", 600),
+        }
+        self.stale_seconds = (
+            stale_seconds if stale_seconds is not None
+            else getattr(config, "REFERENCE_DATA_STALE_SECONDS", 86400)
+        )
+        self.stale_windows = stale_windows if stale_windows is not None else {
+            "pricing": getattr(config, "REFERENCE_DATA_PRICING_STALE_SECONDS", 300),
+        }
+        self.enabled = enabled if enabled is not None else getattr(config, "REFERENCE_DATA_CACHE_ENABLED", True)
+        self._caches: Dict[str, AsyncTTLCache] = {}
+        self._refreshing: Set[asyncio.Task] = set()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._redis = redis_client
+        self._listener: Optional[asyncio.Task] = None
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def stale_for(self, endpoint: str) -> float:
+        return self.stale_windows.get(endpoint, self.stale_seconds)
+
+    def _cache(self, endpoint: str) -> AsyncTTLCache:
+        cache = self._caches.get(endpoint)
+        if cache is None:
+            cache = AsyncTTLCache(
+                f"reference_{endpoint}",
+                max_size=self.MAX_ENTRIES_PER_ENDPOINT,
+                ttl_seconds=self.ttl_for(endpoint) + self.stale_for(endpoint),
+                cacheable=lambda entry: entry.successful,
+            )
+            self._caches[endpoint] = cache
+        return cache
+
+    def _count(self, endpoint: str, result: str) -> None:
+        counts = self._stats.setdefault(endpoint, {})
+        counts[result] = counts.get(result, 0) + 1
+        _reference_cache_total.labels(endpoint=endpoint, result=result).inc()
+
+    async def get(self, endpoint: str, loader: Loader, key: Hashable = None) -> Dict[str, Any]:
+        """Cached response of `loader()` for (endpoint, key)."""
+        if not self.enabled:
+            self._count(endpoint, "bypass")
+            return await loader()
+
+        self._ensure_listener()
+        cache = self._cache(endpoint)
+        entry = cache.get(key, None, count=False)
+        if entry is not None and time.monotonic() < entry.fresh_until:
+            self._count(endpoint, "hit")
+            return copy.deepcopy(entry.value)
+        if entry is not None:
+            self._count(endpoint, "stale")
+            if not cache.loading(key):
+                task = asyncio.create_task(self._refresh(endpoint, key, loader))
+                self._refreshing.add(task)
+                task.add_done_callback(self._refreshing.discard)
+            return copy.deepcopy(entry.value)
+
+        self._count(endpoint, "coalesced" if cache.loading(key) else "miss")
+        entry = await cache.load(key, lambda: self._fetch(endpoint, loader))
+        return copy.deepcopy(entry.value)
+
+    async def _fetch(self, endpoint: str, loader: Loader) -> _CacheEntry:
+        try:
+            entry = _CacheEntry(await loader(), self.ttl_for(endpoint))
+        except Exception:
+            _reference_refresh_errors_total.labels(endpoint=endpoint).inc()
+            raise
+        if not entry.successful:
+            _reference_refresh_errors_total.labels(endpoint=endpoint).inc()
+        return entry
+
+    async def _refresh(self, endpoint: str, key: Hashable, loader: Loader) -> None:
+        try:
+            entry = await self._cache(endpoint).load(key, lambda: self._fetch(endpoint, loader))
+            if not entry.successful:
+                value = entry.value
+                print(f"⚠️ Reference data refresh for {endpoint} failed, serving cached copy: {value.get('message') if isinstance(value, dict) else value}")
+        except Exception as e:
+            print(f"⚠️ Reference data refresh for {endpoint} failed, serving cached copy: {e}")
+
+    def _drop(self, endpoint: Optional[str] = None) -> int:
+        dropped = 0
+        for name, cache in self._caches.items():
+            if endpoint is None or name == endpoint:
+                dropped += len(cache.items())
+                cache.clear()
+        return dropped
+
+    async def invalidate(self, endpoint: Optional[str] = None) -> int:
+        """
+        Drop the cached responses of one endpoint (or all) on every worker; returns how many
+        were dropped on this one.
+        """
+        dropped = self._drop(endpoint)
+        client = self._client()
+        if client is not None:
+            try:
+                await client.publish(self._channel(), endpoint or _INVALIDATE_ALL)
+            except Exception as e:
+                print(f"⚠️ Reference data invalidation not broadcast, other workers keep their copy until the TTL: {e}")
+        return dropped
+
+    # ------------------------------------------------------------------ invalidation backplane
+
+    def _client(self) -> Any:
+        if self._redis is not None:
+            return self._redis
+        from services.redis_client import get_redis
+        return get_redis()
+
+    def _channel(self) -> str:
+        prefix = getattr(config, "STATE_STORE_KEY_PREFIX", "linasbot")
+        return f"{prefix}:reference_data:invalidate"
+
+    def _ensure_listener(self) -> None:
+        if self._client() is None:
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        """Apply the invalidations published by any worker (its own included) to this worker."""
+        while True:
+            client = self._client()
+            if client is None:
+                return
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self._channel())
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    endpoint = message["data"]
+                    if isinstance(endpoint, bytes):
+                        endpoint = endpoint.decode("utf-8")
+                    self._drop(None if endpoint == _INVALIDATE_ALL else endpoint)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Reference data invalidation subscriber error, reconnecting: {e}")
+                await asyncio.sleep(2.0)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        endpoints: Dict[str, Dict[str, Any]] = {}
+        for endpoint, cache in self._caches.items():
+            info = endpoints.setdefault(endpoint, {"entries": 0, "fresh": 0, "oldest_fetched_at": None})
+            for _, entry in cache.items():
+                info["entries"] += 1
+                info["fresh"] += 1 if now < entry.fresh_until else 0
+                if info["oldest_fetched_at"] is None or entry.fetched_at < info["oldest_fetched_at"]:
+                    info["oldest_fetched_at"] = entry.fetched_at
+        for endpoint, counts in self._stats.items():
+            info = endpoints.setdefault(endpoint, {"entries": 0, "fresh": 0, "oldest_fetched_at": None})
+            info.update(counts)
+            info["ttl_seconds"] = self.ttl_for(endpoint)
+            info["stale_seconds"] = self.stale_for(endpoint)
+        return {
+            "enabled": self.enabled,
+            "stale_seconds": self.stale_seconds,
+            "broadcast": self._listener is not None and not self._listener.done(),
+            "refreshing": len(self._refreshing),
+            "endpoints": endpoints,
+        }
+
+
+# Global instance
+reference_data_cache = ReferenceDataCache()
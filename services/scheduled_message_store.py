@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduled Message Store - SQLite (WAL) storage for smart-messaging scheduled messages.
+
+`SmartMessagingService` used to keep scheduled messages in a dict and rewrite the whole
+`sent_smart_messages.json` (every sent message, every datetime converted) on each
+mark_message_sent / mark_message_dry_run, so a 500-message campaign rewrote the file 500 times
+and a crash mid-write lost it. Each message is now one row keyed by message_id, written in its
+own transaction:
+
+- the full entry is kept as JSON (`data`); status, send_at, customer_phone and message_type are
+  columns with indexes on (status, send_at), customer_phone and (message_type, status), so due
+  messages, per-customer sync/cancel and the dashboard summary are indexed queries;
+- the database is shared by all workers on the host (WAL, busy timeout);
+- the legacy `sent_smart_messages.json` is imported once, on first open.
+
+`ScheduledMessagesView` keeps the old `smart_messaging.scheduled_messages` dict interface for
+the API/dispatcher code. Entries it returns are copies: write them back with
+`scheduled_messages[message_id] = entry` (or use the store's update methods).
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.smart_messaging_catalog import normalize_template_id
+
+DATETIME_FIELDS = ("send_at", "sent_at", "created_at", "last_attempt")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scheduled_messages (
+    message_id TEXT PRIMARY KEY,
+    customer_phone TEXT NOT NULL DEFAULT '',
+    message_type TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'scheduled',
+    send_at TEXT,
+    sent_at TEXT,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_scheduled_messages_status_send_at ON scheduled_messages (status, send_at);
+CREATE INDEX IF NOT EXISTS idx_scheduled_messages_phone ON scheduled_messages (customer_phone);
+CREATE INDEX IF NOT EXISTS idx_scheduled_messages_type ON scheduled_messages (message_type, status);
+CREATE TABLE IF NOT EXISTS scheduled_messages_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _as_local_naive(value: Any) -> Optional[datetime]:
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def sortable_time(value: Any) -> Optional[str]:
+    """Fixed-width local time for the send_at/sent_at columns, so text comparison is time order."""
+    value = _as_local_naive(value)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%f") if value else None
+
+
+def _encode(entry: Dict[str, Any]) -> str:
+    data = dict(entry)
+    for key in DATETIME_FIELDS:
+        if isinstance(data.get(key), datetime):
+            data[key] = data[key].isoformat()
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _decode(raw: str) -> Dict[str, Any]:
+    entry = json.loads(raw)
+    for key in DATETIME_FIELDS:
+        if entry.get(key):
+            try:
+                entry[key] = datetime.fromisoformat(entry[key])
+            except (ValueError, TypeError):
+                pass
+    return entry
+
+
+def _row_values(message_id: str, entry: Dict[str, Any]) -> Tuple:
+    return (
+        message_id,
+        str(entry.get("customer_phone") or ""),
+        normalize_template_id(entry.get("message_type")),
+        str(entry.get("status") or "scheduled"),
+        sortable_time(entry.get("send_at")),
+        sortable_time(entry.get("sent_at")),
+        _encode(entry),
+        time.time(),
+    )
+
+
+_UPSERT_SQL = (
+    "INSERT OR REPLACE INTO scheduled_messages "
+    "(message_id, customer_phone, message_type, status, send_at, sent_at, data, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class ScheduledMessageStore:
+    """SQLite-backed scheduled smart messages (one row per message_id)."""
+
+    BUSY_TIMEOUT_SECONDS = 5.0
+
+    def __init__(self, db_path: Optional[Path] = None, legacy_json_path: Optional[Path] = None):
+        if db_path is None:
+            from storage.persistent_storage import SCHEDULED_MESSAGES_DB_FILE
+            db_path = SCHEDULED_MESSAGES_DB_FILE
+        if legacy_json_path is None:
+            from storage.persistent_storage import SENT_SMART_MESSAGES_FILE
+            legacy_json_path = SENT_SMART_MESSAGES_FILE
+        self.db_path = Path(db_path)
+        self.legacy_json_path = Path(legacy_json_path)
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ connection
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                    conn = sqlite3.connect(str(self.db_path), timeout=self.BUSY_TIMEOUT_SECONDS)
+                    try:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.executescript(_SCHEMA)
+                        conn.commit()
+                    finally:
+                        conn.close()
+                    self._schema_ready = True
+                    try:
+                        self.import_legacy_json()
+                    except Exception as e:
+                        print(f"⚠️ Could not import legacy smart messages: {e}")
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=self.BUSY_TIMEOUT_SECONDS, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, fn):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _read(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, tuple(params)).fetchall()
+        finally:
+            conn.close()
+
+    def _entries(self, sql: str, params: Iterable[Any] = ()) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(row["message_id"], _decode(row["data"])) for row in self._read(sql, params)]
+
+    # ------------------------------------------------------------------ legacy import
+
+    def import_legacy_json(self, path: Optional[Path] = None, force: bool = False) -> int:
+        """
+        Import `sent_smart_messages.json` (message_id -> entry) once. Existing rows win, so
+        re-running it never overwrites newer state. The JSON file is left in place.
+        """
+        path = Path(path) if path is not None else self.legacy_json_path
+        key = f"imported:{path.name}"
+        if not force and self._read("SELECT 1 FROM scheduled_messages_meta WHERE key = ?", (key,)):
+            return 0
+        entries: Dict[str, Any] = {}
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entries = json.load(f) or {}
+            except Exception as e:
+                print(f"⚠️ Could not read {path} for import: {e}")
+                return 0
+
+        def _apply(conn):
+            imported = 0
+            for message_id, entry in entries.items():
+                if not isinstance(entry, dict):
+                    continue
+                cursor = conn.execute(
+                    _UPSERT_SQL.replace("INSERT OR REPLACE", "INSERT OR IGNORE"),
+                    _row_values(message_id, entry),
+                )
+                imported += cursor.rowcount
+            conn.execute(
+                "INSERT OR REPLACE INTO scheduled_messages_meta (key, value) VALUES (?, ?)",
+                (key, str(time.time())),
+            )
+            return imported
+
+        imported = self._write(_apply)
+        if imported:
+            print(f"✅ Imported {imported} smart messages from {path} into {self.db_path}")
+        return imported
+
+    # ------------------------------------------------------------------ single rows
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._read("SELECT data FROM scheduled_messages WHERE message_id = ?", (message_id,))
+        return _decode(rows[0]["data"]) if rows else None
+
+    def exists(self, message_id: str) -> bool:
+        return bool(self._read("SELECT 1 FROM scheduled_messages WHERE message_id = ?", (message_id,)))
+
+    def put(self, message_id: str, entry: Dict[str, Any]) -> None:
+        self._write(lambda conn: conn.execute(_UPSERT_SQL, _row_values(message_id, entry)))
+
+    def delete(self, message_id: str) -> bool:
+        return bool(self._write(
+            lambda conn: conn.execute("DELETE FROM scheduled_messages WHERE message_id = ?", (message_id,)).rowcount
+        ))
+
+    def update(
+        self,
+        message_id: str,
+        changes: Dict[str, Any],
+        expected_status: Optional[Iterable[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Apply `changes` to one entry; None if it doesn't exist or its status isn't expected."""
+        updated = self.update_many([message_id], changes, expected_status)
+        return updated[0][1] if updated else None
+
+    def update_many(
+        self,
+        message_ids: Iterable[str],
+        changes: Dict[str, Any],
+        expected_status: Optional[Iterable[str]] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Apply `changes` to several entries in one transaction; returns the updated entries."""
+        message_ids = list(message_ids)
+        expected = set(expected_status) if expected_status is not None else None
+        if not message_ids:
+            return []
+
+        def _apply(conn):
+            updated = []
+            for message_id in message_ids:
+                row = conn.execute(
+                    "SELECT status, data FROM scheduled_messages WHERE message_id = ?", (message_id,)
+                ).fetchone()
+                if row is None or (expected is not None and row["status"] not in expected):
+                    continue
+                entry = _decode(row["data"])
+                entry.update(changes)
+                conn.execute(_UPSERT_SQL, _row_values(message_id, entry))
+                updated.append((message_id, entry))
+            return updated
+
+        return self._write(_apply)
+
+    # ------------------------------------------------------------------ queries
+
+    def count(self) -> int:
+        return self._read("SELECT COUNT(*) AS n FROM scheduled_messages")[0]["n"]
+
+    def all(self) -> List[Tuple[str, Dict[str, Any]]]:
+        return self._entries("SELECT message_id, data FROM scheduled_messages ORDER BY send_at")
+
+    def message_ids(self) -> List[str]:
+        return [row["message_id"] for row in self._read("SELECT message_id FROM scheduled_messages")]
+
+    def due(self, now: Optional[datetime] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Messages in 'scheduled' whose send_at has passed, oldest first."""
+        return self._entries(
+            "SELECT message_id, data FROM scheduled_messages "
+            "WHERE status = 'scheduled' AND send_at <= ? ORDER BY send_at",
+            (sortable_time(now or datetime.now()),),
+        )
+
+    def find(
+        self,
+        statuses: Optional[Iterable[str]] = None,
+        message_type: Optional[str] = None,
+        customer_phone: Optional[str] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        clauses, params = [], []
+        if message_type is not None:
+            clauses.append("message_type = ?")
+            params.append(normalize_template_id(message_type))
+        if statuses is not None:
+            statuses = list(statuses)
+            clauses.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if customer_phone is not None:
+            clauses.append("customer_phone = ?")
+            params.append(str(customer_phone))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._entries(f"SELECT message_id, data FROM scheduled_messages{where} ORDER BY send_at", params)
+
+    def requeue_stale_sending(self, older_than_seconds: float) -> int:
+        """Put messages left in 'sending' by a crashed send cycle back to 'scheduled'."""
+        cutoff = time.time() - older_than_seconds
+        stale = [
+            row["message_id"]
+            for row in self._read(
+                "SELECT message_id FROM scheduled_messages WHERE status = 'sending' AND updated_at < ?", (cutoff,)
+            )
+        ]
+        return len(self.update_many(stale, {"status": "scheduled"}, expected_status=("sending",)))
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts by status and by type, and the next message due."""
+        by_status = {
+            row["status"]: row["n"]
+            for row in self._read("SELECT status, COUNT(*) AS n FROM scheduled_messages GROUP BY status")
+        }
+        by_type = {
+            row["message_type"]: row["n"]
+            for row in self._read("SELECT message_type, COUNT(*) AS n FROM scheduled_messages GROUP BY message_type")
+        }
+        next_rows = self._entries(
+            "SELECT message_id, data FROM scheduled_messages WHERE status = 'scheduled' "
+            "AND send_at IS NOT NULL ORDER BY send_at LIMIT 1"
+        )
+        return {
+            "total": sum(by_status.values()),
+            "by_status": by_status,
+            "by_type": by_type,
+            "next": next_rows[0] if next_rows else None,
+        }
+
+    def delete_stale(self, today: datetime, preserved_types: Iterable[str]) -> Tuple[int, int]:
+        """
+        Delete messages from previous days, except preserved types, messages sent today and
+        messages due today or later. Returns (deleted, kept).
+        """
+        preserved = list(preserved_types)
+        day_start = sortable_time(datetime.combine(today, datetime.min.time()))
+
+        def _apply(conn):
+            deleted = conn.execute(
+                "DELETE FROM scheduled_messages "
+                f"WHERE message_type NOT IN ({', '.join('?' for _ in preserved)}) "
+                "AND NOT (status IN ('sent', 'would_send') AND COALESCE(sent_at, '') >= ?) "
+                "AND COALESCE(send_at, '') < ?",
+                (*preserved, day_start, day_start),
+            ).rowcount
+            kept = conn.execute("SELECT COUNT(*) FROM scheduled_messages").fetchone()[0]
+            return deleted, kept
+
+        return self._write(_apply)
+
+    def stats(self) -> Dict[str, Any]:
+        summary = self.summary()
+        return {"db_path": str(self.db_path), "total": summary["total"], "by_status": summary["by_status"]}
+
+
+class ScheduledMessagesView(MutableMapping):
+    """
+    Dict-style view (message_id -> entry) over the store, for code written against the old
+    in-memory dict. Iterating loads every row: prefer the store's queries in new code.
+    """
+
+    def __init__(self, store: ScheduledMessageStore):
+        self.store = store
+
+    def __getitem__(self, message_id: str) -> Dict[str, Any]:
+        entry = self.store.get(message_id)
+        if entry is None:
+            raise KeyError(message_id)
+        return entry
+
+    def __setitem__(self, message_id: str, entry: Dict[str, Any]) -> None:
+        self.store.put(message_id, entry)
+
+    def __delitem__(self, message_id: str) -> None:
+        if not self.store.delete(message_id):
+            raise KeyError(message_id)
+
+    def __contains__(self, message_id: object) -> bool:
+        return isinstance(message_id, str) and self.store.exists(message_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.store.message_ids())
+
+    def __len__(self) -> int:
+        return self.store.count()
+
+    def items(self):
+        return self.store.all()
+
+    def values(self):
+        return [entry for _, entry in self.store.all()]
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Leader election for the smart-messaging scheduler.
+
+Every gunicorn worker runs `startup_event`, so every worker used to start its own
+AsyncIOScheduler: with 2 workers each populate/monitor/dispatcher job ran twice (double CRM
+load, races on the JSON files under LINASBOT_DATA_ROOT, duplicate sends). Each worker still
+builds the scheduler, but starts it paused; `scheduler_leader` decides which one resumes it:
+
+- Redis (REDIS_URL configured): a lease key `linasbot:leader:<name>` set with
+  `SET NX EX SCHEDULER_LEADER_LEASE_SECONDS` and renewed every SCHEDULER_LEADER_RENEW_SECONDS
+  by its holder (compare-and-expire in a Lua script, so a worker never extends someone else's
+  lease). Works across hosts. If the leader dies the lease expires and another worker takes it
+  on its next attempt. A leader that cannot reach Redis steps down when its lease runs out.
+- Otherwise: an exclusive non-blocking flock on `<data root>/locks/<name>.lock`. The kernel
+  drops the lock when the process dies, so a follower takes over on its next attempt. This
+  covers the workers of one host (the data volume is per host).
+
+The leader's id (`hostname:pid`) and since when it leads are written next to the lease, so any
+worker can report who currently leads (`/api/metrics/scheduler`, `/api/smart-messaging/status`).
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import config
+from services.metrics import counter, gauge
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_is_leader_gauge = gauge("linasbot_scheduler_is_leader", "1 if this worker runs the scheduler jobs", ("name",))
+_leader_changes_total = counter(
+    "linasbot_scheduler_leader_changes_total",
+    "Times this worker became leader or stepped down",
+    ("name", "change"),
+)
+
+# KEYS[1] = lease key, ARGV[1] = our lease value, ARGV[2] = lease seconds
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+Callback = Callable[[], Any]
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SchedulerLeaderElection:
+    def __init__(
+        self,
+        name: str = "smart_messaging_scheduler",
+        lease_seconds: Optional[int] = None,
+        renew_seconds: Optional[float] = None,
+        lock_dir: Optional[Path] = None,
+        redis_client: Any = None,
+    ):
+        self.name = name
+        self.lease_seconds = int(lease_seconds or getattr(config, "SCHEDULER_LEADER_LEASE_SECONDS", 30))
+        self.renew_seconds = float(renew_seconds or getattr(config, "SCHEDULER_LEADER_RENEW_SECONDS", 10))
+        self.worker_id = worker_id()
+        self.is_leader = False
+        self.leader_since: Optional[float] = None
+        self._lock_dir = lock_dir
+        self._redis = redis_client
+        self._lock_fd: Optional[int] = None
+        self._lease_value: Optional[str] = None
+        self._lease_deadline = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._on_elected: Optional[Callback] = None
+        self._on_demoted: Optional[Callback] = None
+        self._last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------ backends
+
+    @property
+    def redis_key(self) -> str:
+        return f"linasbot:leader:{self.name}"
+
+    @property
+    def lock_path(self) -> Path:
+        lock_dir = self._lock_dir
+        if lock_dir is None:
+            from storage.persistent_storage import get_data_root
+            lock_dir = get_data_root() / "locks"
+        return Path(lock_dir) / f"{self.name}.lock"
+
+    def _client(self) -> Any:
+        if self._redis is not None:
+            return self._redis
+        from services.redis_client import get_redis
+        return get_redis()
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._client() is not None else "file_lock"
+
+    def _lease_payload(self) -> str:
+        return json.dumps({"worker_id": self.worker_id, "since": self.leader_since or time.time()})
+
+    async def _try_redis(self, client: Any) -> bool:
+        try:
+            if self.is_leader and self._lease_value:
+                renewed = await client.eval(_RENEW_SCRIPT, 1, self.redis_key, self._lease_value, self.lease_seconds)
+                if renewed:
+                    self._lease_deadline = time.monotonic() + self.lease_seconds
+                    return True
+                return False
+            value = self._lease_payload()
+            if await client.set(self.redis_key, value, ex=self.lease_seconds, nx=True):
+                self._lease_value = value
+                self._lease_deadline = time.monotonic() + self.lease_seconds
+                return True
+            return False
+        except Exception as e:
+            self._last_error = str(e)
+            print(f"⚠️ Scheduler leader lease error ({self.backend}): {e}")
+            # Keep leading until our lease would have expired anyway
+            return self.is_leader and time.monotonic() < self._lease_deadline
+
+    def _try_file_lock(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        if fcntl is None:
+            return True  # no flock (Windows dev box): single process
+        path = self.lock_path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            self._last_error = str(e)
+            print(f"⚠️ Could not open scheduler lock {path}: {e}")
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, self._lease_payload().encode("utf-8"))
+        self._lock_fd = fd
+        return True
+
+    async def try_acquire(self) -> bool:
+        """Take or renew leadership; returns whether this worker leads now."""
+        client = self._client()
+        if client is not None:
+            leading = await self._try_redis(client)
+        else:
+            leading = self._try_file_lock()
+        await self._set_leader(leading)
+        return leading
+
+    async def release(self) -> None:
+        """Give up leadership (shutdown) so another worker can take over right away."""
+        client = self._client()
+        if client is not None and self._lease_value:
+            try:
+                await client.eval(_RELEASE_SCRIPT, 1, self.redis_key, self._lease_value)
+            except Exception as e:
+                print(f"⚠️ Could not release scheduler lease: {e}")
+        if self._lock_fd is not None:
+            try:
+                os.ftruncate(self._lock_fd, 0)
+            except OSError:
+                pass
+            os.close(self._lock_fd)  # also releases the flock
+            self._lock_fd = None
+        self._lease_value = None
+        await self._set_leader(False)
+
+    async def _set_leader(self, leading: bool) -> None:
+        if leading == self.is_leader:
+            return
+        self.is_leader = leading
+        _is_leader_gauge.labels(name=self.name).set(1 if leading else 0)
+        if leading:
+            self.leader_since = time.time()
+            _leader_changes_total.labels(name=self.name, change="elected").inc()
+            print(f"👑 Worker {self.worker_id} is now the {self.name} leader ({self.backend})")
+            callback = self._on_elected
+        else:
+            self.leader_since = None
+            self._lease_value = None
+            _leader_changes_total.labels(name=self.name, change="demoted").inc()
+            print(f"⏸️ Worker {self.worker_id} is no longer the {self.name} leader")
+            callback = self._on_demoted
+        if callback is not None:
+            try:
+                result = callback()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"❌ Error in scheduler leader callback: {e}")
+
+    # ------------------------------------------------------------------ loop
+
+    def start(self, on_elected: Optional[Callback] = None, on_demoted: Optional[Callback] = None) -> None:
+        """Campaign in the background: `on_elected` / `on_demoted` run on every change."""
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.try_acquire()
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"❌ Scheduler leader election error: {e}")
+            await asyncio.sleep(self.renew_seconds)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.release()
+
+    # ------------------------------------------------------------------ reporting
+
+    async def current_leader(self) -> Optional[Dict[str, Any]]:
+        """Who leads right now (any worker can ask): {"worker_id", "since"} or None."""
+        if self.is_leader:
+            return {"worker_id": self.worker_id, "since": self.leader_since}
+        raw = None
+        client = self._client()
+        try:
+            if client is not None:
+                raw = await client.get(self.redis_key)
+            elif self.lock_path.exists():
+                raw = self.lock_path.read_text(encoding="utf-8")
+        except Exception as e:
+            self._last_error = str(e)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return {"worker_id": raw, "since": None}
+
+    async def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "worker_id": self.worker_id,
+            "is_leader": self.is_leader,
+            "leader": await self.current_leader(),
+            "lease_seconds": self.lease_seconds,
+            "renew_seconds": self.renew_seconds,
+            "last_error": self._last_error,
+        }
+
+
+# Global instance
+scheduler_leader = SchedulerLeaderElection()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, rate-limited sender for smart messages.
+
+`monitor_smart_messages_job` used to send approved/due messages one at a time and await the
+Firestore conversation-history write after each send, so a morning batch of reminders took
+minutes and held up the scheduler. `smart_message_sender.send_batch(...)` now:
+
+- sends up to SMART_MESSAGE_SEND_CONCURRENCY messages at once (messages to the same phone
+  still go out in order, one after the other);
+- takes a token from a bucket refilled at SMART_MESSAGE_RATE_PER_SECOND (bursts up to
+  SMART_MESSAGE_RATE_BURST) before each send, to stay inside the provider's quota;
+- keeps the status callbacks of the old loop: the caller passes `on_sent` / `on_failed` /
+  `on_dry_run` (e.g. smart_messaging.mark_message_sent / mark_message_failed), called right
+  after each send attempt;
+- queues the conversation-history write instead of awaiting it. `smart_message_history`
+  writes them in the background (same phone -> same worker, so a customer's history stays in
+  order) and is drained on shutdown.
+
+Each batch logs its progress every SMART_MESSAGE_PROGRESS_EVERY messages and reports counts,
+duration and throughput; the last batches are exposed on /api/metrics/smart-messages.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import config
+from services.metrics import counter, gauge, histogram
+
+_sent_total = counter(
+    "linasbot_smart_messages_sent_total",
+    "Smart message send attempts by batch and result (sent, dry_run, failed)",
+    ("batch", "result"),
+)
+_send_seconds = histogram(
+    "linasbot_smart_message_send_seconds",
+    "Provider call duration for one smart message",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+_rate_wait_seconds = histogram(
+    "linasbot_smart_message_rate_wait_seconds",
+    "Time a smart message waited for a rate-limit token",
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+_in_flight = gauge("linasbot_smart_messages_in_flight", "Smart messages currently being sent")
+_batch_throughput = gauge(
+    "linasbot_smart_message_batch_throughput",
+    "Messages per second of the last smart message batch",
+    ("batch",),
+)
+_history_queue_depth = gauge("linasbot_smart_message_history_queue_depth", "Conversation-history writes waiting")
+_history_writes_total = counter(
+    "linasbot_smart_message_history_writes_total",
+    "Conversation-history writes for sent smart messages by result (written, failed, dropped)",
+    ("result",),
+)
+
+SendFunc = Callable[[str, str], Awaitable[Dict[str, Any]]]
+Callback = Callable[..., Any]
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Wait for one token; returns the time waited. A rate <= 0 disables the limit."""
+        if self.rate <= 0:
+            return 0.0
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:  # FIFO: waiters are served in arrival order
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+        return time.monotonic() - started
+
+
+class SmartMessageHistoryQueue:
+    """Background writer for the conversation-history entries of sent smart messages."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        writer: Optional[Callable[..., Awaitable[Any]]] = None,
+    ):
+        self.workers = max(1, workers or getattr(config, "SMART_MESSAGE_HISTORY_WORKERS", 2))
+        self.max_pending = max_pending or getattr(config, "SMART_MESSAGE_HISTORY_MAX_PENDING", 5000)
+        self._writer = writer
+        self._queues: List[Deque[Dict[str, Any]]] = [deque() for _ in range(self.workers)]
+        self._wakeups: List[Optional[asyncio.Event]] = [None] * self.workers
+        self._tasks: List[Optional[asyncio.Task]] = [None] * self.workers
+        self._pending = 0
+        self._stats = {"queued": 0, "written": 0, "failed": 0, "dropped": 0}
+
+    def enqueue(self, **kwargs: Any) -> bool:
+        """Queue one `save_conversation_message_to_firestore(**kwargs)`; False if dropped."""
+        if self._pending >= self.max_pending:
+            self._stats["dropped"] += 1
+            _history_writes_total.labels(result="dropped").inc()
+            print(f"⚠️ Smart message history queue full, dropping entry for {kwargs.get('user_id')}")
+            return False
+        index = hash(kwargs.get("user_id")) % self.workers
+        self._queues[index].append(kwargs)
+        self._pending += 1
+        self._stats["queued"] += 1
+        _history_queue_depth.set(self._pending)
+        if self._wakeups[index] is None:
+            self._wakeups[index] = asyncio.Event()
+        self._wakeups[index].set()
+        task = self._tasks[index]
+        if task is None or task.done():
+            self._tasks[index] = asyncio.create_task(self._run(index))
+        return True
+
+    async def _write(self, kwargs: Dict[str, Any]) -> None:
+        writer = self._writer
+        if writer is None:
+            from utils.utils import save_conversation_message_to_firestore
+            writer = save_conversation_message_to_firestore
+        try:
+            await writer(**kwargs)
+            self._stats["written"] += 1
+            _history_writes_total.labels(result="written").inc()
+        except Exception as e:
+            self._stats["failed"] += 1
+            _history_writes_total.labels(result="failed").inc()
+            print(f"❌ Error saving smart message to conversation history for {kwargs.get('user_id')}: {e}")
+
+    async def _run(self, index: int) -> None:
+        queue, wakeup = self._queues[index], self._wakeups[index]
+        while True:
+            while queue:
+                kwargs = queue.popleft()
+                try:
+                    await self._write(kwargs)
+                finally:
+                    self._pending -= 1
+                    _history_queue_depth.set(self._pending)
+            wakeup.clear()
+            await wakeup.wait()
+
+    async def drain(self, timeout: float = 30.0) -> int:
+        """Wait (up to `timeout`) for queued writes, then stop the workers; returns what is left."""
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for index, task in enumerate(self._tasks):
+            if task is not None and not task.done():
+                task.cancel()
+            self._tasks[index] = None
+        left = self._pending
+        if left:
+            print(f"⚠️ {left} smart message history writes were not saved before shutdown")
+        return left
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": self._pending, "workers": self.workers, "max_pending": self.max_pending, **self._stats}
+
+
+class SmartMessageSender:
+    RECENT_BATCHES = 10
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[float] = None,
+        history: Optional[SmartMessageHistoryQueue] = None,
+    ):
+        self.concurrency = max(1, concurrency or getattr(config, "SMART_MESSAGE_SEND_CONCURRENCY", 4))
+        rate = rate_per_second if rate_per_second is not None else getattr(config, "SMART_MESSAGE_RATE_PER_SECOND", 5.0)
+        self.bucket = TokenBucket(rate, burst or getattr(config, "SMART_MESSAGE_RATE_BURST", None))
+        self.progress_every = max(1, getattr(config, "SMART_MESSAGE_PROGRESS_EVERY", 25))
+        self.history = history if history is not None else smart_message_history
+        self._in_flight = 0
+        self._recent_batches: Deque[Dict[str, Any]] = deque(maxlen=self.RECENT_BATCHES)
+        self._current: Optional[Dict[str, Any]] = None
+
+    async def send_batch(
+        self,
+        messages: List[Dict[str, Any]],
+        on_sent: Callback,
+        on_failed: Optional[Callback] = None,
+        on_dry_run: Optional[Callback] = None,
+        batch: str = "scheduled",
+        send: Optional[SendFunc] = None,
+    ) -> Dict[str, Any]:
+        """
+        Send `messages` (dicts with phone, content, message_id, type, customer_name).
+
+        After each attempt exactly one callback runs with the message dict: `on_dry_run(msg)`
+        when the adapter only logged it (and `on_dry_run` is given), `on_sent(msg)` on success,
+        `on_failed(msg, error)` otherwise. Sent messages get a conversation-history entry queued.
+        Returns the batch report (counts, duration, throughput).
+        """
+        if send is None:
+            from services.whatsapp_adapters.whatsapp_factory import WhatsAppFactory
+            send = WhatsAppFactory.get_adapter().send_text_message
+
+        report = {
+            "batch": batch,
+            "total": len(messages),
+            "done": 0,
+            "sent": 0,
+            "dry_run": 0,
+            "failed": 0,
+            "started_at": time.time(),
+        }
+        self._current = report
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        phone_locks: Dict[str, asyncio.Lock] = {}
+
+        async def _send_one(msg: Dict[str, Any]) -> None:
+            phone = msg.get("phone")
+            phone_lock = phone_locks.setdefault(str(phone), asyncio.Lock())
+            async with phone_lock, semaphore:
+                _rate_wait_seconds.observe(await self.bucket.acquire())
+                result = await self._attempt(msg, send)
+            self._record(report, msg, result, on_sent, on_failed, on_dry_run, started)
+
+        await asyncio.gather(*(_send_one(msg) for msg in messages))
+
+        duration = time.perf_counter() - started
+        report["duration_seconds"] = round(duration, 3)
+        report["messages_per_second"] = round(report["done"] / duration, 2) if duration > 0 else None
+        _batch_throughput.labels(batch=batch).set(report["messages_per_second"] or 0)
+        self._recent_batches.append(report)
+        self._current = None
+        return report
+
+    async def _attempt(self, msg: Dict[str, Any], send: SendFunc) -> Dict[str, Any]:
+        self._in_flight += 1
+        _in_flight.set(self._in_flight)
+        attempt_started = time.perf_counter()
+        try:
+            return await send(msg.get("phone"), msg.get("content"))
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        finally:
+            _send_seconds.observe(time.perf_counter() - attempt_started)
+            self._in_flight -= 1
+            _in_flight.set(self._in_flight)
+
+    def _record(
+        self,
+        report: Dict[str, Any],
+        msg: Dict[str, Any],
+        result: Dict[str, Any],
+        on_sent: Callback,
+        on_failed: Optional[Callback],
+        on_dry_run: Optional[Callback],
+        started: float,
+    ) -> None:
+        phone, message_id = msg.get("phone"), msg.get("message_id")
+        try:
+            if result.get("dry_run") and on_dry_run is not None:
+                outcome = "dry_run"
+                on_dry_run(msg)
+                print(f"   📋 Dry-run (would send) {message_id} to {phone}")
+            elif result.get("success"):
+                outcome = "sent"
+                on_sent(msg)
+                print(f"   ✅ Sent {message_id} to {phone}")
+                self.history.enqueue(
+                    user_id=phone,
+                    role="ai",
+                    text=msg.get("content"),
+                    conversation_id=None,  # Will create/continue conversation
+                    user_name=msg.get("customer_name", "Customer"),
+                    phone_number=phone,
+                    metadata={
+                        "source": "smart_message",
+                        "type": msg.get("type"),
+                        "message_id": message_id,
+                    },
+                )
+            else:
+                outcome = "failed"
+                error_msg = result.get("error", "Unknown error")
+                if on_failed is not None:
+                    on_failed(msg, error_msg)
+                print(f"   ❌ Failed to send {message_id} to {phone}: {error_msg}")
+        except Exception as e:
+            outcome = "failed"
+            print(f"   ❌ Error recording result for {message_id}: {e}")
+
+        report[outcome] += 1
+        report["done"] += 1
+        _sent_total.labels(batch=report["batch"], result=outcome).inc()
+        if report["done"] % self.progress_every == 0 and report["done"] < report["total"]:
+            elapsed = time.perf_counter() - started
+            print(
+                f"📤 Smart messages [{report['batch']}] {report['done']}/{report['total']} "
+                f"(sent={report['sent']}, dry_run={report['dry_run']}, failed={report['failed']}, "
+                f"{report['done'] / elapsed if elapsed > 0 else 0:.1f} msg/s)"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "rate_per_second": self.bucket.rate,
+            "burst": self.bucket.burst,
+            "in_flight": self._in_flight,
+            "current_batch": dict(self._current) if self._current else None,
+            "recent_batches": list(self._recent_batches),
+            "history": self.history.stats(),
+        }
+
+
+# Global instances
+smart_message_history = SmartMessageHistoryQueue()
+smart_message_sender = SmartMessageSender()
@@ -9,6 +9,7 @@ import os
 from pathlib import Path
 
 from services.message_logs_service import message_logs_service
+from services.scheduled_message_store import ScheduledMessageStore, ScheduledMessagesView
 from services.smart_messaging_catalog import normalize_template_id
 from storage.persistent_storage import (
     SENT_SMART_MESSAGES_FILE,
@@ -29,7 +30,8 @@ class SmartMessagingService:
     - 1-month follow-ups
     """
     
-    SENT_MESSAGES_FILE = str(SENT_SMART_MESSAGES_FILE)
+    SENT_MESSAGES_FILE = str(SENT_SMART_MESSAGES_FILE)  # legacy JSON, imported into the store once
+    SENDING_STALE_SECONDS = 600  # 'sending' longer than this means the send cycle crashed
 
     def __init__(self):
         ensure_dirs()
@@ -37,54 +39,11 @@ class SmartMessagingService:
         self.settings_file = str(APP_SETTINGS_FILE)
         self.mapping_file = str(SERVICE_TEMPLATE_MAPPING_FILE)
         self.message_templates = self._load_templates()
-        self.scheduled_messages = {}
+        # Scheduled/sent messages live in SQLite (services/scheduled_message_store.py) so they
+        # survive restarts; scheduled_messages is a dict-style view over it.
+        self.store = ScheduledMessageStore(legacy_json_path=self.SENT_MESSAGES_FILE)
+        self.scheduled_messages = ScheduledMessagesView(self.store)
         self.sent_messages_log = []
-        self._load_sent_messages()
-        
-    # ------------------------------------------------------------------
-    # Persistence helpers — keep sent messages across server restarts
-    # ------------------------------------------------------------------
-
-    def _load_sent_messages(self):
-        """Load previously sent messages from disk into scheduled_messages dict."""
-        if not os.path.exists(self.SENT_MESSAGES_FILE):
-            return
-        try:
-            with open(self.SENT_MESSAGES_FILE, 'r', encoding='utf-8') as f:
-                entries = json.load(f)
-            loaded = 0
-            for message_id, entry in entries.items():
-                # Convert ISO strings back to datetime objects
-                for key in ('send_at', 'sent_at', 'created_at', 'last_attempt'):
-                    if entry.get(key):
-                        try:
-                            entry[key] = datetime.fromisoformat(entry[key])
-                        except (ValueError, TypeError):
-                            pass
-                self.scheduled_messages[message_id] = entry
-                loaded += 1
-            print(f"✅ Loaded {loaded} sent messages from {self.SENT_MESSAGES_FILE}")
-        except Exception as e:
-            print(f"⚠️ Could not load sent messages: {e}")
-
-    def _persist_sent_messages(self):
-        """Save all sent messages to disk so they survive restarts."""
-        try:
-            entries = {}
-            for message_id, msg in self.scheduled_messages.items():
-                if msg.get("status") not in ("sent", "would_send"):
-                    continue
-                # Shallow copy and serialise datetimes
-                entry = dict(msg)
-                for key in ('send_at', 'sent_at', 'created_at', 'last_attempt'):
-                    if isinstance(entry.get(key), datetime):
-                        entry[key] = entry[key].isoformat()
-                entries[message_id] = entry
-            os.makedirs(os.path.dirname(self.SENT_MESSAGES_FILE), exist_ok=True)
-            with open(self.SENT_MESSAGES_FILE, 'w', encoding='utf-8') as f:
-                json.dump(entries, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"⚠️ Could not persist sent messages: {e}")
 
     def _load_templates(self) -> Dict:
         """Load message templates from JSON file or use defaults"""
@@ -532,7 +491,7 @@ Des questions? Nous sommes là! 💬
             print(f"Template {canonical_type} not enabled for service {service_id}, skipping")
             return None
 
-        self.scheduled_messages[message_id] = {
+        self.store.put(message_id, {
             "customer_phone": customer_phone,
             "message_type": canonical_type,
             "send_at": send_at,
@@ -543,7 +502,7 @@ Des questions? Nous sommes là! 💬
             "status": "scheduled",
             "created_at": datetime.now(),
             "metadata": metadata or {},
-        }
+        })
 
         # If preview mode is enabled, also add to preview queue
         if self._is_preview_mode_enabled():
@@ -596,10 +555,9 @@ Des questions? Nous sommes là! 💬
         try:
             from services.message_preview_service import message_preview_service
 
-            msg_data = self.scheduled_messages.get(message_id)
+            # Update status to pending_approval
+            msg_data = self.store.update(message_id, {'status': 'pending_approval'})
             if msg_data:
-                # Update status to pending_approval
-                self.scheduled_messages[message_id]['status'] = 'pending_approval'
 
                 # Add to preview service
                 message_preview_service.add_to_preview_queue({
@@ -656,40 +614,39 @@ Des questions? Nous sommes là! 💬
         current_time = datetime.now()
         messages_to_send = []
 
-        for message_id, message_data in list(self.scheduled_messages.items()):
-            if message_data["status"] == "scheduled" and message_data["send_at"] <= current_time:
-                # Use edited content if present, otherwise render from template
-                content = message_data.get("content")
-                if not content:
-                    content = self.get_message_content(
-                        message_data["message_type"],
-                        message_data["language"],
-                        message_data["placeholders"]
-                    )
+        requeued = self.store.requeue_stale_sending(self.SENDING_STALE_SECONDS)
+        if requeued:
+            print(f"   [RETRY] {requeued} messages stuck in 'sending' reverted to 'scheduled'")
+
+        for message_id, message_data in self.store.due(current_time):
+            # Use edited content if present, otherwise render from template
+            content = message_data.get("content")
+            if not content:
+                content = self.get_message_content(
+                    message_data["message_type"],
+                    message_data["language"],
+                    message_data["placeholders"]
+                )
 
-                if content:
-                    canonical_type = normalize_template_id(message_data["message_type"])
-                    messages_to_send.append({
-                        "phone": message_data["customer_phone"],
-                        "content": content,
-                        "type": canonical_type,
-                        "message_id": message_id,
-                        "customer_name": message_data.get("placeholders", {}).get("customer_name", "Customer")
-                    })
-
-                    # Mark as 'sending' to prevent duplicate processing,
-                    # but do NOT mark 'sent' yet — caller does that after
-                    # confirming the WhatsApp send succeeded.
-                    self.scheduled_messages[message_id]["status"] = "sending"
+            # Mark as 'sending' to prevent duplicate processing,
+            # but do NOT mark 'sent' yet — caller does that after
+            # confirming the WhatsApp send succeeded.
+            if content and self.store.update(message_id, {"status": "sending"}, expected_status=("scheduled",)):
+                canonical_type = normalize_template_id(message_data["message_type"])
+                messages_to_send.append({
+                    "phone": message_data["customer_phone"],
+                    "content": content,
+                    "type": canonical_type,
+                    "message_id": message_id,
+                    "customer_name": message_data.get("placeholders", {}).get("customer_name", "Customer")
+                })
 
         return messages_to_send
 
     def mark_message_dry_run(self, message_id: str):
         """Mark message as dry-run (would send) – used when ENABLE_SENDING=false or local sandbox."""
-        if message_id in self.scheduled_messages:
-            self.scheduled_messages[message_id]["status"] = "would_send"
-            self.scheduled_messages[message_id]["sent_at"] = datetime.now()
-            msg_data = self.scheduled_messages[message_id]
+        msg_data = self.store.update(message_id, {"status": "would_send", "sent_at": datetime.now()})
+        if msg_data:
             canonical_type = normalize_template_id(msg_data.get("message_type", ""))
             content_preview = self.get_message_content(
                 canonical_type,
@@ -703,16 +660,12 @@ Des questions? Nous sommes là! 💬
                 "sent_at": datetime.now(),
                 "content": "(dry-run) " + (content_preview[:80] + "..." if len(content_preview) > 80 else content_preview)
             })
-            self._persist_sent_messages()
             print(f"   📋 Marked {message_id} as would_send (dry-run)")
 
     def mark_message_sent(self, message_id: str):
         """Mark a single message as successfully sent (called after WhatsApp confirms)."""
-        if message_id in self.scheduled_messages:
-            self.scheduled_messages[message_id]["status"] = "sent"
-            self.scheduled_messages[message_id]["sent_at"] = datetime.now()
-
-            msg_data = self.scheduled_messages[message_id]
+        msg_data = self.store.update(message_id, {"status": "sent", "sent_at": datetime.now()})
+        if msg_data:
             metadata = msg_data.get("metadata", {}) if isinstance(msg_data.get("metadata"), dict) else {}
             canonical_type = normalize_template_id(msg_data["message_type"])
             content = self.get_message_content(
@@ -760,15 +713,9 @@ Des questions? Nous sommes là! 💬
             except Exception as log_exc:
                 print(f"⚠️ Failed to write message log for {message_id}: {log_exc}")
 
-            self._persist_sent_messages()
-
     def mark_message_failed(self, message_id: str, error: str = ""):
         """Revert a message back to 'scheduled' so it can be retried next cycle."""
-        if message_id in self.scheduled_messages:
-            msg = self.scheduled_messages[message_id]
-            msg["status"] = "scheduled"
-            msg["last_error"] = error
-            msg["last_attempt"] = datetime.now()
+        if self.store.update(message_id, {"status": "scheduled", "last_error": error, "last_attempt": datetime.now()}):
             print(f"   [RETRY] {message_id} reverted to 'scheduled' — {error}")
     
     def schedule_appointment_reminders(
@@ -877,37 +824,30 @@ Des questions? Nous sommes là! 💬
     def get_scheduled_messages_summary(self) -> Dict:
         """Get summary of scheduled messages"""
         
+        counts = self.store.summary()
+        by_status = counts["by_status"]
+        scheduled = by_status.get("scheduled", 0)
+        would_send = by_status.get("would_send", 0)
+
         summary = {
-            "total": len(self.scheduled_messages),
-            "scheduled": 0,
-            "sent": 0,
-            "would_send": 0,
-            "by_type": {},
+            "total": counts["total"],
+            "scheduled": scheduled,
+            # everything that is neither waiting nor dry-run, as before
+            "sent": counts["total"] - scheduled - would_send,
+            "would_send": would_send,
+            "by_type": counts["by_type"],
             "next_message": None
         }
-        
-        next_send_time = None
-        
-        for message_data in self.scheduled_messages.values():
-            if message_data["status"] == "scheduled":
-                summary["scheduled"] += 1
-                
-                # Find next message to be sent
-                if not next_send_time or message_data["send_at"] < next_send_time:
-                    next_send_time = message_data["send_at"]
-                    summary["next_message"] = {
-                        "type": message_data["message_type"],
-                        "send_at": message_data["send_at"].isoformat(),
-                        "phone": message_data["customer_phone"]
-                    }
-            elif message_data["status"] == "would_send":
-                summary["would_send"] += 1
-            else:
-                summary["sent"] += 1
-            
-            # Count by type
-            msg_type = message_data["message_type"]
-            summary["by_type"][msg_type] = summary["by_type"].get(msg_type, 0) + 1
+
+        # Next message to be sent
+        if counts["next"]:
+            _, message_data = counts["next"]
+            send_at = message_data["send_at"]
+            summary["next_message"] = {
+                "type": message_data["message_type"],
+                "send_at": send_at.isoformat() if isinstance(send_at, datetime) else send_at,
+                "phone": message_data["customer_phone"]
+            }
         
         return summary
     
@@ -927,57 +867,56 @@ Des questions? Nous sommes là! 💬
 
         normalized_type = normalize_template_id(message_type)
 
-        for message_id, msg_data in self.scheduled_messages.items():
-            if normalize_template_id(msg_data.get("message_type")) != normalized_type:
-                continue
-            if msg_data.get("status") not in ("scheduled", "pending_approval"):
-                continue
-
+        # Indexed on (message_type, status); the phone suffix match runs on that small set
+        candidates = self.store.find(statuses=("scheduled", "pending_approval"), message_type=normalized_type)
+        matching_ids = []
+        for message_id, msg_data in candidates:
             # Normalize stored phone for comparison
             stored_phone = str(msg_data.get("customer_phone", "")).replace("+", "").replace(" ", "").replace("-", "")
 
             if stored_phone == phone_clean or stored_phone.endswith(phone_clean) or phone_clean.endswith(stored_phone):
-                msg_data["status"] = "sent"
-                msg_data["sent_at"] = now
-                updated += 1
-                metadata = msg_data.get("metadata", {}) if isinstance(msg_data.get("metadata"), dict) else {}
-                reference_date = (
-                    metadata.get("reference_date")
-                    or msg_data.get("placeholders", {}).get("reference_date")
-                    or msg_data.get("placeholders", {}).get("appointment_date")
-                )
-                appointment_id = metadata.get("appointment_id")
-                customer_id = metadata.get("customer_id") or customer_phone
-                campaign_id = metadata.get("campaign_id")
+                matching_ids.append(message_id)
+
+        for message_id, msg_data in self.store.update_many(
+            matching_ids, {"status": "sent", "sent_at": now}, expected_status=("scheduled", "pending_approval")
+        ):
+            updated += 1
+            metadata = msg_data.get("metadata", {}) if isinstance(msg_data.get("metadata"), dict) else {}
+            reference_date = (
+                metadata.get("reference_date")
+                or msg_data.get("placeholders", {}).get("reference_date")
+                or msg_data.get("placeholders", {}).get("appointment_date")
+            )
+            appointment_id = metadata.get("appointment_id")
+            customer_id = metadata.get("customer_id") or customer_phone
+            campaign_id = metadata.get("campaign_id")
 
-                try:
-                    if not message_logs_service.was_message_sent(
+            try:
+                if not message_logs_service.was_message_sent(
+                    customer_id=customer_id,
+                    template_type=normalized_type,
+                    reference_date=reference_date,
+                    appointment_id=appointment_id,
+                    campaign_id=campaign_id,
+                ):
+                    message_logs_service.log_message(
                         customer_id=customer_id,
                         template_type=normalized_type,
-                        reference_date=reference_date,
                         appointment_id=appointment_id,
                         campaign_id=campaign_id,
-                    ):
-                        message_logs_service.log_message(
-                            customer_id=customer_id,
-                            template_type=normalized_type,
-                            appointment_id=appointment_id,
-                            campaign_id=campaign_id,
-                            reference_date=reference_date,
-                            extra={
-                                "phone": msg_data.get("customer_phone"),
-                                "service_name": msg_data.get("service_name"),
-                                "source": metadata.get("source", "sync_mark_sent"),
-                            },
-                        )
-                except Exception as log_exc:
-                    print(f"⚠️ Failed to write message log while syncing {message_id}: {log_exc}")
-                print(f"   [SYNC] Marked {message_id} as sent in scheduled_messages dict")
+                        reference_date=reference_date,
+                        extra={
+                            "phone": msg_data.get("customer_phone"),
+                            "service_name": msg_data.get("service_name"),
+                            "source": metadata.get("source", "sync_mark_sent"),
+                        },
+                    )
+            except Exception as log_exc:
+                print(f"⚠️ Failed to write message log while syncing {message_id}: {log_exc}")
+            print(f"   [SYNC] Marked {message_id} as sent in the scheduled messages store")
 
         if updated == 0:
             print(f"   [SYNC] No matching scheduled message found for {customer_phone} / {message_type}")
-        else:
-            self._persist_sent_messages()
 
         return updated
 
@@ -991,50 +930,11 @@ Des questions? Nous sommes là! 💬
         - KEEP all twenty_day_followup and missed_paused_appointment messages (they show
           cumulative data for the entire month)
         - KEEP messages sent today (so user can see what was sent)
-        - Persist sent messages before clearing so history is not lost
         """
         preserved_types = {"twenty_day_followup", "missed_paused_appointment"}
         today = datetime.now().date()
 
-        # Persist sent messages first so they survive the cleanup
-        self._persist_sent_messages()
-
-        cleared = 0
-        kept = 0
-        new_scheduled = {}
-
-        for message_id, msg_data in self.scheduled_messages.items():
-            msg_type = msg_data.get("message_type", "")
-
-            # Always keep long-horizon follow-up and campaign messages
-            if msg_type in preserved_types:
-                new_scheduled[message_id] = msg_data
-                kept += 1
-                continue
-
-            # Keep messages that were sent or dry-run today (so user can see today's activity)
-            status = msg_data.get("status", "")
-            sent_at = msg_data.get("sent_at")
-            if status in ("sent", "would_send") and sent_at:
-                sent_date = sent_at.date() if isinstance(sent_at, datetime) else None
-                if sent_date and sent_date >= today:
-                    new_scheduled[message_id] = msg_data
-                    kept += 1
-                    continue
-
-            # Keep messages whose send_at is today or in the future
-            send_at = msg_data.get("send_at")
-            if send_at:
-                send_date = send_at.date() if isinstance(send_at, datetime) else None
-                if send_date and send_date >= today:
-                    new_scheduled[message_id] = msg_data
-                    kept += 1
-                    continue
-
-            # Otherwise, discard (stale message from a previous day)
-            cleared += 1
-
-        self.scheduled_messages = new_scheduled
+        cleared, kept = self.store.delete_stale(today, preserved_types)
 
         print(f"🧹 Daily cleanup: cleared {cleared} stale messages, kept {kept}")
         return {"cleared": cleared, "kept": kept}
@@ -1042,14 +942,15 @@ Des questions? Nous sommes là! 💬
     def cancel_scheduled_messages(self, customer_phone: str, message_type: Optional[str] = None):
         """Cancel scheduled messages for a customer"""
         
-        cancelled = []
-        for message_id, message_data in list(self.scheduled_messages.items()):
-            if message_data["customer_phone"] == customer_phone and message_data["status"] == "scheduled":
-                if not message_type or message_data["message_type"] == message_type:
-                    self.scheduled_messages[message_id]["status"] = "cancelled"
-                    cancelled.append(message_id)
-        
-        return cancelled
+        candidates = self.store.find(
+            statuses=("scheduled",),
+            message_type=message_type or None,
+            customer_phone=customer_phone,
+        )
+        updated = self.store.update_many(
+            [message_id for message_id, _ in candidates], {"status": "cancelled"}, expected_status=("scheduled",)
+        )
+        return [message_id for message_id, _ in updated]
 
 
 # Mapping of message types to friendly names
@@ -1082,6 +983,7 @@ async def get_sent_smart_messages_from_firestore(
         List of sent message dicts with customer info
     """
     from utils.utils import get_firestore_db
+    from services.conversation_store import hydrate_conversation_payload
 
     db = get_firestore_db()
     if not db:
@@ -1107,7 +1009,7 @@ async def get_sent_smart_messages_from_firestore(
                 ))
 
                 for conv_doc in conversations_docs:
-                    conv_data = conv_doc.to_dict() or {}
+                    conv_data = await hydrate_conversation_payload(conv_doc.reference, conv_doc.to_dict() or {})
                     messages = conv_data.get("messages", [])
                     customer_info = conv_data.get("customer_info", {})
 
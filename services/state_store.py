@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Shared per-user state store.
+
+Per-user conversation state lives in the `config.user_*` defaultdicts, which are local to one
+gunicorn worker. This store persists the cross-message parts of that state in a pluggable
+backend so a customer whose webhooks land on different workers keeps their greeting stage,
+booking progress and takeover flag:
+
+- `await user_state_store.load(user_id)` before handling a message (one pipelined round trip
+  for every namespace), refreshing the config dicts in place; with a shared backend, local
+  entries the backend no longer has (deleted elsewhere or expired) are dropped.
+- `await user_state_store.save(user_id)` after the bot has responded (pipelined SET with TTL;
+  entries removed locally are deleted from the backend).
+
+Backends: Redis (REDIS_URL) for production, process-local memory for dev/tests.
+The config dicts remain the working copy, so existing handlers are unchanged.
+"""
+
+import datetime
+import json
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import config
+
+# `config` per-user dicts shared across workers
+SHARED_NAMESPACES = (
+    "user_context",
+    "user_gender",
+    "user_names",
+    "user_greeting_stage",
+    "user_data_whatsapp",
+    "user_booking_state",
+    "user_in_human_takeover_mode",
+)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, deque):
+        return {"__deque__": list(value), "maxlen": value.maxlen}
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def _object_hook(value: Dict[str, Any]) -> Any:
+    if "__datetime__" in value and len(value) == 1:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    if "__deque__" in value:
+        return deque(value["__deque__"], maxlen=value.get("maxlen"))
+    return value
+
+
+def encode_state(value: Any) -> str:
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+def decode_state(raw: str) -> Any:
+    return json.loads(raw, object_hook=_object_hook)
+
+
+class InMemoryStateBackend:
+    """Process-local backend (dev, tests, single worker). Honors TTLs lazily on read."""
+
+    name = "memory"
+    shared = False  # this worker's dicts are the only copy: nothing to reconcile on load
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        now = time.monotonic()
+        values = []
+        for key in keys:
+            item = self._data.get(key)
+            if item is not None and item[1] is not None and item[1] <= now:
+                self._data.pop(key, None)
+                item = None
+            values.append(item[0] if item is not None else None)
+        return values
+
+    async def set_many(self, items: Dict[str, str], ttl_seconds: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds else None
+        for key, value in items.items():
+            self._data[key] = (value, expires_at)
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class RedisStateBackend:
+    """Redis backend: MGET for reads, non-transactional pipeline of SET EX / DEL for writes."""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, client):
+        self._client = client
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return await self._client.mget(list(keys))
+
+    async def set_many(self, items: Dict[str, str], ttl_seconds: Optional[int]) -> None:
+        if not items:
+            return
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, value, ex=ttl_seconds or None)
+        await pipe.execute()
+
+    async def delete_many(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if keys:
+            await self._client.delete(*keys)
+
+
+def create_state_backend():
+    """Backend selected by STATE_STORE_BACKEND (auto = Redis when REDIS_URL is configured)."""
+    mode = getattr(config, "STATE_STORE_BACKEND", "auto")
+    if mode in ("auto", "redis"):
+        from services.redis_client import get_redis
+        client = get_redis()
+        if client is not None:
+            return RedisStateBackend(client)
+        if mode == "redis":
+            print("⚠️ STATE_STORE_BACKEND=redis but Redis is not available; using process-local state")
+    return InMemoryStateBackend()
+
+
+class UserStateStore:
+    """Loads/saves the shared `config.user_*` entries of one user through a state backend."""
+
+    def __init__(self, backend=None, ttl_seconds: Optional[int] = None, namespaces: Sequence[str] = SHARED_NAMESPACES):
+        self._backend = backend
+        self._ttl_seconds = ttl_seconds
+        self.namespaces = tuple(namespaces)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_state_backend()
+            print(f"✅ User state store backend: {self._backend.name}")
+        return self._backend
+
+    @property
+    def ttl_seconds(self) -> int:
+        return self._ttl_seconds or getattr(config, "USER_STATE_TTL_SECONDS", 7 * 24 * 60 * 60)
+
+    def _key(self, namespace: str, user_id: str) -> str:
+        prefix = getattr(config, "STATE_STORE_KEY_PREFIX", "linasbot")
+        return f"{prefix}:state:{namespace}:{user_id}"
+
+    def _restore(self, namespace: str, user_id: str, value: Any) -> None:
+        """Refresh the local entry in place so references held by running handlers stay valid."""
+        target = getattr(config, namespace)
+        current = target.get(user_id)
+        if namespace == "user_context" and not isinstance(value, deque):
+            value = deque(value or [], maxlen=config.MAX_CONTEXT_MESSAGES)
+        if isinstance(current, dict) and isinstance(value, dict):
+            current.clear()
+            current.update(value)
+        elif isinstance(current, deque) and isinstance(value, deque):
+            current.clear()
+            current.extend(value)
+        else:
+            target[user_id] = value
+
+    async def load_many(self, user_ids: Sequence[str], namespaces: Optional[Sequence[str]] = None) -> int:
+        """Restore shared state for several users in a single pipelined read. Returns entries restored."""
+        namespaces = tuple(namespaces or self.namespaces)
+        pairs = [(namespace, user_id) for user_id in user_ids if user_id for namespace in namespaces]
+        if not pairs:
+            return 0
+        try:
+            raw_values = await self.backend.get_many([self._key(ns, uid) for ns, uid in pairs])
+        except Exception as e:
+            print(f"⚠️ State store load failed ({self.backend.name}), using local state: {e}")
+            return 0
+        restored = 0
+        shared = getattr(self.backend, "shared", False)
+        for (namespace, user_id), raw in zip(pairs, raw_values):
+            if raw is None:
+                if shared:
+                    # Deleted by another worker or expired: a stale local copy would be saved back
+                    getattr(config, namespace).pop(user_id, None)
+                continue
+            try:
+                self._restore(namespace, user_id, decode_state(raw))
+                restored += 1
+            except Exception as e:
+                print(f"⚠️ Could not restore {namespace} for {user_id}: {e}")
+        return restored
+
+    async def load(self, user_id: str, namespaces: Optional[Sequence[str]] = None) -> int:
+        return await self.load_many([user_id], namespaces)
+
+    async def save(self, user_id: str, namespaces: Optional[Sequence[str]] = None) -> None:
+        """Write the user's local entries (pipelined, with TTL); entries missing locally are deleted."""
+        if not user_id:
+            return
+        items: Dict[str, str] = {}
+        removed: List[str] = []
+        for namespace in namespaces or self.namespaces:
+            target = getattr(config, namespace)
+            key = self._key(namespace, user_id)
+            if user_id in target:
+                try:
+                    items[key] = encode_state(target[user_id])
+                except Exception as e:
+                    print(f"⚠️ Could not serialize {namespace} for {user_id}: {e}")
+            else:
+                removed.append(key)
+        try:
+            await self.backend.set_many(items, self.ttl_seconds)
+            await self.backend.delete_many(removed)
+        except Exception as e:
+            print(f"⚠️ State store save failed ({self.backend.name}) for {user_id}: {e}")
+
+    async def delete(self, user_id: str) -> None:
+        try:
+            await self.backend.delete_many(self._key(ns, user_id) for ns in self.namespaces)
+        except Exception as e:
+            print(f"⚠️ State store delete failed for {user_id}: {e}")
+
+
+# Global instance
+user_state_store = UserStateStore()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight latency tracing for the webhook → reply pipeline.
+
+A trace is bound to the current asyncio context (contextvars), so tasks created while it is active
+(pre-flight checks, the delayed text reply) keep recording into it without passing it around:
+
+    with start_trace("inbound", started_at=received_at):
+        async with span("firestore_restore"):
+            ...
+
+Every span is observed in the `linasbot_pipeline_stage_seconds{stage}` histogram, whether or not a
+trace is active, and the finished trace in `linasbot_pipeline_seconds{trace}`. Span names must be
+fixed strings (they are Prometheus label values). `log_interaction` attaches the active trace to
+the Activity Flow entry as a per-message latency breakdown.
+
+The text reply continues the inbound trace of the message that scheduled it
+(`start_trace("text_reply", parent=...)`), so its total is webhook receipt → reply sent,
+including the combining delay and the LLM slot wait.
+"""
+
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.metrics import histogram
+
+_stage_seconds = histogram(
+    "linasbot_pipeline_stage_seconds",
+    "Duration of one stage of the webhook → reply pipeline",
+    ("stage",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+_trace_seconds = histogram(
+    "linasbot_pipeline_seconds",
+    "End-to-end duration of a traced pipeline",
+    ("trace",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+
+_MAX_SPANS = 100
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("linasbot_trace", default=None)
+
+
+class Trace:
+    def __init__(self, name: str, started_at: Optional[float] = None, **attributes: Any):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.attributes = attributes
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(self, name: str, started_at: float, duration: float, error: Optional[str] = None) -> None:
+        if len(self.spans) >= _MAX_SPANS:
+            return
+        entry = {
+            "name": name,
+            "offset_ms": round((started_at - self.started_at) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+        }
+        if error:
+            entry["error"] = error
+        self.spans.append(entry)
+
+    @property
+    def total_ms(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return round((end - self.started_at) * 1000, 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "total_ms": self.total_ms,
+            "attributes": self.attributes,
+            "spans": sorted(self.spans, key=lambda s: s["offset_ms"]),
+        }
+
+    def format(self) -> str:
+        """Human-readable breakdown for the Activity Flow."""
+        lines = [f"Total: {self.total_ms:.0f}ms (trace {self.trace_id})"]
+        for s in sorted(self.spans, key=lambda s: s["offset_ms"]):
+            suffix = f" ⚠️ {s['error']}" if s.get("error") else ""
+            lines.append(f"  +{s['offset_ms']:.0f}ms {s['name']}: {s['duration_ms']:.0f}ms{suffix}")
+        return "\n".join(lines)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name: str, started_at: Optional[float] = None, parent: Optional[Trace] = None, **attributes: Any) -> Iterator[Trace]:
+    """
+    Make a new trace current for the block. With `parent`, the trace continues it: same start
+    time and trace id, and the parent's spans are carried over.
+    """
+    trace = Trace(name, started_at if started_at is not None else (parent.started_at if parent else None), **attributes)
+    if parent is not None:
+        trace.trace_id = parent.trace_id
+        trace.spans = list(parent.spans)
+        trace.attributes = {**parent.attributes, **attributes}
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished_at = time.perf_counter()
+        _current_trace.reset(token)
+        _trace_seconds.labels(trace=name).observe(trace.finished_at - trace.started_at)
+
+
+def record_span(name: str, duration: float, started_at: Optional[float] = None, error: Optional[str] = None) -> None:
+    """Record an already-measured stage (e.g. a queue wait) in the metrics and the current trace."""
+    _stage_seconds.labels(stage=name).observe(duration)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, started_at if started_at is not None else time.perf_counter() - duration, duration, error)
+
+
+class span:
+    """Time a block as a named stage: `with span("x"):` or `async with span("x"):`."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._started = 0.0
+
+    def __enter__(self) -> "span":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        error = None
+        if exc_type is not None:
+            error = "cancelled" if exc_type.__name__ == "CancelledError" else exc_type.__name__
+        record_span(self.name, time.perf_counter() - self._started, self._started, error)
+        return False
+
+    async def __aenter__(self) -> "span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        return self.__exit__(exc_type, exc, tb)
+
+
+def traced_send(send_message_func, name: str = "send_reply"):
+    """Wrap an adapter's send function so every reply sent is recorded as a span."""
+    async def _send(*args, **kwargs):
+        async with span(name):
+            return await send_message_func(*args, **kwargs)
+    return _send
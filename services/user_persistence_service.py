@@ -7,6 +7,7 @@ Prevents bot from forgetting user preferences
 
 import config
 import datetime
+from services.async_cache import AsyncTTLCache, MISSING
 from services.api_integrations import get_customer_by_phone, create_customer
 from utils.utils import get_user_state_from_firestore, get_firestore_db
 
@@ -14,8 +15,19 @@ class UserPersistenceService:
     """Manages persistent user data (gender, language) via Firestore"""
 
     def __init__(self):
-        self._gender_cache = {}  # Cache to avoid repeated Firestore calls
-        self._language_cache = {}  # Cache for language preferences
+        max_size = getattr(config, "USER_PREFERENCE_CACHE_MAX_SIZE", 10000)
+        ttl_seconds = getattr(config, "USER_PREFERENCE_CACHE_TTL_SECONDS", 86400)
+        # Cache to avoid repeated Firestore calls; "unknown" is kept briefly so a user without a
+        # gender does not cost a Firestore read and a CRM call on every message
+        self._gender_cache = AsyncTTLCache(
+            "user_gender",
+            max_size=max_size,
+            ttl_seconds=ttl_seconds,
+            negative_ttl_seconds=getattr(config, "USER_PREFERENCE_CACHE_NEGATIVE_TTL_SECONDS", 60),
+            is_negative=lambda gender: gender not in ("male", "female"),
+        )
+        # Cache for language preferences
+        self._language_cache = AsyncTTLCache("user_language", max_size=max_size, ttl_seconds=ttl_seconds)
 
     async def get_user_gender(self, user_id: str, phone: str = None) -> str:
         """
@@ -26,16 +38,15 @@ class UserPersistenceService:
         if user_id in config.user_gender and config.user_gender[user_id] in ["male", "female"]:
             return config.user_gender[user_id]
 
-        # Check cache
-        if user_id in self._gender_cache:
-            return self._gender_cache[user_id]
+        # Check cache; concurrent misses for the same user share one Firestore/API lookup
+        return await self._gender_cache.get_or_load(user_id, lambda: self._load_user_gender(user_id, phone))
 
+    async def _load_user_gender(self, user_id: str, phone: str = None) -> str:
         # Fetch from Firestore first (primary source)
         try:
             user_state = await get_user_state_from_firestore(user_id)
             if user_state and user_state.get("gender") in ["male", "female"]:
                 firestore_gender = user_state["gender"]
-                self._gender_cache[user_id] = firestore_gender
                 config.user_gender[user_id] = firestore_gender
                 print(f"✅ Gender fetched from Firestore for {user_id}: {firestore_gender}")
                 return firestore_gender
@@ -52,8 +63,7 @@ class UserPersistenceService:
                 api_gender = customer_data.get("gender", "").lower()
 
                 if api_gender in ["male", "female"]:
-                    # Update cache and memory
-                    self._gender_cache[user_id] = api_gender
+                    # Update memory (the cache is filled by get_user_gender)
                     config.user_gender[user_id] = api_gender
                     print(f"✅ Gender fetched from API for {user_id}: {api_gender}")
                     return api_gender
@@ -74,7 +84,7 @@ class UserPersistenceService:
             return False
 
         # Update local cache and memory FIRST (always works)
-        self._gender_cache[user_id] = gender
+        self._gender_cache.set(user_id, gender)
         config.user_gender[user_id] = gender
         config.gender_attempts[user_id] = 0  # Reset attempts
 
@@ -156,15 +166,16 @@ class UserPersistenceService:
         Returns: 'ar', 'en', 'fr', or 'franco'
         """
         # Check cache first
-        if user_id in self._language_cache:
-            return self._language_cache[user_id]
+        cached = self._language_cache.get(user_id, MISSING)
+        if cached is not MISSING:
+            return cached
         
         # Check config
         user_data = config.user_data_whatsapp.get(user_id, {})
         lang = user_data.get('user_preferred_lang', 'ar')
         
         # Cache it
-        self._language_cache[user_id] = lang
+        self._language_cache.set(user_id, lang)
         return lang
     
     def save_user_language(self, user_id: str, language: str) -> None:
@@ -177,8 +188,8 @@ class UserPersistenceService:
             return
 
         # Always update language - users can switch languages mid-conversation
-        previous_lang = self._language_cache.get(user_id)
-        self._language_cache[user_id] = language
+        previous_lang = self._language_cache.get(user_id, count=False)
+        self._language_cache.set(user_id, language)
 
         if user_id not in config.user_data_whatsapp:
             config.user_data_whatsapp[user_id] = {}
@@ -192,8 +203,8 @@ class UserPersistenceService:
     def clear_cache(self, user_id: str = None) -> None:
         """Clear cache for a specific user or all users"""
         if user_id:
-            self._gender_cache.pop(user_id, None)
-            self._language_cache.pop(user_id, None)
+            self._gender_cache.pop(user_id)
+            self._language_cache.pop(user_id)
         else:
             self._gender_cache.clear()
             self._language_cache.clear()
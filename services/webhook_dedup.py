@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Webhook deduplication.
+
+Qiscus/MontyMobile retry webhooks (sometimes 15+ seconds apart) and a retry may land on the
+other gunicorn worker. `webhook_deduplicator.is_duplicate(provider, message_id)` claims the
+message id for the dedup window (`release()` drops the claim when the message could not be queued):
+
+- Redis (REDIS_URL configured): `SET key NX EX window`, shared by all workers.
+- Otherwise (or if Redis errors): a process-local time-bucketed ring, O(1) amortized expiry.
+
+Per-provider received/duplicate counts are kept for `stats()` and exported to Prometheus.
+"""
+
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import config
+from services.metrics import counter
+
+_webhook_dedup_total = counter(
+    "linasbot_webhook_dedup_total",
+    "Webhooks checked for duplicates, by provider and result",
+    ("provider", "result"),
+)
+
+
+class TimeBucketedSeenSet:
+    """
+    Recently seen keys grouped into fixed-width time buckets kept in a ring (deque).
+    Expiring drops whole buckets from the old end, so each key is touched once on the way out
+    instead of scanning the whole cache on every webhook.
+    """
+
+    def __init__(self, window_seconds: float, bucket_seconds: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self._clock = clock
+        self._seen: Dict[str, float] = {}
+        self._buckets: deque = deque()  # (bucket_index, [keys])
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        oldest_live = int((now - self.window_seconds) // self.bucket_seconds)
+        while self._buckets and self._buckets[0][0] < oldest_live:
+            _, keys = self._buckets.popleft()
+            for key in keys:
+                seen_at = self._seen.get(key)
+                if seen_at is not None and now - seen_at > self.window_seconds:
+                    del self._seen[key]
+
+    def claim(self, key: str) -> Optional[float]:
+        """Record `key`; returns None if new, else seconds since it was first seen."""
+        now = self._clock()
+        self._expire(now)
+        seen_at = self._seen.get(key)
+        if seen_at is not None and now - seen_at <= self.window_seconds:
+            return now - seen_at
+        self._seen[key] = now
+        bucket = int(now // self.bucket_seconds)
+        if self._buckets and self._buckets[-1][0] == bucket:
+            self._buckets[-1][1].append(key)
+        else:
+            self._buckets.append((bucket, [key]))
+        return None
+
+    def discard(self, key: str) -> None:
+        """Forget `key` (its bucket entry is skipped on expiry)."""
+        self._seen.pop(key, None)
+
+
+class WebhookDeduplicator:
+    def __init__(self, window_seconds: Optional[int] = None, redis_client: Any = None):
+        self.window_seconds = window_seconds or getattr(config, "WEBHOOK_DEDUP_WINDOW_SECONDS", 60)
+        self._redis = redis_client
+        self._local = TimeBucketedSeenSet(self.window_seconds)
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def _redis_client(self):
+        if self._redis is None:
+            from services.redis_client import get_redis
+            return get_redis()
+        return self._redis
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis_client() is not None else "memory"
+
+    def _key(self, provider: str, message_id: str) -> str:
+        prefix = getattr(config, "STATE_STORE_KEY_PREFIX", "linasbot")
+        return f"{prefix}:webhook:{provider}:{message_id}"
+
+    async def _claim_shared(self, client, key: str) -> Optional[float]:
+        now = time.time()
+        if await client.set(key, f"{now:.3f}", nx=True, ex=self.window_seconds):
+            return None
+        try:
+            return max(0.0, now - float(await client.get(key) or now))
+        except (TypeError, ValueError):
+            return 0.0
+
+    async def is_duplicate(self, provider: str, message_id: str) -> Optional[float]:
+        """Returns None for a first delivery, else seconds since the original was received."""
+        provider = provider or "unknown"
+        if not message_id:
+            return None
+        key = self._key(provider, message_id)
+        client = self._redis_client()
+        age = None
+        if client is not None:
+            try:
+                age = await self._claim_shared(client, key)
+            except Exception as e:
+                print(f"⚠️ Redis webhook dedup failed, using local cache: {e}")
+                age = self._local.claim(key)
+        else:
+            age = self._local.claim(key)
+
+        counts = self._counts.setdefault(provider, {"received": 0, "duplicates": 0})
+        counts["received"] += 1
+        if age is not None:
+            counts["duplicates"] += 1
+        _webhook_dedup_total.labels(provider=provider, result="duplicate" if age is not None else "new").inc()
+        return age
+
+    async def release(self, provider: str, message_id: str) -> None:
+        """Drop the claim made by is_duplicate() so a retry of a message we did not process is accepted."""
+        if not message_id:
+            return
+        key = self._key(provider or "unknown", message_id)
+        self._local.discard(key)
+        client = self._redis_client()
+        if client is not None:
+            try:
+                await client.delete(key)
+            except Exception as e:
+                print(f"⚠️ Redis webhook dedup release failed for {message_id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        providers = {
+            provider: {
+                **counts,
+                "duplicate_rate": round(counts["duplicates"] / counts["received"], 4) if counts["received"] else 0.0,
+            }
+            for provider, counts in self._counts.items()
+        }
+        return {
+            "backend": self.backend,
+            "window_seconds": self.window_seconds,
+            "local_entries": len(self._local),
+            "providers": providers,
+        }
+
+
+# Global instance
+webhook_deduplicator = WebhookDeduplicator()
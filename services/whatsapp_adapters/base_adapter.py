@@ -4,7 +4,7 @@ Defines the common interface for all WhatsApp providers (Meta, 360Dialog, etc.)
 """
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
-import httpx
+from services.http_clients import get_http_client
 
 class WhatsAppAdapter(ABC):
     """Base class for WhatsApp API adapters"""
@@ -12,7 +12,7 @@ class WhatsAppAdapter(ABC):
     def __init__(self, api_token: str, phone_number_id: str = None):
         self.api_token = api_token
         self.phone_number_id = phone_number_id
-        self.client = httpx.AsyncClient()
+        self.client = get_http_client("whatsapp")  # shared keep-alive pool
     
     @abstractmethod
     async def send_text_message(self, to_number: str, message: str) -> Dict[str, Any]:
@@ -40,5 +40,5 @@ class WhatsAppAdapter(ABC):
         pass
     
     async def close(self):
-        """Close HTTP client"""
-        await self.client.aclose()
\ No newline at end of file
+        """Nothing to close: the shared HTTP client is closed on app shutdown"""
+        pass
\ No newline at end of file
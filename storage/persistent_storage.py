@@ -23,6 +23,7 @@ QA_DIR = _DATA_ROOT / "qa"
 CONTENT_DIR = _DATA_ROOT / "content"
 SETTINGS_DIR = _DATA_ROOT / "settings"
 SMART_MESSAGING_DIR = _DATA_ROOT / "smart_messaging"
+LIVE_CHAT_DIR = _DATA_ROOT / "live_chat"
 
 # QA
 QA_PAIRS_FILE = QA_DIR / "qa_pairs.jsonl"
@@ -46,7 +47,8 @@ ACTIVITY_FLOW_FILE = LOGS_DIR / "activity_flow.jsonl"
 # Smart Messaging
 MESSAGE_TEMPLATES_FILE = SMART_MESSAGING_DIR / "message_templates.json"
 MESSAGE_TEMPLATES_LOCK_FILE = SMART_MESSAGING_DIR / ".message_templates.lock"
-SENT_SMART_MESSAGES_FILE = SMART_MESSAGING_DIR / "sent_smart_messages.json"
+SENT_SMART_MESSAGES_FILE = SMART_MESSAGING_DIR / "sent_smart_messages.json"  # legacy, imported into the DB below
+SCHEDULED_MESSAGES_DB_FILE = SMART_MESSAGING_DIR / "scheduled_messages.sqlite3"
 SERVICE_TEMPLATE_MAPPING_FILE = SMART_MESSAGING_DIR / "service_template_mapping.json"
 MESSAGE_PREVIEW_QUEUE_FILE = SMART_MESSAGING_DIR / "message_preview_queue.json"
 DAILY_TEMPLATE_DISPATCH_STATE_FILE = SMART_MESSAGING_DIR / "daily_template_dispatch_state.json"
@@ -56,6 +58,9 @@ TEMPLATE_ACTIVATION_STATUS_FILE = SMART_MESSAGING_DIR / "template_activation_sta
 SCHEDULED_MESSAGES_FILE = SMART_MESSAGING_DIR / "scheduled_messages_to_be_sent.json"
 DRY_RUN_MESSAGES_FILE = SMART_MESSAGING_DIR / "dry_run_messages.jsonl"
 
+# Live Chat (materialized chat list index, rebuildable from Firestore)
+CHAT_INDEX_DB_FILE = LIVE_CHAT_DIR / "chat_index.sqlite3"
+
 
 def get_qa_path(relative: str) -> Path:
     """Get path under qa/."""
@@ -79,7 +84,7 @@ def get_smart_messaging_path(relative: str) -> Path:
 
 def ensure_dirs():
     """Create all persistent data directories."""
-    for d in (QA_DIR, CONTENT_DIR, SETTINGS_DIR, SMART_MESSAGING_DIR, LOGS_DIR,
+    for d in (QA_DIR, CONTENT_DIR, SETTINGS_DIR, SMART_MESSAGING_DIR, LOGS_DIR, LIVE_CHAT_DIR,
               KNOWLEDGE_FILES_DIR, STYLE_FILES_DIR, PRICE_FILES_DIR):
         d.mkdir(parents=True, exist_ok=True)
 
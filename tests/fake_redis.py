@@ -0,0 +1,155 @@
+"""Minimal in-process stand-in for redis.asyncio.Redis used by the tests (string, list and pub/sub commands).
+
+Lua scripts are not interpreted: tests register a Python equivalent in `scripts`.
+"""
+
+import asyncio
+import time
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        results = []
+        for method, args, kwargs in self._commands:
+            results.append(await method(*args, **kwargs))
+        self._commands = []
+        return results
+
+
+class FakePubSub:
+    def __init__(self, client):
+        self._client = client
+        self._channels = set()
+        self._queue = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self._channels.update(channels)
+        self._client._subscribers.add(self)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self._client._subscribers.discard(self)
+
+
+class FakeRedis:
+    def __init__(self):
+        self._subscribers = set()
+        self._data = {}
+        self._expires = {}
+        self.scripts = {}
+        self.now = time.monotonic
+
+    def _alive(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= self.now():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    async def get(self, key):
+        return self._data[key] if self._alive(key) else None
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self._data[key] = value if isinstance(value, str) else str(value)
+        self._expires.pop(key, None)
+        if ex:
+            self._expires[key] = self.now() + ex
+        elif px:
+            self._expires[key] = self.now() + px / 1000.0
+        return True
+
+    async def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+    async def exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    async def expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self._expires[key] = self.now() + seconds
+        return True
+
+    async def ttl(self, key):
+        if not self._alive(key):
+            return -2
+        expires_at = self._expires.get(key)
+        return -1 if expires_at is None else int(expires_at - self.now())
+
+    async def incr(self, key, amount=1):
+        value = int(await self.get(key) or 0) + amount
+        self._data[key] = str(value)
+        return value
+
+    async def rpush(self, key, *values):
+        if not self._alive(key):
+            self._data[key] = []
+        self._data[key].extend(str(value) for value in values)
+        return len(self._data[key])
+
+    async def rpushx(self, key, *values):
+        if not self._alive(key):
+            return 0
+        return await self.rpush(key, *values)
+
+    async def lrange(self, key, start, end):
+        if not self._alive(key):
+            return []
+        items = self._data[key]
+        start = max(len(items) + start, 0) if start < 0 else start
+        end = len(items) + end if end < 0 else end
+        return items[start:end + 1]
+
+    async def ltrim(self, key, start, end):
+        if self._alive(key):
+            self._data[key] = await self.lrange(key, start, end)
+            if not self._data[key]:
+                await self.delete(key)
+        return True
+
+    async def eval(self, script, numkeys, *args):
+        return await self.scripts[script](self, list(args[:numkeys]), list(args[numkeys:]))
+
+    async def publish(self, channel, message):
+        receivers = [sub for sub in self._subscribers if channel in sub._channels]
+        for sub in receivers:
+            sub._queue.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(receivers)
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def close(self):
+        pass
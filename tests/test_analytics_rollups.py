@@ -0,0 +1,107 @@
+import datetime
+import json
+
+from services.analytics_events import AnalyticsEvents
+from services.analytics_rollups import AnalyticsRollups
+
+
+def _analytics(tmp_path):
+    analytics = AnalyticsEvents()
+    analytics.events_file = str(tmp_path / "events.jsonl")
+    analytics.rollups = AnalyticsRollups(analytics, state_file=str(tmp_path / "rollups.json"))
+    return analytics
+
+
+def _write(analytics, *events):
+    with open(analytics.events_file, "a", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def _message(user_id, at, source="user", **extra):
+    return {"type": "message", "source": source, "msg_type": "text", "user_id": user_id,
+            "language": "en", "timestamp": at.isoformat(), **extra}
+
+
+def test_closed_days_are_persisted_and_today_is_read_incrementally(tmp_path):
+    analytics = _analytics(tmp_path)
+    today = datetime.date.today()
+    day_ago = datetime.datetime.combine(today - datetime.timedelta(days=1), datetime.time(10))
+    old = datetime.datetime.combine(today - datetime.timedelta(days=30), datetime.time(10))
+    this_morning = datetime.datetime.combine(today, datetime.time(0, 0, 1))
+    _write(
+        analytics,
+        _message("+961 111", old),
+        _message("961222", day_ago),
+        _message("961222", day_ago, source="bot", tokens=100, cost_usd=0.01, response_time_ms=800, model="gpt-4o"),
+        {"type": "service_request", "user_id": "961222", "service": "laser", "timestamp": day_ago.isoformat()},
+        {"type": "service_request", "user_id": "961111", "service": "laser", "timestamp": this_morning.isoformat()},
+    )
+
+    result = analytics.aggregate_analytics(days=7)
+    assert result["overview"]["total_messages"] == 2
+    assert result["overview"]["total_users"] == 2
+    # 961111 was first seen 30 days ago, so only 961222 is new in this window
+    assert result["new_clients"]["total_new_clients"] == 1
+    assert result["services_discussed_today"]["total_mentions"] == 1
+    assert result["performance"]["avg_response_time_ms"] == 800
+    assert result["conversation_types"]["exclusive_counts"]["conversation_2"] == 2
+
+    state = json.loads((tmp_path / "rollups.json").read_text())
+    assert sorted(state["days"]) == [(today - datetime.timedelta(days=30)).isoformat(), day_ago.date().isoformat()]
+    assert state["first_seen"]["961111"] == old.isoformat()
+
+    # Only the appended line is read; the closed days come from the rollups
+    _write(analytics, _message("961333", this_morning))
+    offset = analytics.rollups.offset
+    result = analytics.aggregate_analytics(days=7)
+    assert result["overview"]["total_messages"] == 3
+    assert result["new_clients"]["total_new_clients"] == 2
+    assert analytics.rollups.offset == offset
+    assert analytics.rollups.stats()["tail_events"] == 2
+
+    # Another process picks up the persisted rollups, and a rebuild gives the same numbers
+    other = _analytics(tmp_path)
+    assert other.aggregate_analytics(days=7)["overview"] == result["overview"]
+    assert other.rollups.rebuild()["closed_days"] == 2
+    assert other.aggregate_analytics(days=30)["overview"]["total_users"] == 3
+
+
+def test_tail_is_folded_when_the_day_is_over(tmp_path):
+    analytics = _analytics(tmp_path)
+    day = datetime.date(2026, 3, 1)
+    _write(analytics, _message("961222", datetime.datetime.combine(day, datetime.time(23, 50))))
+
+    totals, _ = analytics.rollups.collect(day, today=day)
+    assert totals["messages"] == 1 and analytics.rollups.offset == 0
+
+    totals, first_seen = analytics.rollups.collect(day, today=day + datetime.timedelta(days=1))
+    assert totals["messages"] == 1
+    assert list(first_seen) == ["961222"]
+    assert analytics.rollups.stats()["tail_events"] == 0
+    assert analytics.rollups.offset == (tmp_path / "events.jsonl").stat().st_size
+
+
+def test_late_batch_from_before_midnight_is_folded_with_its_day(tmp_path):
+    analytics = _analytics(tmp_path)
+    day = datetime.date(2026, 3, 1)
+    next_day = day + datetime.timedelta(days=1)
+    at = lambda d, *hms: datetime.datetime.combine(d, datetime.time(*hms))
+    # Worker B's batch lands first; worker A flushes its pre-midnight batch a moment later
+    _write(analytics, _message("961222", at(day, 23, 59, 50)), _message("961333", at(next_day, 0, 0, 1)))
+
+    analytics.rollups.collect(day, today=next_day, now=at(next_day, 0, 0, 2))
+    assert analytics.rollups.stats()["closed_days"] == 0
+
+    _write(analytics, _message("961222", at(day, 23, 59, 58), source="bot"))
+    _write(analytics, _message("961333", at(next_day, 0, 5)))
+    totals, _ = analytics.rollups.collect(day, today=next_day, now=at(next_day, 0, 5))
+
+    assert totals["messages"] == 4
+    assert analytics.rollups.stats()["tail_events"] == 2
+    stored = analytics.rollups.days[day.isoformat()]
+    assert stored["conversation_stages"] == analytics._conversation_stage_counts([
+        _message("961222", at(day, 23, 59, 50)),
+        _message("961222", at(day, 23, 59, 58), source="bot"),
+    ])
+    assert analytics.rollups.offset == len(json.dumps(_message("961222", at(day, 23, 59, 50))).encode()) + 1
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+
+from services.analytics_writer import AnalyticsEventWriter
+
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_events_are_written_in_batches_and_flushed_on_close(tmp_path):
+    path = tmp_path / "events.jsonl"
+    writer = AnalyticsEventWriter(str(path), batch_size=3, flush_interval_seconds=60, fsync_interval_seconds=60)
+
+    writer.write({"n": 1})
+    writer.write({"n": 2})
+    assert not path.exists()
+
+    writer.write({"n": 3})  # batch size reached: the writer thread wakes up
+    deadline = time.monotonic() + 2
+    while writer.stats()["written"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [event["n"] for event in _lines(path)] == [1, 2, 3]
+
+    writer.write({"n": 4})
+    writer.close()
+    assert [event["n"] for event in _lines(path)] == [1, 2, 3, 4]
+
+    writer.write({"n": 5})  # after shutdown: written synchronously, counted as late
+    stats = writer.stats()
+    assert [event["n"] for event in _lines(path)] == [1, 2, 3, 4, 5]
+    assert stats["late"] == 1 and stats["written"] == 5 and stats["fsyncs"] >= 1
+
+
+def test_full_buffer_drops_and_concurrent_writers_keep_lines_whole(tmp_path):
+    path = tmp_path / "events.jsonl"
+    full = AnalyticsEventWriter(str(path), batch_size=100, flush_interval_seconds=60, max_pending=2)
+    for n in range(4):
+        full.write({"n": n})
+    assert full.stats()["dropped"] == 2
+    full.close()
+
+    writers = [AnalyticsEventWriter(str(path), batch_size=50, flush_interval_seconds=0.01) for _ in range(3)]
+
+    def produce(writer, worker):
+        for n in range(200):
+            writer.write({"worker": worker, "n": n, "text": "x" * 200})
+
+    threads = [threading.Thread(target=produce, args=(writer, i)) for i, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in writers:
+        writer.close()
+
+    events = _lines(path)[2:]
+    assert len(events) == 600
+    for worker in range(3):
+        assert [e["n"] for e in events if e["worker"] == worker] == list(range(200))
+
+
+def test_flushes_from_several_threads_keep_batches_in_order(tmp_path):
+    path = tmp_path / "events.jsonl"
+    writer = AnalyticsEventWriter(str(path), batch_size=5, flush_interval_seconds=0.001, fsync_interval_seconds=60)
+    stop = threading.Event()
+
+    def flush_repeatedly():  # e.g. aggregate_analytics flushing while the writer thread runs
+        while not stop.is_set():
+            writer.flush()
+
+    flushers = [threading.Thread(target=flush_repeatedly) for _ in range(3)]
+    for thread in flushers:
+        thread.start()
+    for n in range(2000):
+        writer.write({"n": n})
+    stop.set()
+    for thread in flushers:
+        thread.join()
+    writer.close()
+
+    assert [event["n"] for event in _lines(path)] == list(range(2000))
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from services.async_cache import AsyncTTLCache, MISSING
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_negative_ttl_and_lru_eviction():
+    clock = _Clock()
+    cache = AsyncTTLCache(
+        "test", max_size=2, ttl_seconds=100, negative_ttl_seconds=10,
+        is_negative=lambda value: value is None, clock=clock,
+    )
+    cache.set("a", 1)
+    cache.set("missing", None)
+    assert cache.get("missing", MISSING) is None
+
+    clock.now = 11  # negative entry expired, positive one still fresh
+    assert cache.get("missing", MISSING) is MISSING
+    assert cache.get("a") == 1
+
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now the most recently used
+    cache.set("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache
+
+    stats = cache.stats()
+    assert stats["size"] == 2 and stats["evicted"] == 1 and stats["expired"] == 1
+
+
+def test_concurrent_misses_share_one_load_and_errors_are_not_cached():
+    async def scenario():
+        cache = AsyncTTLCache("test", max_size=10, ttl_seconds=60)
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return {"exists": True}
+
+        results = await asyncio.gather(*(cache.get_or_load("+96170000000", load) for _ in range(5)))
+        assert len(calls) == 1 and all(r == {"exists": True} for r in results)
+        assert await cache.get_or_load("+96170000000", load) == {"exists": True}
+        assert len(calls) == 1
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("CRM down")
+
+        outcomes = await asyncio.gather(*(cache.get_or_load("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(o, RuntimeError) for o in outcomes) and len(calls) == 2
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("k", fail)
+        assert len(calls) == 3
+
+        stats = cache.stats()
+        assert (stats["misses"], stats["coalesced"], stats["hits"]) == (3, 6, 1)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_load_running_and_rejected_values_are_not_cached():
+    async def scenario():
+        cache = AsyncTTLCache("test", ttl_seconds=60, cacheable=lambda value: value.get("success"))
+        calls = []
+
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return {"success": len(calls) > 1}
+
+        first = asyncio.create_task(cache.get_or_load("k", load))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_load("k", load))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == {"success": False}
+        assert "k" not in cache and not cache.loading("k")
+
+        assert await cache.get_or_load("k", load) == {"success": True}
+        assert cache.get("k") == {"success": True} and len(calls) == 2
+
+    asyncio.run(scenario())
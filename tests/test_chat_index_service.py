@@ -0,0 +1,112 @@
+import datetime
+import time
+
+import pytest
+
+from services.chat_index_service import ChatIndexService
+
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ChatIndexService(db_path=tmp_path / "chat_index.sqlite3")
+
+
+def _message(text, minutes_ago, role="user", source=None):
+    metadata = {"source": source} if source else {}
+    return {
+        "role": role,
+        "text": text,
+        "timestamp": datetime.datetime.now(UTC) - datetime.timedelta(minutes=minutes_ago),
+        "metadata": metadata,
+    }
+
+
+def _customer(name, phone):
+    return {"name": name, "phone_full": phone, "phone_clean": phone.lstrip("+")[3:]}
+
+
+def test_record_message_keeps_latest_conversation_per_user(index):
+    index.record_message("u1", "c1", _message("hi", 10), customer_info=_customer("Rana", "+96170111222"),
+                         conversation={"status": "active"}, new_conversation=True)
+    index.record_message("u1", "c1", _message("reply", 9, role="ai"), conversation={"status": "active"})
+    index.record_message("u1", "c2", _message("again", 1), conversation={"status": "active"}, new_conversation=True)
+
+    rows, total = index.query_unified("", time.time() - 7200, 10, 0)
+    assert total == 1
+    row = rows[0]
+    assert row["conversation_id"] == "c2"
+    assert row["last_message_content"] == "again"
+    assert row["message_count"] == 1
+    assert row["total_message_count"] == 3
+    assert row["conversation_count"] == 2
+    assert row["user_name"] == "Rana"
+
+
+def test_smart_messages_are_not_indexed(index):
+    assert not index.record_message("u1", "c1", _message("promo", 1, role="ai", source="smart_message"))
+    assert index.query_unified("", 0, 10, 0) == ([], 0)
+
+
+def test_unified_orders_live_first_and_paginates(index):
+    index.record_message("old", "c1", _message("old", 60 * 5), conversation={})
+    index.record_message("resolved", "c2", _message("done", 1), conversation={"status": "resolved"})
+    index.record_message("live", "c3", _message("now", 5), conversation={})
+
+    rows, total = index.query_unified("", time.time() - 7200, 2, 0)
+    assert total == 3
+    assert [r["user_id"] for r in rows] == ["live", "resolved"]
+    assert rows[0]["is_live"] and not rows[1]["is_live"]
+
+    rows, _ = index.query_unified("", time.time() - 7200, 2, 2)
+    assert [r["user_id"] for r in rows] == ["old"]
+
+
+def test_takeover_state_moves_chat_between_lists(index):
+    index.record_message("u1", "c1", _message("help", 1), conversation={})
+    assert index.update_conversation_state("u1", "c1", human_takeover_active=True)
+
+    assert [r["user_id"] for r in index.query_waiting()] == ["u1"]
+    assert index.query_unified("", 0, 10, 0)[1] == 0
+
+    index.update_conversation_state("u1", "c1", human_takeover_active=True, operator_id="op1", status="human")
+    assert index.query_waiting() == []
+    assert [r["user_id"] for r in index.query_active(time.time() - 7200)] == ["u1"]
+
+    # Updates for another conversation of the same user do not touch the row
+    assert not index.update_conversation_state("u1", "other", status="resolved")
+    index.update_conversation_state("u1", "c1", status="resolved", human_takeover_active=False, operator_id=None)
+    assert index.query_active(time.time() - 7200) == []
+
+
+def test_search_matches_name_and_phone_variants(index):
+    index.record_message("u1", "c1", _message("hi", 1), customer_info=_customer("Rana", "+96170111222"), conversation={})
+    index.record_message("u2", "c2", _message("hi", 1), customer_info=_customer("Maya", "+96171333444"), conversation={})
+
+    assert [r["user_id"] for r in index.query_unified("rana", 0, 10, 0)[0]] == ["u1"]
+    assert [r["user_id"] for r in index.query_unified("70111", 0, 10, 0)[0]] == ["u1"]
+    assert [r["user_id"] for r in index.query_history("333444", None, 10, 0)[0]] == ["u2"]
+    assert index.query_unified("100%", 0, 10, 0)[1] == 0
+
+
+def test_rebuild_does_not_overwrite_newer_incremental_rows(index):
+    built_after = time.time()
+    index.record_message("u1", "c2", _message("fresh", 0), conversation={})
+    stale = index.build_row(
+        {
+            "user_id": "u1",
+            "conversation_id": "c1",
+            "last_message_content": "stale",
+            "last_activity": time.time() - 3600,
+        },
+        total_message_count=1,
+        conversation_count=1,
+    )
+    assert index.replace_rows([stale], built_after=built_after) == 0
+    index.mark_built(1)
+
+    assert index.is_ready()
+    rows, _ = index.query_history("", None, 10, 0)
+    assert rows[0]["last_message_content"] == "fresh"
@@ -0,0 +1,88 @@
+import asyncio
+
+from services.conversation_history_cache import ConversationHistoryCache
+from tests.fake_redis import FakeRedis
+
+
+def _msg(index, role="user"):
+    return {"role": role, "text": f"text {index}", "metadata": {"image_data": "x" * 100}}
+
+
+def test_ring_keeps_last_messages_and_only_appends_to_cached_conversations():
+    async def scenario():
+        cache = ConversationHistoryCache(capacity=3, max_conversations=10)
+        await cache.append("c1", _msg(0))  # not cached yet: nothing to append to
+        assert await cache.get("c1", 3) is None
+
+        assert await cache.fill("c1", [_msg(i) for i in range(5)], await cache.generation("c1"))
+        for index in range(5, 7):
+            await cache.append("c1", _msg(index, role="ai"))
+        history = await cache.get("c1", 2)
+        assert history == [{"role": "ai", "text": "text 5"}, {"role": "ai", "text": "text 6"}]
+        assert len(await cache.get("c1", 3)) == 3
+        # Asking for more than the ring holds must go to Firestore
+        assert await cache.get("c1", 4) is None
+
+    asyncio.run(scenario())
+
+
+def test_fill_is_discarded_when_a_save_raced_with_it():
+    async def scenario():
+        cache = ConversationHistoryCache(capacity=5)
+        generation = await cache.generation("c1")
+        await cache.append("c1", _msg(1))  # saved while Firestore was being read
+        assert not await cache.fill("c1", [_msg(0)], generation)
+        assert await cache.get("c1", 5) is None
+        assert await cache.fill("c1", [_msg(0), _msg(1)], await cache.generation("c1"))
+
+    asyncio.run(scenario())
+
+
+def test_lru_bounds_cached_conversations():
+    async def scenario():
+        cache = ConversationHistoryCache(capacity=5, max_conversations=2)
+        for conv in ("a", "b"):
+            await cache.fill(conv, [_msg(0)], await cache.generation(conv))
+        await cache.get("a", 1)
+        await cache.fill("c", [_msg(0)], await cache.generation("c"))
+        assert await cache.get("b", 1) is None
+        assert await cache.get("a", 1) is not None
+
+    asyncio.run(scenario())
+
+
+def test_memory_ring_is_disabled_with_several_workers():
+    async def scenario():
+        cache = ConversationHistoryCache(capacity=5, workers=2)
+        assert not await cache.fill("c1", [_msg(0)], await cache.generation("c1"))
+        await cache.append("c1", _msg(1))
+        assert await cache.get("c1", 1) is None
+        assert cache.stats()["backend"] == "disabled"
+
+        shared = ConversationHistoryCache(capacity=5, workers=2, redis_client=FakeRedis())
+        assert await shared.fill("c1", [_msg(0)], await shared.generation("c1"))
+        assert await shared.get("c1", 1) == [{"role": "user", "text": "text 0"}]
+
+    asyncio.run(scenario())
+
+
+def test_redis_ring_is_shared_between_workers():
+    async def scenario():
+        redis = FakeRedis()
+        worker_a = ConversationHistoryCache(capacity=3, redis_client=redis)
+        worker_b = ConversationHistoryCache(capacity=3, redis_client=redis)
+
+        await worker_a.start("c1", _msg(0))
+        for index in range(1, 4):
+            await worker_b.append("c1", _msg(index))
+        history = await worker_a.get("c1", 3)
+        assert [m["text"] for m in history] == ["text 1", "text 2", "text 3"]
+
+        generation = await worker_a.generation("c2")
+        await worker_b.append("c2", _msg(0))
+        assert not await worker_a.fill("c2", [_msg(0)], generation)
+
+        await worker_b.invalidate("c1")
+        assert await worker_a.get("c1", 3) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,309 @@
+import asyncio
+import datetime
+import itertools
+
+import pytest
+from google.api_core import exceptions as gcp_exceptions
+from google.cloud import firestore
+
+import config
+from services import conversation_store
+
+
+class _Snapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Doc:
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return _Collection(self._store, f"{self.path}/{name}")
+
+    def get(self, transaction=None):
+        return _Snapshot(self, self._store.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        base = dict(self._store.docs.get(self.path) or {}) if merge else {}
+        base.update(data)
+        self._store.docs[self.path] = base
+
+    def create(self, data):
+        if self.path in self._store.docs:
+            raise gcp_exceptions.AlreadyExists(self.path)
+        self._store.docs[self.path] = dict(data)
+
+    def update(self, data):
+        current = dict(self._store.docs[self.path])
+        for key, value in data.items():
+            if value is firestore.DELETE_FIELD:
+                current.pop(key, None)
+            elif isinstance(value, firestore.Increment):
+                current[key] = (current.get(key) or 0) + value.value
+            else:
+                current[key] = value
+        self._store.docs[self.path] = current
+
+
+class _Query:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def order_by(self, field, direction=None):
+        reverse = direction == firestore.Query.DESCENDING
+        return _Query(sorted(self._docs, key=lambda d: d.to_dict()[field], reverse=reverse))
+
+    def limit(self, count):
+        return _Query(self._docs[:count])
+
+    def where(self, field, op, value):
+        return _Query([d for d in self._docs if d.to_dict().get(field) == value])
+
+    def stream(self):
+        return list(self._docs)
+
+
+class _Collection(_Query):
+    _ids = itertools.count(1)
+
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+
+    @property
+    def _docs(self):
+        prefix = self.path + "/"
+        return [
+            _Doc(self._store, path).get()
+            for path in self._store.docs
+            if path.startswith(prefix) and "/" not in path[len(prefix):]
+        ]
+
+    def document(self, doc_id=None):
+        return _Doc(self._store, f"{self.path}/{doc_id or 'auto%d' % next(self._ids)}")
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return None, ref
+
+
+class _Batch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def create(self, ref, data):
+        self._ops.append(lambda: ref.create(data))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def commit(self):
+        for op in self._ops:
+            op()
+
+
+def _run_in_transaction(db, apply):
+    # Single-threaded stand-in: buffered writes are committed once `apply` returns
+    transaction = _Batch()
+    result = apply(transaction)
+    transaction.commit()
+    return result
+
+
+class _FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+
+    def batch(self):
+        return _Batch()
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = _FakeFirestore()
+    monkeypatch.setattr(conversation_store, "_get_db", lambda: db)
+    monkeypatch.setattr(conversation_store, "_run_in_transaction", _run_in_transaction)
+    monkeypatch.setattr(config, "CONVERSATION_STORAGE_MODE", "subcollection")
+    return db
+
+
+def _message(index, role="user", source=None):
+    metadata = {"message_id": f"m{index}"}
+    if source:
+        metadata["source"] = source
+    return {
+        "role": role,
+        "text": f"text {index}",
+        "timestamp": datetime.datetime(2026, 3, 1, 10, 0, index, tzinfo=datetime.timezone.utc),
+        "message_id": f"m{index}",
+        "metadata": metadata,
+    }
+
+
+def test_append_is_single_message_write_with_header_counters(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {"status": "active"}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+
+    for index in range(1, 30):
+        header = conv_ref.get().to_dict()
+        total = asyncio.run(conversation_store.append_message(conv_ref, header, _message(index), {}))
+        assert total == index + 1
+
+    header = conv_ref.get().to_dict()
+    assert "messages" not in header
+    assert header["message_count"] == 30
+    assert len(header["recent_messages"]) == conversation_store.RECENT_MESSAGES_LIMIT
+    assert header["last_visible_message"]["message_id"] == "m29"
+
+    messages = asyncio.run(conversation_store.load_conversation_messages(conv_ref, header))
+    assert [m["message_id"] for m in messages] == [f"m{i}" for i in range(30)]
+
+    recent = asyncio.run(conversation_store.load_recent_messages(conv_ref, header, 25))
+    assert [m["message_id"] for m in recent] == [f"m{i}" for i in range(5, 30)]
+
+
+def test_appends_from_a_stale_header_keep_each_others_tail(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+
+    stale = conv_ref.get().to_dict()  # both writers read the header before either appended
+    assert asyncio.run(conversation_store.append_message(conv_ref, stale, _message(1), {})) == 2
+    assert asyncio.run(conversation_store.append_message(conv_ref, stale, _message(2), {})) == 3
+
+    header = conv_ref.get().to_dict()
+    assert [m["message_id"] for m in header["recent_messages"]] == ["m0", "m1", "m2"]
+    assert header["message_count"] == 3
+
+
+def test_duplicate_message_id_is_skipped(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+
+    header = conv_ref.get().to_dict()
+    assert asyncio.run(conversation_store.append_message(conv_ref, header, _message(0), {})) is None
+    assert conv_ref.get().to_dict()["message_count"] == 1
+
+
+def test_smart_messages_do_not_count_as_visible(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+    header = conv_ref.get().to_dict()
+    asyncio.run(conversation_store.append_message(conv_ref, header, _message(1, role="ai", source="smart_message"), {}))
+
+    header = conv_ref.get().to_dict()
+    assert header["message_count"] == 2
+    assert header["visible_message_count"] == 1
+    assert header["last_visible_message"]["message_id"] == "m0"
+
+
+def test_legacy_array_document_is_migrated_on_append(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_ref = conversations.document("legacy")
+    legacy_messages = [_message(i) for i in range(3)]
+    legacy_messages[1].pop("message_id")
+    legacy_messages[1]["metadata"] = {}
+    conv_ref.set({"status": "active", "messages": legacy_messages})
+
+    header = conv_ref.get().to_dict()
+    total = asyncio.run(conversation_store.append_message(conv_ref, header, _message(3), {"status": "active"}))
+    assert total == 4
+
+    header = conv_ref.get().to_dict()
+    assert conversation_store.is_subcollection_layout(header)
+    assert "messages" not in header
+    messages = asyncio.run(conversation_store.load_conversation_messages(conv_ref, header))
+    assert [m["text"] for m in messages] == [f"text {i}" for i in range(4)]
+
+
+def test_late_migration_does_not_clobber_an_already_migrated_header(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_ref = conversations.document("legacy")
+    conv_ref.set({"status": "active", "messages": [_message(i) for i in range(3)]})
+    stale = conv_ref.get().to_dict()  # read by a second worker before the first one migrated
+
+    assert asyncio.run(conversation_store.append_message(conv_ref, stale, _message(3), {})) == 4
+    header = asyncio.run(conversation_store.migrate_conversation(conv_ref, stale))
+
+    assert header["message_count"] == 4
+    stored = conv_ref.get().to_dict()
+    assert stored["message_count"] == 4 and stored["recent_messages"][-1]["message_id"] == "m3"
+
+
+def test_update_message_edits_subcollection_and_header_tail(fake_db):
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+    header = conv_ref.get().to_dict()
+
+    def _select(messages):
+        for i, msg in enumerate(messages):
+            if msg.get("message_id") == "m0":
+                return i
+        return None
+
+    def _edit(message):
+        message["text"] = "edited"
+
+    updated = asyncio.run(conversation_store.update_message(conv_ref, header, _select, _edit))
+    assert updated["text"] == "edited"
+
+    header = conv_ref.get().to_dict()
+    assert header["recent_messages"][0]["text"] == "edited"
+    assert header["last_visible_message"]["text"] == "edited"
+    messages = asyncio.run(conversation_store.load_conversation_messages(conv_ref, header))
+    assert messages[0]["text"] == "edited"
+
+
+def test_array_mode_keeps_legacy_layout(fake_db, monkeypatch):
+    monkeypatch.setattr(config, "CONVERSATION_STORAGE_MODE", "array")
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+
+    header = conv_ref.get().to_dict()
+    assert asyncio.run(conversation_store.append_message(conv_ref, header, _message(1), {})) == 2
+    assert len(conv_ref.get().to_dict()["messages"]) == 2
+
+
+def test_saves_write_through_to_history_ring(fake_db):
+    from services.conversation_history_cache import conversation_history_cache
+
+    conversations = fake_db.collection("conversations")
+    conv_id = asyncio.run(conversation_store.create_conversation(conversations, {}, _message(0)))
+    conv_ref = conversations.document(conv_id)
+    header = conv_ref.get().to_dict()
+    asyncio.run(conversation_store.append_message(conv_ref, header, _message(1, role="ai"), {}))
+    # Duplicates are not written, so they don't reach the ring either
+    asyncio.run(conversation_store.append_message(conv_ref, conv_ref.get().to_dict(), _message(1, role="ai"), {}))
+
+    history = asyncio.run(conversation_history_cache.get(conv_id, 10))
+    assert history == [{"role": "user", "text": "text 0"}, {"role": "ai", "text": "text 1"}]
+
+    asyncio.run(conversation_store.update_message(
+        conv_ref, conv_ref.get().to_dict(), lambda messages: 0, lambda message: message.update(text="edited")
+    ))
+    assert asyncio.run(conversation_history_cache.get(conv_id, 10)) is None
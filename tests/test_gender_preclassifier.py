@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from services import gender_recognition_service as grs
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("ana shab", "male"),
+    ("Ana chab w baddi laser", "male"),
+    ("أنا صبيّة", "female"),
+    ("انا بنت", "female"),
+    ("I'm a girl, how much is laser?", "female"),
+    ("Je suis une femme", "female"),
+    ("شب", "male"),
+    ("Female", "female"),
+    ("hi kifak", "unknown"),
+    ("مرحبا", "unknown"),
+    ("بدي احجز موعد", "unknown"),
+    ("what is the price", "unknown"),
+    ("my girl friend wants laser", None),
+    ("ana shab bas bade e7jez la bnt", "male"),
+])
+def test_classify_gender_locally(text, expected):
+    assert grs.classify_gender_locally(text) == expected
+
+
+def test_gpt_only_for_ambiguous_text_and_memoized(monkeypatch):
+    calls = []
+
+    async def fake_gpt(text):
+        calls.append(text)
+        return "female"
+
+    monkeypatch.setattr(grs, "get_gender_from_gpt", fake_gpt)
+    monkeypatch.setattr(grs, "_gender_memo", type(grs._gender_memo)())
+
+    assert asyncio.run(grs.detect_explicit_gender("kifak")) == "unknown"
+    assert asyncio.run(grs.detect_explicit_gender("My girl friend wants laser")) == "female"
+    assert asyncio.run(grs.detect_explicit_gender("my girl friend wants laser!")) == "female"
+    assert calls == ["My girl friend wants laser"]
+
+    # Known gender: ambiguous text is not sent to GPT, explicit statements still count
+    assert asyncio.run(grs.detect_explicit_gender("the girls want laser", current_gender="male")) == "unknown"
+    assert asyncio.run(grs.detect_explicit_gender("ana sabieh", current_gender="male")) == "female"
+    assert len(calls) == 1
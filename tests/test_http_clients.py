@@ -0,0 +1,47 @@
+import asyncio
+
+from services import http_clients
+
+
+async def _start_server(connections):
+    async def handle(reader, writer):
+        connections.append(writer.get_extra_info("peername"))
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: text/plain\r\n\r\nok")
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_named_clients_are_shared_and_keep_connections_alive(monkeypatch):
+    # Own registry: closing it must not close the clients other modules already hold
+    monkeypatch.setattr(http_clients, "_clients", {})
+
+    async def scenario():
+        connections = []
+        server, port = await _start_server(connections)
+        try:
+            client = http_clients.get_http_client("test", base_url=f"http://127.0.0.1:{port}")
+            assert http_clients.get_http_client("test") is client
+
+            for _ in range(3):
+                response = await client.get("/ping", timeout=5.0)
+                assert response.text == "ok"
+            assert len(connections) == 1  # one TCP connection reused for every request
+
+            stats = http_clients.http_client_stats()["clients"]["test"]
+            assert stats["idle"] == 1 and stats["active"] == 0 and not stats["closed"]
+        finally:
+            await http_clients.close_http_clients()
+            server.close()
+            await server.wait_closed()
+
+        assert client.is_closed and http_clients.http_client_stats()["clients"] == {}
+
+    asyncio.run(scenario())
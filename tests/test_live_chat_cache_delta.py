@@ -0,0 +1,119 @@
+import asyncio
+import datetime
+
+import pytest
+
+from services.live_chat_contracts import utc_now
+from services.live_chat_service import LiveChatService
+
+
+@pytest.fixture
+def service():
+    svc = LiveChatService()
+    now = utc_now()
+    svc._unified_chats_cache = []
+    svc._unified_chats_cache_time = now
+    svc._conversations_cache = []
+    svc._conversations_cache_time = now
+    svc._queue_cache = []
+    svc._queue_cache_time = now
+    return svc
+
+
+def _message(text, minutes_ago=0, role="user"):
+    return {
+        "role": role,
+        "text": text,
+        "timestamp": utc_now() - datetime.timedelta(minutes=minutes_ago),
+        "metadata": {},
+    }
+
+
+def _conversation(**fields):
+    base = {"status": "active", "customer_info": {"name": fields.pop("name", "Client")}}
+    base.update(fields)
+    return base
+
+
+def test_new_message_moves_chat_to_top_with_preview(service):
+    service.apply_message_delta("u1", "c1", _message("first", 30), _conversation(name="A"))
+    service.apply_message_delta("u2", "c2", _message("second", 10), _conversation(name="B"))
+    assert [c["user_id"] for c in service._unified_chats_cache] == ["u2", "u1"]
+
+    service.apply_message_delta("u1", "c1", _message("again"), _conversation(name="A"))
+    top = service._unified_chats_cache[0]
+    assert top["user_id"] == "u1"
+    assert top["last_message"]["content"] == "again"
+    assert top["message_count"] == 2
+    assert [c["user_id"] for c in service._conversations_cache] == ["u1", "u2"]
+    assert len(service._unified_chats_cache) == 2
+
+
+def test_smart_messages_leave_caches_untouched(service):
+    message = _message("promo", role="ai")
+    message["metadata"] = {"source": "smart_message"}
+    service.apply_message_delta("u1", "c1", message, _conversation())
+    assert service._unified_chats_cache == []
+
+
+def test_takeover_moves_chat_between_active_and_queue(service):
+    service.apply_message_delta("u1", "c1", _message("help"), _conversation())
+
+    asyncio.run(service.apply_state_delta("u1", "c1", human_takeover_active=True))
+    assert [q["user_id"] for q in service._queue_cache] == ["u1"]
+    assert service._conversations_cache == []
+    assert service._unified_chats_cache == []
+
+    asyncio.run(service.apply_state_delta("u1", "c1", human_takeover_active=True, operator_id="op1", status="human"))
+    assert service._queue_cache == []
+    assert service._conversations_cache[0]["status"] == "human"
+    assert service._unified_chats_cache[0]["is_live"] is False
+
+    asyncio.run(service.apply_state_delta("u1", "c1", status="resolved", human_takeover_active=False, operator_id=None))
+    assert service._conversations_cache == []
+    assert service._unified_chats_cache[0]["status"] == "bot"
+
+
+def test_state_change_of_older_conversation_is_ignored(service):
+    service.apply_message_delta("u1", "c2", _message("latest"), _conversation())
+    asyncio.run(service.apply_state_delta("u1", "c1", status="resolved"))
+    assert [c["conversation_id"] for c in service._conversations_cache] == ["c2"]
+
+
+def test_active_view_reports_per_customer_totals(service):
+    service.apply_message_delta("u1", "c1", _message("old conversation", 5), _conversation())
+    service.apply_message_delta("u1", "c1", _message("reply", 4, role="ai"), _conversation())
+    service.apply_message_delta("u1", "c2", _message("new conversation"), _conversation())
+
+    entry = service._conversations_cache[0]
+    assert entry["conversation_id"] == "c2" and entry["conversations"][0]["message_count"] == 1
+    assert entry["conversation_count"] == 2 and entry["message_count"] == 3
+
+
+def test_refresh_after_an_edit_rewrites_the_index_row(tmp_path, monkeypatch):
+    from services import live_chat_service as lcs
+    from services.chat_index_service import ChatIndexService
+
+    index = ChatIndexService(db_path=tmp_path / "chat_index.sqlite3")
+    index.mark_built(0)
+    monkeypatch.setattr(lcs, "chat_index_service", index)
+    service = LiveChatService()  # no cached lists: only the index is updated
+
+    message = _message("voice note", 1)
+    index.record_message("u1", "c1", message, conversation=_conversation(), new_conversation=True)
+
+    class _Doc:
+        id = "c1"
+
+        def to_dict(self):
+            return _conversation(messages=[{**message, "text": "transcribed: hello"}])
+
+    async def stream(users_collection, user_id):
+        return user_id, [_Doc()]
+
+    monkeypatch.setattr(service, "_get_users_collection", lambda: object())
+    monkeypatch.setattr(service, "_stream_user_conversations", stream)
+    asyncio.run(service.refresh_user_chat("u1"))
+
+    rows, _ = index.query_history("", None, 10, 0)
+    assert rows[0]["last_message_content"] == "transcribed: hello"
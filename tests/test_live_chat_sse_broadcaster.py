@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from services.live_chat_sse_broadcaster import _PUBLISH_SCRIPT, LiveChatSSEBroadcaster
+from tests.fake_redis import FakeRedis
+
+
+async def _publish(redis, keys, args):
+    sequence_key, ring_key, channel = keys
+    frame, published_at, replay_size = args
+    sequence = await redis.incr(sequence_key)
+    payload = json.dumps({"sequence": sequence, "frame": f"id: {sequence}\n{frame}", "published_at": float(published_at)})
+    await redis.rpush(ring_key, payload)
+    await redis.ltrim(ring_key, -int(replay_size), -1)
+    await redis.publish(channel, payload)
+    return sequence
+
+
+class _Request:
+    async def is_disconnected(self):
+        return False
+
+
+async def _initial_payload():
+    return {"conversations": [], "total": 0}
+
+
+async def _next_frames(stream, count):
+    return [(await asyncio.wait_for(stream.__anext__(), timeout=2)).decode("utf-8") for _ in range(count)]
+
+
+def test_events_published_on_one_worker_reach_clients_of_another():
+    async def scenario():
+        redis = FakeRedis()
+        redis.scripts = {_PUBLISH_SCRIPT: _publish}
+        worker_a = LiveChatSSEBroadcaster(redis_client=redis)
+        worker_b = LiveChatSSEBroadcaster(redis_client=redis)
+
+        stream = worker_b.stream(_Request(), initial_payload_loader=_initial_payload)
+        connected, conversations = await _next_frames(stream, 2)
+        assert "event: connected" in connected and "event: conversations" in conversations
+        await asyncio.sleep(0.05)  # let worker B's subscriber attach
+
+        await worker_a.publish("new_message", {"conversation_id": "c1"})
+        await worker_a.publish("new_message", {"conversation_id": "c2"})
+        first, second = await _next_frames(stream, 2)
+        assert first.startswith("id: 1\nevent: new_message\n") and '"c1"' in first
+        assert second.startswith("id: 2\n")
+        await stream.aclose()
+
+        # Reconnect (to the other worker) after missing event 3: replayed, no full reload
+        await worker_b.publish("message_updated", {"conversation_id": "c3"})
+        resumed = worker_a.stream(_Request(), initial_payload_loader=_initial_payload, last_event_id="2")
+        connected, replayed = await _next_frames(resumed, 2)
+        assert '"resumed": true' in connected and '"replayed": 1' in connected
+        assert replayed.startswith("id: 3\nevent: message_updated\n")
+        await resumed.aclose()
+
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
+
+
+def test_replay_falls_back_to_a_full_reload_when_the_ring_is_too_short():
+    async def scenario():
+        broadcaster = LiveChatSSEBroadcaster(replay_size=3)
+        for n in range(5):
+            await broadcaster.publish("new_message", {"n": n})
+
+        assert [e["sequence"] for e in await broadcaster.replay_since(3)] == [4, 5]
+        assert await broadcaster.replay_since(5) == []
+        assert await broadcaster.replay_since(1) is None  # event 2 was dropped from the ring
+        assert await broadcaster.replay_since(9) is None  # ids from before a restart
+
+        stream = broadcaster.stream(_Request(), initial_payload_loader=_initial_payload, last_event_id="1")
+        connected, conversations = await _next_frames(stream, 2)
+        assert '"resumed": false' in connected and "event: conversations" in conversations
+        await stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_frames_are_encoded_once_and_slow_clients_get_a_resync():
+    async def scenario():
+        broadcaster = LiveChatSSEBroadcaster()
+        broadcaster.CLIENT_QUEUE_SIZE = 2
+        fast = broadcaster.stream(_Request(), initial_payload_loader=_initial_payload)
+        slow = broadcaster.stream(_Request(), initial_payload_loader=_initial_payload)
+        await _next_frames(fast, 2)
+        await _next_frames(slow, 2)
+
+        await broadcaster.publish("new_message", {"n": 1})
+        frame = await asyncio.wait_for(fast.__anext__(), timeout=2)
+        await broadcaster.publish("new_message", {"n": 2})
+        await asyncio.wait_for(fast.__anext__(), timeout=2)
+        # The slow client has not read anything: same bytes object in its queue
+        slow_client = next(c for c in broadcaster._clients if c.queue.qsize() == 2)
+        assert slow_client.queue._queue[0]["frame"] is frame
+
+        await broadcaster.publish("new_message", {"n": 3})  # slow client's queue is full
+        await broadcaster.publish("new_message", {"n": 4})
+        resync, conversations = await _next_frames(slow, 2)
+        assert resync.startswith("event: resync\n") and '"dropped": 4' in resync
+        assert conversations.startswith("event: conversations\n")
+
+        await _next_frames(fast, 2)
+        await broadcaster.publish("new_message", {"n": 5})
+        assert (await _next_frames(slow, 1))[0].startswith("id: 5\n")
+        stats = broadcaster.stats()
+        assert stats["resyncs"] == 1 and stats["dropped"] == 4 and stats["lagging_clients"] == 0
+        await fast.aclose()
+        await slow.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from services.blocking_executor import BlockingExecutor
+from services.loop_monitor import EventLoopMonitor
+
+
+def _blocking_bcrypt_like_call():
+    time.sleep(0.3)
+
+
+def test_stall_is_recorded_with_the_blocking_stack():
+    async def scenario():
+        monitor = EventLoopMonitor(interval_seconds=0.02, threshold_seconds=0.1)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        _blocking_bcrypt_like_call()
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(scenario())
+    assert monitor.stall_count >= 1
+    stall = monitor.recent_stalls[-1]
+    assert stall["lag_ms"] >= 150
+    assert "_blocking_bcrypt_like_call" in (stall["stack"] or "")
+
+
+def test_offload_pools_are_bounded_and_keep_context():
+    request_id = contextvars.ContextVar("request_id", default=None)
+    executor = BlockingExecutor(io_workers=2, cpu_workers=1)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return request_id.get()
+
+    async def scenario():
+        request_id.set("req-1")
+        results = await asyncio.gather(*(executor.run_io(work) for _ in range(6)))
+        cpu_result = await executor.run_cpu(work)
+        return results, cpu_result
+
+    try:
+        results, cpu_result = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+    assert results == ["req-1"] * 6 and cpu_result == "req-1"
+    assert max(peak) <= 2
+    stats = executor.stats()
+    assert stats["io"]["completed"] == 6 and stats["io"]["pending"] == 0
+    assert stats["cpu"]["completed"] == 1
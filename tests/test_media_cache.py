@@ -0,0 +1,50 @@
+import asyncio
+import os
+
+from services.media_cache import MediaDiskCache
+
+
+async def _download(cache, url, chunks, content_type="audio/ogg"):
+    writer = cache.writer(url, content_type)
+    for chunk in chunks:
+        await writer.write(chunk)
+    return writer
+
+
+def test_downloads_are_content_addressed_and_evicted_least_recently_played_first(tmp_path):
+    async def scenario():
+        cache = MediaDiskCache(root=tmp_path, max_bytes=25)
+        assert await cache.lookup("https://a/1.ogg") is None
+
+        entry = await (await _download(cache, "https://a/1.ogg", [b"0123456789"])).commit()
+        assert entry.size == 10 and entry.path.read_bytes() == b"0123456789"
+
+        # Same bytes behind another URL share the blob (and the ETag)
+        same = await (await _download(cache, "https://b/signed?token=x", [b"01234", b"56789"])).commit()
+        assert same.path == entry.path and same.etag == entry.etag
+        assert cache.stats()["files"] == 1
+
+        second = await (await _download(cache, "https://a/2.ogg", [b"x" * 10])).commit()
+        os.utime(second.path, (1, 1))
+        os.utime(entry.path, (2, 2))
+        hit = await cache.lookup("https://a/1.ogg")  # played again: most recently used
+        assert hit.path == entry.path and hit.content_type == "audio/ogg"
+
+        await (await _download(cache, "https://a/3.ogg", [b"y" * 10])).commit()  # 30 bytes > 25
+        assert await cache.lookup("https://a/2.ogg") is None
+        assert await cache.lookup("https://a/1.ogg") is not None
+        assert cache.stats()["bytes"] == 20
+
+    asyncio.run(scenario())
+
+
+def test_aborted_downloads_leave_nothing_behind(tmp_path):
+    async def scenario():
+        cache = MediaDiskCache(root=tmp_path, max_bytes=1024)
+        writer = await _download(cache, "https://a/partial.ogg", [b"half of a file"])
+        await writer.abort()
+        assert await cache.lookup("https://a/partial.ogg") is None
+        assert list((tmp_path / "tmp").iterdir()) == []
+        assert cache.stats()["files"] == 0
+
+    asyncio.run(scenario())
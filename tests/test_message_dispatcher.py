@@ -0,0 +1,98 @@
+import asyncio
+
+from services.message_dispatcher import MessageDispatcher
+
+
+def test_messages_from_one_user_run_in_order_and_users_run_in_parallel():
+    async def scenario():
+        dispatcher = MessageDispatcher(max_llm_pipelines=4)
+        log = []
+        running = set()
+        overlap = []
+
+        def job(user, n, delay):
+            async def run():
+                if user in running:
+                    overlap.append(user)
+                running.add(user)
+                await asyncio.sleep(delay)
+                log.append((user, n))
+                running.discard(user)
+            return run
+
+        dispatcher.submit("u1", job("u1", 1, 0.03))
+        dispatcher.submit("u1", job("u1", 2, 0))
+        dispatcher.submit("u2", job("u2", 1, 0.01))
+        assert dispatcher.stats()["queue_depth"] == 3
+        while dispatcher.stats()["active_mailboxes"]:
+            await asyncio.sleep(0.01)
+        return log, overlap, dispatcher.stats()
+
+    log, overlap, stats = asyncio.run(scenario())
+    assert [entry for entry in log if entry[0] == "u1"] == [("u1", 1), ("u1", 2)]
+    assert log[0] == ("u2", 1)
+    assert overlap == []
+    assert stats["queue_depth"] == 0 and stats["processed"] == 3
+
+
+def test_llm_slots_cap_concurrency():
+    async def scenario():
+        dispatcher = MessageDispatcher(max_llm_pipelines=2)
+        peak = 0
+
+        async def pipeline():
+            nonlocal peak
+            async with dispatcher.llm_slot():
+                peak = max(peak, dispatcher.stats()["llm_in_flight"])
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(pipeline() for _ in range(6)))
+        return peak, dispatcher.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["llm_in_flight"] == 0 and stats["llm_waiting"] == 0
+
+
+def test_full_mailboxes_shed_new_messages():
+    async def scenario():
+        dispatcher = MessageDispatcher(max_user_queue=2, max_pending=3)
+
+        async def noop():
+            pass
+
+        results = [dispatcher.submit("u1", noop) for _ in range(3)]
+        results += [dispatcher.submit("u2", noop), dispatcher.submit("u3", noop)]
+        await asyncio.sleep(0.01)
+        return results, dispatcher.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == [True, True, False, True, False]
+    assert stats["shed"] == {"user_queue_full": 1, "backlog_full": 1}
+    assert stats["queue_depth"] == 0
+
+
+def test_follow_up_work_runs_in_the_mailbox_and_survives_caller_cancellation():
+    async def scenario():
+        dispatcher = MessageDispatcher(max_user_queue=1)
+        log = []
+
+        async def inbound():
+            await asyncio.sleep(0.02)
+            log.append("inbound")
+
+        async def reply():
+            log.append("reply")
+            return "sent"
+
+        assert dispatcher.submit("u1", inbound)
+        # Queued behind the inbound message, and not subject to the per-user cap
+        assert await dispatcher.run_in_mailbox("u1", reply) == "sent"
+
+        caller = asyncio.create_task(dispatcher.run_in_mailbox("u1", reply))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        return log
+
+    assert asyncio.run(scenario()) == ["inbound", "reply", "reply"]
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from services import chat_response_service as crs
+
+
+@pytest.fixture
+def slow_steps(monkeypatch):
+    calls = {"qa_cancelled": False, "moderation": (True, {"flagged": False})}
+
+    async def moderate(text, user_id=None):
+        await asyncio.sleep(0.1)
+        return calls["moderation"]
+
+    async def gender(text, current_gender=None):
+        await asyncio.sleep(0.1)
+        return "female"
+
+    async def qa(question, language=None, limit=3):
+        try:
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            calls["qa_cancelled"] = True
+            raise
+        return [{"question": "q", "answer": "a", "similarity": 0.9}]
+
+    monkeypatch.setattr(crs, "moderate_content", moderate)
+    monkeypatch.setattr(crs, "detect_explicit_gender", gender)
+    monkeypatch.setattr(crs.local_qa_service, "get_relevant_qa_pairs", qa)
+    return calls
+
+
+def test_steps_run_concurrently(slow_steps):
+    started = time.perf_counter()
+    result = asyncio.run(crs._run_preflight_checks("u1", "ana sabieh", "ar", include_qa=True))
+    assert time.perf_counter() - started < 0.25
+    assert result["is_safe"] and result["gender"] == "female"
+    assert result["relevant_qa"][0]["answer"] == "a"
+    assert set(result["timings_ms"]) == {"moderation", "gender", "qa", "wall"}
+
+
+def test_moderation_veto_wins_and_cancels_other_steps(slow_steps, monkeypatch):
+    async def quick_veto(text, user_id=None):
+        return False, {"flagged": True}
+
+    monkeypatch.setattr(crs, "moderate_content", quick_veto)
+    result = asyncio.run(crs._run_preflight_checks("u1", "bad", "ar", include_qa=True))
+    assert result["is_safe"] is False
+    assert result["gender"] is None and result["relevant_qa"] == []
+    assert slow_steps["qa_cancelled"]
+
+
+def test_timed_out_step_uses_fallback(slow_steps, monkeypatch):
+    monkeypatch.setattr(crs.config, "PREFLIGHT_GENDER_TIMEOUT_SECONDS", 0.01)
+    result = asyncio.run(crs._run_preflight_checks("u1", "hello", "en", include_qa=False))
+    assert result["gender"] == "unknown"
+    assert result["is_safe"]
+
+
+def test_turn_qa_scores_are_reused(slow_steps, monkeypatch):
+    async def must_not_rescore(*args, **kwargs):
+        raise AssertionError("Q&A scored twice in one turn")
+
+    monkeypatch.setattr(crs.local_qa_service, "get_relevant_qa_pairs", must_not_rescore)
+    relevant = [{"question": "q", "answer": "cached", "similarity": 0.5}]
+    qa_turn = crs.QATurnMatch("ana sabieh", "ar", None, 0.5, relevant)
+
+    result = asyncio.run(crs._run_preflight_checks("u1", "ana sabieh", "ar", include_qa=True, qa_turn=qa_turn))
+    assert result["relevant_qa"] == relevant
+    assert "qa" not in result["timings_ms"]
+
+
+def test_qa_timeout_fires_while_the_matcher_is_busy(monkeypatch):
+    async def moderate(text, user_id=None):
+        return True, {"flagged": False}
+
+    async def gender(text, current_gender=None):
+        return "unknown"
+
+    def busy_matcher(question, language, limit):
+        time.sleep(0.3)  # CPU-bound scoring of a large Q&A set
+        return []
+
+    monkeypatch.setattr(crs, "moderate_content", moderate)
+    monkeypatch.setattr(crs, "detect_explicit_gender", gender)
+    monkeypatch.setattr(crs.local_qa_service, "_relevant_matches", busy_matcher)
+    monkeypatch.setattr(crs.config, "PREFLIGHT_QA_TIMEOUT_SECONDS", 0.05)
+
+    result = asyncio.run(crs._run_preflight_checks("u1", "ana sabieh", "ar", include_qa=True))
+    assert result["relevant_qa"] == []
+    assert result["timings_ms"]["qa"] < 250
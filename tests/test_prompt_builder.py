@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import config
+from services.prompt_builder import SystemPromptBuilder
+
+
+def _use_content(monkeypatch, style="STYLE", kb="KB", prices="PRICES"):
+    monkeypatch.setattr(config, "BOT_STYLE_GUIDE", style)
+    monkeypatch.setattr(config, "CORE_KNOWLEDGE_BASE", kb)
+    monkeypatch.setattr(config, "PRICE_LIST", prices)
+
+
+def test_prefix_is_shared_across_users_and_turns(monkeypatch):
+    _use_content(monkeypatch)
+    monkeypatch.setitem(config.user_gender, "u1", "male")
+    monkeypatch.setitem(config.user_gender, "u2", "female")
+    builder = SystemPromptBuilder()
+
+    first = builder.build("u1", "ar", qa_reference="Q: a\nA: b", tail_sections=[("customer_status", "time 10:00")])
+    second = builder.build("u2", "en", tail_sections=[("customer_status", "time 10:01")])
+
+    assert first.prefix == second.prefix
+    assert first.text.startswith(first.prefix) and second.text.startswith(second.prefix)
+    names = [name for name, _ in first.sections]
+    assert names == ["identity", "style_guide", "knowledge_base", "rules", "price_list", "gender", "qa_reference", "customer_status"]
+    assert "masculine" in first.text and "feminine" in second.text
+    assert '"action": "answer_question"' in first.text
+
+
+def test_without_price_list_prefix_is_a_prefix_of_the_full_one(monkeypatch):
+    _use_content(monkeypatch)
+    builder = SystemPromptBuilder()
+    with_prices = builder.build("u1", "ar")
+    without_prices = builder.build("u1", "ar", include_price_list=False)
+    assert with_prices.prefix.startswith(without_prices.prefix)
+    assert "PRICES" not in without_prices.text
+
+
+def test_custom_knowledge_goes_to_the_tail(monkeypatch):
+    _use_content(monkeypatch)
+    prompt = SystemPromptBuilder().build("u1", "ar", custom_knowledge_context="RETRIEVED")
+    assert "KB" not in prompt.prefix and "STYLE" not in prompt.text
+    assert prompt.sections[prompt.static_count][0] == "relevant_information"
+
+
+def test_recompiles_only_when_content_changes(monkeypatch):
+    _use_content(monkeypatch)
+    builder = SystemPromptBuilder()
+    builder.build("u1", "ar")
+    builder.build("u2", "ar")
+    assert builder.compiles == 1
+
+    _use_content(monkeypatch, kb="KB v2")
+    assert "KB v2" in builder.build("u1", "ar").prefix
+    assert builder.compiles == 2
+
+
+def test_record_usage_tracks_cached_share():
+    builder = SystemPromptBuilder()
+    usage = SimpleNamespace(prompt_tokens=2000, prompt_tokens_details=SimpleNamespace(cached_tokens=1536))
+    assert builder.record_usage("gpt-4o", usage) == 1536
+    assert builder.record_usage("gpt-4o", SimpleNamespace(prompt_tokens=1000, prompt_tokens_details={"cached_tokens": 0})) == 0
+    # Older SDKs don't report prompt_tokens_details
+    assert builder.record_usage("gpt-4o", SimpleNamespace(prompt_tokens=500)) == 0
+
+    totals = builder.stats()["usage"]["gpt-4o"]
+    assert totals["requests"] == 3
+    assert totals["prompt_tokens"] == 3500
+    assert totals["cached_tokens"] == 1536
+
+
+def test_token_cache_holds_static_sections_only(monkeypatch):
+    _use_content(monkeypatch)
+    builder = SystemPromptBuilder()
+    for turn in range(50):
+        prompt = builder.build("u1", "ar", qa_reference=f"Q: {turn}\nA: " + "x" * 600,
+                               tail_sections=[("customer_status", f"time {turn} " + "y" * 600)])
+        counts = prompt.token_counts()
+    assert set(builder._token_cache) == {"identity", "style_guide", "knowledge_base", "rules", "price_list"}
+    assert counts["qa_reference"] > 0 and counts["customer_status"] > 0
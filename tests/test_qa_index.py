@@ -0,0 +1,82 @@
+import asyncio
+import json
+import random
+import shutil
+from pathlib import Path
+
+import pytest
+
+from scripts.benchmark_qa_matcher import linear_best, linear_relevant, linear_search, perturb
+from services.local_qa_service import LocalQAService
+
+DATA_FILE = Path(__file__).resolve().parent.parent / "data" / "qa_pairs.jsonl"
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / "qa_pairs.jsonl"
+    shutil.copy(DATA_FILE, path)
+    return LocalQAService(data_path=str(path))
+
+
+def test_indexed_scores_match_linear_scan(service):
+    rng = random.Random(3)
+    for _ in range(60):
+        qa = rng.choice(service.qa_pairs)
+        query = perturb(qa["question"], rng)
+        language = rng.choice([qa.get("language"), "en", None])
+
+        strict_language = language or "ar"
+        best = service._best_match(query, service._normalize_language(strict_language))
+        assert best == linear_best(service, query, strict_language)
+
+        relevant = asyncio.run(service.get_relevant_qa_pairs(query, language, limit=3))
+        assert [(r["similarity"], r["question"]) for r in relevant] == linear_relevant(service, query, language)
+
+        search = asyncio.run(service.search_qa_pairs(query, language))
+        assert [(r["match_score"], r["question"]) for r in search["data"]] == linear_search(service, query, language)
+
+
+def test_index_follows_create_update_delete(service):
+    asyncio.run(service.create_qa_pair("Do you offer tattoo removal?", "Yes, with Pico laser.", "en", "services"))
+    match = asyncio.run(service.find_match_with_tier("do you offer tattoo removal", "en"))
+    assert match["qa_pair"]["answer"] == "Yes, with Pico laser."
+
+    index = len(service.qa_pairs) - 1
+    asyncio.run(service.update_qa_pair(index, {"question": "Is parking available?"}))
+    assert asyncio.run(service.find_match_with_tier("do you offer tattoo removal", "en")) is None
+    assert asyncio.run(service.find_match_with_tier("is parking available", "en"))["match_score"] == 1.0
+
+    asyncio.run(service.delete_qa_pair(index))
+    assert asyncio.run(service.find_match_with_tier("is parking available", "en")) is None
+    assert len(service._qa_index) == len(service.qa_pairs)
+
+    reloaded = [json.loads(line) for line in Path(service.data_path).read_text(encoding="utf-8").splitlines() if line]
+    service.qa_pairs = reloaded
+    assert len(service._qa_index) == len(reloaded)
+
+
+def test_turn_scoring_matches_separate_lookups(service):
+    rng = random.Random(5)
+    for _ in range(40):
+        qa = rng.choice(service.qa_pairs)
+        query = perturb(qa["question"], rng)
+        language = qa.get("language") or "ar"
+
+        turn = asyncio.run(service.score_turn(query, language))
+        direct = turn.direct_match()
+        expected_best, expected_score = linear_best(service, query, language)
+        if expected_score >= 0.9:
+            assert direct["qa_pair"] is expected_best and direct["match_score"] == expected_score
+        else:
+            assert direct is None
+        assert turn.relevant == asyncio.run(service.get_relevant_qa_pairs(query, language, limit=3))
+
+
+def test_turn_context_excludes_pairs_without_a_language(service):
+    service.qa_pairs = service.qa_pairs + [{"question": "Ma hiya saat al amal?", "answer": "Min 10 ila 6."}]
+    turn = asyncio.run(service.score_turn("ma hiya saat al amal", "ar"))
+
+    assert turn.direct_match()["qa_pair"]["answer"] == "Min 10 ila 6."
+    assert all(entry["question"] != "Ma hiya saat al amal?" for entry in turn.relevant)
+    assert turn.relevant == asyncio.run(service.get_relevant_qa_pairs("ma hiya saat al amal", "ar", limit=3))
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from services.reference_data_cache import ReferenceDataCache
+from tests.fake_redis import FakeRedis
+
+
+def _loader(calls, result=None, delay=0.0):
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result if result is not None else {"success": True, "data": [{"id": len(calls)}]}
+    return load
+
+
+def test_single_flight_ttl_and_stale_while_revalidate():
+    async def scenario():
+        cache = ReferenceDataCache(ttls={"branches": 0.05}, stale_seconds=60)
+        calls = []
+        load = _loader(calls, delay=0.02)
+
+        # Concurrent cold misses share one CRM call
+        results = await asyncio.gather(*(cache.get("branches", load) for _ in range(5)))
+        assert len(calls) == 1 and all(r["data"] == [{"id": 1}] for r in results)
+
+        # Callers get copies
+        results[0]["data"].clear()
+        assert (await cache.get("branches", load))["data"] == [{"id": 1}]
+
+        await asyncio.sleep(0.06)  # past the TTL: old value now, refresh in the background
+        assert (await cache.get("branches", load))["data"] == [{"id": 1}]
+        await asyncio.sleep(0.05)
+        assert len(calls) == 2
+        assert (await cache.get("branches", load))["data"] == [{"id": 2}]
+
+        stats = cache.stats()["endpoints"]["branches"]
+        assert (stats["miss"], stats["coalesced"], stats["stale"]) == (1, 4, 1)
+        assert stats["hit"] == 2 and stats["entries"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_failures_are_not_cached_and_invalidate_drops_entries():
+    async def scenario():
+        cache = ReferenceDataCache(stale_seconds=0)
+        calls = []
+        failing = _loader(calls, result={"success": False, "message": "CRM down"})
+        assert (await cache.get("services", failing))["success"] is False
+        assert (await cache.get("services", failing))["success"] is False
+        assert len(calls) == 2
+
+        ok = _loader(calls)
+        await cache.get("pricing", ok, key=("1", "", ("3",), ""))
+        await cache.get("pricing", ok, key=("1", "", ("4",), ""))
+        await cache.get("pricing", ok, key=("1", "", ("3",), ""))
+        assert len(calls) == 4
+        assert await cache.invalidate("pricing") == 2
+        await cache.get("pricing", ok, key=("1", "", ("3",), ""))
+        assert len(calls) == 5
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_load():
+    async def scenario():
+        cache = ReferenceDataCache()
+        calls = []
+        load = _loader(calls, delay=0.02)
+
+        leader = asyncio.create_task(cache.get("machines", load))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get("machines", load))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert (await waiter)["data"] == [{"id": 1}]
+        assert len(calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_pricing_has_a_short_stale_window():
+    cache = ReferenceDataCache(stale_seconds=86400, stale_windows={"pricing": 300})
+    assert cache.stale_for("pricing") == 300 and cache.stale_for("branches") == 86400
+
+
+def test_invalidation_reaches_every_worker():
+    async def scenario():
+        redis = FakeRedis()
+        worker_a = ReferenceDataCache(redis_client=redis)
+        worker_b = ReferenceDataCache(redis_client=redis)
+        calls = []
+        load = _loader(calls)
+        await worker_a.get("branches", load)
+        await worker_b.get("branches", load)
+        await asyncio.sleep(0.05)  # let the subscribers attach
+
+        assert await worker_a.invalidate("branches") == 1
+        await asyncio.sleep(0.05)
+        assert worker_b.stats()["endpoints"]["branches"]["entries"] == 0
+        await worker_b.get("branches", load)
+        assert len(calls) == 3
+
+        await worker_a.close()
+        await worker_b.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import json
+from datetime import datetime, timedelta
+
+from services.scheduled_message_store import ScheduledMessageStore, ScheduledMessagesView
+
+
+def _store(tmp_path, legacy=None):
+    legacy_path = tmp_path / "sent_smart_messages.json"
+    if legacy is not None:
+        legacy_path.write_text(json.dumps(legacy), encoding="utf-8")
+    return ScheduledMessageStore(db_path=tmp_path / "scheduled.sqlite3", legacy_json_path=legacy_path)
+
+
+def _entry(phone, message_type, send_at, status="scheduled", **extra):
+    return {"customer_phone": phone, "message_type": message_type, "send_at": send_at,
+            "status": status, "placeholders": {}, "language": "ar", **extra}
+
+
+def test_legacy_json_is_imported_once_and_due_messages_are_claimed(tmp_path):
+    now = datetime.now()
+    store = _store(tmp_path, legacy={
+        "old_sent": {**_entry("961111", "reminder_24h", (now - timedelta(days=3)).isoformat(), status="sent"),
+                     "sent_at": (now - timedelta(days=3)).isoformat()},
+    })
+    store.put("due", _entry("961222", "reminder_24h", now - timedelta(minutes=5)))
+    store.put("later", _entry("961333", "post_session_feedback", now + timedelta(hours=2)))
+
+    assert store.get("old_sent")["status"] == "sent"
+    assert isinstance(store.get("old_sent")["sent_at"], datetime)
+    assert store.import_legacy_json() == 0  # already imported
+
+    assert [message_id for message_id, _ in store.due(now)] == ["due"]
+    assert store.update("due", {"status": "sending"}, expected_status=("scheduled",)) is not None
+    # A second worker cannot claim it again
+    assert store.update("due", {"status": "sending"}, expected_status=("scheduled",)) is None
+    assert store.due(now) == []
+
+    # A send cycle that died mid-way is picked up again
+    assert store.requeue_stale_sending(older_than_seconds=-1) == 1
+    assert store.get("due")["status"] == "scheduled"
+
+    summary = store.summary()
+    assert summary["total"] == 3
+    assert summary["by_status"] == {"scheduled": 2, "sent": 1}
+    assert summary["next"][0] == "due"
+
+
+def test_find_update_many_delete_stale_and_dict_view(tmp_path):
+    now = datetime.now()
+    yesterday = now - timedelta(days=1)
+    store = _store(tmp_path)
+    store.put("a", _entry("961222", "missed_yesterday", yesterday))
+    store.put("b", _entry("961222", "reminder_24h", yesterday))
+    store.put("c", _entry("961333", "reminder_24h", now + timedelta(hours=1)))
+    store.put("d", _entry("961444", "reminder_24h", yesterday, status="sent", sent_at=now))
+
+    matches = store.find(statuses=("scheduled",), customer_phone="961222")
+    assert sorted(message_id for message_id, _ in matches) == ["a", "b"]
+    updated = store.update_many([message_id for message_id, _ in matches], {"status": "cancelled"})
+    assert len(updated) == 2
+    assert [message_id for message_id, _ in store.find(statuses=("cancelled",), message_type="missed_yesterday")] == ["a"]
+
+    # "a" is a preserved type, "c" is due later, "d" was sent today: only "b" goes
+    assert store.delete_stale(now.date(), preserved_types=("missed_yesterday",)) == (1, 3)
+
+    view = ScheduledMessagesView(store)
+    assert len(view) == 3 and "c" in view and "b" not in view
+    entry = view["c"]
+    entry["status"] = "would_send"
+    assert store.get("c")["status"] == "scheduled"  # entries are copies
+    view["c"] = entry
+    assert store.get("c")["status"] == "would_send"
+    del view["c"]
+    assert sorted(view) == ["a", "d"]
@@ -0,0 +1,78 @@
+import asyncio
+
+from services.scheduler_leader import _RELEASE_SCRIPT, _RENEW_SCRIPT, SchedulerLeaderElection
+from tests.fake_redis import FakeRedis
+
+
+def _fake_redis():
+    redis = FakeRedis()
+
+    async def renew(client, keys, args):
+        if await client.get(keys[0]) == args[0]:
+            return int(await client.expire(keys[0], int(args[1])))
+        return 0
+
+    async def release(client, keys, args):
+        if await client.get(keys[0]) == args[0]:
+            return await client.delete(keys[0])
+        return 0
+
+    redis.scripts = {_RENEW_SCRIPT: renew, _RELEASE_SCRIPT: release}
+    return redis
+
+
+def _election(name, **kwargs):
+    election = SchedulerLeaderElection(lease_seconds=30, renew_seconds=1, **kwargs)
+    election.worker_id = name
+    return election
+
+
+def test_file_lock_elects_one_worker_and_fails_over(tmp_path):
+    async def scenario():
+        events = []
+        a = _election("host:1", lock_dir=tmp_path)
+        b = _election("host:2", lock_dir=tmp_path)
+        a._on_elected = lambda: events.append("a elected")
+        b._on_elected = lambda: events.append("b elected")
+
+        assert await a.try_acquire() is True
+        assert await b.try_acquire() is False
+        assert await a.try_acquire() is True  # renewing keeps it
+        assert (await b.current_leader())["worker_id"] == "host:1"
+
+        await a.release()  # leader goes away: the lock is free again
+        assert await b.try_acquire() is True
+        assert (await a.describe())["leader"]["worker_id"] == "host:2"
+        assert events == ["a elected", "b elected"]
+        await b.release()
+
+    asyncio.run(scenario())
+
+
+def test_redis_lease_expires_and_is_never_renewed_by_another_worker():
+    async def scenario():
+        redis = _fake_redis()
+        clock = [1000.0]
+        redis.now = lambda: clock[0]
+        a = _election("host-a:1", redis_client=redis)
+        b = _election("host-b:1", redis_client=redis)
+        demoted = []
+        a._on_demoted = lambda: demoted.append("a")
+
+        assert await a.try_acquire() is True
+        assert await b.try_acquire() is False
+        assert (await b.current_leader())["worker_id"] == "host-a:1"
+
+        clock[0] += 31  # the leader stopped renewing (died): its lease expired
+        assert await b.try_acquire() is True
+        # The old leader finds its lease gone and steps down
+        assert await a.try_acquire() is False
+        assert demoted == ["a"] and b.is_leader
+        assert (await a.current_leader())["worker_id"] == "host-b:1"
+
+        await a.release()  # not the holder: the lease stays
+        assert await redis.get(b.redis_key) is not None
+        await b.release()
+        assert await redis.get(b.redis_key) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from services.smart_message_sender import SmartMessageHistoryQueue, SmartMessageSender, TokenBucket
+
+
+def _messages(*phones):
+    return [
+        {"phone": phone, "content": f"hello {i}", "message_id": f"m{i}", "type": "reminder_24h"}
+        for i, phone in enumerate(phones)
+    ]
+
+
+def test_batch_runs_concurrently_and_keeps_status_callbacks():
+    async def scenario():
+        history_written = []
+
+        async def write_history(**kwargs):
+            await asyncio.sleep(0.2)
+            history_written.append(kwargs["metadata"]["message_id"])
+
+        history = SmartMessageHistoryQueue(workers=1, writer=write_history)
+        sender = SmartMessageSender(concurrency=4, rate_per_second=0, history=history)
+        in_flight, peak, order = 0, 0, []
+
+        async def send(phone, content):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            order.append(content)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            if phone == "bad":
+                raise RuntimeError("provider down")
+            return {"success": True, "dry_run": phone == "dry"}
+
+        outcomes = {}
+        started = time.perf_counter()
+        report = await sender.send_batch(
+            _messages("961111", "961222", "961111", "bad", "dry", "961333"),
+            on_sent=lambda msg: outcomes.setdefault(msg["message_id"], "sent"),
+            on_failed=lambda msg, error: outcomes.setdefault(msg["message_id"], f"failed: {error}"),
+            on_dry_run=lambda msg: outcomes.setdefault(msg["message_id"], "dry_run"),
+            send=send,
+        )
+        elapsed = time.perf_counter() - started
+
+        assert outcomes == {"m0": "sent", "m1": "sent", "m2": "sent", "m3": "failed: provider down",
+                            "m4": "dry_run", "m5": "sent"}
+        assert (report["sent"], report["dry_run"], report["failed"], report["done"]) == (4, 1, 1, 6)
+        assert peak == 4 and elapsed < 0.25
+        # Same phone: sent in order
+        assert order.index("hello 0") < order.index("hello 2")
+        # History writes are not awaited by the batch, only queued
+        assert history_written == [] and history.stats()["pending"] == 4
+        assert await history.drain(timeout=2) == 0
+        assert sorted(history_written) == ["m0", "m1", "m2", "m5"]
+        assert sender.stats()["recent_batches"][-1]["total"] == 6
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_limits_the_send_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=2)
+        started = time.perf_counter()
+        for _ in range(6):
+            await bucket.acquire()
+        # 2 from the burst, then 4 more at 20/s
+        assert 0.18 <= time.perf_counter() - started < 0.5
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+from collections import deque
+
+import pytest
+
+import config
+from services.state_store import InMemoryStateBackend, RedisStateBackend, UserStateStore, decode_state, encode_state
+from tests.fake_redis import FakeRedis
+
+
+USER = "test-state-user"
+
+
+@pytest.fixture(autouse=True)
+def clean_user_state():
+    yield
+    for namespace in ("user_context", "user_gender", "user_names", "user_greeting_stage",
+                      "user_data_whatsapp", "user_booking_state", "user_in_human_takeover_mode"):
+        getattr(config, namespace).pop(USER, None)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    backend = InMemoryStateBackend() if request.param == "memory" else RedisStateBackend(FakeRedis())
+    return UserStateStore(backend=backend, ttl_seconds=60)
+
+
+def test_state_survives_a_worker_switch(store):
+    config.user_names[USER] = "Rana"
+    config.user_greeting_stage[USER] = 2
+    config.user_context[USER].append({"role": "user", "content": "hi"})
+    asyncio.run(store.save(USER))
+
+    # Another worker starts from empty local dicts
+    for namespace in store.namespaces:
+        getattr(config, namespace).pop(USER, None)
+    assert asyncio.run(store.load(USER)) == 3
+
+    assert config.user_names[USER] == "Rana"
+    assert config.user_greeting_stage[USER] == 2
+    assert isinstance(config.user_context[USER], deque)
+    assert list(config.user_context[USER]) == [{"role": "user", "content": "hi"}]
+
+
+def test_load_refreshes_mutable_entries_in_place(store):
+    config.user_booking_state[USER] = {"step": "branch"}
+    asyncio.run(store.save(USER))
+
+    held = config.user_booking_state[USER]
+    held["step"] = "stale"
+    asyncio.run(store.load(USER))
+    assert config.user_booking_state[USER] is held
+    assert held == {"step": "branch"}
+
+
+def test_entries_removed_locally_are_deleted(store):
+    config.user_in_human_takeover_mode[USER] = True
+    asyncio.run(store.save(USER))
+    del config.user_in_human_takeover_mode[USER]
+    asyncio.run(store.save(USER, ("user_in_human_takeover_mode",)))
+
+    assert asyncio.run(store.load(USER)) == 0
+    assert USER not in config.user_in_human_takeover_mode
+
+
+def test_entries_deleted_by_another_worker_are_dropped_locally():
+    redis = FakeRedis()
+    worker_a = UserStateStore(backend=RedisStateBackend(redis), ttl_seconds=60)
+    worker_b = UserStateStore(backend=RedisStateBackend(redis), ttl_seconds=60)
+
+    config.user_in_human_takeover_mode[USER] = True
+    asyncio.run(worker_a.save(USER))
+    # Worker B ends the takeover; worker A's dict still holds the old flag
+    asyncio.run(worker_b.backend.delete_many([worker_b._key("user_in_human_takeover_mode", USER)]))
+
+    assert asyncio.run(worker_a.load(USER)) == 0
+    assert USER not in config.user_in_human_takeover_mode
+
+
+def test_entries_expire_after_ttl():
+    redis = FakeRedis()
+    clock = [1000.0]
+    redis.now = lambda: clock[0]
+    store = UserStateStore(backend=RedisStateBackend(redis), ttl_seconds=60)
+
+    config.user_gender[USER] = "female"
+    asyncio.run(store.save(USER))
+    clock[0] += 61
+    del config.user_gender[USER]
+    assert asyncio.run(store.load(USER)) == 0
+
+
+def test_encoding_round_trips_datetimes_and_deques():
+    value = {"at": datetime.datetime(2026, 1, 2, 3, 4, 5), "recent": deque([1, 2], maxlen=5)}
+    decoded = decode_state(encode_state(value))
+    assert decoded["at"] == value["at"]
+    assert decoded["recent"] == value["recent"] and decoded["recent"].maxlen == 5
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from services.tracing import current_trace, record_span, span, start_trace
+
+
+def test_spans_from_child_tasks_land_in_the_trace():
+    async def preflight_step():
+        async with span("preflight_moderation"):
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        with start_trace("inbound", message_type="text") as trace:
+            async with span("state_load"):
+                await asyncio.sleep(0)
+            await asyncio.gather(asyncio.ensure_future(preflight_step()))
+            record_span("queue_wait", 0.05)
+        return trace
+
+    trace = asyncio.run(scenario())
+    names = [s["name"] for s in trace.to_dict()["spans"]]
+    assert set(names) == {"state_load", "preflight_moderation", "queue_wait"}
+    # queue_wait happened "before" the trace's own work and is ordered first
+    assert names[0] == "queue_wait"
+    assert current_trace() is None
+    assert "preflight_moderation" in trace.format()
+
+
+def test_reply_trace_continues_the_inbound_trace():
+    async def scenario():
+        with start_trace("inbound") as inbound:
+            async with span("text_buffer"):
+                pass
+        with start_trace("text_reply", parent=inbound) as reply:
+            with span("gpt_response"):
+                pass
+        return inbound, reply
+
+    inbound, reply = asyncio.run(scenario())
+    assert reply.trace_id == inbound.trace_id
+    assert reply.started_at == inbound.started_at
+    assert [s["name"] for s in reply.spans] == ["text_buffer", "gpt_response"]
+    assert [s["name"] for s in inbound.spans] == ["text_buffer"]
+
+
+def test_failed_span_records_the_error():
+    with start_trace("inbound") as trace:
+        with pytest.raises(ValueError):
+            with span("crm_lookup"):
+                raise ValueError("boom")
+    assert trace.spans[0]["error"] == "ValueError"
@@ -0,0 +1,54 @@
+import asyncio
+
+from services.webhook_dedup import TimeBucketedSeenSet, WebhookDeduplicator
+from tests.fake_redis import FakeRedis
+
+
+def test_seen_set_expires_whole_buckets():
+    clock = [100.0]
+    seen = TimeBucketedSeenSet(window_seconds=60, clock=lambda: clock[0])
+    assert seen.claim("m1") is None
+    clock[0] += 15
+    assert seen.claim("m1") == 15
+    assert seen.claim("m2") is None
+
+    clock[0] += 50  # m1 is 65s old, m2 50s
+    assert seen.claim("m3") is None
+    assert len(seen) == 2
+    assert seen.claim("m1") is None
+
+
+def test_redis_backend_is_shared_between_workers():
+    redis = FakeRedis()
+    worker_a = WebhookDeduplicator(window_seconds=60, redis_client=redis)
+    worker_b = WebhookDeduplicator(window_seconds=60, redis_client=redis)
+
+    assert asyncio.run(worker_a.is_duplicate("qiscus", "m1")) is None
+    assert asyncio.run(worker_b.is_duplicate("qiscus", "m1")) is not None
+    # Same id from another provider is a different message
+    assert asyncio.run(worker_b.is_duplicate("montymobile", "m1")) is None
+
+    stats = worker_b.stats()
+    assert stats["backend"] == "redis"
+    assert stats["providers"]["qiscus"] == {"received": 1, "duplicates": 1, "duplicate_rate": 1.0}
+    assert stats["providers"]["montymobile"]["duplicates"] == 0
+
+
+def test_redis_errors_fall_back_to_local_cache():
+    class BrokenRedis(FakeRedis):
+        async def set(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    dedup = WebhookDeduplicator(window_seconds=60, redis_client=BrokenRedis())
+    assert asyncio.run(dedup.is_duplicate("qiscus", "m1")) is None
+    assert asyncio.run(dedup.is_duplicate("qiscus", "m1")) is not None
+    assert asyncio.run(dedup.is_duplicate("qiscus", "")) is None
+
+
+def test_released_claims_accept_the_retry():
+    redis = FakeRedis()
+    for dedup in (WebhookDeduplicator(window_seconds=60, redis_client=redis), WebhookDeduplicator(window_seconds=60)):
+        assert asyncio.run(dedup.is_duplicate("qiscus", "m1")) is None
+        asyncio.run(dedup.release("qiscus", "m1"))
+        assert asyncio.run(dedup.is_duplicate("qiscus", "m1")) is None
+        assert asyncio.run(dedup.is_duplicate("qiscus", "m1")) is not None
@@ -1,4 +1,5 @@
 # utils.py
+import asyncio
 import re
 import json
 import os
@@ -17,6 +18,13 @@ from services.live_chat_contracts import (
     parse_timestamp_utc,
     utc_now,
 )
+from services.chat_index_service import chat_index_service, update_chat_index
+from services.conversation_store import (
+    append_message as append_conversation_message,
+    create_conversation,
+    load_recent_messages,
+    update_message as update_conversation_message,
+)
 
 # NEW: Firebase Admin SDK Imports
 import firebase_admin
@@ -249,6 +257,8 @@ async def _update_customer_name_from_external_after_save(
         external_id = external.get("external_id")
         if customer_name:
             config.user_names[canonical_user_id] = customer_name
+            from services.state_store import user_state_store
+            await user_state_store.save(canonical_user_id, ("user_names",))
         doc_ref = conversations_collection_for_user.document(conversation_id)
         doc_snap = await asyncio.to_thread(doc_ref.get)
         if doc_snap.exists:
@@ -257,6 +267,9 @@ async def _update_customer_name_from_external_after_save(
             customer_info["name"] = customer_name
             customer_info["last_updated"] = utc_now()
             await asyncio.to_thread(doc_ref.update, {"customer_info": customer_info})
+            await update_chat_index(
+                chat_index_service.update_customer_info, canonical_user_id, conversation_id, customer_info
+            )
         if customer_name or external_id is not None:
             update_data = {"last_activity": utc_now(), "name": customer_name}
             if external_id is not None:
@@ -267,6 +280,55 @@ async def _update_customer_name_from_external_after_save(
         _log.warning("Background customer name update failed: %s", e)
 
 
+async def _apply_saved_message_to_live_chat(
+    canonical_user_id: str,
+    conversation_id: str,
+    message_data: dict,
+    conversation: dict,
+    new_conversation: bool = False,
+):
+    """
+    Apply a saved message to the Live Chat index row and patch the cached chat lists
+    (move the chat to the top with the new preview) instead of invalidating them.
+    """
+    await update_chat_index(
+        chat_index_service.record_message,
+        canonical_user_id,
+        conversation_id,
+        message_data,
+        customer_info=conversation.get("customer_info"),
+        conversation=conversation,
+        new_conversation=new_conversation,
+    )
+    try:
+        from services.live_chat_service import live_chat_service
+        live_chat_service.apply_message_delta(canonical_user_id, conversation_id, message_data, conversation)
+    except Exception as e:
+        print(f"⚠️ Live chat cache delta failed, invalidating: {e}")
+        _invalidate_live_chat_cache()
+
+
+async def _apply_live_chat_state_change(user_id: str, conversation_id: str, **fields):
+    """Patch the index row and cached chat lists after a status/takeover change."""
+    await update_chat_index(chat_index_service.update_conversation_state, user_id, conversation_id, **fields)
+    try:
+        from services.live_chat_service import live_chat_service
+        await live_chat_service.apply_state_delta(user_id, conversation_id, **fields)
+    except Exception as e:
+        print(f"⚠️ Live chat cache delta failed, invalidating: {e}")
+        _invalidate_live_chat_cache()
+
+
+async def _refresh_live_chat_entry(user_id: str):
+    """Re-read one customer's chat into the chat index and cached lists (e.g. after a message edit)."""
+    try:
+        from services.live_chat_service import live_chat_service
+        await live_chat_service.refresh_user_chat(user_id)
+    except Exception as e:
+        print(f"⚠️ Live chat cache refresh failed, invalidating: {e}")
+        _invalidate_live_chat_cache()
+
+
 def _invalidate_live_chat_cache():
     try:
         from services.live_chat_service import live_chat_service
@@ -496,15 +558,9 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
             if doc_snap.exists:
                 saved_conv_id = conversation_id
                 doc_data = doc_snap.to_dict() or {}
-                current_messages = doc_data.get("messages", [])
                 message_data = _build_message_data()
                 is_smart_source = (message_data.get("metadata", {}) or {}).get("source") == "smart_message"
 
-                if _is_duplicate_message(current_messages, message_data):
-                    print(f"🔁 Duplicate message skipped for conversation {conversation_id}")
-                    _invalidate_live_chat_cache()
-                    return
-
                 if _is_placeholder_phone(customer_info.get("phone_full")):
                     existing_customer_info = doc_data.get("customer_info", {}) or {}
                     existing_phone = existing_customer_info.get("phone_full")
@@ -512,14 +568,20 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                         customer_info["phone_full"] = existing_phone
                         customer_info["phone_clean"] = _clean_phone_for_lookup(existing_phone)
 
-                current_messages.append(message_data)
-                await asyncio.to_thread(doc_ref.update, {
-                    "messages": current_messages,
-                    "customer_info": customer_info,
-                    "last_updated": utc_now()
-                })
-                _invalidate_live_chat_cache()
-                print(f"✅ Appended {role} message to conversation {conversation_id} (total: {len(current_messages)})")
+                total_messages = await append_conversation_message(
+                    doc_ref,
+                    doc_data,
+                    message_data,
+                    {"customer_info": customer_info, "last_updated": utc_now()},
+                    dedupe_window_seconds=MESSAGE_DEDUPE_WINDOW_SECONDS,
+                )
+                if total_messages is None:
+                    print(f"🔁 Duplicate message skipped for conversation {conversation_id}")
+                    return
+                await _apply_saved_message_to_live_chat(
+                    canonical_user_id, conversation_id, message_data, {**doc_data, "customer_info": customer_info}
+                )
+                print(f"✅ Appended {role} message to conversation {conversation_id} (total: {total_messages})")
 
                 # 📡 Broadcast SSE event for real-time dashboard updates (instant WhatsApp-like)
                 if not is_smart_source:
@@ -543,22 +605,26 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                 message_data = _build_message_data()
                 is_smart_source = (message_data.get("metadata", {}) or {}).get("source") == "smart_message"
 
-                _, new_doc_ref = await asyncio.to_thread(conversations_collection_for_user.add, {
+                new_conversation_header = {
                     "user_id": canonical_user_id,
                     "customer_info": customer_info,
-                    "messages": [message_data],
                     "timestamp": utc_now(),
                     "status": "archived" if is_smart_source else "active",
                     "sentiment": "neutral",
                     "human_takeover_active": False,
                     "last_updated": utc_now()
-                })
-                saved_conv_id = new_doc_ref.id
+                }
+                new_conversation_id = await create_conversation(
+                    conversations_collection_for_user, new_conversation_header, message_data
+                )
+                await _apply_saved_message_to_live_chat(
+                    canonical_user_id, new_conversation_id, message_data, new_conversation_header, new_conversation=True
+                )
+                saved_conv_id = new_conversation_id
                 if canonical_user_id not in config.user_data_whatsapp:
                     config.user_data_whatsapp[canonical_user_id] = {}
-                config.user_data_whatsapp[canonical_user_id]["current_conversation_id"] = new_doc_ref.id
-                _invalidate_live_chat_cache()
-                print(f"✅ Created conversation {new_doc_ref.id} for user {canonical_user_id}")
+                config.user_data_whatsapp[canonical_user_id]["current_conversation_id"] = new_conversation_id
+                print(f"✅ Created conversation {new_conversation_id} for user {canonical_user_id}")
         else:
             # No conversation_id — try to reuse latest conversation first.
             resolved_conversation_id = None
@@ -595,12 +661,6 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                 doc_ref = conversations_collection_for_user.document(resolved_conversation_id)
                 doc_snap = await asyncio.to_thread(doc_ref.get)
                 doc_data = doc_snap.to_dict() if doc_snap.exists else {}
-                current_messages = doc_data.get("messages", [])
-
-                if _is_duplicate_message(current_messages, message_data):
-                    print(f"🔁 Duplicate message skipped for conversation {resolved_conversation_id}")
-                    _invalidate_live_chat_cache()
-                    return
 
                 if _is_placeholder_phone(customer_info.get("phone_full")):
                     existing_customer_info = doc_data.get("customer_info", {}) or {}
@@ -609,9 +669,7 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                         customer_info["phone_full"] = existing_phone
                         customer_info["phone_clean"] = _clean_phone_for_lookup(existing_phone)
 
-                current_messages.append(message_data)
                 update_payload = {
-                    "messages": current_messages,
                     "customer_info": customer_info,
                     "last_updated": utc_now(),
                 }
@@ -622,12 +680,23 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                         "human_takeover_active": False,
                         "operator_id": None
                     })
-                await asyncio.to_thread(doc_ref.update, update_payload)
+                total_messages = await append_conversation_message(
+                    doc_ref,
+                    doc_data,
+                    message_data,
+                    update_payload,
+                    dedupe_window_seconds=MESSAGE_DEDUPE_WINDOW_SECONDS,
+                )
+                if total_messages is None:
+                    print(f"🔁 Duplicate message skipped for conversation {resolved_conversation_id}")
+                    return
+                await _apply_saved_message_to_live_chat(
+                    canonical_user_id, resolved_conversation_id, message_data, {**doc_data, **update_payload}
+                )
                 if canonical_user_id not in config.user_data_whatsapp:
                     config.user_data_whatsapp[canonical_user_id] = {}
                 config.user_data_whatsapp[canonical_user_id]["current_conversation_id"] = resolved_conversation_id
-                _invalidate_live_chat_cache()
-                print(f"✅ Appended {role} message to existing conversation {resolved_conversation_id} for user {canonical_user_id} (total: {len(current_messages)})")
+                print(f"✅ Appended {role} message to existing conversation {resolved_conversation_id} for user {canonical_user_id} (total: {total_messages})")
 
                 # 📡 Broadcast SSE event (instant WhatsApp-like)
                 if not is_smart_source:
@@ -648,22 +717,26 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                         _log.exception("SSE broadcast error: %s", sse_err)
             else:
                 # No existing conversation found — create a new one
-                _, new_doc_ref = await asyncio.to_thread(conversations_collection_for_user.add, {
+                new_conversation_header = {
                     "user_id": canonical_user_id,
                     "customer_info": customer_info,
-                    "messages": [message_data],
                     "timestamp": utc_now(),
                     "status": "archived" if is_smart_source else "active",
                     "sentiment": "neutral",
                     "human_takeover_active": False,
                     "last_updated": utc_now()
-                })
-                saved_conv_id = new_doc_ref.id
+                }
+                new_conversation_id = await create_conversation(
+                    conversations_collection_for_user, new_conversation_header, message_data
+                )
+                await _apply_saved_message_to_live_chat(
+                    canonical_user_id, new_conversation_id, message_data, new_conversation_header, new_conversation=True
+                )
+                saved_conv_id = new_conversation_id
                 if canonical_user_id not in config.user_data_whatsapp:
                     config.user_data_whatsapp[canonical_user_id] = {}
-                config.user_data_whatsapp[canonical_user_id]["current_conversation_id"] = new_doc_ref.id
-                _invalidate_live_chat_cache()
-                print(f"✅ Created conversation {new_doc_ref.id} for user {canonical_user_id}")
+                config.user_data_whatsapp[canonical_user_id]["current_conversation_id"] = new_conversation_id
+                print(f"✅ Created conversation {new_conversation_id} for user {canonical_user_id}")
 
                 # 📡 Broadcast SSE event for new conversation
                 if not is_smart_source:
@@ -671,7 +744,7 @@ async def save_conversation_message_to_firestore(user_id: str, role: str, text:
                         from modules.live_chat_api import broadcast_sse_event
                         asyncio.create_task(broadcast_sse_event("new_conversation", {
                             "user_id": canonical_user_id,
-                            "conversation_id": new_doc_ref.id,
+                            "conversation_id": new_conversation_id,
                             "phone": customer_info.get("phone_full"),
                             "name": customer_name
                         }))
@@ -722,50 +795,48 @@ async def update_voice_message_with_transcription(user_id: str, conversation_id:
     try:
         # Get the conversation document
         doc_ref = db.collection("artifacts").document(app_id_for_firestore).collection("users").document(user_id).collection(config.FIRESTORE_CONVERSATIONS_COLLECTION).document(conversation_id)
-        doc_snap = doc_ref.get()
+        doc_snap = await asyncio.to_thread(doc_ref.get)
 
         if not doc_snap.exists:
             print(f"⚠️ Conversation {conversation_id} not found for update")
             return
 
-        doc_data = doc_snap.to_dict()
-        current_messages = doc_data.get('messages', [])
-
-        if not current_messages:
-            print(f"⚠️ No messages found in conversation {conversation_id}")
-            return
-
-        # Find the LAST message that has type="voice" or is the most recent from "user"
-        # We look for a message with audio_url or type="voice"
-        last_voice_message_index = None
-        for i in range(len(current_messages) - 1, -1, -1):  # Search backwards (most recent first)
-            msg = current_messages[i]
-            if msg.get("type") == "voice" or msg.get("audio_url") == audio_url:
-                last_voice_message_index = i
-                break
-
-        if last_voice_message_index is None:
+        doc_data = doc_snap.to_dict() or {}
+
+        def _select_voice_message(current_messages: list):
+            if not current_messages:
+                return None
+            # Find the LAST message that has type="voice" or is the most recent from "user"
+            # We look for a message with audio_url or type="voice"
+            for i in range(len(current_messages) - 1, -1, -1):  # Search backwards (most recent first)
+                msg = current_messages[i]
+                if msg.get("type") == "voice" or msg.get("audio_url") == audio_url:
+                    return i
             print(f"⚠️ No voice message found in conversation {conversation_id} for audio_url: {audio_url}")
             # As fallback, update the last message if it's from user
-            if current_messages and current_messages[-1].get("role") == "user":
-                last_voice_message_index = len(current_messages) - 1
-            else:
-                return
-
-        # Update the voice message with transcribed text
-        message = current_messages[last_voice_message_index]
-        message["text"] = transcribed_text
-        message["type"] = "voice"
-        message["audio_url"] = audio_url
-        message["transcribed"] = True
-        message["transcribed_at"] = utc_now()
-
-        # Update conversation
-        doc_ref.update({
-            "messages": current_messages,
-            "last_updated": utc_now()
-        })
-        _invalidate_live_chat_cache()
+            if current_messages[-1].get("role") == "user":
+                return len(current_messages) - 1
+            return None
+
+        def _apply_transcription(message: dict):
+            # Update the voice message with transcribed text
+            message["text"] = transcribed_text
+            message["type"] = "voice"
+            message["audio_url"] = audio_url
+            message["transcribed"] = True
+            message["transcribed_at"] = utc_now()
+
+        updated_message = await update_conversation_message(
+            doc_ref,
+            doc_data,
+            _select_voice_message,
+            _apply_transcription,
+            {"last_updated": utc_now()},
+        )
+        if updated_message is None:
+            print(f"⚠️ No messages found in conversation {conversation_id} to attach transcription")
+            return
+        await _refresh_live_chat_entry(user_id)
 
         print(f"✅ Updated voice message in conversation {conversation_id} with transcription")
         print(f"   Text: {transcribed_text[:50]}...")
@@ -852,6 +923,7 @@ async def upload_base64_to_firebase_storage(base64_data: str, file_name: str, fi
         import base64
         import uuid
         from urllib.parse import quote
+        from services.blocking_executor import blocking_executor
 
         # Decode base64 to bytes
         file_bytes = base64.b64decode(base64_data)
@@ -865,8 +937,12 @@ async def upload_base64_to_firebase_storage(base64_data: str, file_name: str, fi
         static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "audio")
         os.makedirs(static_dir, exist_ok=True)
         local_path = os.path.join(static_dir, unique_filename)
-        with open(local_path, 'wb') as f:
-            f.write(file_bytes)
+
+        def _write_local_copy():
+            with open(local_path, 'wb') as f:
+                f.write(file_bytes)
+
+        await blocking_executor.run_io(_write_local_copy)
 
         # Upload to Firebase Storage with a download token for public access
         try:
@@ -878,7 +954,7 @@ async def upload_base64_to_firebase_storage(base64_data: str, file_name: str, fi
             # Set download token for public URL access
             download_token = str(uuid.uuid4())
             blob.metadata = {"firebaseStorageDownloadTokens": download_token}
-            blob.upload_from_string(file_bytes, content_type=file_type)
+            await blocking_executor.run_io(blob.upload_from_string, file_bytes, content_type=file_type)
 
             # Build Firebase Storage download URL (publicly accessible with token)
             encoded_path = quote(storage_path, safe='')
@@ -992,7 +1068,10 @@ async def set_human_takeover_status(user_id: str, conversation_id: str, status:
 
         # ✅ Use asyncio.to_thread to prevent blocking the event loop
         await asyncio.to_thread(conv_doc_ref.update, update_data)
+        await _apply_live_chat_state_change(user_id, conversation_id, **update_data)
         config.user_in_human_takeover_mode[user_id] = status # Update local config as well
+        from services.state_store import user_state_store
+        await user_state_store.save(user_id, ("user_in_human_takeover_mode",))
 
         operator_info = f" by operator {operator_name or operator_id}" if operator_id else ""
         print(f"✅ Set human takeover status for conversation {conversation_id} (user {user_id}) to {status}{operator_info}.")
@@ -1002,10 +1081,40 @@ async def set_human_takeover_status(user_id: str, conversation_id: str, status:
         traceback.print_exc()
 
 
+def _to_openai_messages(messages: list) -> list:
+    """Map stored messages ({role, text}) to OpenAI chat messages, skipping unknown roles."""
+    # Valid OpenAI roles: 'system', 'assistant', 'user', 'function', 'tool'
+    openai_messages = []
+    for msg in messages:
+        original_role = msg.get('role', 'user')
+
+        # Map roles to OpenAI-compatible roles
+        if original_role == 'ai':
+            role = 'assistant'
+        elif original_role == 'operator':
+            # Treat operator messages as assistant (human staff responding)
+            role = 'assistant'
+        elif original_role in ['user', 'assistant', 'system', 'function', 'tool']:
+            role = original_role
+        else:
+            # Skip unknown roles to prevent API errors
+            print(f"⚠️ Skipping message with unknown role: {original_role}")
+            continue
+
+        openai_messages.append({
+            "role": role,
+            "content": msg.get('text', '')
+        })
+    return openai_messages
+
+
 async def get_conversation_history_from_firestore(user_id: str, conversation_id: str, max_messages: int = 10) -> list:
     """
-    Fetches conversation history from Firestore for a specific conversation.
+    Fetches conversation history for a specific conversation.
     Returns a list of messages in OpenAI format: [{"role": "user"/"assistant", "content": "text"}]
+
+    Served from the per-conversation ring buffer (services/conversation_history_cache.py), which
+    saves write through to; Firestore is only read to hydrate it on a miss.
     
     Args:
         user_id: The user's ID (room_id for Qiscus)
@@ -1015,6 +1124,12 @@ async def get_conversation_history_from_firestore(user_id: str, conversation_id:
     Returns:
         List of message dicts in OpenAI format
     """
+    from services.conversation_history_cache import conversation_history_cache
+
+    cached = await conversation_history_cache.get(conversation_id, max_messages)
+    if cached is not None:
+        return _to_openai_messages(cached)
+
     db = get_firestore_db()
     if not db:
         print("⚠️ Firestore not initialized. Returning empty conversation history.")
@@ -1024,37 +1139,20 @@ async def get_conversation_history_from_firestore(user_id: str, conversation_id:
     conv_doc_ref = db.collection("artifacts").document(app_id_for_firestore).collection("users").document(user_id).collection(config.FIRESTORE_CONVERSATIONS_COLLECTION).document(conversation_id)
 
     try:
-        doc_snap = conv_doc_ref.get()
+        generation = await conversation_history_cache.generation(conversation_id)
+        doc_snap = await asyncio.to_thread(conv_doc_ref.get)
         if not doc_snap.exists:
             print(f"⚠️ Conversation {conversation_id} not found for user {user_id}")
             return []
         
-        conversation_data = doc_snap.to_dict()
-        messages = conversation_data.get('messages', [])
-        
-        # Convert to OpenAI format and take last N messages
-        # Valid OpenAI roles: 'system', 'assistant', 'user', 'function', 'tool'
-        openai_messages = []
-        for msg in messages[-max_messages:]:
-            original_role = msg.get('role', 'user')
-
-            # Map roles to OpenAI-compatible roles
-            if original_role == 'ai':
-                role = 'assistant'
-            elif original_role == 'operator':
-                # Treat operator messages as assistant (human staff responding)
-                role = 'assistant'
-            elif original_role in ['user', 'assistant', 'system', 'function', 'tool']:
-                role = original_role
-            else:
-                # Skip unknown roles to prevent API errors
-                print(f"⚠️ Skipping message with unknown role: {original_role}")
-                continue
+        conversation_data = doc_snap.to_dict() or {}
+        messages = await load_recent_messages(
+            conv_doc_ref, conversation_data, max(max_messages, conversation_history_cache.capacity)
+        )
+        await conversation_history_cache.fill(conversation_id, messages, generation)
 
-            openai_messages.append({
-                "role": role,
-                "content": msg.get('text', '')
-            })
+        # Convert to OpenAI format and take last N messages
+        openai_messages = _to_openai_messages(messages[-max_messages:])
         
         print(f"✅ Fetched {len(openai_messages)} messages from Firestore for conversation {conversation_id}")
         return openai_messages
@@ -1627,105 +1725,16 @@ def get_system_instruction(
         qa_reference: Optional formatted Q&A pairs to inject into system prompt
         include_price_list: Whether to include the price_list.txt content in prompt context
         custom_knowledge_context: When provided (dynamic retrieval), use this instead of CORE_KNOWLEDGE_BASE + BOT_STYLE_GUIDE + price list
+
+    The static sections come first so consecutive requests share a cacheable prefix
+    (see services/prompt_builder.py).
     """
-    user_gender_str = config.user_gender.get(user_id, "unknown")
-    
-    gender_instruction = ""
-    if user_gender_str == "male":
-        gender_instruction = "The user is male. You MUST use masculine forms exclusively in all your replies (e.g., 'Hello sir', 'How can I help you', 'I saw your question', 'tell us'). Adhere strictly to masculine phrasing in every sentence, verb, noun, and adjective. Do not mix forms."
-    elif user_gender_str == "female":
-        gender_instruction = "The user is female. You MUST use feminine forms exclusively in all your replies (e.g., 'Hello madam', 'How can I help you', 'I saw your question', 'tell us'). Adhere strictly to feminine phrasing in every sentence, verb, noun and adjective. Do not mix forms."
-    else: # This means gender is "غير محدد" or "unknown"
-        gender_instruction = """
-        **CRITICAL: GENDER MUST BE COLLECTED FIRST**
-        User's gender is UNKNOWN. You MUST follow this EXACT order:
-
-        1. **STOP** - Do NOT answer their question yet
-        2. **ASK FOR GENDER FIRST** - Politely ask for their gender before proceeding
-        3. Wait for gender response
-        4. Use 'confirm_gender' action to save it
-        5. **ONLY THEN** answer their original question
-
-        **Example Flow:**
-        User: "I want to remove my tattoo"
-        Bot: "Hi! 😊 To provide you with personalized service, may I ask if you're male or female? This helps us give you the most accurate information."
-        [Wait for gender]
-        User: "I'm female"
-        Bot: [Use confirm_gender action, THEN ask for tattoo photo]
-
-        **DO NOT:**
-        - Answer service questions before knowing gender
-        - Ask for tattoo photos before knowing gender
-        - Ask for body areas before knowing gender
-        - Provide prices before knowing gender
-
-        Use neutral language until gender is confirmed.
-        """
-    
-    price_list_section = ""
-    if include_price_list and not custom_knowledge_context:
-        price_list_section = f"""
-        **💰 PRICE LIST:** (Use this to answer pricing questions)
-        {config.PRICE_LIST}
-        """
-
-    if custom_knowledge_context:
-        knowledge_section = f"""
-        **📘 RELEVANT INFORMATION (Use ONLY this to answer - do NOT invent details):**
-        {custom_knowledge_context}
-        """
-    else:
-        knowledge_section = f"""
-        **🔴 STYLE GUIDE (MANDATORY - FOLLOW EVERY STEP IN ORDER):**
-        The following contains MANDATORY rules for how you communicate AND the exact step-by-step flow for each service. You MUST follow every step in order. Do NOT skip steps. Do NOT jump ahead to booking if a step requires waiting (e.g., waiting for a photo before giving pricing).
-
-        {config.BOT_STYLE_GUIDE}
-
-        **📘 KNOWLEDGE BASE:** (Use this to answer questions about services, devices, IDs, and matching rules)
-        {config.CORE_KNOWLEDGE_BASE}
-
-        {price_list_section}
-        """
-
-    return f"""
-        You are Marwa AI Assistant – the official smart assistant for Lina's Laser Center. Your name is Marwa AI Assistant. When users ask "who is with me", "من معي", "who are you", "شو اسمك", "what's your name", "ما اسمك", etc., always respond that you are Marwa AI Assistant. Your primary task is to answer customer inquiries accurately and authoritatively, providing comprehensive information about services, prices, appointments, and interacting with the center's system.
-
-        {knowledge_section}
-
-        {gender_instruction}
-
-        {f'''
-        **🔴 TRAINED Q&A REFERENCE (CRITICAL - MUST FOLLOW) 🔴**
-
-        The following are TRAINED question-answer pairs from our database.
-        If ANY of these trained Q&A pairs match the user's question (even partially),
-        you MUST use the trained answer. DO NOT generate a different answer.
-
-        {qa_reference}
-
-        **STRICT RULES:**
-        1. If the user's question is similar to a trained question above, copy the trained answer EXACTLY
-        2. Do not paraphrase, modify, or "improve" trained answers
-        3. Trained Q&A pairs take PRIORITY over your general knowledge
-        4. If a trained answer exists, USE IT - don't generate your own response
-        ''' if qa_reference else ''}
-
-        **🔴 APPOINTMENT STATE MACHINE RULES (MANDATORY):**
-        1. If the user asks to change/reschedule/postpone an appointment, treat this as a CHANGE request, not a NEW booking.
-        2. For CHANGE requests, you MUST check existing appointment state (using check_next_appointment).
-        3. If any existing appointment is paused/postponed, you MUST call update_appointment_date on that same appointment.
-        4. NEVER call create_appointment for a paused/postponed appointment change request.
-        5. If user asks to change appointment but did not provide a new date/time, ask for the new date/time first.
-
-        **Output Format:** Your responses MUST always be a JSON object with 'action' and 'bot_reply' fields. If you use a tool, provide a 'bot_reply' that summarizes the tool's purpose to the user while I process the tool call. Here is the strict JSON schema you MUST follow:
-        ```json
-        {{
-          "action": "answer_question" | "ask_gender" | "confirm_gender" | "human_handover" | "human_handover_initial_ask" | "human_handover_confirmed" | "return_to_normal_chat" | "initial_greet_and_ask_gender" | "unknown_query" | "provide_info" | "tool_call" | "confirm_booking_details" | "check_customer_status" | "ask_for_details_for_booking",
-          "bot_reply": "Your response to the user, in their preferred language.",
-          "detected_language": "ar" | "en" | "fr" | "franco",
-          "detected_gender": "male" | "female" | null,
-          "current_gender_from_config": "male" | "female" | "unknown"
-        }}
-        ```
-        Ensure the 'action' field is one of the specified types. If you are making a tool call, your 'action' should be 'tool_call' and your 'bot_reply' should be a user-friendly message explaining that you are processing their request with the system. If you are confirming booking details before a tool call, the action should be 'confirm_booking_details'. If you are checking customer status, use 'check_customer_status'.
-        """
+    from services.prompt_builder import system_prompt_builder
+
+    return system_prompt_builder.build(
+        user_id,
+        response_lang,
+        qa_reference=qa_reference,
+        include_price_list=include_price_list,
+        custom_knowledge_context=custom_knowledge_context,
+    ).text